@@ -785,8 +785,8 @@ async def create_start_code(request: CreateStartCodeRequest) -> Dict[str, Any]:
             )
             
             # Reload cache to include new code
-            from app.core.start_code_cache import reload_cache
-            reload_cache()
+            from app.core import cache_bus
+            await cache_bus.invalidate(cache_bus.CACHE_START_CODES)
             
             return {
                 "code": start_code.code,
@@ -856,8 +856,8 @@ async def update_start_code(code: str, request: UpdateStartCodeRequest) -> Dict[
                 raise HTTPException(status_code=404, detail=f"Start code '{code}' not found")
             
             # Reload cache to reflect updates
-            from app.core.start_code_cache import reload_cache
-            reload_cache()
+            from app.core import cache_bus
+            await cache_bus.invalidate(cache_bus.CACHE_START_CODES)
             
             return {
                 "code": start_code.code,
@@ -893,8 +893,8 @@ async def delete_start_code(code: str) -> Dict[str, Any]:
                 raise HTTPException(status_code=404, detail=f"Start code '{code}' not found")
             
             # Reload cache to remove deleted code
-            from app.core.start_code_cache import reload_cache
-            reload_cache()
+            from app.core import cache_bus
+            await cache_bus.invalidate(cache_bus.CACHE_START_CODES)
             
             return {"message": f"Start code '{code}' deleted successfully"}
     except HTTPException:
@@ -1661,8 +1661,8 @@ async def create_persona(request: CreatePersonaRequest) -> Dict[str, Any]:
                 )
             
             # Reload persona cache
-            from app.core.persona_cache import reload_cache
-            reload_cache()
+            from app.core import cache_bus
+            await cache_bus.invalidate(cache_bus.CACHE_PERSONAS)
             
             return {
                 "id": str(persona.id),
@@ -1733,8 +1733,8 @@ async def update_persona(persona_id: str, request: UpdatePersonaRequest) -> Dict
                 raise HTTPException(status_code=404, detail=f"Persona not found: {persona_id}")
             
             # Reload persona cache
-            from app.core.persona_cache import reload_cache
-            reload_cache()
+            from app.core import cache_bus
+            await cache_bus.invalidate(cache_bus.CACHE_PERSONAS)
             
             return {
                 "id": str(persona.id),
@@ -1786,8 +1786,8 @@ async def delete_persona(persona_id: str) -> Dict[str, Any]:
                 raise HTTPException(status_code=404, detail=f"Persona not found: {persona_id}")
             
             # Reload persona cache
-            from app.core.persona_cache import reload_cache
-            reload_cache()
+            from app.core import cache_bus
+            await cache_bus.invalidate(cache_bus.CACHE_PERSONAS)
             
             return {"message": f"Persona '{persona_id}' deleted successfully"}
     except ValueError:
@@ -1895,8 +1895,8 @@ async def create_persona_history(request: CreatePersonaHistoryRequest) -> Dict[s
             )
             
             # Reload persona cache
-            from app.core.persona_cache import reload_cache
-            reload_cache()
+            from app.core import cache_bus
+            await cache_bus.invalidate(cache_bus.CACHE_PERSONAS)
             
             return {
                 "id": str(history.id),
@@ -1954,8 +1954,8 @@ async def update_persona_history(history_id: str, request: UpdatePersonaHistoryR
                 raise HTTPException(status_code=404, detail=f"History not found: {history_id}")
             
             # Reload persona cache
-            from app.core.persona_cache import reload_cache
-            reload_cache()
+            from app.core import cache_bus
+            await cache_bus.invalidate(cache_bus.CACHE_PERSONAS)
             
             return {
                 "id": str(history.id),
@@ -2001,8 +2001,8 @@ async def delete_persona_history(history_id: str) -> Dict[str, Any]:
                 raise HTTPException(status_code=404, detail=f"History not found: {history_id}")
             
             # Reload persona cache
-            from app.core.persona_cache import reload_cache
-            reload_cache()
+            from app.core import cache_bus
+            await cache_bus.invalidate(cache_bus.CACHE_PERSONAS)
             
             return {"message": f"History '{history_id}' deleted successfully"}
     except ValueError:
@@ -2173,6 +2173,93 @@ async def get_most_cached_images(
         raise HTTPException(status_code=500, detail=f"Error fetching images: {str(e)}")
 
 
+@router.get("/image-cache-stats")
+async def get_image_cache_stats() -> Dict[str, Any]:
+    """
+    Get image cache statistics for this process
+    
+    Returns:
+        - seen_filter: cache lookups, candidates filtered as already seen,
+          filter rebuilds, DB fallbacks and batched rows flushed
+        - near_duplicates: near-duplicate prompt hits, extra hit rate over
+          exact lookups and estimated GPU cost saved
+    """
+    from app.core import shown_images, image_similarity
+    return {
+        "seen_filter": shown_images.get_stats(),
+        "near_duplicates": image_similarity.get_stats(),
+    }
+
+
+@router.get("/image-job-stats")
+async def get_image_job_stats() -> Dict[str, Any]:
+    """
+    Get pending image job reconciler statistics
+    
+    Returns:
+        - pending / pending_age_histogram: jobs still waiting for a result, by age
+        - completion_age_histogram: submit-to-finalize time of finished jobs
+        - polled, recovered, retried, timed_out: reconciler counters
+        - speculative_plans: image plans drafted during dialogue (used / discarded / failed)
+    """
+    from app.core import image_job_reconciler
+    from app.core.multi_brain_pipeline import get_speculative_plan_stats
+    return {
+        **(await image_job_reconciler.get_stats()),
+        "speculative_plans": get_speculative_plan_stats(),
+    }
+
+
+@router.get("/llm-stats")
+async def get_llm_stats() -> Dict[str, Any]:
+    """
+    Get LLM client health statistics for this process
+    
+    Returns:
+        - models: per-model calls, error_rate, recent_error_rate, ewma_ms, p95_ms,
+          circuit_open, cost_usd and usd_per_1k_tokens (billed)
+        - hedged, backup_wins: hedged requests and how often the backup answered first
+        - routes: model picks per brain (model_routing)
+        - governor: in-flight/queued requests and queue times per priority lane
+    """
+    from app.core import llm_governor, llm_health, model_router
+    return {
+        **llm_health.get_stats(),
+        "routes": model_router.get_stats(),
+        "governor": llm_governor.get_stats(),
+    }
+
+
+@router.get("/prefilter-stats")
+async def get_prefilter_stats() -> Dict[str, Any]:
+    """
+    Get local pre-filter statistics for this process
+    
+    Returns per filter (image_decision, user_name, gift_text):
+        - mode: enforce / shadow / off
+        - checked, decided: inputs seen and decided locally
+        - llm_calls_skipped: LLM calls saved (enforce mode)
+        - shadow_compared, shadow_agreed, shadow_precision: agreement with the LLM (shadow mode;
+          gift_text is enforce-only and never has one)
+    """
+    from app.core import prefilters
+    return prefilters.get_stats()
+
+
+@router.get("/cache-bus-stats")
+async def get_cache_bus_stats() -> Dict[str, Any]:
+    """
+    Get cross-process cache invalidation statistics for this process
+    
+    Returns:
+        - published, received, ignored, coalesced: invalidation messages
+        - reloads, reload_errors: local reloads triggered by other processes
+        - generations: cache generation each local snapshot reflects
+    """
+    from app.core import cache_bus
+    return cache_bus.get_stats()
+
+
 # ========== TRANSLATION MANAGEMENT ENDPOINTS ==========
 
 class TranslationRequest(BaseModel):
@@ -2482,9 +2569,10 @@ async def refresh_translation_cache() -> Dict[str, Any]:
         Success message with statistics
     """
     try:
+        from app.core import cache_bus
         from app.core.translation_service import translation_service
         
-        translation_service.reload()
+        await cache_bus.invalidate(cache_bus.CACHE_TRANSLATIONS)
         
         # Get statistics
         stats = {}
@@ -2582,6 +2670,16 @@ def _convert_audio_to_ogg_opus(audio_bytes: bytes, file_ext: str) -> bytes:
     return ogg_buffer.read()
 
 
+async def _iter_upload_chunks(file: UploadFile):
+    """Read an uploaded file in R2 part-sized chunks"""
+    from app.core.r2_storage import MULTIPART_CHUNK_SIZE
+    while True:
+        chunk = await file.read(MULTIPART_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
 @router.post("/upload")
 async def upload_file(file: UploadFile = File(...), file_type: str = Query("audio", regex="^(audio|image)$")):
     """
@@ -2606,6 +2704,30 @@ async def upload_file(file: UploadFile = File(...), file_type: str = Query("audi
             if file_ext not in ALLOWED_IMAGE_EXTENSIONS:
                 raise HTTPException(status_code=400, detail=f"Invalid image format. Allowed: {', '.join(ALLOWED_IMAGE_EXTENSIONS)}")
         
+        from app.settings import settings
+        use_r2 = settings.UPLOADS_BACKEND == "r2"
+        if use_r2:
+            from app.core import r2_storage
+            
+            if not r2_storage.is_r2_configured():
+                raise HTTPException(status_code=500, detail="R2 storage is not configured")
+        
+        # Images go to R2 straight from the request body, without reading the whole file
+        if use_r2 and file_type == "image":
+            unique_filename = f"{uuid4()}{file_ext}"
+            object_key = r2_storage.build_r2_key(filename=unique_filename)
+            try:
+                await r2_storage.upload_stream_async(
+                    key=object_key,
+                    chunks=_iter_upload_chunks(file),
+                    content_type=file.content_type,
+                    max_bytes=MAX_FILE_SIZE,
+                )
+            except r2_storage.UploadTooLargeError:
+                raise HTTPException(status_code=400, detail=f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB")
+            file_url = r2_storage.build_r2_object_url(key=object_key)
+            return {"url": file_url, "filename": unique_filename}
+        
         # Read file content
         content = await file.read()
         
@@ -2621,21 +2743,14 @@ async def upload_file(file: UploadFile = File(...), file_type: str = Query("audi
         # Generate unique filename
         unique_filename = f"{uuid4()}{file_ext}"
         
-        from app.settings import settings
-        if settings.UPLOADS_BACKEND == "r2":
-            from app.core.r2_storage import build_r2_key, build_r2_object_url, upload_bytes_to_r2, is_r2_configured
-            
-            if not is_r2_configured():
-                raise HTTPException(status_code=500, detail="R2 storage is not configured")
-            
-            object_key = build_r2_key(filename=unique_filename)
-            await asyncio.to_thread(
-                upload_bytes_to_r2,
+        if use_r2:
+            object_key = r2_storage.build_r2_key(filename=unique_filename)
+            await r2_storage.upload_bytes_async(
                 key=object_key,
                 data=content,
                 content_type=file.content_type,
             )
-            file_url = build_r2_object_url(key=object_key)
+            file_url = r2_storage.build_r2_object_url(key=object_key)
             return {"url": file_url, "filename": unique_filename}
         
         file_path = UPLOADS_DIR / unique_filename
@@ -2652,6 +2767,19 @@ async def upload_file(file: UploadFile = File(...), file_type: str = Query("audi
         raise HTTPException(status_code=500, detail=f"Error uploading file: {str(e)}")
 
 
+@router.get("/upload-stats")
+async def get_upload_stats() -> Dict[str, Any]:
+    """
+    Get R2 upload statistics for this process
+    
+    Returns:
+        - uploads, multipart_uploads, parts, failures: upload counters
+        - bytes, seconds, throughput_mb_per_sec: upload volume and average throughput
+    """
+    from app.core.r2_storage import get_upload_stats as get_r2_upload_stats
+    return get_r2_upload_stats()
+
+
 # ========== SYSTEM MESSAGES ENDPOINTS ==========
 
 @router.post("/system-messages", response_model=SystemMessageResponse)
@@ -3202,3 +3330,66 @@ async def search_users(query: str, limit: int = 20):
     except Exception as e:
         print(f"[ANALYTICS-API] Error searching users: {e}")
         raise HTTPException(status_code=500, detail=f"Error searching users: {str(e)}")
+
+
+@router.get("/webapp-auth-stats")
+async def get_webapp_auth_stats() -> Dict[str, Any]:
+    """
+    Get Mini App init-data and user-context cache statistics for this process
+    
+    Returns:
+        - init_data_hits, init_data_misses: signature checks skipped / performed
+        - user_context_hits, user_context_misses: user lookups served from cache / DB
+        - init_data_cached, user_contexts_cached: current cache sizes
+    """
+    from app.core import webapp_auth
+    return webapp_auth.get_stats()
+
+
+@router.get("/user-profile-cache-stats")
+async def get_user_profile_cache_stats() -> Dict[str, Any]:
+    """
+    Get per-user profile cache statistics for this process
+    
+    Returns:
+        - local_hits, redis_hits, misses, hit_rate: profile lookups by layer
+        - stores, invalidations: write-throughs and invalidations after writes
+        - redis_errors, redis_available: shared layer health
+    """
+    from app.core import user_profile_cache
+    return user_profile_cache.get_stats()
+
+
+@router.get("/startup-stats")
+async def get_startup_stats() -> Dict[str, Any]:
+    """
+    Get how long this process took to start, per startup phase
+    
+    Returns:
+        - ready_ms: time from the start of lifespan until ready to serve
+        - phases_ms: duration of each phase (concurrent phases overlap)
+        - deferred_imports: optional heavy modules imported since, with import time in ms
+    """
+    from app.core import lazy_imports, startup
+    return {**startup.get_stats(), "deferred_imports": lazy_imports.get_stats()}
+
+
+@router.get("/worker-stats")
+async def get_worker_stats() -> Dict[str, Any]:
+    """
+    Get the role and background work of the worker that served this request
+    
+    In multi-worker mode each request lands on one worker, so repeated calls
+    show different workers (compare pid / instance_id).
+    
+    Returns:
+        - worker: pid, worker count, multi-worker mode, scheduler leadership, election counters
+        - background_tasks: spawned/completed/failed/cancelled and currently running
+        - chat_actions: active indicators in this worker and forwarded stops
+    """
+    from app.core import action_registry, background_tasks, workers
+    return {
+        "worker": workers.get_stats(),
+        "background_tasks": background_tasks.get_stats(),
+        "chat_actions": action_registry.get_stats(),
+    }
@@ -2,13 +2,15 @@
 Mini App API endpoints
 Provides data for the Telegram Web App
 """
-from fastapi import APIRouter, Header, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
 from typing import Optional, List, Dict, Any
+import orjson
 from pydantic import BaseModel
-from urllib.parse import parse_qsl
-from app.core.security import validate_telegram_webapp_data
+from app.core.webapp_auth import InitData, UserContext, invalidate_user_context, miniapp_init_data, miniapp_user
 from app.db.base import get_db
 from app.db import crud
+from app.core import background_tasks, shown_images, user_profile_cache
+from app.core.conversation_state import ConversationState
 from app.settings import settings
 
 router = APIRouter(prefix="/api/miniapp", tags=["miniapp"])
@@ -18,7 +20,7 @@ async def generate_initial_state_for_story(
     persona_name: str,
     story_description: str,
     greeting_text: str
-) -> str:
+) -> ConversationState:
     """Generate initial state from story description using State Resolver"""
     from app.core.brains.state_resolver import resolve_state
     
@@ -38,13 +40,13 @@ async def generate_initial_state_for_story(
         previous_image_prompt=None
     )
     
-    print(f"[MINIAPP-SELECT] ✅ Initial state generated ({len(state)} chars)")
+    print(f"[MINIAPP-SELECT] ✅ Initial state generated ({len(str(state))} chars)")
     return state
 
 
 async def generate_initial_story_image_prompts(
     persona: dict,
-    state: str,
+    state: ConversationState,
     story_description: str,
     greeting_text: str
 ) -> tuple[str, str]:
@@ -83,24 +85,11 @@ class ChatCheckRequest(BaseModel):
     history_id: Optional[str] = None
 
 
-def extract_user_id_from_init_data(x_telegram_init_data: Optional[str]) -> Optional[int]:
-    """Extract user ID from Telegram Web App init data"""
-    if not x_telegram_init_data:
-        return None
-    
-    try:
-        import json
-        parsed = dict(parse_qsl(x_telegram_init_data))
-        user_data = json.loads(parsed.get('user', '{}'))
-        return user_data.get('id')
-    except:
-        return None
-
-
 @router.get("/personas")
 async def get_personas(
-    x_telegram_init_data: Optional[str] = Header(None)
-) -> List[Dict[str, Any]]:
+    user: Optional[UserContext] = Depends(miniapp_user),
+    if_none_match: Optional[str] = Header(None),
+) -> Response:
     """
     Get all public personas for the Mini App gallery
     
@@ -108,34 +97,22 @@ async def get_personas(
     - id, name, description, badges
     - avatar_url (primary image for gallery)
     - Descriptions are returned in user's language if available
-    """
-    # Validate Telegram Web App authentication
-    # Skip validation if SKIP_MINIAPP_AUTH is true (for dev/testing only)
-    if not settings.SKIP_MINIAPP_AUTH:
-        if settings.ENV == "production" and not validate_telegram_webapp_data(x_telegram_init_data or ""):
-            raise HTTPException(status_code=403, detail="Invalid Telegram authentication")
-    
-    # Get user ID and language preference
-    user_id = extract_user_id_from_init_data(x_telegram_init_data)
-    user_language = 'en'
-    if user_id:
-        with get_db() as db:
-            user_language = crud.get_user_language(db, user_id)
-    
-    # Get personas from cache (much faster!)
-    from app.core.persona_cache import get_preset_personas, get_random_history, get_persona_field
-    personas = get_preset_personas()
     
-    result = []
-    
-    # Add user's custom characters FIRST (at the top)
+    The public part is a prebuilt per-language payload (see persona_cache.get_gallery_payload);
+    only the user's custom characters are serialized per request. Responses carry an ETag,
+    and a matching If-None-Match gets a 304.
+    """
+    # Language comes from the cached user context; only custom characters need the DB
+    user_id = user.user_id if user else None
+    user_language = user.language if user else 'en'
+    custom = []
     if user_id:
         with get_db() as db:
             user_personas = crud.get_user_personas(db, user_id)
             # Sort by created_at descending (newest first)
             user_personas.sort(key=lambda p: p.created_at, reverse=True)
             for up in user_personas:
-                result.append({
+                custom.append({
                     "id": str(up.id),
                     "name": up.name,
                     "description": up.description or "",
@@ -147,48 +124,31 @@ async def get_personas(
                     "has_voice": up.voice_id is not None,
                 })
     
-    # Then add public personas
-    for persona in personas:
-        persona_id = persona["id"]
-        
-        # Use avatar_url as primary image, fallback to first history image from cache
-        avatar_url = persona["avatar_url"]
-        if not avatar_url:
-            history_start = get_random_history(persona_id)
-            avatar_url = history_start["image_url"] if history_start else None
-        
-        # Get translated descriptions and name
-        name = get_persona_field(persona, 'name', language=user_language) or persona["name"]
-        description = get_persona_field(persona, 'description', language=user_language) or ""
-        small_description = get_persona_field(persona, 'small_description', language=user_language) or ""
-        
-        result.append({
-            "id": persona_id,
-            "name": name,
-            "description": description,
-            "smallDescription": small_description,
-            "badges": persona["badges"] or [],
-            "avatar_url": avatar_url,
-            "is_custom": False,
-            "has_voice": persona.get("voice_id") is not None,
-        })
+    # Public personas come prebuilt from the cache
+    from app.core.persona_cache import get_gallery_payload, payload_etag
+    body, etag = get_gallery_payload(user_language)
     
-    return result
+    # User's custom characters go FIRST (at the top): splice them into the JSON array
+    if custom:
+        custom_body = orjson.dumps(custom)
+        body = custom_body[:-1] + (b"," + body[1:] if body != b"[]" else b"]")
+        etag = payload_etag(body)
+    
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @router.get("/user/active-chat")
 async def get_user_active_chat(
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> Dict[str, Any]:
     """
     Get user's most recent active chat (any persona).
     Used by shop page to know which chat to purchase gifts for.
     """
-    if not settings.SKIP_MINIAPP_AUTH:
-        if settings.ENV == "production" and not validate_telegram_webapp_data(x_telegram_init_data or ""):
-            raise HTTPException(status_code=403, detail="Invalid Telegram authentication")
-    
-    user_id = extract_user_id_from_init_data(x_telegram_init_data)
+    user_id = init_data.user_id
     if not user_id:
         return {"chatId": None, "personaName": None, "personaAvatarUrl": None}
     
@@ -212,7 +172,7 @@ async def get_user_active_chat(
 @router.get("/personas/{persona_id}/active-chat")
 async def get_persona_active_chat(
     persona_id: str,
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> Dict[str, Any]:
     """
     Check if user has an existing chat with this persona
@@ -221,10 +181,6 @@ async def get_persona_active_chat(
     - hasActiveChat: boolean
     - chatId: string (if exists)
     """
-    # Validate authentication
-    if settings.ENV == "production" and not validate_telegram_webapp_data(x_telegram_init_data or ""):
-        raise HTTPException(status_code=403, detail="Invalid Telegram authentication")
-    
     # Validate persona_id format
     try:
         from uuid import UUID
@@ -233,7 +189,7 @@ async def get_persona_active_chat(
         raise HTTPException(status_code=400, detail="Invalid persona ID format")
     
     # Get user ID
-    user_id = extract_user_id_from_init_data(x_telegram_init_data)
+    user_id = init_data.user_id
     if not user_id:
         return {"hasActiveChat": False, "chatId": None}
     
@@ -249,7 +205,7 @@ async def get_persona_active_chat(
 @router.get("/personas/{persona_id}/histories")
 async def get_persona_histories(
     persona_id: str,
-    x_telegram_init_data: Optional[str] = Header(None)
+    user: Optional[UserContext] = Depends(miniapp_user)
 ) -> List[Dict[str, Any]]:
     """
     Get all history starts for a specific persona
@@ -261,10 +217,6 @@ async def get_persona_histories(
     - id, description, text (greeting), image_url
     - Descriptions and text are returned in user's language if available
     """
-    # Validate authentication
-    if settings.ENV == "production" and not validate_telegram_webapp_data(x_telegram_init_data or ""):
-        raise HTTPException(status_code=403, detail="Invalid Telegram authentication")
-    
     # Validate persona_id format
     try:
         from uuid import UUID
@@ -272,12 +224,9 @@ async def get_persona_histories(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid persona ID format")
     
-    # Get user ID and language preference
-    user_id = extract_user_id_from_init_data(x_telegram_init_data)
-    user_language = 'en'
-    if user_id:
-        with get_db() as db:
-            user_language = crud.get_user_language(db, user_id)
+    # Get user ID and language preference (cached user context)
+    user_id = user.user_id if user else None
+    user_language = user.language if user else 'en'
     
     # Try to get histories from cache (for preset personas)
     from app.core import persona_cache
@@ -331,7 +280,7 @@ async def get_persona_histories(
 
 @router.get("/user/energy")
 async def get_user_energy(
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> Dict[str, Any]:
     """
     Get current user's token balance and premium tier
@@ -347,15 +296,12 @@ async def get_user_energy(
     }
     """
     # Validate and extract user ID from init data
-    if not x_telegram_init_data:
+    if not init_data.raw:
         return {"tokens": 100, "premium_tier": "free", "is_premium": False, "can_claim_daily_bonus": False, "next_bonus_in_seconds": 86400, "daily_bonus_streak": 0, "char_created": False, "voice_enabled": False}
     
     try:
         # Parse init data to get user ID
-        parsed = dict(parse_qsl(x_telegram_init_data))
-        import json
-        user_data = json.loads(parsed.get('user', '{}'))
-        user_id = user_data.get('id')
+        user_id = init_data.user_id
         
         if not user_id:
             raise HTTPException(status_code=400, detail="User ID not found in init data")
@@ -401,7 +347,7 @@ async def get_user_energy(
 
 @router.get("/user/language")
 async def get_user_language(
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> Dict[str, Any]:
     """
     Get user's language preference
@@ -409,16 +355,13 @@ async def get_user_language(
     Returns: {language: str}
     """
     # Validate and extract user ID from init data
-    if not x_telegram_init_data:
+    if not init_data.raw:
         return {"language": "en"}  # Default for testing
     
     try:
         # Parse init data to get user ID and language_code
-        parsed = dict(parse_qsl(x_telegram_init_data))
-        import json
-        user_data = json.loads(parsed.get('user', '{}'))
-        user_id = user_data.get('id')
-        telegram_language_code = user_data.get('language_code', 'en')
+        user_id = init_data.user_id
+        telegram_language_code = init_data.language_code
         
         if not user_id:
             raise HTTPException(status_code=400, detail="User ID not found in init data")
@@ -437,7 +380,7 @@ async def get_user_language(
 
 @router.get("/user/age-status")
 async def get_user_age_status(
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> Dict[str, Any]:
     """
     Get user's age verification status
@@ -445,15 +388,12 @@ async def get_user_age_status(
     Returns: {age_verified: bool}
     """
     # Skip auth and return verified if SKIP_MINIAPP_AUTH is true (dev only)
-    if settings.SKIP_MINIAPP_AUTH and not x_telegram_init_data:
+    if settings.SKIP_MINIAPP_AUTH and not init_data.raw:
         return {"age_verified": True}
     
     try:
         # Parse init data to get user ID
-        parsed = dict(parse_qsl(x_telegram_init_data))
-        import json
-        user_data = json.loads(parsed.get('user', '{}'))
-        user_id = user_data.get('id')
+        user_id = init_data.user_id
         
         if not user_id:
             raise HTTPException(status_code=400, detail="User ID not found in init data")
@@ -470,7 +410,7 @@ async def get_user_age_status(
 
 @router.post("/user/verify-age")
 async def verify_user_age(
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> Dict[str, Any]:
     """
     Mark user as age verified
@@ -478,15 +418,12 @@ async def verify_user_age(
     Returns: {success: bool, age_verified: bool}
     """
     # Skip auth if SKIP_MINIAPP_AUTH is true (dev only)
-    if settings.SKIP_MINIAPP_AUTH and not x_telegram_init_data:
+    if settings.SKIP_MINIAPP_AUTH and not init_data.raw:
         return {"success": True, "age_verified": True}
     
     try:
         # Parse init data to get user ID
-        parsed = dict(parse_qsl(x_telegram_init_data))
-        import json
-        user_data = json.loads(parsed.get('user', '{}'))
-        user_id = user_data.get('id')
+        user_id = init_data.user_id
         
         if not user_id:
             raise HTTPException(status_code=400, detail="User ID not found in init data")
@@ -514,7 +451,7 @@ class UpdateLanguageRequest(BaseModel):
 @router.post("/user/update-language")
 async def update_user_language(
     request: UpdateLanguageRequest,
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> Dict[str, Any]:
     """
     Manually update user's language preference
@@ -527,15 +464,12 @@ async def update_user_language(
         raise HTTPException(status_code=400, detail=f"Unsupported language: {request.language}")
     
     # Validate and extract user ID from init data
-    if not x_telegram_init_data:
+    if not init_data.raw:
         raise HTTPException(status_code=400, detail="No init data provided")
     
     try:
         # Parse init data to get user ID
-        parsed = dict(parse_qsl(x_telegram_init_data))
-        import json
-        user_data = json.loads(parsed.get('user', '{}'))
-        user_id = user_data.get('id')
+        user_id = init_data.user_id
         
         if not user_id:
             raise HTTPException(status_code=400, detail="User ID not found in init data")
@@ -558,6 +492,8 @@ async def update_user_language(
                 db.refresh(user)
                 print(f"[UPDATE-LANGUAGE-API] ✅ User {user_id} created with language: {request.language}")
             
+            invalidate_user_context(user_id)
+            user_profile_cache.invalidate(user_id)
             return {"success": True, "language": request.language}
     
     except HTTPException:
@@ -574,7 +510,7 @@ class UpdateVoiceSettingsRequest(BaseModel):
 @router.post("/user/update-voice-settings")
 async def update_user_voice_settings(
     request: UpdateVoiceSettingsRequest,
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> Dict[str, Any]:
     """
     Update user's voice button visibility preference
@@ -582,15 +518,12 @@ async def update_user_voice_settings(
     Returns: {success: bool, voice_enabled: bool}
     """
     # Validate and extract user ID from init data
-    if not x_telegram_init_data:
+    if not init_data.raw:
         raise HTTPException(status_code=400, detail="No init data provided")
     
     try:
         # Parse init data to get user ID
-        parsed = dict(parse_qsl(x_telegram_init_data))
-        import json
-        user_data = json.loads(parsed.get('user', '{}'))
-        user_id = user_data.get('id')
+        user_id = init_data.user_id
         
         if not user_id:
             raise HTTPException(status_code=400, detail="User ID not found in init data")
@@ -635,7 +568,7 @@ class CreateInvoiceRequest(BaseModel):
 @router.post("/select-scenario")
 async def select_scenario(
     request: SelectScenarioRequest,
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> Dict[str, Any]:
     """
     Handle scenario selection from Mini App
@@ -644,16 +577,9 @@ async def select_scenario(
     
     Returns: {success: bool, message: str}
     """
-    # Validate authentication
-    if settings.ENV == "production" and not validate_telegram_webapp_data(x_telegram_init_data or ""):
-        raise HTTPException(status_code=403, detail="Invalid Telegram authentication")
-    
     # Parse user ID and chat ID from init data
     try:
-        parsed = dict(parse_qsl(x_telegram_init_data or ""))
-        import json
-        user_data = json.loads(parsed.get('user', '{}'))
-        user_id = user_data.get('id')
+        user_id = init_data.user_id
         
         if not user_id:
             raise HTTPException(status_code=400, detail="User ID not found")
@@ -662,7 +588,6 @@ async def select_scenario(
     
     # Import necessary functions
     from uuid import UUID
-    import asyncio
     
     try:
         persona_uuid = UUID(request.persona_id)
@@ -693,7 +618,7 @@ async def select_scenario(
         raise HTTPException(status_code=404, detail="Persona not found")
     
     # Return immediately and process in background
-    asyncio.create_task(_process_scenario_selection(
+    background_tasks.spawn(_process_scenario_selection(
         user_id=user_id,
         persona_uuid=persona_uuid,
         history_uuid=history_uuid,
@@ -1133,7 +1058,7 @@ async def _process_scenario_selection(
                 print(f"[MINIAPP-SELECT] 📋 Created AI-generated image job {job_id}")
                 
                 # Step 4: Save initial state to chat
-                crud.update_chat_state(db, chat_id, {"state": initial_state})
+                crud.update_chat_state(db, chat_id, initial_state.to_snapshot())
                 print(f"[MINIAPP-SELECT] ✅ Saved initial state to chat")
         
         # Dispatch image generation for custom characters immediately
@@ -1205,7 +1130,7 @@ async def _process_scenario_selection(
 @router.post("/create-invoice")
 async def create_invoice(
     request: CreateInvoiceRequest,
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> Dict[str, Any]:
     """
     Create a Telegram Stars invoice for token package or tier subscription
@@ -1216,16 +1141,11 @@ async def create_invoice(
     Returns: {invoice_link: str} OR {success: bool, simulated: bool, ...}
     """
     print(f"[INVOICE-API] 📥 Received create-invoice request: product_id={request.product_id}")
-    print(f"[INVOICE-API] 📥 Init data present: {bool(x_telegram_init_data)}, length: {len(x_telegram_init_data) if x_telegram_init_data else 0}")
+    print(f"[INVOICE-API] 📥 Init data present: {bool(init_data.raw)}, length: {len(init_data.raw) if init_data.raw else 0}")
     print(f"[INVOICE-API] 📥 ENV: {settings.ENV}, SIMULATE_PAYMENTS: {settings.SIMULATE_PAYMENTS}")
     
-    # Validate authentication (skip in development with simulated payments)
-    if settings.ENV == "production" and not validate_telegram_webapp_data(x_telegram_init_data or ""):
-        print(f"[INVOICE-API] ❌ Invalid Telegram authentication")
-        raise HTTPException(status_code=403, detail="Invalid Telegram authentication")
-    
     # Extract user ID from init data
-    user_id = extract_user_id_from_init_data(x_telegram_init_data)
+    user_id = init_data.user_id
     
     if not user_id:
         # In development with simulated payments, allow a test user ID
@@ -1234,7 +1154,7 @@ async def create_invoice(
             user_id = 549861060  # Test user from FOLLOWUP_TEST_USERS
         else:
             print(f"[INVOICE-API] ❌ Failed to extract user ID from init data")
-            print(f"[INVOICE-API] ❌ Init data: {x_telegram_init_data[:100] if x_telegram_init_data else 'None'}...")
+            print(f"[INVOICE-API] ❌ Init data: {init_data.raw[:100] if init_data.raw else 'None'}...")
             raise HTTPException(status_code=400, detail="Failed to extract user ID from init data. Please try reopening the app.")
     
     print(f"[INVOICE-API] ✅ User ID extracted: {user_id}")
@@ -1268,6 +1188,7 @@ async def create_invoice(
             )
             
             if result["success"]:
+                invalidate_user_context(user_id)
                 print(f"[SIMULATED-PAYMENT] ✅ Simulated payment successful for user {user_id}")
                 return {
                     "success": True,
@@ -1324,7 +1245,7 @@ async def create_invoice(
 
 @router.post("/claim-daily-bonus")
 async def claim_daily_bonus(
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> Dict[str, Any]:
     """
     Claim daily bonus (10 tokens)
@@ -1332,15 +1253,12 @@ async def claim_daily_bonus(
     Returns: {success: bool, tokens: int, message: str}
     """
     # Validate and extract user ID from init data
-    if not x_telegram_init_data:
+    if not init_data.raw:
         raise HTTPException(status_code=400, detail="No init data provided")
     
     try:
         # Parse init data to get user ID
-        parsed = dict(parse_qsl(x_telegram_init_data))
-        import json
-        user_data = json.loads(parsed.get('user', '{}'))
-        user_id = user_data.get('id')
+        user_id = init_data.user_id
         
         if not user_id:
             raise HTTPException(status_code=400, detail="User ID not found in init data")
@@ -1349,6 +1267,7 @@ async def claim_daily_bonus(
             result = crud.claim_daily_bonus(db, user_id)
             
             if result["success"]:
+                invalidate_user_context(user_id)
                 # Track the claim
                 from app.core import analytics_service_tg
                 analytics_service_tg.track_daily_bonus_claimed(user_id, 10)
@@ -1364,7 +1283,7 @@ async def claim_daily_bonus(
 
 @router.get("/can-claim-daily-bonus")
 async def can_claim_daily_bonus_endpoint(
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> Dict[str, Any]:
     """
     Check if user can claim daily bonus
@@ -1372,15 +1291,12 @@ async def can_claim_daily_bonus_endpoint(
     Returns: {can_claim: bool, next_claim_seconds: int}
     """
     # Validate and extract user ID from init data
-    if not x_telegram_init_data:
+    if not init_data.raw:
         return {"can_claim": False, "next_claim_seconds": 86400}
     
     try:
         # Parse init data to get user ID
-        parsed = dict(parse_qsl(x_telegram_init_data))
-        import json
-        user_data = json.loads(parsed.get('user', '{}'))
-        user_id = user_data.get('id')
+        user_id = init_data.user_id
         
         if not user_id:
             raise HTTPException(status_code=400, detail="User ID not found in init data")
@@ -1402,7 +1318,7 @@ class TrackEventRequest(BaseModel):
 @router.post("/track-event")
 async def track_event(
     request: TrackEventRequest,
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> Dict[str, Any]:
     """
     Track analytics event from mini app
@@ -1410,15 +1326,12 @@ async def track_event(
     Returns: {success: bool}
     """
     # Validate and extract user ID from init data
-    if not x_telegram_init_data:
+    if not init_data.raw:
         raise HTTPException(status_code=400, detail="No init data provided")
     
     try:
         # Parse init data to get user ID
-        parsed = dict(parse_qsl(x_telegram_init_data))
-        import json
-        user_data = json.loads(parsed.get('user', '{}'))
-        user_id = user_data.get('id')
+        user_id = init_data.user_id
         
         if not user_id:
             raise HTTPException(status_code=400, detail="User ID not found in init data")
@@ -1460,7 +1373,7 @@ async def track_event(
 
 @router.get("/user/referrals")
 async def get_user_referrals(
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> Dict[str, Any]:
     """
     Get user's referral statistics
@@ -1470,15 +1383,12 @@ async def get_user_referrals(
         bot_username: str
     }
     """
-    if not x_telegram_init_data:
+    if not init_data.raw:
         raise HTTPException(status_code=401, detail="Telegram init data required")
     
     try:
         # Parse init data to get user ID
-        parsed = dict(parse_qsl(x_telegram_init_data))
-        import json
-        user_data = json.loads(parsed.get('user', '{}'))
-        user_id = user_data.get('id')
+        user_id = init_data.user_id
         
         if not user_id:
             raise HTTPException(status_code=400, detail="User ID not found in init data")
@@ -1534,19 +1444,15 @@ class CreateCustomStoryRequest(BaseModel):
 @router.post("/generate-stories")
 async def generate_stories(
     request: GenerateStoriesRequest,
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> Dict[str, Any]:
     """
     Generate 3 AI story scenarios for a custom character (free, no token cost)
     
     Returns: {success: bool, stories: List[Dict], error: str}
     """
-    # Validate authentication
-    if settings.ENV == "production" and not validate_telegram_webapp_data(x_telegram_init_data or ""):
-        raise HTTPException(status_code=403, detail="Invalid Telegram authentication")
-    
     # Extract user_id
-    user_id = extract_user_id_from_init_data(x_telegram_init_data)
+    user_id = init_data.user_id
     if not user_id:
         raise HTTPException(status_code=400, detail="User ID not found")
     
@@ -1587,7 +1493,7 @@ async def generate_stories(
 @router.post("/create-character")
 async def create_character(
     request: CreateCharacterRequest,
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> Dict[str, Any]:
     """
     Create a custom character
@@ -1596,12 +1502,8 @@ async def create_character(
     
     Returns: {success: bool, persona_id: str, message: str, error: str}
     """
-    # Validate authentication
-    if settings.ENV == "production" and not validate_telegram_webapp_data(x_telegram_init_data or ""):
-        raise HTTPException(status_code=403, detail="Invalid Telegram authentication")
-    
     # Extract user_id
-    user_id = extract_user_id_from_init_data(x_telegram_init_data)
+    user_id = init_data.user_id
     if not user_id:
         raise HTTPException(status_code=400, detail="User ID not found")
     
@@ -1768,7 +1670,7 @@ async def create_character(
             
             # Check image cache before generating - find a cached image the user hasn't seen
             prompt_hash = crud.compute_prompt_hash(first_image_prompt)
-            cached_image = crud.find_cached_image(db, prompt_hash, user_id)
+            cached_image = await shown_images.find_unseen_cached_image(db, prompt_hash, user_id)
             
             if cached_image and cached_image.result_url:
                 # Cache hit! Use cached image as avatar
@@ -1779,8 +1681,8 @@ async def create_character(
                 crud.update_persona(db, persona.id, avatar_url=cached_image.result_url)
                 
                 # Mark image as shown to this user and increment cache serve count
-                crud.mark_image_shown(db, user_id, cached_image.id)
-                crud.increment_cache_serve_count(db, cached_image.id)
+                await shown_images.mark_image_shown(user_id, cached_image.id)
+                await shown_images.record_cache_serve(cached_image.id)
                 
                 # Track cache hit analytics
                 from app.core import analytics_service_tg
@@ -1862,19 +1764,15 @@ async def create_character(
 @router.delete("/characters/{persona_id}")
 async def delete_character(
     persona_id: str,
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> Dict[str, Any]:
     """
     Delete a custom character (only owner can delete)
     
     Returns: {success: bool, message: str}
     """
-    # Validate authentication
-    if settings.ENV == "production" and not validate_telegram_webapp_data(x_telegram_init_data or ""):
-        raise HTTPException(status_code=403, detail="Invalid Telegram authentication")
-    
     # Extract user_id
-    user_id = extract_user_id_from_init_data(x_telegram_init_data)
+    user_id = init_data.user_id
     if not user_id:
         raise HTTPException(status_code=400, detail="User ID not found")
     
@@ -1915,7 +1813,7 @@ async def delete_character(
 @router.post("/create-custom-story")
 async def create_custom_story(
     request: CreateCustomStoryRequest,
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> Dict[str, Any]:
     """
     Create a custom story for a custom character
@@ -1926,12 +1824,8 @@ async def create_custom_story(
     
     Returns: {success: bool, history_id: str, message: str}
     """
-    # Validate authentication
-    if settings.ENV == "production" and not validate_telegram_webapp_data(x_telegram_init_data or ""):
-        raise HTTPException(status_code=403, detail="Invalid Telegram authentication")
-    
     # Extract user_id
-    user_id = extract_user_id_from_init_data(x_telegram_init_data)
+    user_id = init_data.user_id
     if not user_id:
         raise HTTPException(status_code=400, detail="User ID not found")
     
@@ -2016,7 +1910,7 @@ class PurchaseRequest(BaseModel):
 
 @router.get("/shop/items")
 async def get_shop_items(
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> List[Dict[str, Any]]:
     """
     Get all available shop items
@@ -2024,27 +1918,19 @@ async def get_shop_items(
     key, name_en/name_ru, subtitle_en/subtitle_ru, icon fields, optional image_path,
     plus price/mood/category.
     """
-    if not settings.SKIP_MINIAPP_AUTH:
-        if settings.ENV == "production" and not validate_telegram_webapp_data(x_telegram_init_data or ""):
-            raise HTTPException(status_code=403, detail="Invalid Telegram authentication")
-    
     return crud.get_shop_items()
 
 
 @router.post("/shop/purchase")
 async def purchase_item(
     request: PurchaseRequest,
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> Dict[str, Any]:
     """
     Purchase a shop item for a specific chat
     Deducts tokens, boosts mood, creates purchase record
     """
-    if not settings.SKIP_MINIAPP_AUTH:
-        if settings.ENV == "production" and not validate_telegram_webapp_data(x_telegram_init_data or ""):
-            raise HTTPException(status_code=403, detail="Invalid Telegram authentication")
-    
-    user_id = extract_user_id_from_init_data(x_telegram_init_data)
+    user_id = init_data.user_id
     if not user_id:
         raise HTTPException(status_code=400, detail="User ID not found")
     
@@ -2059,6 +1945,7 @@ async def purchase_item(
         
         if not result["success"]:
             raise HTTPException(status_code=400, detail=result["message"])
+        invalidate_user_context(user_id)
         
         # Get tg_chat_id and item info to trigger background gift reaction
         from app.db.models import Chat
@@ -2070,9 +1957,8 @@ async def purchase_item(
             from app.db.crud import SHOP_ITEMS
             item_info = SHOP_ITEMS.get(request.item_key, {})
             
-            import asyncio
             from app.core.multi_brain_pipeline import process_gift_purchase
-            asyncio.create_task(process_gift_purchase(
+            background_tasks.spawn(process_gift_purchase(
                 chat_id=chat_uuid,
                 user_id=user_id,
                 tg_chat_id=tg_chat_id,
@@ -2089,16 +1975,12 @@ async def purchase_item(
 @router.get("/shop/purchases/{chat_id}")
 async def get_chat_purchases(
     chat_id: str,
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> List[Dict[str, Any]]:
     """
     Get all purchases for a specific chat
     Used for context in image generation
     """
-    if not settings.SKIP_MINIAPP_AUTH:
-        if settings.ENV == "production" and not validate_telegram_webapp_data(x_telegram_init_data or ""):
-            raise HTTPException(status_code=403, detail="Invalid Telegram authentication")
-    
     try:
         from uuid import UUID
         chat_uuid = UUID(chat_id)
@@ -2112,16 +1994,12 @@ async def get_chat_purchases(
 @router.get("/chat/{chat_id}/mood")
 async def get_chat_mood(
     chat_id: str,
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> Dict[str, Any]:
     """
     Get mood info for a specific chat
     Returns: {mood: int, coldness_streak: int}
     """
-    if not settings.SKIP_MINIAPP_AUTH:
-        if settings.ENV == "production" and not validate_telegram_webapp_data(x_telegram_init_data or ""):
-            raise HTTPException(status_code=403, detail="Invalid Telegram authentication")
-    
     try:
         from uuid import UUID
         chat_uuid = UUID(chat_id)
@@ -2134,17 +2012,13 @@ async def get_chat_mood(
 
 @router.get("/bonus-calendar")
 async def get_bonus_calendar(
-    x_telegram_init_data: Optional[str] = Header(None)
+    init_data: InitData = Depends(miniapp_init_data)
 ) -> Dict[str, Any]:
     """
     Get bonus calendar data for display
     Returns: {calendar: list, current_day: int, can_claim: bool, next_bonus_in_seconds: int}
     """
-    if not settings.SKIP_MINIAPP_AUTH:
-        if settings.ENV == "production" and not validate_telegram_webapp_data(x_telegram_init_data or ""):
-            raise HTTPException(status_code=403, detail="Invalid Telegram authentication")
-    
-    user_id = extract_user_id_from_init_data(x_telegram_init_data)
+    user_id = init_data.user_id
     if not user_id:
         return {
             "calendar": crud.get_bonus_calendar(),
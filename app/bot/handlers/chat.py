@@ -17,6 +17,7 @@ from app.core.constants import ERROR_MESSAGES
 from app.core.logging_utils import log_verbose, log_always
 from app.core import redis_queue
 from app.core import analytics_service_tg
+from app.core import background_tasks
 from app.bot.keyboards.inline import build_no_active_chat_keyboard
 
 
@@ -282,8 +283,7 @@ async def handle_text_message(message: types.Message, state: FSMContext):
     # Start processing in background (don't await - return webhook immediately)
     log_always(f"[CHAT] 🚀 Starting background processing")
     
-    import asyncio
-    asyncio.create_task(_background_process(
+    background_tasks.spawn(_background_process(
         chat_id=chat_id,
         user_id=user_id,
         tg_chat_id=tg_chat_id,
@@ -18,6 +18,7 @@ from app.core.pipeline_adapter import build_image_prompts
 from app.core.img_runpod import submit_image_job
 from app.core.constants import ERROR_MESSAGES
 from app.core import analytics_service_tg
+from app.core import shown_images
 from app.core.persona_cache import get_persona_by_id, get_persona_field
 from app.core.logging_utils import log_always
 import random
@@ -61,6 +62,14 @@ async def image_prompt_callback(callback: types.CallbackQuery):
     await generate_image_for_user(callback.message, callback.from_user.id, user_prompt)
 
 
+def _refund_reserved_energy(user_id: int, amount: int):
+    """Give back energy reserved for an image that won't be generated (no job was created)"""
+    if amount:
+        with get_db() as db:
+            crud.refund_user_energy(db, user_id, amount)
+        print(f"[IMAGE] ↩️ Refunded {amount} energy to user {user_id}")
+
+
 async def generate_image_for_user(message: types.Message, user_id: int, user_prompt: str):
     """Generate image for user with given prompt"""
     config = get_app_config()
@@ -69,7 +78,9 @@ async def generate_image_for_user(message: types.Message, user_id: int, user_pro
     with get_db() as db:
         is_premium = crud.check_user_premium(db, user_id)["is_premium"]
     
-    # Free users pay 3 energy for images, premium users don't
+    # Free users pay 3 energy for images, premium users don't.
+    # The energy is reserved here and refunded if no image comes of it.
+    energy_reserved = 0
     if not is_premium:
         with get_db() as db:
             if not crud.check_user_energy(db, user_id, required=3):
@@ -80,6 +91,7 @@ async def generate_image_for_user(message: types.Message, user_id: int, user_pro
             if not crud.deduct_user_energy(db, user_id, amount=3):
                 await message.answer(ERROR_MESSAGES["insufficient_energy"])
                 return
+        energy_reserved = 3
         print(f"[IMAGE] 🖼️ Generating image for free user {user_id} (3 energy deducted)")
     else:
         print(f"[IMAGE] 🖼️ Generating image for premium user {user_id} (no energy cost)")
@@ -93,6 +105,7 @@ async def generate_image_for_user(message: types.Message, user_id: int, user_pro
     )
     
     if not allowed:
+        _refund_reserved_energy(user_id, energy_reserved)
         await message.answer(ERROR_MESSAGES["rate_limit_image"])
         return
     
@@ -103,25 +116,10 @@ async def generate_image_for_user(message: types.Message, user_id: int, user_pro
         current_count = await redis_queue.get_user_image_count(user_id)
         if current_count >= settings.CONCURRENT_IMAGE_LIMIT_NUMBER:
             print(f"[IMAGE] ⏭️  User {user_id} has reached concurrent image limit ({current_count}/{settings.CONCURRENT_IMAGE_LIMIT_NUMBER}) - skipping")
+            _refund_reserved_energy(user_id, energy_reserved)
             return
     
     with get_db() as db:
-        is_premium_check = crud.check_user_premium(db, user_id)["is_premium"]
-        
-        # Free users pay 3 energy for images, premium users don't
-        if not is_premium_check:
-            if not crud.check_user_energy(db, user_id, required=3):
-                await message.answer(ERROR_MESSAGES["insufficient_energy"])
-                return
-            
-            # Deduct energy for free users
-            if not crud.deduct_user_energy(db, user_id, amount=3):
-                await message.answer(ERROR_MESSAGES["insufficient_energy"])
-                return
-            print(f"[IMAGE] 🖼️ Generating image for free user {user_id} (3 energy deducted)")
-        else:
-            print(f"[IMAGE] 🖼️ Generating image for premium user {user_id} (no energy cost)")
-        
         # Get user's global message count for priority determination
         user = db.query(User).filter(User.id == user_id).first()
         global_message_count = user.global_message_count if user else 999
@@ -130,12 +128,14 @@ async def generate_image_for_user(message: types.Message, user_id: int, user_pro
         chat = crud.get_active_chat(db, message.chat.id, user_id)
         
         if not chat:
+            _refund_reserved_energy(user_id, energy_reserved)
             await message.answer(ERROR_MESSAGES["no_persona"])
             return
         
         # Get persona
         persona = crud.get_persona_by_id(db, chat.persona_id)
         if not persona:
+            _refund_reserved_energy(user_id, energy_reserved)
             await message.answer(ERROR_MESSAGES["persona_not_found"])
             return
         
@@ -154,7 +154,9 @@ async def generate_image_for_user(message: types.Message, user_id: int, user_pro
         
         # Check image cache before generating
         prompt_hash = crud.compute_prompt_hash(positive_prompt)
-        cached_image = crud.find_cached_image(db, prompt_hash, user_id)
+        cached_image = await shown_images.find_unseen_cached_image(
+            db, prompt_hash, user_id, prompt=positive_prompt, persona_id=persona.id
+        )
         
         if cached_image and cached_image.result_url:
             print(f"[IMAGE] ✅ CACHE HIT! Found cached image {cached_image.id}")
@@ -194,8 +196,8 @@ async def generate_image_for_user(message: types.Message, user_id: int, user_pro
                     db.commit()
                 
                 # Mark image as shown to this user and increment cache serve count
-                crud.mark_image_shown(db, user_id, cached_image.id)
-                crud.increment_cache_serve_count(db, cached_image.id)
+                await shown_images.mark_image_shown(user_id, cached_image.id)
+                await shown_images.record_cache_serve(cached_image.id)
                 
                 # Track analytics
                 from app.core import analytics_service_tg
@@ -222,7 +224,8 @@ async def generate_image_for_user(message: types.Message, user_id: int, user_pro
             prompt=positive_prompt,
             negative_prompt=negative_prompt,
             chat_id=chat.id,
-            ext={"seed": seed, "user_prompt": user_prompt}
+            ext={"seed": seed, "user_prompt": user_prompt},
+            energy_reserved=energy_reserved
         )
         
         job_id = job.id
@@ -367,11 +370,12 @@ async def show_energy_upsell_message(message: types.Message = None, user_id: int
         crud.save_energy_upsell_message(db, user_id, sent_msg.message_id, chat_id)
 
 
-async def generate_image_for_refresh(user_id: int, original_job_id: str, tg_chat_id: int):
+async def generate_image_for_refresh(user_id: int, original_job_id: str, tg_chat_id: int, energy_reserved: int = 0):
     """Generate image for refresh - costs 3 energy for free users, 0 for premium
     
     Reuses the EXACT same prompts from the original job, only changes the seed.
     Increments refresh_count in the new job's ext.
+    energy_reserved: energy the caller already deducted; refunded if no image is generated.
     """
     config = get_app_config()
     
@@ -384,6 +388,7 @@ async def generate_image_for_refresh(user_id: int, original_job_id: str, tg_chat
     )
     
     if not allowed:
+        _refund_reserved_energy(user_id, energy_reserved)
         # Send error message directly instead of editing
         await bot.send_message(tg_chat_id, ERROR_MESSAGES["rate_limit_image"])
         return
@@ -395,6 +400,7 @@ async def generate_image_for_refresh(user_id: int, original_job_id: str, tg_chat
         current_count = await redis_queue.get_user_image_count(user_id)
         if current_count >= settings.CONCURRENT_IMAGE_LIMIT_NUMBER:
             print(f"[REFRESH-IMAGE] ⏭️  User {user_id} has reached concurrent image limit ({current_count}/{settings.CONCURRENT_IMAGE_LIMIT_NUMBER}) - skipping")
+            _refund_reserved_energy(user_id, energy_reserved)
             return
     
     # Check if user is premium for priority determination
@@ -408,6 +414,7 @@ async def generate_image_for_refresh(user_id: int, original_job_id: str, tg_chat
         # Get original job to reuse its prompts
         original_job = crud.get_image_job(db, original_job_id)
         if not original_job:
+            _refund_reserved_energy(user_id, energy_reserved)
             await bot.send_message(tg_chat_id, ERROR_MESSAGES["image_failed"])
             return
         
@@ -415,6 +422,7 @@ async def generate_image_for_refresh(user_id: int, original_job_id: str, tg_chat
         persona = crud.get_persona_by_id(db, original_job.persona_id)
         
         if not persona:
+            _refund_reserved_energy(user_id, energy_reserved)
             await bot.send_message(tg_chat_id, ERROR_MESSAGES["persona_not_found"])
             return
         
@@ -455,7 +463,8 @@ async def generate_image_for_refresh(user_id: int, original_job_id: str, tg_chat
             prompt=positive_prompt,
             negative_prompt=negative_prompt,
             chat_id=original_job.chat_id,
-            ext=new_ext
+            ext=new_ext,
+            energy_reserved=energy_reserved
         )
         
         job_id = job.id
@@ -639,6 +648,7 @@ async def refresh_image_callback(callback: types.CallbackQuery):
         is_premium = crud.check_user_premium(db, user_id)["is_premium"]
         
         # Free users pay 3 energy for refresh, premium users don't
+        energy_reserved = 0
         if not is_premium:
             if not crud.check_user_energy(db, user_id, required=3):
                 await callback.answer("❌ Insufficient energy", show_alert=True)
@@ -648,6 +658,7 @@ async def refresh_image_callback(callback: types.CallbackQuery):
             if not crud.deduct_user_energy(db, user_id, amount=3):
                 await callback.answer("❌ Failed to deduct energy", show_alert=True)
                 return
+            energy_reserved = 3
             print(f"[REFRESH-IMAGE] 🔄 Refreshing for free user {user_id} (3 energy deducted)")
         else:
             print(f"[REFRESH-IMAGE] 🔄 Refreshing for premium user {user_id} (no energy cost)")
@@ -690,7 +701,7 @@ async def refresh_image_callback(callback: types.CallbackQuery):
     # Image refreshes until max limit, then text-only fallback.
     if refresh_count < max_image_refreshes:
         # Generate new image with EXACT same prompts from original job (only seed changes)
-        await generate_image_for_refresh(user_id, job_id_str, callback.message.chat.id)
+        await generate_image_for_refresh(user_id, job_id_str, callback.message.chat.id, energy_reserved=energy_reserved)
     else:
         # Send text-only response
         await generate_text_only_refresh(user_id, job_id_str, callback.message.chat.id)
@@ -867,6 +878,7 @@ async def generate_image_with_prompt(message: types.Message, user_id: int, perso
         is_premium = crud.check_user_premium(db, user_id)["is_premium"]
         
         # Free users pay 3 energy for images, premium users don't
+        energy_reserved = 0
         if not is_premium:
             if not crud.check_user_energy(db, user_id, required=3):
                 await message.answer(ERROR_MESSAGES["insufficient_energy"])
@@ -876,6 +888,7 @@ async def generate_image_with_prompt(message: types.Message, user_id: int, perso
             if not crud.deduct_user_energy(db, user_id, amount=3):
                 await message.answer(ERROR_MESSAGES["insufficient_energy"])
                 return
+            energy_reserved = 3
             print(f"[IMAGE] 🖼️ Generating image for free user {user_id} (3 energy deducted)")
         else:
             print(f"[IMAGE] 🖼️ Generating image for premium user {user_id} (no energy cost)")
@@ -889,6 +902,7 @@ async def generate_image_with_prompt(message: types.Message, user_id: int, perso
     )
     
     if not allowed:
+        _refund_reserved_energy(user_id, energy_reserved)
         await message.answer(ERROR_MESSAGES["rate_limit_image"])
         return
     
@@ -899,11 +913,13 @@ async def generate_image_with_prompt(message: types.Message, user_id: int, perso
         current_count = await redis_queue.get_user_image_count(user_id)
         if current_count >= settings.CONCURRENT_IMAGE_LIMIT_NUMBER:
             print(f"[IMAGE] ⏭️  User {user_id} has reached concurrent image limit ({current_count}/{settings.CONCURRENT_IMAGE_LIMIT_NUMBER}) - skipping")
+            _refund_reserved_energy(user_id, energy_reserved)
             return
     
     # Get persona from cache
     persona = get_persona_by_id(persona_id)
     if not persona:
+        _refund_reserved_energy(user_id, energy_reserved)
         await message.answer(get_ui_text("errors.persona_not_found", language=user_language))
         return
     
@@ -965,7 +981,9 @@ async def generate_image_with_prompt(message: types.Message, user_id: int, perso
         
         # Check image cache before generating
         prompt_hash = crud.compute_prompt_hash(positive_prompt)
-        cached_image = crud.find_cached_image(db, prompt_hash, user_id)
+        cached_image = await shown_images.find_unseen_cached_image(
+            db, prompt_hash, user_id, prompt=positive_prompt, persona_id=persona_id
+        )
         
         if cached_image and cached_image.result_url:
             print(f"[IMAGE] ✅ CACHE HIT! Found cached image {cached_image.id}")
@@ -991,8 +1009,8 @@ async def generate_image_with_prompt(message: types.Message, user_id: int, perso
                 )
                 
                 # Mark image as shown to this user and increment cache serve count
-                crud.mark_image_shown(db, user_id, cached_image.id)
-                crud.increment_cache_serve_count(db, cached_image.id)
+                await shown_images.mark_image_shown(user_id, cached_image.id)
+                await shown_images.record_cache_serve(cached_image.id)
                 
                 # Track analytics
                 from app.core import analytics_service_tg
@@ -1027,7 +1045,8 @@ async def generate_image_with_prompt(message: types.Message, user_id: int, perso
             prompt=positive_prompt,
             negative_prompt=negative_prompt,
             chat_id=None,  # No chat needed
-            ext=job_ext
+            ext=job_ext,
+            energy_reserved=energy_reserved
         )
         
         job_id = job.id
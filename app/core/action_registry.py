@@ -1,14 +1,27 @@
 """
 Global registry for managing chat actions across different execution contexts
 Used to coordinate actions between background tasks and webhook callbacks
+
+Managers live in the worker that started them. In multi-worker mode the
+webhook that should stop one (e.g. the image callback) may be served by
+another worker; that worker publishes the chat id on the action stop
+channel and the owning worker stops its manager.
 """
 from typing import Dict
 from app.core.chat_actions import ChatActionManager
+from app.core import background_tasks, cache_bus, redis_queue, workers
+from app.core.logging_utils import log_always, log_verbose
 
 
 # Global registry: tg_chat_id -> ChatActionManager
 _action_managers: Dict[int, ChatActionManager] = {}
 
+_STATS: Dict[str, int] = {
+    "remote_stops_sent": 0,
+    "remote_stops_handled": 0,
+    "publish_errors": 0,
+}
+
 
 def register_action_manager(tg_chat_id: int, manager: ChatActionManager) -> None:
     """Register an action manager for a chat"""
@@ -16,18 +29,54 @@ def register_action_manager(tg_chat_id: int, manager: ChatActionManager) -> None
 
 
 def get_action_manager(tg_chat_id: int) -> ChatActionManager | None:
-    """Get action manager for a chat"""
+    """Get action manager for a chat (this worker's only)"""
     return _action_managers.get(tg_chat_id)
 
 
 async def stop_and_remove_action(tg_chat_id: int) -> None:
-    """Stop action and remove from registry"""
+    """Stop action and remove from registry (forwarded to the other workers if it isn't ours)"""
     manager = _action_managers.pop(tg_chat_id, None)
     if manager:
         await manager.stop()
+    elif workers.is_multi_worker():
+        await _publish_stop(tg_chat_id)
 
 
 def has_active_action(tg_chat_id: int) -> bool:
-    """Check if chat has an active action manager"""
+    """Check if chat has an active action manager in this worker"""
     return tg_chat_id in _action_managers
 
+
+async def _publish_stop(tg_chat_id: int) -> None:
+    try:
+        redis = await redis_queue.get_redis()
+        await redis.publish(workers.get_workers_config()["action_stop_channel"], str(tg_chat_id))
+        _STATS["remote_stops_sent"] += 1
+    except Exception as e:
+        # The indicator then runs until the owning worker's pipeline stops it
+        _STATS["publish_errors"] += 1
+        log_always(f"[ACTIONS] ⚠️ Failed to forward action stop for chat {tg_chat_id}: {e}")
+
+
+def handle_stop_message(data: str) -> None:
+    """Stop this worker's manager for a chat another worker asked to stop"""
+    try:
+        tg_chat_id = int(data)
+    except (TypeError, ValueError):
+        return
+    manager = _action_managers.pop(tg_chat_id, None)
+    if manager:
+        _STATS["remote_stops_handled"] += 1
+        log_verbose(f"[ACTIONS] 🛑 Stopping action for chat {tg_chat_id} (requested by another worker)")
+        background_tasks.spawn(manager.stop(), name=f"action-stop-{tg_chat_id}")
+
+
+def listen_for_remote_stops() -> None:
+    """Subscribe to stop requests from other workers (call at startup, before cache_bus.start)"""
+    if workers.is_multi_worker():
+        cache_bus.add_channel(workers.get_workers_config()["action_stop_channel"], handle_stop_message)
+
+
+def get_stats() -> Dict[str, int]:
+    """Get action manager counts for this worker"""
+    return {**_STATS, "active": len(_action_managers)}
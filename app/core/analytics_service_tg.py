@@ -1,14 +1,14 @@
 """
 Analytics Service for Telegram Bot
 Tracks all user interactions in a non-blocking way
-All tracking functions use asyncio.create_task() to avoid blocking main bot operations
+All tracking functions use background_tasks.spawn() to avoid blocking main bot operations
 """
-import asyncio
 from typing import Optional
 from uuid import UUID
 from app.db.base import get_db
 from app.db import crud
 from app.core.cloudflare_upload import upload_to_cloudflare_tg
+from app.core import background_tasks
 
 
 async def _track_event_impl(
@@ -55,7 +55,7 @@ def track_event_tg(
     
     This function immediately returns and processes the event in the background
     """
-    asyncio.create_task(_track_event_impl(client_id, event_name, **kwargs))
+    background_tasks.spawn(_track_event_impl(client_id, event_name, **kwargs))
 
 
 # ========== EVENT TRACKING FUNCTIONS ==========
@@ -200,7 +200,7 @@ def track_image_generated(
     import random
     filename = f"tg_image_{client_id}_{random.randint(1000, 9999)}.png"
     
-    asyncio.create_task(
+    background_tasks.spawn(
         _upload_and_track_image(
             client_id=client_id,
             event_name="image_generated",
@@ -0,0 +1,85 @@
+"""
+Tracked fire-and-forget tasks
+
+Webhook handlers hand long work (the batch pipeline, image uploads, gift and
+scenario processing, analytics) to a background task and return right away.
+A bare asyncio.create_task is only weakly referenced by the event loop and is
+dropped without a trace when the worker stops. spawn() keeps a reference
+until the task is done and logs it if it fails; drain() gives running tasks
+time to finish on shutdown, so a worker that is restarted or scaled down
+doesn't cut a reply off halfway.
+
+Tasks belong to the worker that spawned them; nothing here is shared
+between workers.
+"""
+import asyncio
+from typing import Any, Coroutine, Dict, Optional, Set
+
+from app.core.logging_utils import log_always
+
+
+_TASKS: Set[asyncio.Task] = set()
+
+_STATS: Dict[str, int] = {
+    "spawned": 0,
+    "completed": 0,
+    "failed": 0,
+    "cancelled": 0,
+}
+
+
+def spawn(coro: Coroutine[Any, Any, Any], name: Optional[str] = None) -> asyncio.Task:
+    """Run coro in the background, tracked until it finishes (must be called from the event loop)"""
+    task = asyncio.create_task(coro, name=name)
+    _TASKS.add(task)
+    _STATS["spawned"] += 1
+    task.add_done_callback(_on_done)
+    return task
+
+
+def _on_done(task: asyncio.Task):
+    _TASKS.discard(task)
+    if task.cancelled():
+        _STATS["cancelled"] += 1
+        return
+    error = task.exception()
+    if error is None:
+        _STATS["completed"] += 1
+        return
+    _STATS["failed"] += 1
+    log_always(f"[BACKGROUND] ❌ Task {task.get_name()} failed: {error!r}")
+
+
+async def drain(timeout: float) -> int:
+    """
+    Wait for background tasks (and any they spawn) on shutdown.
+
+    Args:
+        timeout: Seconds to wait in total; tasks still running after that are cancelled
+
+    Returns:
+        Number of tasks that had to be cancelled
+    """
+    if not _TASKS:
+        return 0
+    log_always(f"[BACKGROUND] ⏳ Waiting up to {timeout:.0f}s for {len(_TASKS)} background task(s)")
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while _TASKS:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        await asyncio.wait(set(_TASKS), timeout=remaining)
+
+    pending = list(_TASKS)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    if pending:
+        log_always(f"[BACKGROUND] ⚠️ Cancelled {len(pending)} background task(s) still running at shutdown")
+    return len(pending)
+
+
+def get_stats() -> Dict[str, int]:
+    """Get background task counters for this process"""
+    return {**_STATS, "running": len(_TASKS)}
@@ -8,6 +8,9 @@ from difflib import SequenceMatcher
 from typing import List, Dict, Optional, Tuple
 from app.core.prompt_service import PromptService
 from app.core.llm_openrouter import generate_text
+from app.core import model_router
+from app.core.context_packer import pack_context
+from app.core.prompt_templates import render_partial
 from app.settings import get_app_config
 from app.core.constants import DIALOGUE_SPECIALIST_MAX_RETRIES
 from app.core.logging_utils import log_messages_array, log_dev_request, log_dev_response, log_dev_context_breakdown, is_development
@@ -36,7 +39,9 @@ def _apply_template_replacements(
     # When no name is known, use generic references instead of Telegram's unreliable first_name
     name_for_prompt = user_name if user_name else "them"
     
-    replacements = {
+    # Persona fields are the same for every message of a persona: the prompt
+    # with these filled in is cached, only the per-request fields below vary
+    persona_fields = {
         "{{char.name}}": persona.get("name", "AI"),
         "{{char.physical_description}}": persona.get("prompt", ""),
         "{{scene.location}}": "[see state below]",
@@ -53,19 +58,17 @@ def _apply_template_replacements(
         "{{core.personality.prompts}}": "",
         "{{sexual.archetypes}}": "Balanced",
         "{{sexual.archetype.prompts}}": "",
+        "{{user.lang}}": "[detect from conversation]",
+    }
+    request_fields = {
         # User profile — use discovered chat name, or generic reference
         "{{user.name}}": name_for_prompt,
-        "{{user.lang}}": "[detect from conversation]",
         # Dynamic response length based on conversation progress
         "{{response.length_guidance}}": length_guidance,
         "{{response.length_task}}": length_task,
     }
     
-    result = template
-    for key, value in replacements.items():
-        result = result.replace(key, value)
-    
-    return result
+    return render_partial(template, persona_fields, request_fields)
 
 
 def _get_mood_description(mood: int) -> str:
@@ -228,17 +231,20 @@ async def generate_dialogue(
     Retries: 3 attempts with validation
     
     Context optimization:
-    - If context_summary is provided, uses summary + last 2 messages verbatim
-    - Otherwise falls back to full chat_history (up to MAX_CONTEXT_MESSAGES)
+    - History, summary and memory are packed into the "dialogue" token budget
+      (app.yaml context_budget), most recent messages first
     """
     config = get_app_config()
     
     # Select model based on context
+    dialogue_brain = "followup" if is_auto_followup else "dialogue"
     if is_auto_followup:
-        dialogue_model = config["llm"].get("followup_model", config["llm"]["model"])
+        dialogue_model = model_router.pick_model(
+            dialogue_brain, config["llm"].get("followup_model", config["llm"]["model"])
+        )
         print(f"[DIALOGUE] 🔄 Using followup model: {dialogue_model}")
     else:
-        dialogue_model = config["llm"]["model"]
+        dialogue_model = model_router.pick_model(dialogue_brain, config["llm"]["model"])
         print(f"[DIALOGUE] 💬 Using main dialogue model: {dialogue_model}")
     
     max_retries = DIALOGUE_SPECIALIST_MAX_RETRIES + 2 if is_auto_followup else DIALOGUE_SPECIALIST_MAX_RETRIES
@@ -254,13 +260,21 @@ async def generate_dialogue(
         user_name=user_name
     )
     
+    # Fit history, summary and memory into the dialogue token budget
+    packed = pack_context(
+        chat_history,
+        brain="dialogue",
+        summary=context_summary if len(chat_history) > 4 else None,
+        memory=memory,
+    )
+    
     # Add memory context if available
     memory_context = ""
-    if memory and memory.strip():
+    if packed["memory"]:
         memory_context = f"""
 
 # CONVERSATION MEMORY
-{memory}
+{packed["memory"]}
 
 Note: This memory contains important facts about the user and past interactions. Use these details naturally in your responses to show continuity and personalization.
 """
@@ -337,35 +351,34 @@ You are reaching out after a period of silence. Follow these rules:
     
     # Build conversation context block based on whether we have a summary
     conversation_context = ""
-    if context_summary and len(chat_history) > 4:
-        # Use summary + last 2 messages verbatim for efficiency
-        last_2_messages = chat_history[-2:] if len(chat_history) >= 2 else chat_history
+    packed_messages = packed["messages"]
+    if packed["summary"]:
+        # Summary + as many recent messages verbatim as the budget allows
         last_msgs_text = "\n".join([
             f"**{msg['role'].upper()}:** {msg['content']}"
-            for msg in last_2_messages
+            for msg in packed_messages
         ])
         conversation_context = f"""
 
 # CONVERSATION CONTEXT (SUMMARY OF LAST 20 MESSAGES)
-{context_summary}
+{packed["summary"]}
 
-# LAST 2 MESSAGES (VERBATIM - MOST IMPORTANT FOR CONTINUITY)
+# LAST {len(packed_messages)} MESSAGES (VERBATIM - MOST IMPORTANT FOR CONTINUITY)
 {last_msgs_text}
 """
-        print(f"[DIALOGUE] 📝 Using context summary ({len(context_summary)} chars) + last 2 messages verbatim")
-    elif chat_history:
+        print(f"[DIALOGUE] 📝 Using context summary ({len(packed['summary'])} chars) + last {len(packed_messages)} messages verbatim ({packed['tokens']} tokens)")
+    elif packed_messages:
         # Fallback: use recent history directly (for short conversations or no summary)
-        recent_count = min(6, len(chat_history))
         recent_msgs_text = "\n".join([
             f"**{msg['role'].upper()}:** {msg['content']}"
-            for msg in chat_history[-recent_count:]
+            for msg in packed_messages
         ])
         conversation_context = f"""
 
-# RECENT CONVERSATION ({recent_count} messages)
+# RECENT CONVERSATION ({len(packed_messages)} messages)
 {recent_msgs_text}
 """
-        print(f"[DIALOGUE] 📚 Using {recent_count} recent messages (no summary)")
+        print(f"[DIALOGUE] 📚 Using {len(packed_messages)} recent messages (no summary, {packed['tokens']} tokens)")
     
     # Build mood and gifts context
     mood_description = _get_mood_description(mood)
@@ -497,7 +510,8 @@ You don't know the user's name yet. Within the first few messages, naturally int
                 frequency_penalty=0.8,  # Increased to prevent repetition
                 presence_penalty=0.8,   # Increased to encourage new tokens
                 max_tokens=config["llm"].get("max_tokens", 512),
-                user_id=user_id
+                user_id=user_id,
+                brain=dialogue_brain
             )
             
             brain_duration_ms = (time.time() - brain_start) * 1000
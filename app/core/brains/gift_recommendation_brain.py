@@ -6,7 +6,9 @@ import random
 import re
 from typing import Any, Dict, List
 
+from app.core import prefilters
 from app.core.catalog.gifts import get_shop_items_map
+from app.core.conversation_state import ConversationState
 from app.core.llm_openrouter import generate_text
 from app.core.prompt_service import PromptService
 from app.settings import get_app_config
@@ -50,15 +52,6 @@ def _gift_config() -> Dict[str, Any]:
     return defaults
 
 
-def _parse_state_fields(state: str) -> Dict[str, str]:
-    fields: Dict[str, str] = {}
-    if not state:
-        return fields
-    for key, value in re.findall(r'(\w+)="(.*?)"', state):
-        fields[key] = value
-    return fields
-
-
 def _contains_any(text: str, markers: set[str]) -> bool:
     lower = (text or "").lower()
     return any(marker in lower for marker in markers)
@@ -69,15 +62,15 @@ def _normalize_language(language: str | None) -> str:
     return "ru" if code.startswith("ru") else "en"
 
 
-def classify_scene_mode(state: str, dialogue_response: str, user_message: str) -> str:
+def classify_scene_mode(state: ConversationState | str, dialogue_response: str, user_message: str) -> str:
     """Classify scene into normal/intimate/explicit from current turn + state."""
-    state_fields = _parse_state_fields(state)
+    state = ConversationState.coerce(state)
     combined = " ".join([
         user_message or "",
         dialogue_response or "",
-        state_fields.get("description", ""),
-        state_fields.get("location", ""),
-        state_fields.get("aiClothing", ""),
+        state.description or "",
+        state.location or "",
+        state.ai_clothing or "",
     ]).lower()
 
     if _contains_any(combined, REFUSAL_MARKERS):
@@ -111,7 +104,7 @@ def _ordered_pool(shop_items: Dict[str, Dict[str, Any]], keys: List[str]) -> Lis
 
 
 def decide_gift_recommendation(
-    state: str,
+    state: ConversationState | str,
     dialogue_response: str,
     user_message: str,
     chat_ext: Dict[str, Any] | None,
@@ -268,7 +261,7 @@ def _fallback_suggestion_text(scene_mode: str, language: str, item_key: str, ite
 
 
 async def generate_gift_recommendation(
-    state: str,
+    state: ConversationState | str,
     dialogue_response: str,
     user_message: str,
     language: str,
@@ -297,6 +290,12 @@ async def generate_gift_recommendation(
     item_key = decision.get("item_key") or "gift"
     scene_mode = decision.get("scene_mode", "normal")
 
+    # Nothing in a bare "ok"/emoji turn to personalize the text with
+    verdict = prefilters.classify(prefilters.FILTER_GIFT_TEXT, user_message=user_message)
+    if prefilters.try_skip(prefilters.FILTER_GIFT_TEXT, verdict):
+        decision["suggestion_text"] = _fallback_suggestion_text(scene_mode, language, item_key, item_info)
+        return decision
+
     try:
         prompt = PromptService.get("GIFT_RECOMMENDATION_GPT")
         context_lines = [
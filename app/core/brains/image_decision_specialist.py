@@ -6,38 +6,24 @@ import asyncio
 from typing import Tuple
 from app.core.prompt_service import PromptService
 from app.core.llm_openrouter import generate_text
+from app.core import model_router, prefilters
+from app.core.context_packer import pack_context
+from app.core.conversation_state import ConversationState
 from app.settings import get_app_config
 from app.core.constants import IMAGE_DECISION_MAX_RETRIES
 from app.core.logging_utils import log_messages_array, log_dev_request, log_dev_response, log_dev_context_breakdown, is_development
 import time
 
 
-def _extract_location_from_state(state: str) -> str:
-    """Extract location from state string"""
+def _extract_location_from_state(state: ConversationState | str | None) -> str:
+    """Extract location from state"""
     if not state:
         return "unknown"
-    
-    # State format: location="..." | ...
-    # Parse the state string to extract location
-    try:
-        parts = state.split("|")
-        for part in parts:
-            part = part.strip()
-            if part.startswith("location="):
-                # Extract value between quotes
-                location = part.split("=", 1)[1].strip()
-                # Remove surrounding quotes
-                if location.startswith('"') and location.endswith('"'):
-                    location = location[1:-1]
-                return location
-    except:
-        pass
-    
-    return "unknown"
+    return ConversationState.coerce(state).get("location", "unknown")
 
 
 def _build_decision_context(
-    previous_state: str,
+    previous_state: ConversationState | str,
     user_message: str,
     chat_history: list[dict],
     persona_name: str,
@@ -45,31 +31,31 @@ def _build_decision_context(
 ) -> str:
     """Build context for image generation decision
     
-    Uses context_summary + last 2 messages if summary is available.
+    Uses context_summary + recent messages packed into the "image_decision" token budget.
     """
     # Extract location from previous state
     previous_location = _extract_location_from_state(previous_state)
     
-    # Use summary + last 2 messages OR recent history
-    if context_summary and len(chat_history) > 4:
-        last_2_msgs = chat_history[-2:] if len(chat_history) >= 2 else chat_history
-        last_msgs_text = "\n".join([
-            f"**{msg['role'].upper()}:** {msg['content']}"
-            for msg in last_2_msgs
-        ])
+    # Use summary + recent messages that fit the "image_decision" token budget
+    packed = pack_context(
+        chat_history,
+        brain="image_decision",
+        summary=context_summary if len(chat_history) > 4 else None,
+    )
+    recent_msgs = packed["messages"]
+    msgs_text = "\n".join([
+        f"**{msg['role'].upper()}:** {msg['content']}"
+        for msg in recent_msgs
+    ])
+    if packed["summary"]:
         history_text = f"""SUMMARY:
-{context_summary}
+{packed["summary"]}
 
-LAST 2 MESSAGES:
-{last_msgs_text}"""
-        print(f"[IMAGE-DECISION] 📝 Using context summary + last 2 messages")
+LAST {len(recent_msgs)} MESSAGES:
+{msgs_text}"""
+        print(f"[IMAGE-DECISION] 📝 Using context summary + last {len(recent_msgs)} messages ({packed['tokens']} tokens)")
     else:
-        # Fallback: use last 4 messages directly
-        recent_count = min(4, len(chat_history))
-        history_text = "\n".join([
-            f"**{msg['role'].upper()}:** {msg['content']}"
-            for msg in chat_history[-recent_count:]
-        ]) if chat_history else "No conversation history yet."
+        history_text = msgs_text or "No conversation history yet."
     
     context = f"""
 # PREVIOUS STATE
@@ -92,27 +78,16 @@ Now decide: Should we generate an image for this exchange?
     return context
 
 
-async def should_generate_image(
-    previous_state: str,
+async def _decide_with_llm(
+    previous_state: ConversationState | str,
     user_message: str,
     chat_history: list[dict],
     persona_name: str,
     context_summary: str = None
 ) -> Tuple[bool, str]:
-    """
-    Brain 4: Decide whether to generate an image
-    
-    Model: qwen/qwen-2.5-7b-instruct (fast, uncensored, cheap)
-    Temperature: 0.3 (deterministic decision-making)
-    Retries: 2 attempts
-    Returns: (should_generate: bool, reason: str)
-    
-    Context optimization:
-    - If context_summary is provided, uses summary + last 2 messages
-    - Otherwise falls back to last 4 messages
-    """
+    """Ask the decision model (Brain 4 LLM call with retries)"""
     config = get_app_config()
-    decision_model = config["llm"]["decision_model"]
+    decision_model = model_router.pick_model("image_decision", config["llm"]["decision_model"])
     
     prompt = PromptService.get("IMAGE_DECISION_GPT")
     context = _build_decision_context(previous_state, user_message, chat_history, persona_name, context_summary)
@@ -164,7 +139,8 @@ async def should_generate_image(
                 messages=messages,
                 model=decision_model,
                 temperature=0.3,
-                max_tokens=50  # Short response
+                max_tokens=50,  # Short response
+                brain="image_decision"
             )
             
             brain_duration_ms = (time.time() - brain_start) * 1000
@@ -212,3 +188,34 @@ async def should_generate_image(
     # Should never reach here due to fallback
     return True, "fallback - defaulting to yes"
 
+
+async def should_generate_image(
+    previous_state: ConversationState | str,
+    user_message: str,
+    chat_history: list[dict],
+    persona_name: str,
+    context_summary: str = None
+) -> Tuple[bool, str]:
+    """
+    Brain 4: Decide whether to generate an image
+    
+    Model: qwen/qwen-2.5-7b-instruct (fast, uncensored, cheap)
+    Temperature: 0.3 (deterministic decision-making)
+    Retries: 2 attempts
+    Returns: (should_generate: bool, reason: str)
+    
+    Context optimization:
+    - History is packed into the "image_decision" token budget (context_packer):
+      the last min_recent_messages turns, the summary if it fits (chats over
+      4 messages), then older turns newest first
+    - Trivial messages (acknowledgments, emoji only) that don't answer a photo
+      offer can be decided locally by prefilters (enforce mode) without an LLM call
+    """
+    verdict = prefilters.classify(prefilters.FILTER_IMAGE_DECISION, user_message=user_message, chat_history=chat_history)
+    if prefilters.try_skip(prefilters.FILTER_IMAGE_DECISION, verdict):
+        print(f"[IMAGE-DECISION] ⚡ Decision: NO - {verdict[1]}")
+        return verdict
+    
+    decision = await _decide_with_llm(previous_state, user_message, chat_history, persona_name, context_summary)
+    prefilters.record_shadow(prefilters.FILTER_IMAGE_DECISION, verdict, decision[0])
+    return decision
@@ -7,6 +7,8 @@ import re
 from typing import Dict, Tuple, List, Optional, Any
 from app.core.prompt_service import PromptService
 from app.core.llm_openrouter import generate_text
+from app.core import model_router
+from app.core.conversation_state import ConversationState
 from app.settings import get_app_config
 from app.core.constants import IMAGE_ENGINEER_MAX_RETRIES, IMAGE_ENGINEER_BASE_DELAY
 from app.core.logging_utils import log_messages_array, log_dev_request, log_dev_response, log_dev_context_breakdown, is_development
@@ -473,24 +475,6 @@ def _enforce_tag_policy(
     return ", ".join(trimmed[:24])
 
 
-def _parse_state(state: str) -> dict:
-    """Parse pipe-separated state string into a dict of visual fields."""
-    fields = {}
-    if not state:
-        return fields
-    for pair in state.split("|"):
-        pair = pair.strip()
-        match = re.match(r'(\w+)="(.*?)"', pair)
-        if match:
-            fields[match.group(1)] = match.group(2)
-        else:
-            # Handle boolean fields like terminateDialog=false
-            match_bool = re.match(r'(\w+)=(true|false)', pair)
-            if match_bool:
-                fields[match_bool.group(1)] = match_bool.group(2)
-    return fields
-
-
 def _extract_visual_actions(dialogue_response: str) -> str:
     """Extract visual/physical actions from dialogue, stripping speech.
     
@@ -518,7 +502,7 @@ def _extract_visual_actions(dialogue_response: str) -> str:
 
 
 def _build_image_context(
-    state: str,
+    state: ConversationState | str,
     dialogue_response: str,
     user_message: str,
     persona: dict,
@@ -540,13 +524,13 @@ def _build_image_context(
     Parses state into labeled fields and extracts visual actions from dialogue
     so the image tag LLM gets clear, structured input instead of raw text.
     """
-    # Parse state into structured fields
-    state_fields = _parse_state(state)
-    location = state_fields.get("location", "")
-    clothing = state_fields.get("aiClothing", "")
-    description = state_fields.get("description", "")
-    emotions = state_fields.get("emotions", "")
-    mood_notes = state_fields.get("moodNotes", "")
+    # Structured state fields (parsed once by the pipeline)
+    state = ConversationState.coerce(state)
+    location = state.location
+    clothing = state.ai_clothing
+    description = state.description
+    emotions = state.emotions
+    mood_notes = state.mood_notes
     
     # Extract visual actions and intent
     visual_actions = _extract_visual_actions(dialogue_response)
@@ -736,6 +720,7 @@ Rules:
             frequency_penalty=0.0,
             max_tokens=96,
             reasoning=use_reasoning,
+            brain="image_prompt",
         )
     except Exception:
         return []
@@ -760,7 +745,7 @@ Rules:
 
 
 async def generate_image_plan(
-    state: str,
+    state: ConversationState | str,
     dialogue_response: str,
     user_message: str,
     persona: Dict[str, str],
@@ -790,7 +775,7 @@ async def generate_image_plan(
     - Reasoning disabled to reduce output tokens
     """
     config = get_app_config()
-    model = config["llm"]["image_model"]
+    model = model_router.pick_model("image_prompt", config["llm"]["image_model"])
     use_reasoning = config["llm"].get("image_model_reasoning", False)
     
     prompt = PromptService.get("IMAGE_TAG_GENERATOR_GPT")
@@ -874,7 +859,8 @@ async def generate_image_plan(
                 temperature=0.5,
                 frequency_penalty=0.1,
                 max_tokens=512,
-                reasoning=use_reasoning
+                reasoning=use_reasoning,
+                brain="image_prompt"
             )
             
             brain_duration_ms = (time.time() - brain_start) * 1000
@@ -6,6 +6,9 @@ import asyncio
 from typing import Optional, List, Dict
 from app.core.prompt_service import PromptService
 from app.core.llm_openrouter import generate_text
+from app.core import model_router
+from app.core.context_packer import pack_context
+from app.core.conversation_state import ConversationState
 from app.settings import get_app_config
 from app.core.constants import STATE_RESOLVER_MAX_RETRIES
 from app.core.logging_utils import log_messages_array, log_dev_request, log_dev_response, log_dev_context_breakdown, is_development
@@ -24,7 +27,7 @@ Mood: Just starting conversation"""
 
 
 def _build_state_context(
-    previous_state: Optional[str],
+    previous_state: Optional[ConversationState | str],
     chat_history: list[dict],
     persona_name: str,
     previous_image_prompt: Optional[str] = None,
@@ -34,30 +37,30 @@ def _build_state_context(
     """Build context for state resolver
     
     Note: chat_history contains ONLY processed messages (not current user message)
-    Uses context_summary + last 2 messages if summary is available.
+    Uses context_summary + recent messages packed into the "state" token budget.
     """
-    # Use summary + last 2 messages OR full history
-    if context_summary and len(chat_history) > 4:
+    # Use summary + recent messages that fit the "state" token budget
+    packed = pack_context(
+        chat_history,
+        brain="state",
+        summary=context_summary if len(chat_history) > 4 else None,
+    )
+    recent_msgs = packed["messages"]
+    msgs_text = "\n".join([
+        f"**{msg['role'].upper()}:** {msg['content']}"
+        for msg in recent_msgs
+    ])
+    if packed["summary"]:
         # Summary mode: compact context
-        last_2_msgs = chat_history[-2:] if len(chat_history) >= 2 else chat_history
-        last_msgs_text = "\n".join([
-            f"**{msg['role'].upper()}:** {msg['content']}"
-            for msg in last_2_msgs
-        ])
         history_text = f"""SUMMARY OF CONVERSATION:
-{context_summary}
+{packed["summary"]}
 
-LAST 2 MESSAGES (VERBATIM):
-{last_msgs_text}"""
-        print(f"[STATE-RESOLVER] 📝 Using context summary + last 2 messages")
+LAST {len(recent_msgs)} MESSAGES (VERBATIM):
+{msgs_text}"""
+        print(f"[STATE-RESOLVER] 📝 Using context summary + last {len(recent_msgs)} messages ({packed['tokens']} tokens)")
     else:
-        # Fallback: use last 6 messages directly
-        recent_count = min(6, len(chat_history))
-        history_text = "\n".join([
-            f"**{msg['role'].upper()}:** {msg['content']}"
-            for msg in chat_history[-recent_count:]
-        ]) if chat_history else "No conversation history yet."
-        print(f"[STATE-RESOLVER] 📚 Using {recent_count} recent messages (no summary)")
+        history_text = msgs_text or "No conversation history yet."
+        print(f"[STATE-RESOLVER] 📚 Using {len(recent_msgs)} recent messages (no summary, {packed['tokens']} tokens)")
     
     # Handle None previous state
     if previous_state:
@@ -109,28 +112,28 @@ especially for location, clothing, and scene details that may have been shown vi
 
 
 async def resolve_state(
-    previous_state: Optional[str],
+    previous_state: Optional[ConversationState | str],
     chat_history: List[Dict[str, str]],
     user_message: str,
     persona_name: str,
     previous_image_prompt: Optional[str] = None,
     context_summary: Optional[str] = None,
     dialogue_response: Optional[str] = None
-) -> str:
+) -> ConversationState:
     """
     Brain 2: Update conversation state (runs after dialogue generation)
     
     Model: x-ai/grok-3-mini:nitro (fast state tracking from app.yaml)
     Temperature: 0.3 (deterministic)
     Retries: 2 attempts with fallback
-    Returns: Simple string state description
+    Returns: ConversationState (str() gives the state line)
     
     Context optimization:
     - If context_summary is provided, uses summary + last 2 messages verbatim
     - Otherwise falls back to last 6 messages
     """
     config = get_app_config()
-    state_model = config["llm"]["state_model"]
+    state_model = model_router.pick_model("state", config["llm"]["state_model"])
     
     # Build context
     prompt = PromptService.get("CONVERSATION_STATE_GPT")
@@ -183,7 +186,8 @@ async def resolve_state(
                 messages=messages,
                 model=state_model,
                 temperature=0.3,
-                max_tokens=800
+                max_tokens=800,
+                brain="state"
             )
             
             brain_duration_ms = (time.time() - brain_start) * 1000
@@ -226,25 +230,16 @@ async def resolve_state(
             print(f"[STATE-RESOLVER] ✅ State resolved ({len(state_text)} chars)")
             print(f"[STATE-RESOLVER] 📝 Full state: {state_text}")
             
-            # Parse and log key fields for debugging
-            if "location=" in state_text:
-                try:
-                    location = state_text.split('location="')[1].split('"')[0] if 'location="' in state_text else "NOT FOUND"
-                    print(f"[STATE-RESOLVER]   📍 Location: {location}")
-                except:
-                    print(f"[STATE-RESOLVER]   📍 Location: (parse error)")
-            if "aiClothing=" in state_text:
-                try:
-                    clothing = state_text.split('aiClothing="')[1].split('"')[0] if 'aiClothing="' in state_text else "NOT FOUND"
-                    print(f"[STATE-RESOLVER]   👗 AI Clothing: {clothing}")
-                except:
-                    print(f"[STATE-RESOLVER]   👗 AI Clothing: (parse error)")
+            # Parse once; brains downstream read fields from the object
+            state = ConversationState.parse(state_text)
+            print(f"[STATE-RESOLVER]   📍 Location: {state.get('location', 'NOT FOUND')}")
+            print(f"[STATE-RESOLVER]   👗 AI Clothing: {state.get('aiClothing', 'NOT FOUND')}")
             
             # Check if state has changed
-            if previous_state and state_text == previous_state:
+            if previous_state and state == previous_state:
                 print("[STATE-RESOLVER] ⚠️  WARNING: State unchanged from previous!")
             
-            return state_text
+            return state
             
         except Exception as e:
             print(f"[STATE-RESOLVER] ⚠️ Attempt {attempt}/{STATE_RESOLVER_MAX_RETRIES} failed: {e}")
@@ -252,12 +247,12 @@ async def resolve_state(
                 # Fallback: return previous state or create initial
                 if previous_state:
                     print("[STATE-RESOLVER] 🔄 Using fallback (previous state)")
-                    return previous_state
+                    return ConversationState.coerce(previous_state)
                 else:
                     print("[STATE-RESOLVER] 🔄 Using fallback (initial state)")
-                    return _create_initial_state(persona_name)
+                    return ConversationState.parse(_create_initial_state(persona_name))
             await asyncio.sleep(1)  # Brief delay before retry
         
     # Should never reach here due to fallback
-    return previous_state if previous_state else _create_initial_state(persona_name)
+    return ConversationState.coerce(previous_state or _create_initial_state(persona_name))
 
@@ -0,0 +1,247 @@
+"""
+Cross-process invalidation of the in-memory caches
+
+persona_cache, translation_service and start_code_cache are per-process
+snapshots. An admin write reloads the process that served it and publishes
+the change on a Redis channel (app.yaml cache_bus); every other worker and
+replica reloads its own copy.
+
+Each cache has a generation counter in Redis (cache_gen:<name>), bumped on
+every invalidation. A process remembers the generation its snapshot
+reflects and ignores older or duplicate messages. Several messages for the
+same cache while a reload is pending collapse into one reload. Each process
+waits a random delay of up to reload_jitter_ms first, so replicas don't all
+query Postgres at the same moment.
+
+Reloads run in a worker thread and the caches build a new snapshot before
+swapping it in, so readers see either the old or the new data. Generations
+are re-checked periodically and after reconnecting, which catches up on
+messages missed while unsubscribed (Redis pub/sub doesn't buffer them).
+
+Other cross-worker notifications can ride on the same subscription with
+add_channel (e.g. action_registry's chat action stops).
+"""
+import asyncio
+import json
+import random
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from app.core import redis_queue
+from app.core.logging_utils import log_always, log_verbose
+from app.settings import get_app_config
+
+
+CACHE_PERSONAS = "personas"
+CACHE_TRANSLATIONS = "translations"
+CACHE_START_CODES = "start_codes"
+
+CACHE_NAMES = (CACHE_PERSONAS, CACHE_TRANSLATIONS, CACHE_START_CODES)
+
+GENERATION_KEY = "cache_gen:{}"
+RESYNC_INTERVAL_SEC = 60
+
+INSTANCE_ID = uuid.uuid4().hex  # Identifies this process's own messages
+
+_GENERATIONS: Dict[str, int] = {name: 0 for name in CACHE_NAMES}  # Generation each local snapshot reflects
+_TARGETS: Dict[str, int] = {}  # Highest generation seen while a reload is pending
+_PENDING: Dict[str, asyncio.Task] = {}
+_LISTENER: Optional[asyncio.Task] = None
+_CHANNELS: Dict[str, Callable[[str], None]] = {}  # Extra channels -> message handler
+
+_STATS: Dict[str, int] = {
+    "published": 0,
+    "publish_errors": 0,
+    "received": 0,
+    "ignored": 0,
+    "coalesced": 0,
+    "reloads": 0,
+    "reload_errors": 0,
+}
+
+
+def get_bus_config() -> Dict[str, Any]:
+    """Get channel and reload settings from app.yaml (cache_bus)"""
+    cfg = get_app_config().get("cache_bus", {}) or {}
+    return {
+        "enabled": cfg.get("enabled", True),
+        "channel": cfg.get("channel", "cache:invalidate"),
+        "reload_jitter_ms": int(cfg.get("reload_jitter_ms", 500)),
+    }
+
+
+def add_channel(channel: str, handler: Callable[[str], None]):
+    """Also deliver messages published on channel to handler (call before start())"""
+    _CHANNELS[channel] = handler
+
+
+def _handlers() -> Dict[str, Callable[[str], None]]:
+    """Channels this process listens on, with their handlers"""
+    handlers = dict(_CHANNELS)
+    if get_bus_config()["enabled"]:
+        handlers[get_bus_config()["channel"]] = handle_message
+    return handlers
+
+
+def _reloaders() -> Dict[str, Callable[[], None]]:
+    from app.core import persona_cache, start_code_cache
+    from app.core.translation_service import translation_service
+    return {
+        CACHE_PERSONAS: persona_cache.reload_cache,
+        CACHE_TRANSLATIONS: translation_service.reload,
+        CACHE_START_CODES: start_code_cache.reload_cache,
+    }
+
+
+async def invalidate(cache_name: str):
+    """
+    Reload a cache in this process and tell every other process to reload it.
+
+    Args:
+        cache_name: One of CACHE_NAMES
+    """
+    _reloaders()[cache_name]()
+    if not get_bus_config()["enabled"]:
+        return
+    try:
+        redis = await redis_queue.get_redis()
+        generation = await redis.incr(GENERATION_KEY.format(cache_name))
+        _GENERATIONS[cache_name] = max(_GENERATIONS[cache_name], generation)
+        await redis.publish(get_bus_config()["channel"], json.dumps({
+            "cache": cache_name,
+            "generation": generation,
+            "origin": INSTANCE_ID,
+        }))
+        _STATS["published"] += 1
+        log_verbose(f"[CACHE-BUS] 📣 Published {cache_name} generation {generation}")
+    except Exception as e:
+        # The local reload already happened; other processes catch up on their next resync
+        _STATS["publish_errors"] += 1
+        log_always(f"[CACHE-BUS] ⚠️ Failed to publish {cache_name} invalidation: {e}")
+
+
+def _request_reload(cache_name: str, generation: int):
+    """Schedule a reload up to generation, merging into a pending one"""
+    if generation <= _GENERATIONS.get(cache_name, 0):
+        _STATS["ignored"] += 1
+        return
+    _TARGETS[cache_name] = max(_TARGETS.get(cache_name, 0), generation)
+    if cache_name in _PENDING:
+        _STATS["coalesced"] += 1
+        return
+    _PENDING[cache_name] = asyncio.create_task(_reload(cache_name))
+
+
+async def _reload(cache_name: str):
+    try:
+        await asyncio.sleep(random.uniform(0, get_bus_config()["reload_jitter_ms"]) / 1000)
+        # Anything published from here on needs another reload
+        target = _TARGETS.pop(cache_name, 0)
+        await asyncio.to_thread(_reloaders()[cache_name])
+        _GENERATIONS[cache_name] = max(_GENERATIONS[cache_name], target)
+        _STATS["reloads"] += 1
+        log_always(f"[CACHE-BUS] 🔄 Reloaded {cache_name} (generation {target})")
+    except Exception as e:
+        _STATS["reload_errors"] += 1
+        log_always(f"[CACHE-BUS] ⚠️ Failed to reload {cache_name}: {e}")
+    finally:
+        _PENDING.pop(cache_name, None)
+        if _TARGETS.get(cache_name, 0) > _GENERATIONS.get(cache_name, 0):
+            _request_reload(cache_name, _TARGETS.pop(cache_name))
+
+
+def handle_message(data: str):
+    """Handle one message from the invalidation channel"""
+    _STATS["received"] += 1
+    try:
+        message = json.loads(data)
+        cache_name = message["cache"]
+        generation = int(message["generation"])
+    except (ValueError, KeyError, TypeError):
+        _STATS["ignored"] += 1
+        return
+    if cache_name not in CACHE_NAMES or message.get("origin") == INSTANCE_ID:
+        _STATS["ignored"] += 1
+        return
+    _request_reload(cache_name, generation)
+
+
+async def _read_generations(redis) -> Dict[str, int]:
+    values = await redis.mget([GENERATION_KEY.format(name) for name in CACHE_NAMES])
+    return {name: int(value or 0) for name, value in zip(CACHE_NAMES, values)}
+
+
+async def _resync(redis):
+    """Reload caches whose generation moved without us seeing the message"""
+    for cache_name, generation in (await _read_generations(redis)).items():
+        if generation > _GENERATIONS.get(cache_name, 0):
+            _request_reload(cache_name, generation)
+
+
+async def _listen():
+    handlers = _handlers()
+    resync = get_bus_config()["enabled"]
+    while True:
+        pubsub = None
+        try:
+            redis = await redis_queue.get_redis()
+            pubsub = redis.pubsub()
+            await pubsub.subscribe(*handlers)
+            if resync:
+                await _resync(redis)
+            log_always(f"[CACHE-BUS] ✅ Subscribed to {', '.join(repr(name) for name in handlers)}")
+            loop = asyncio.get_running_loop()
+            next_resync = loop.time() + RESYNC_INTERVAL_SEC
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message and message.get("type") == "message":
+                    handlers.get(message["channel"], handle_message)(message["data"])
+                if resync and loop.time() >= next_resync:
+                    await _resync(redis)
+                    next_resync = loop.time() + RESYNC_INTERVAL_SEC
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log_always(f"[CACHE-BUS] ⚠️ Listener error, resubscribing in 5s: {e}")
+            await asyncio.sleep(5)
+        finally:
+            if pubsub is not None:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+
+
+async def start():
+    """Start listening (call at startup, after the caches are loaded)"""
+    global _LISTENER
+    if not _handlers() or _LISTENER is not None:
+        return
+    try:
+        # The snapshots were just loaded from the DB, so they reflect the current generations
+        redis = await redis_queue.get_redis()
+        _GENERATIONS.update(await _read_generations(redis))
+    except Exception as e:
+        log_always(f"[CACHE-BUS] ⚠️ Could not read cache generations: {e}")
+    _LISTENER = asyncio.create_task(_listen())
+
+
+async def stop():
+    """Stop listening and cancel pending reloads (call on shutdown)"""
+    global _LISTENER
+    tasks = [task for task in (_LISTENER, *_PENDING.values()) if task]
+    _LISTENER = None
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _PENDING.clear()
+
+
+def get_stats() -> Dict[str, Any]:
+    """Get invalidation counters and local cache generations for this process"""
+    return {
+        **_STATS,
+        "instance_id": INSTANCE_ID,
+        "generations": dict(_GENERATIONS),
+        "pending_reloads": sorted(_PENDING),
+    }
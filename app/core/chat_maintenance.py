@@ -0,0 +1,193 @@
+"""
+Per-chat background maintenance (memory, user name, context summary)
+
+Instead of firing three independent tasks after every exchange, the pipeline
+calls schedule_maintenance. Requests for the same chat are merged and run once
+the chat has been quiet for quiet_sec, or right away after max_pending_messages
+exchanges. A run fetches chat + history once and shares it between the jobs.
+Runs for one chat never overlap; a timer that is superseded by a newer request
+is cancelled, so its run is dropped.
+
+In multi-worker mode a chat's messages can be served by different workers,
+each debouncing on its own. A run then also holds a Redis lock for the chat
+(chat_maintenance:lock:<chat_id>); a worker that finds it taken keeps its
+request pending and retries after lock_retry_sec, so two workers never
+refresh the same chat at once.
+"""
+import asyncio
+from typing import Dict, Any, Iterable, Optional
+from uuid import UUID
+
+from app.core import redis_queue, workers
+from app.core.logging_utils import log_always, log_verbose
+from app.db.base import get_db
+from app.db import crud
+from app.settings import get_app_config
+
+
+JOB_MEMORY = "memory"
+JOB_NAME = "name"
+JOB_SUMMARY = "summary"
+
+HISTORY_LIMIT = 20  # Largest window any job needs (summary)
+MEMORY_HISTORY = 15
+NAME_HISTORY = 10
+
+LOCK_KEY = "chat_maintenance:lock:{chat_id}"
+
+_PENDING: Dict[UUID, Dict[str, Any]] = {}  # chat_id -> {"jobs", "persona_name", "requests", "timer"}
+_RUNNING: Dict[UUID, asyncio.Task] = {}
+
+
+def get_maintenance_config() -> Dict[str, Any]:
+    """Get debounce settings from app.yaml (chat_maintenance)"""
+    cfg = get_app_config().get("chat_maintenance", {}) or {}
+    return {
+        "quiet_sec": float(cfg.get("quiet_sec", 20)),
+        "max_pending_messages": int(cfg.get("max_pending_messages", 4)),
+        "lock_ttl_sec": int(cfg.get("lock_ttl_sec", 120)),
+        "lock_retry_sec": float(cfg.get("lock_retry_sec", 5)),
+    }
+
+
+def schedule_maintenance(chat_id: UUID, jobs: Iterable[str], persona_name: Optional[str] = None):
+    """Request maintenance jobs for a chat (debounced; must be called from the event loop)"""
+    jobs = set(jobs)
+    if not jobs:
+        return
+
+    cfg = get_maintenance_config()
+    entry = _PENDING.setdefault(chat_id, {"jobs": set(), "persona_name": None, "requests": 0, "timer": None})
+    entry["jobs"] |= jobs
+    entry["persona_name"] = persona_name or entry["persona_name"]
+    entry["requests"] += 1
+
+    if entry["timer"]:
+        entry["timer"].cancel()
+        log_verbose(f"[MAINTENANCE] ⏳ Chat {chat_id}: run superseded ({entry['requests']} requests pending)")
+
+    delay = 0 if entry["requests"] >= cfg["max_pending_messages"] else cfg["quiet_sec"]
+    entry["timer"] = asyncio.create_task(_run_after(chat_id, delay))
+
+
+async def _run_after(chat_id: UUID, delay: float):
+    if delay:
+        await asyncio.sleep(delay)
+
+    # Never overlap with a run that is still going for this chat
+    running = _RUNNING.get(chat_id)
+    if running:
+        await asyncio.shield(running)
+
+    entry = _PENDING.pop(chat_id, None)
+    if not entry:
+        return
+
+    _RUNNING[chat_id] = asyncio.current_task()
+    try:
+        if not await _acquire_lock(chat_id):
+            _retry_later(chat_id, entry)
+            return
+        try:
+            await run_maintenance(chat_id, entry["jobs"], entry["persona_name"])
+        finally:
+            await _release_lock(chat_id)
+    finally:
+        _RUNNING.pop(chat_id, None)
+
+
+def _retry_later(chat_id: UUID, entry: Dict[str, Any]):
+    """Another worker is refreshing this chat: keep the request pending until it's done"""
+    pending = _PENDING.get(chat_id)
+    if pending:
+        # A newer request arrived meanwhile; its timer runs the merged jobs
+        pending["jobs"] |= entry["jobs"]
+        pending["persona_name"] = pending["persona_name"] or entry["persona_name"]
+        return
+    log_verbose(f"[MAINTENANCE] 🔒 Chat {chat_id}: another worker is running maintenance, retrying")
+    _PENDING[chat_id] = entry
+    entry["timer"] = asyncio.create_task(_run_after(chat_id, get_maintenance_config()["lock_retry_sec"]))
+
+
+async def _acquire_lock(chat_id: UUID) -> bool:
+    """Take the cross-worker lock for a chat (always granted in single-worker mode)"""
+    if not workers.is_multi_worker():
+        return True
+    try:
+        redis = await redis_queue.get_redis()
+        ttl_sec = get_maintenance_config()["lock_ttl_sec"]
+        return bool(await redis.set(LOCK_KEY.format(chat_id=chat_id), "1", nx=True, ex=ttl_sec))
+    except Exception as e:
+        # A duplicate refresh is cheaper than a chat that's never refreshed
+        log_always(f"[MAINTENANCE] ⚠️ Failed to lock chat {chat_id}, running anyway: {e}")
+        return True
+
+
+async def _release_lock(chat_id: UUID):
+    if not workers.is_multi_worker():
+        return
+    try:
+        redis = await redis_queue.get_redis()
+        await redis.delete(LOCK_KEY.format(chat_id=chat_id))
+    except Exception as e:
+        log_always(f"[MAINTENANCE] ⚠️ Failed to unlock chat {chat_id} (expires on its own): {e}")
+
+
+async def run_maintenance(chat_id: UUID, jobs: Iterable[str], persona_name: Optional[str] = None):
+    """Run maintenance jobs for a chat now, sharing one chat/history fetch"""
+    from app.core.memory_service import refresh_memory, refresh_user_name
+    from app.core.context_summarizer import update_context_summary
+
+    jobs = set(jobs)
+    try:
+        with get_db() as db:
+            chat = crud.get_chat_by_id(db, chat_id)
+            if not chat:
+                log_verbose(f"[MAINTENANCE] ⚠️ Chat {chat_id} not found")
+                return
+            current_memory = chat.memory
+            user_id = chat.user_id
+            name_known = bool(chat.ext and chat.ext.get("user_display_name"))
+            messages = crud.get_chat_messages(db, chat_id, limit=HISTORY_LIMIT)
+            chat_history = [
+                {"role": m.role, "content": m.text, "created_at": m.created_at}
+                for m in messages
+                if m.text
+            ]
+    except Exception as e:
+        log_always(f"[MAINTENANCE] ❌ Failed to load chat {chat_id}: {e}")
+        return
+
+    tasks = []
+    if JOB_MEMORY in jobs:
+        tasks.append(refresh_memory(chat_id, chat_history[-MEMORY_HISTORY:], current_memory))
+    if JOB_NAME in jobs and not name_known:
+        tasks.append(refresh_user_name(chat_id, chat_history[-NAME_HISTORY:]))
+    if JOB_SUMMARY in jobs:
+        tasks.append(update_context_summary(chat_id, chat_history, persona_name or "AI", user_id=user_id))
+
+    log_verbose(f"[MAINTENANCE] 🧹 Chat {chat_id}: running {sorted(jobs)} on {len(chat_history)} messages")
+    await asyncio.gather(*tasks)
+
+
+async def run_pending_now():
+    """Run every debounced request immediately (used on shutdown)"""
+    pending = list(_PENDING.items())
+    _PENDING.clear()
+    for _, entry in pending:
+        if entry["timer"]:
+            entry["timer"].cancel()
+    await asyncio.gather(
+        *(_run_on_shutdown(chat_id, entry) for chat_id, entry in pending),
+        return_exceptions=True,
+    )
+
+
+async def _run_on_shutdown(chat_id: UUID, entry: Dict[str, Any]):
+    if not await _acquire_lock(chat_id):
+        log_always(f"[MAINTENANCE] ⚠️ Chat {chat_id}: another worker holds the maintenance lock, dropping {sorted(entry['jobs'])}")
+        return
+    try:
+        await run_maintenance(chat_id, entry["jobs"], entry["persona_name"])
+    finally:
+        await _release_lock(chat_id)
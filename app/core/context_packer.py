@@ -0,0 +1,163 @@
+"""
+Token-budgeted context packing for the LLM brains
+
+Brains used to pick history by message count, so a few long messages blew up
+prompt size while short ones wasted the budget. pack_context fills a per-brain
+token budget (app.yaml context_budget) greedily:
+1. the most recent min_recent_messages turns (always kept)
+2. the context summary, if it fits without eating into the memory reserve
+3. the conversation memory (long-term user facts), truncated rather than
+   dropped when it doesn't fit; memory_reserve tokens are kept for it
+4. older turns, newest first, until the budget is used up
+Whatever is dropped or truncated is logged.
+
+Tokens are estimated with a fast regex count (the brains run on several
+model families with different tokenizers, so an exact count for one of them
+wouldn't be exact either). Counts are cached per text, since the same
+history is packed by several brains every turn.
+"""
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from app.core.logging_utils import log_always, log_verbose
+from app.settings import get_app_config
+
+
+MESSAGE_OVERHEAD_TOKENS = 4  # Role label + separators per rendered message
+DEFAULT_BUDGETS = {
+    "dialogue": 900,
+    "state": 500,
+    "image_decision": 300,
+}
+
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+ASCII_CHARS_PER_TOKEN = 4
+OTHER_CHARS_PER_TOKEN = 2  # Cyrillic etc. split into more BPE tokens per char
+
+
+def _estimate_tokens(text: str) -> int:
+    tokens = 0
+    for piece in _PIECE_RE.findall(text):
+        per_token = ASCII_CHARS_PER_TOKEN if piece.isascii() else OTHER_CHARS_PER_TOKEN
+        tokens += -(-len(piece) // per_token)
+    return tokens
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """Count tokens of a text (cached)"""
+    if not text:
+        return 0
+    return _estimate_tokens(text)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens, keeping its beginning and whole lines where possible"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    kept = []
+    used = 0
+    for line in text.splitlines():
+        tokens = count_tokens(line)
+        if used + tokens > max_tokens:
+            break
+        kept.append(line)
+        used += tokens
+    if kept:
+        return "\n".join(kept)
+    # First line alone is too long: cut it by pieces
+    end = 0
+    used = 0
+    for match in _PIECE_RE.finditer(text):
+        used += count_tokens(match.group())
+        if used > max_tokens:
+            break
+        end = match.end()
+    return text[:end]
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    content = message.get("content", message.get("text")) or ""
+    return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def get_context_budget(brain: str) -> Dict[str, int]:
+    """Get token budget and minimum recent turns for a brain (app.yaml context_budget)"""
+    cfg = get_app_config().get("context_budget", {}) or {}
+    return {
+        "tokens": int(cfg.get(brain, DEFAULT_BUDGETS.get(brain, 1000))),
+        "min_recent_messages": int(cfg.get("min_recent_messages", 2)),
+        "memory_reserve": int(cfg.get("memory_reserve", 200)),
+    }
+
+
+def pack_context(
+    chat_history: List[Dict[str, Any]],
+    brain: str,
+    summary: Optional[str] = None,
+    memory: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Select the history, summary and memory that fit a brain's token budget.
+
+    Args:
+        chat_history: Messages oldest first ({role, content} dicts)
+        brain: Budget name in app.yaml context_budget (dialogue, state, image_decision)
+        summary: Context summary, if any
+        memory: Conversation memory, if any
+
+    Returns:
+        Dict with summary/memory (None if not included), messages (oldest first)
+        and tokens used
+    """
+    budget = get_context_budget(brain)
+    remaining = budget["tokens"]
+    min_recent = budget["min_recent_messages"]
+    dropped = []
+
+    recent = chat_history[-min_recent:] if min_recent else []
+    remaining -= sum(message_tokens(m) for m in recent)
+
+    memory = memory if memory and memory.strip() else None
+    memory_tokens = count_tokens(memory) if memory else 0
+    reserve = max(0, min(memory_tokens, budget["memory_reserve"], remaining))
+
+    packed_summary = None
+    if summary and summary.strip():
+        if count_tokens(summary) <= remaining - reserve:
+            packed_summary = summary
+            remaining -= count_tokens(summary)
+        else:
+            dropped.append(f"summary ({count_tokens(summary)} tokens)")
+
+    packed_memory = None
+    if memory:
+        packed_memory = truncate_to_tokens(memory, max(0, remaining)) or None
+        packed_tokens = count_tokens(packed_memory) if packed_memory else 0
+        remaining -= packed_tokens
+        if packed_tokens < memory_tokens:
+            dropped.append(f"memory ({memory_tokens - packed_tokens} of {memory_tokens} tokens)")
+
+    older = []
+    candidates = chat_history[:len(chat_history) - len(recent)]
+    for message in reversed(candidates):
+        tokens = message_tokens(message)
+        if tokens > remaining:
+            break
+        older.append(message)
+        remaining -= tokens
+
+    if dropped:
+        log_always(f"[CONTEXT] ✂️ {brain}: over the {budget['tokens']}-token budget, cut {', '.join(dropped)}")
+    if len(older) < len(candidates):
+        log_verbose(f"[CONTEXT] {brain}: {len(candidates) - len(older)} older turns left out")
+
+    return {
+        "summary": packed_summary,
+        "memory": packed_memory,
+        "messages": list(reversed(older)) + list(recent),
+        "tokens": budget["tokens"] - remaining,
+    }
@@ -3,11 +3,14 @@ Context Summarizer Service
 Generates compact summaries of conversation history to reduce LLM context size.
 Saves summary to chat.ext["context_summary"] for persistence.
 """
-from typing import List, Dict, Optional, Tuple
+from datetime import datetime
+from typing import Any, List, Dict, Optional, Tuple
 from uuid import UUID
 
 from app.core.prompt_service import PromptService
 from app.core.llm_openrouter import generate_text
+from app.core import model_router
+from app.core.context_packer import pack_context
 from app.core.logging_utils import log_verbose, log_always
 from app.settings import get_app_config
 
@@ -28,9 +31,44 @@ def format_history_for_summary(chat_history: List[Dict[str, str]]) -> str:
     return "\n".join(formatted)
 
 
+CHARS_PER_TOKEN = 4  # Rough estimate for reporting baseline prompt size
+
+
+def get_summary_config() -> Dict[str, Any]:
+    """Get context summary settings from app.yaml (context_summary)"""
+    cfg = get_app_config().get("context_summary", {}) or {}
+    return {
+        "incremental": cfg.get("incremental", True),
+        "window_messages": int(cfg.get("window_messages", 20)),
+        "compact_every": int(cfg.get("compact_every", 8)),
+    }
+
+
+def estimate_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(len(m["content"]) for m in messages) // CHARS_PER_TOKEN
+
+
+def _build_full_summary_messages(chat_history: List[Dict[str, str]], persona_name: str) -> List[Dict[str, str]]:
+    prompt = PromptService.get("CONTEXT_SUMMARY_GPT")
+    history_text = format_history_for_summary(chat_history)
+    
+    user_content = f"""Character name: {persona_name}
+
+CONVERSATION HISTORY ({len(chat_history)} messages):
+{history_text}
+
+Now generate a compact summary following the format above."""
+    
+    return [
+        {"role": "system", "content": prompt},
+        {"role": "user", "content": user_content}
+    ]
+
+
 async def generate_context_summary(
     chat_history: List[Dict[str, str]],
-    persona_name: str = "AI"
+    persona_name: str = "AI",
+    user_id: Optional[int] = None
 ) -> str:
     """
     Generate a compact summary of conversation history using a cheap model.
@@ -38,6 +76,7 @@ async def generate_context_summary(
     Args:
         chat_history: Full conversation history (up to 20 messages)
         persona_name: Name of the AI persona
+        user_id: Telegram user ID for llm_cost tracking
     
     Returns:
         Compact summary string (max ~400 chars)
@@ -47,22 +86,10 @@ async def generate_context_summary(
         return ""
     
     config = get_app_config()
-    summary_model = config["llm"].get("summary_model") or config["llm"].get("model", "openrouter/auto")
-    
-    prompt = PromptService.get("CONTEXT_SUMMARY_GPT")
-    history_text = format_history_for_summary(chat_history)
-    
-    user_content = f"""Character name: {persona_name}
-
-CONVERSATION HISTORY ({len(chat_history)} messages):
-{history_text}
-
-Now generate a compact summary following the format above."""
-    
-    messages = [
-        {"role": "system", "content": prompt},
-        {"role": "user", "content": user_content}
-    ]
+    summary_model = model_router.pick_model(
+        "context_summary", config["llm"].get("summary_model") or config["llm"].get("model", "openrouter/auto")
+    )
+    messages = _build_full_summary_messages(chat_history, persona_name)
     
     try:
         log_verbose(f"[CONTEXT-SUMMARY] 🧠 Generating summary for {len(chat_history)} messages...")
@@ -71,7 +98,10 @@ Now generate a compact summary following the format above."""
             messages=messages,
             model=summary_model,
             temperature=0.3,
-            max_tokens=250  # Keep it short
+            max_tokens=250,  # Keep it short
+            user_id=user_id,
+            cost_meta={"brain": "context_summary", "summary_mode": "full"},
+            brain="context_summary"
         )
         
         summary = response.strip()
@@ -85,60 +115,157 @@ Now generate a compact summary following the format above."""
         return ""
 
 
-def build_summarized_context(
+async def fold_into_summary(
     summary: str,
-    chat_history: List[Dict[str, str]],
-    current_user_message: str,
-    last_n_verbatim: int = 2
-) -> Tuple[str, List[Dict[str, str]]]:
+    new_messages: List[Dict[str, str]],
+    persona_name: str = "AI",
+    user_id: Optional[int] = None,
+    baseline_history: Optional[List[Dict[str, str]]] = None
+) -> str:
     """
-    Build context using summary + last N messages verbatim.
+    Fold only the new messages into an existing summary.
+    
+    Args:
+        summary: Current summary covering everything before new_messages
+        new_messages: Messages since the summary was last updated
+        persona_name: Name of the AI persona
+        user_id: Telegram user ID for llm_cost tracking
+        baseline_history: Window a full resummarization would have sent; its
+            estimated prompt size is reported so llm_cost shows the savings
     
     Returns:
-        Tuple of (context_block_for_system_prompt, messages_to_append)
-        
-    The context_block goes into the system prompt.
-    The messages_to_append are added to the messages array (with current_user_message last).
+        Updated summary string, or "" on failure
     """
-    # Extract last N messages verbatim
-    last_messages = chat_history[-last_n_verbatim:] if len(chat_history) >= last_n_verbatim else chat_history
-    
-    # Build context block for system prompt
-    context_parts = []
+    config = get_app_config()
+    summary_model = model_router.pick_model(
+        "context_summary", config["llm"].get("summary_model") or config["llm"].get("model", "openrouter/auto")
+    )
     
-    if summary:
-        context_parts.append(f"""# CONVERSATION CONTEXT (SUMMARY)
-{summary}""")
+    user_content = f"""Character name: {persona_name}
+
+PREVIOUS SUMMARY:
+{summary}
+
+NEW MESSAGES ({len(new_messages)}):
+{format_history_for_summary(new_messages)}
+
+Now output the updated summary following the format above."""
     
-    # Add last 2 messages section header
-    if last_messages:
-        last_msgs_text = "\n".join([
-            f"**{msg['role'].upper()}:** {msg['content']}"
-            for msg in last_messages
-        ])
-        context_parts.append(f"""# LAST {len(last_messages)} MESSAGES (VERBATIM)
-{last_msgs_text}""")
+    messages = [
+        {"role": "system", "content": PromptService.get("CONTEXT_SUMMARY_UPDATE_GPT")},
+        {"role": "user", "content": user_content}
+    ]
+    cost_meta = {"brain": "context_summary", "summary_mode": "incremental"}
+    if baseline_history:
+        cost_meta["baseline_prompt_tokens"] = estimate_tokens(
+            _build_full_summary_messages(baseline_history, persona_name)
+        )
     
-    context_parts.append("""# RESPONSE INSTRUCTIONS
-- The user's CURRENT message is below (the one you MUST respond to)
-- Use the summary and last messages for context only
-- Respond DIRECTLY to the current user message""")
+    try:
+        log_verbose(f"[CONTEXT-SUMMARY] 🧠 Folding {len(new_messages)} new messages into summary...")
+        
+        response = await generate_text(
+            messages=messages,
+            model=summary_model,
+            temperature=0.3,
+            max_tokens=250,
+            user_id=user_id,
+            cost_meta=cost_meta,
+            brain="context_summary"
+        )
+        
+        updated = response.strip()
+        log_verbose(f"[CONTEXT-SUMMARY] ✅ Summary updated ({len(updated)} chars)")
+        return updated
+        
+    except Exception as e:
+        log_always(f"[CONTEXT-SUMMARY] ❌ Error updating summary incrementally: {e}")
+        return ""
+
+
+async def update_context_summary(
+    chat_id: UUID,
+    chat_history: List[Dict[str, Any]],
+    persona_name: str = "AI",
+    user_id: Optional[int] = None
+):
+    """
+    Update chat.ext["context_summary"] after new exchanges. Called by chat_maintenance.
     
-    context_block = "\n\n".join(context_parts)
+    chat_history entries carry created_at. If the chat already has a summary
+    whose cut-off (context_summary_upto) is inside the window, only the newer
+    messages are folded into it; every compact_every folds (or when the
+    cut-off fell out of the window) the window is resummarized from scratch.
+    """
+    from sqlalchemy.orm.attributes import flag_modified
+    from app.db.base import get_db
+    from app.db import crud
     
-    # Messages to append: just the current user message (last 2 are in context block)
-    messages_to_append = [
-        {"role": "user", "content": current_user_message}
-    ]
+    try:
+        cfg = get_summary_config()
+        window = chat_history[-cfg["window_messages"]:]
+        
+        # Only generate summary if we have enough messages
+        if len(window) < 5:
+            log_verbose(f"[CONTEXT-SUMMARY] ⏭️ Skipping - only {len(window)} messages (need 5+)")
+            return
+        
+        with get_db() as db:
+            chat = crud.get_chat_by_id(db, chat_id)
+            ext = dict(chat.ext or {}) if chat else {}
+        current_summary = ext.get("context_summary")
+        summarized_upto = ext.get("context_summary_upto")
+        folds = int(ext.get("context_summary_folds", 0))
+        
+        new_messages = None
+        if cfg["incremental"] and current_summary and summarized_upto and folds < cfg["compact_every"]:
+            cutoff = datetime.fromisoformat(summarized_upto)
+            new_messages = [m for m in window if m["created_at"] > cutoff]
+            if len(new_messages) == len(window):
+                new_messages = None  # Cut-off is outside the window: gap, resummarize
+            elif not new_messages:
+                log_verbose(f"[CONTEXT-SUMMARY] ⏭️ Summary already up to date")
+                return
+        
+        if new_messages:
+            new_summary = await fold_into_summary(
+                current_summary, new_messages, persona_name, user_id=user_id, baseline_history=window
+            )
+            folds += 1
+        else:
+            new_summary = await generate_context_summary(window, persona_name, user_id=user_id)
+            folds = 0
+        
+        if not new_summary:
+            log_verbose(f"[CONTEXT-SUMMARY] ⚠️ Empty summary generated, skipping save")
+            return
+        
+        with get_db() as db:
+            chat = crud.get_chat_by_id(db, chat_id)
+            if chat:
+                if not chat.ext:
+                    chat.ext = {}
+                chat.ext["context_summary"] = new_summary
+                chat.ext["context_summary_upto"] = window[-1]["created_at"].isoformat()
+                chat.ext["context_summary_folds"] = folds
+                flag_modified(chat, "ext")
+                db.commit()
+                mode = "incremental" if new_messages else "full"
+                log_always(f"[CONTEXT-SUMMARY] ✅ Summary saved ({len(new_summary)} chars, {mode})")
+            else:
+                log_verbose(f"[CONTEXT-SUMMARY] ⚠️ Chat {chat_id} not found")
     
-    return context_block, messages_to_append
+    except Exception as e:
+        log_always(f"[CONTEXT-SUMMARY] ❌ Error updating summary: {e}")
+        # Non-critical - don't raise, just log
 
 
 def get_context_for_brain(
     summary: Optional[str],
     chat_history: List[Dict[str, str]],
     current_user_message: str,
-    include_current_in_messages: bool = True
+    include_current_in_messages: bool = True,
+    brain: str = "dialogue"
 ) -> Tuple[str, List[Dict[str, str]]]:
     """
     Get formatted context for any brain.
@@ -148,39 +275,39 @@ def get_context_for_brain(
         chat_history: Recent chat history
         current_user_message: The message to respond to
         include_current_in_messages: If True, add current message to messages list
+        brain: Token budget to pack history and summary into (app.yaml context_budget)
     
     Returns:
         (context_block, messages_list)
         - context_block: String to add to system prompt
         - messages_list: Messages to add after system message
     """
-    # If no summary or short history, use last messages directly
-    if not summary or len(chat_history) <= 4:
-        # Short history - just use last 4 messages + current
-        recent = chat_history[-4:] if chat_history else []
-        
-        context_block = ""
-        if recent:
-            msgs_text = "\n".join([
-                f"**{msg['role'].upper()}:** {msg['content']}"
-                for msg in recent
-            ])
-            context_block = f"""# RECENT CONVERSATION
-{msgs_text}
-
-# RESPONSE INSTRUCTIONS
-Respond to the user's CURRENT message below."""
-        
-        messages = []
-        if include_current_in_messages:
-            messages.append({"role": "user", "content": current_user_message})
-        
-        return context_block, messages
-    
-    # Use summary + last 2 verbatim
-    return build_summarized_context(
-        summary=summary,
-        chat_history=chat_history,
-        current_user_message=current_user_message,
-        last_n_verbatim=2
-    )
+    # Short history doesn't need the summary
+    packed = pack_context(chat_history, brain=brain, summary=summary if len(chat_history) > 4 else None)
+    recent = packed["messages"]
+    
+    context_parts = []
+    if packed["summary"]:
+        context_parts.append(f"""# CONVERSATION CONTEXT (SUMMARY)
+{packed["summary"]}""")
+    
+    if recent:
+        msgs_text = "\n".join([
+            f"**{msg['role'].upper()}:** {msg['content']}"
+            for msg in recent
+        ])
+        header = f"LAST {len(recent)} MESSAGES (VERBATIM)" if packed["summary"] else "RECENT CONVERSATION"
+        context_parts.append(f"""# {header}
+{msgs_text}""")
+    
+    if context_parts:
+        context_parts.append("""# RESPONSE INSTRUCTIONS
+- The user's CURRENT message is below (the one you MUST respond to)
+- Use the summary and last messages for context only
+- Respond DIRECTLY to the current user message""")
+    
+    messages = []
+    if include_current_in_messages:
+        messages.append({"role": "user", "content": current_user_message})
+    
+    return "\n\n".join(context_parts), messages
@@ -0,0 +1,180 @@
+"""
+Structured conversation state
+
+The state resolver (Brain 2) outputs one line such as:
+    relationshipStage="lover" | emotions="playful" | ... | terminateDialog=false | terminateReason=""
+The pipeline parses it once per batch into a ConversationState and passes
+that object to every brain, instead of each brain re-parsing the string.
+str(state) gives back the state line for prompts.
+
+Chats store the state in state_snapshot as a compact versioned list:
+    {"v": 2, "s": [relationshipStage, emotions, ..., terminateReason]}
+from_snapshot also reads the legacy formats: {"state": "<state line>"} and
+the structured {"rel": {...}, "scene": {...}} dict.
+"""
+import re
+from typing import Any, Dict, List, Optional, Union
+
+
+FIELDS = (
+    "relationshipStage",
+    "emotions",
+    "moodNotes",
+    "location",
+    "description",
+    "aiClothing",
+    "userClothing",
+    "terminateDialog",
+    "terminateReason",
+)
+_ATTRS = (
+    "relationship_stage",
+    "emotions",
+    "mood_notes",
+    "location",
+    "description",
+    "ai_clothing",
+    "user_clothing",
+    "terminate_dialog",
+    "terminate_reason",
+)
+_FIELD_ATTRS = dict(zip(FIELDS, _ATTRS))
+
+DEFAULTS: Dict[str, Any] = {
+    "relationshipStage": "friend",
+    "emotions": "",
+    "moodNotes": "",
+    "location": "",
+    "description": "",
+    "aiClothing": "",
+    "userClothing": "unknown",
+    "terminateDialog": False,
+    "terminateReason": "",
+}
+
+SNAPSHOT_VERSION = 2
+
+_QUOTED_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+_BOOL_RE = re.compile(r'(\w+)=(true|false)\b')
+_UNESCAPE_RE = re.compile(r'\\(.)')
+
+
+def _escape(value: Any) -> str:
+    return str(value or "").replace("\\", "\\\\").replace('"', '\\"')
+
+
+class ConversationState:
+    """Parsed conversation state; fields missing from the source keep DEFAULTS"""
+
+    __slots__ = _ATTRS + ("present", "_line")
+
+    def __init__(self, fields: Optional[Dict[str, Any]] = None, line: Optional[str] = None):
+        fields = fields or {}
+        for field, attr in _FIELD_ATTRS.items():
+            setattr(self, attr, fields.get(field, DEFAULTS[field]))
+        self.present = frozenset(field for field in FIELDS if field in fields)
+        self._line = line
+
+    # ========== CONSTRUCTION ==========
+
+    @classmethod
+    def parse(cls, line: Optional[str]) -> "ConversationState":
+        """Parse a state line; a freeform (legacy) line is kept as is for str()"""
+        line = line or ""
+        fields: Dict[str, Any] = {}
+        for key, value in _QUOTED_RE.findall(line):
+            if key in _FIELD_ATTRS:
+                fields[key] = _UNESCAPE_RE.sub(r"\1", value)
+        for key, value in _BOOL_RE.findall(line):
+            if key == "terminateDialog":
+                fields[key] = value == "true"
+        return cls(fields, line=line)
+
+    @classmethod
+    def coerce(cls, state: Union["ConversationState", str, None]) -> "ConversationState":
+        """Accept a ConversationState or a raw state line"""
+        if isinstance(state, ConversationState):
+            return state
+        return cls.parse(state)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Any) -> Optional["ConversationState"]:
+        """Read a chat/message state_snapshot (compact or legacy); None if there is no state"""
+        if not snapshot or not isinstance(snapshot, dict):
+            return None
+        if snapshot.get("v") == SNAPSHOT_VERSION:
+            values: List[Any] = snapshot.get("s") or []
+            fields = {field: value for field, value in zip(FIELDS, values) if value is not None}
+            return cls(fields, line=snapshot.get("raw"))
+        if isinstance(snapshot.get("state"), str):
+            return cls.parse(snapshot["state"]) if snapshot["state"] else None
+        if "rel" in snapshot and "scene" in snapshot:
+            rel = snapshot.get("rel") or {}
+            scene = snapshot.get("scene") or {}
+            fields = {field: source[field] for source in (rel, scene) for field in FIELDS if field in source}
+            return cls(fields)
+        return None
+
+    # ========== ACCESS ==========
+
+    @property
+    def is_structured(self) -> bool:
+        """False for freeform legacy states without any known field"""
+        return bool(self.present)
+
+    def get(self, field: str, default: Any = None) -> Any:
+        """Value of a field by its state-line name; default if it wasn't in the source"""
+        if field in self.present or default is None:
+            return getattr(self, _FIELD_ATTRS[field])
+        return default
+
+    def to_dict(self) -> Dict[str, Any]:
+        """All fields by state-line name (missing ones filled with DEFAULTS)"""
+        return {field: getattr(self, attr) for field, attr in _FIELD_ATTRS.items()}
+
+    def replace(self, **fields: Any) -> "ConversationState":
+        """Copy with some fields changed (by state-line name)"""
+        merged = {field: getattr(self, _FIELD_ATTRS[field]) for field in self.present}
+        merged.update(fields)
+        return ConversationState(merged)
+
+    # ========== SERIALIZATION ==========
+
+    def to_line(self) -> str:
+        """State line as used in prompts"""
+        if self._line is None:
+            parts = []
+            for field, attr in _FIELD_ATTRS.items():
+                value = getattr(self, attr)
+                if field == "terminateDialog":
+                    parts.append(f'{field}={"true" if value else "false"}')
+                else:
+                    parts.append(f'{field}="{_escape(value)}"')
+            self._line = " | ".join(parts)
+        return self._line
+
+    def to_snapshot(self) -> Dict[str, Any]:
+        """Compact JSONB form for state_snapshot"""
+        snapshot: Dict[str, Any] = {
+            "v": SNAPSHOT_VERSION,
+            "s": [getattr(self, attr) if field in self.present else None for field, attr in _FIELD_ATTRS.items()],
+        }
+        if not self.is_structured and self._line:
+            snapshot["raw"] = self._line
+        return snapshot
+
+    def __str__(self) -> str:
+        return self.to_line()
+
+    def __repr__(self) -> str:
+        return f"ConversationState({self.to_line()!r})"
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, ConversationState):
+            return self.to_line() == other.to_line()
+        if isinstance(other, str):
+            return self.to_line() == other
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self.to_line())
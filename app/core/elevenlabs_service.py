@@ -5,10 +5,12 @@ Converts MP3 to OGG Opus format for Telegram voice messages.
 """
 import io
 import httpx
-from pydub import AudioSegment
 from app.settings import settings
+from app.core.lazy_imports import lazy_import
 from app.core.logging_utils import log_verbose, log_always
 
+pydub = lazy_import("pydub")  # Only needed when converting audio
+
 
 # ElevenLabs API endpoint
 ELEVENLABS_TTS_URL = "https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
@@ -110,7 +112,7 @@ def _convert_mp3_to_ogg_opus(mp3_bytes: bytes) -> bytes | None:
     """
     try:
         # Load MP3 from bytes
-        mp3_audio = AudioSegment.from_mp3(io.BytesIO(mp3_bytes))
+        mp3_audio = pydub.AudioSegment.from_mp3(io.BytesIO(mp3_bytes))
         
         # Export as OGG Opus
         ogg_buffer = io.BytesIO()
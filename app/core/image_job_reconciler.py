@@ -0,0 +1,226 @@
+"""
+Pending image job reconciler
+Finalizes or retries RunPod jobs whose webhook never arrived
+
+Every submitted job is indexed in a Redis sorted set scored by the time it
+was last submitted or checked. The scheduler periodically takes overdue jobs
+in batches, polls RunPod /status for them and then:
+- COMPLETED: delivers the result through the normal callback path
+- FAILED / CANCELLED / TIMED_OUT / unknown to RunPod, or stuck past the hard
+  timeout: resubmits (up to max_retries) or marks the job failed
+- still queued/running: re-scored to the time of the check, so the next
+  batch moves on to other overdue jobs instead of polling the same oldest
+  ones every sweep during a RunPod backlog
+Finalizing goes through main.handle_image_result, so the user's concurrent
+image counter is decremented and the upload_photo action is stopped.
+"""
+import json
+import time
+from typing import Dict, Any, List, Optional
+
+from app.core import redis_queue
+from app.core.logging_utils import log_always, log_verbose
+from app.settings import get_app_config
+
+
+PENDING_KEY = "image_jobs:pending"  # ZSET job_id -> last submit/check timestamp
+META_KEY = "image_jobs:meta"  # HASH job_id -> {"runpod_id", "first_submitted_at", "submitted_at", "retries"}
+LOCK_KEY = "image_jobs:reconciler_lock"
+
+AGE_BUCKETS_SEC = [15, 30, 60, 120, 300, 600]  # Histogram upper bounds (last bucket is +inf)
+FAILED_RUNPOD_STATUSES = {"FAILED", "CANCELLED", "TIMED_OUT", "NOT_FOUND"}
+
+_STATS: Dict[str, Any] = {
+    "sweeps": 0,
+    "polled": 0,
+    "recovered": 0,
+    "retried": 0,
+    "timed_out": 0,
+    "completion_age_histogram": {},  # bucket label -> count of finalized jobs
+}
+
+
+def get_reconciler_config() -> Dict[str, Any]:
+    """Get reconciler settings from app.yaml (image.reconciler)"""
+    cfg = get_app_config().get("image", {}).get("reconciler", {}) or {}
+    return {
+        "overdue_sec": int(cfg.get("overdue_sec", 90)),
+        "hard_timeout_sec": int(cfg.get("hard_timeout_sec", 600)),
+        "max_retries": int(cfg.get("max_retries", 1)),
+        "batch_size": int(cfg.get("batch_size", 20)),
+    }
+
+
+def _bucket_label(age_sec: float) -> str:
+    for bound in AGE_BUCKETS_SEC:
+        if age_sec <= bound:
+            return f"<={bound}s"
+    return f">{AGE_BUCKETS_SEC[-1]}s"
+
+
+async def track_submitted_job(job_id: str, runpod_job_id: Optional[str]):
+    """Index a job that was just submitted (or resubmitted) to RunPod"""
+    try:
+        redis = await redis_queue.get_redis()
+        now = time.time()
+        raw_meta = await redis.hget(META_KEY, job_id)
+        meta = json.loads(raw_meta) if raw_meta else {"first_submitted_at": now, "retries": 0}
+        meta["runpod_id"] = runpod_job_id
+        meta["submitted_at"] = now
+
+        pipe = redis.pipeline(transaction=True)
+        pipe.zadd(PENDING_KEY, {job_id: now})
+        pipe.hset(META_KEY, job_id, json.dumps(meta))
+        await pipe.execute()
+    except Exception as e:
+        log_always(f"[IMAGE-RECONCILER] ⚠️ Failed to track job {job_id}: {e}")
+
+
+async def untrack_job(job_id: str):
+    """Remove a finalized job from the pending index and record its age"""
+    try:
+        redis = await redis_queue.get_redis()
+        raw_meta = await redis.hget(META_KEY, job_id)
+        pipe = redis.pipeline(transaction=True)
+        pipe.zrem(PENDING_KEY, job_id)
+        pipe.hdel(META_KEY, job_id)
+        await pipe.execute()
+    except Exception as e:
+        log_always(f"[IMAGE-RECONCILER] ⚠️ Failed to untrack job {job_id}: {e}")
+        return
+
+    if raw_meta:
+        age = time.time() - json.loads(raw_meta).get("first_submitted_at", time.time())
+        histogram = _STATS["completion_age_histogram"]
+        label = _bucket_label(age)
+        histogram[label] = histogram.get(label, 0) + 1
+
+
+async def _finalize_failed(job_id: str, reason: str):
+    from app.main import handle_image_result
+
+    _STATS["timed_out"] += 1
+    log_always(f"[IMAGE-RECONCILER] ❌ Failing job {job_id}: {reason}")
+    await handle_image_result(job_id, "FAILED", {}, error=reason)
+    await untrack_job(job_id)
+
+
+async def _retry_or_fail(redis, job_id: str, meta: Dict[str, Any], reason: str, max_retries: int):
+    """Resubmit the job with its stored prompt, or fail it once retries are used up"""
+    from app.core.img_runpod import submit_image_job
+    from app.db.base import get_db
+    from app.db import crud
+
+    if meta.get("retries", 0) >= max_retries:
+        await _finalize_failed(job_id, reason)
+        return
+
+    with get_db() as db:
+        job = crud.get_image_job(db, job_id)
+        if not job:
+            await untrack_job(job_id)
+            return
+        prompt, negative_prompt = job.prompt, job.negative_prompt
+        seed = (job.ext or {}).get("seed")
+
+    meta["retries"] = meta.get("retries", 0) + 1
+    await redis.hset(META_KEY, job_id, json.dumps(meta))
+    try:
+        await submit_image_job(job_id, prompt, negative_prompt or "", seed=seed)
+        _STATS["retried"] += 1
+        log_always(f"[IMAGE-RECONCILER] 🔁 Resubmitted job {job_id} ({reason}, retry {meta['retries']}/{max_retries})")
+    except Exception as e:
+        await _finalize_failed(job_id, f"{reason}; resubmit failed: {e}")
+
+
+async def reconcile_pending_jobs() -> Dict[str, int]:
+    """Poll RunPod for overdue pending jobs and finalize or retry them (one batch)"""
+    from app.core.img_runpod import get_job_statuses
+    from app.db.base import get_db
+    from app.db import crud
+
+    cfg = get_reconciler_config()
+    redis = await redis_queue.get_redis()
+
+    # Only one worker/replica sweeps at a time
+    if not await redis.set(LOCK_KEY, "1", ex=max(cfg["overdue_sec"], 60), nx=True):
+        return {"polled": 0}
+
+    try:
+        _STATS["sweeps"] += 1
+        now = time.time()
+        overdue_ids: List[str] = await redis.zrangebyscore(
+            PENDING_KEY, 0, now - cfg["overdue_sec"], start=0, num=cfg["batch_size"]
+        )
+        if not overdue_ids:
+            return {"polled": 0}
+
+        raw_metas = await redis.hmget(META_KEY, overdue_ids)
+        metas = {jid: json.loads(raw) if raw else {} for jid, raw in zip(overdue_ids, raw_metas)}
+        # The score is the last check, so the hard timeout counts from the last submit
+        submitted_at = {jid: metas[jid].get("submitted_at", now) for jid in overdue_ids}
+
+        with get_db() as db:
+            statuses = crud.get_image_job_statuses(db, overdue_ids)
+
+        to_poll = {}
+        for job_id in overdue_ids:
+            if statuses.get(job_id) in (None, "completed", "failed"):
+                await untrack_job(job_id)
+                continue
+            runpod_id = metas[job_id].get("runpod_id")
+            if runpod_id:
+                to_poll[runpod_id] = job_id
+            elif now - submitted_at[job_id] > cfg["hard_timeout_sec"]:
+                await _retry_or_fail(redis, job_id, metas[job_id], "no webhook and no RunPod job id", cfg["max_retries"])
+
+        results = await get_job_statuses(list(to_poll.keys())) if to_poll else {}
+        _STATS["polled"] += len(results)
+
+        for runpod_id, payload in results.items():
+            job_id = to_poll[runpod_id]
+            runpod_status = (payload.get("status") or "").upper()
+            age = now - submitted_at[job_id]
+
+            if runpod_status == "COMPLETED":
+                from app.main import handle_image_result, parse_image_payload
+                status, output, error, image_data, image_url = parse_image_payload(payload)
+                _STATS["recovered"] += 1
+                log_always(f"[IMAGE-RECONCILER] ✅ Recovered job {job_id} (webhook missing, {age:.0f}s)")
+                await handle_image_result(job_id, "COMPLETED", output, error, image_data, image_url)
+                await untrack_job(job_id)
+            elif runpod_status in FAILED_RUNPOD_STATUSES:
+                await _retry_or_fail(redis, job_id, metas[job_id], f"RunPod status {runpod_status}", cfg["max_retries"])
+            elif runpod_status == "POLL_ERROR":
+                log_verbose(f"[IMAGE-RECONCILER] ⚠️ Poll failed for job {job_id}: {payload.get('error')}")
+            elif age > cfg["hard_timeout_sec"]:
+                await _retry_or_fail(redis, job_id, metas[job_id], f"stuck in {runpod_status or 'unknown'} for {age:.0f}s", cfg["max_retries"])
+            # Otherwise still IN_QUEUE/IN_PROGRESS at RunPod: polled again once overdue again
+
+        # Push jobs that are still pending behind the other overdue ones (xx: finalized jobs stay removed)
+        await redis.zadd(PENDING_KEY, {job_id: now for job_id in overdue_ids}, xx=True)
+        return {"polled": len(results)}
+    finally:
+        await redis.delete(LOCK_KEY)
+
+
+async def get_stats() -> Dict[str, Any]:
+    """Get reconciler counters and a histogram of currently pending job ages (since last submit)"""
+    pending_histogram = {_bucket_label(bound): 0 for bound in AGE_BUCKETS_SEC + [float("inf")]}
+    pending_total = 0
+    try:
+        redis = await redis_queue.get_redis()
+        now = time.time()
+        for raw_meta in await redis.hvals(META_KEY):
+            meta = json.loads(raw_meta)
+            submitted_at = meta.get("submitted_at", meta.get("first_submitted_at", now))
+            pending_histogram[_bucket_label(now - submitted_at)] += 1
+        pending_total = await redis.zcard(PENDING_KEY)
+    except Exception as e:
+        log_always(f"[IMAGE-RECONCILER] ⚠️ Failed to read pending jobs: {e}")
+
+    return {
+        **_STATS,
+        "pending": pending_total,
+        "pending_age_histogram": pending_histogram,
+    }
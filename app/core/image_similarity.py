@@ -0,0 +1,257 @@
+"""
+Near-duplicate prompt matching for the image cache
+
+Exact cache lookups (crud.compute_prompt_hash) miss prompts that differ by a
+single weight or alias. This module keeps an in-memory MinHash/LSH index over
+canonical tag sets of servable cached images, partitioned by persona, so a
+close-enough completed image can be served instead of a new RunPod generation.
+
+The index is refreshed incrementally from the DB by the scheduler
+(refresh_index, in a worker thread: a cold index hashes every cached prompt
+of the lookback window). A refresh updates a copy and swaps it in, so
+lookups on the event loop never see a half-built index. Tags from the global quality prompt are ignored so the
+similarity reflects the scene, not boilerplate shared by every prompt.
+"""
+import hashlib
+import random
+from datetime import datetime, timedelta
+from typing import Dict, FrozenSet, List, Optional, Tuple, Any
+from uuid import UUID
+
+from app.core.brains.image_prompt_engineer import _canonicalize_tag, _split_tags
+from app.core.logging_utils import log_always, log_verbose
+from app.settings import get_app_config
+
+
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS  # LSH candidate threshold ~ (1/16)^(1/4) = 0.5 Jaccard
+REFRESH_OVERLAP = timedelta(minutes=15)  # Cloudflare URLs are attached after finished_at
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(0x1DE5)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+
+_INDEX: Dict[str, Any] = {
+    "buckets": {},  # (persona_id, band, band_hash) -> set of job_id
+    "entries": {},  # job_id -> (persona_id, tag frozenset, finished_at)
+    "last_refreshed": None,
+}
+
+_STATS: Dict[str, int] = {
+    "lookups": 0,
+    "candidates": 0,
+    "hits": 0,
+}
+
+
+def get_similarity_config() -> Dict[str, Any]:
+    """Get near-duplicate cache settings from app.yaml (image.similar_cache)"""
+    cfg = get_app_config().get("image", {}).get("similar_cache", {}) or {}
+    return {
+        "enabled": cfg.get("enabled", True),
+        "jaccard_threshold": float(cfg.get("jaccard_threshold", 0.85)),
+        "lookback_days": int(cfg.get("lookback_days", 60)),
+        "cost_per_image_usd": float(cfg.get("cost_per_image_usd", 0.003)),
+    }
+
+
+def _quality_tags() -> FrozenSet[str]:
+    quality_prompt = get_app_config().get("image", {}).get("quality_prompt", "")
+    return frozenset(_canonicalize_tag(t) for t in _split_tags(quality_prompt))
+
+
+def canonical_tag_set(prompt: str, ignore: FrozenSet[str] = frozenset()) -> FrozenSet[str]:
+    """Canonical tag set of a prompt (weights stripped, aliases resolved)"""
+    tags = (_canonicalize_tag(t) for t in _split_tags(prompt or ""))
+    return frozenset(t for t in tags if t and t not in ignore)
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _tag_hash(tag: str) -> int:
+    return int.from_bytes(hashlib.blake2b(tag.encode(), digest_size=8).digest(), "big")
+
+
+def minhash_signature(tags: FrozenSet[str]) -> Tuple[int, ...]:
+    """MinHash signature of a tag set (NUM_PERM universal hash permutations)"""
+    if not tags:
+        return tuple([_MERSENNE_PRIME] * NUM_PERM)
+    hashes = [_tag_hash(t) for t in tags]
+    return tuple(
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def band_hashes(signature: Tuple[int, ...]) -> List[int]:
+    """Hash each LSH band of a signature into a bucket key"""
+    return [
+        hash(signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND])
+        for band in range(BANDS)
+    ]
+
+
+def add_to_index(job_id: str, persona_id: Optional[str], prompt: str, finished_at: Optional[datetime] = None):
+    """Add a cached image to the index (no-op if already indexed)"""
+    _add(_INDEX, job_id, persona_id, prompt, finished_at, _quality_tags())
+
+
+def _add(index: Dict[str, Any], job_id: str, persona_id: Optional[str], prompt: str,
+         finished_at: Optional[datetime], ignore: FrozenSet[str]):
+    job_id = str(job_id)
+    persona_key = str(persona_id) if persona_id else None
+    if job_id in index["entries"]:
+        return
+    tags = canonical_tag_set(prompt, ignore)
+    if not tags:
+        return
+
+    buckets = index["buckets"]
+    for band, band_hash in enumerate(band_hashes(minhash_signature(tags))):
+        buckets.setdefault((persona_key, band, band_hash), set()).add(job_id)
+    index["entries"][job_id] = (persona_key, tags, finished_at)
+
+
+def _remove_from_index(job_id: str):
+    _remove(_INDEX, job_id)
+
+
+def _remove(index: Dict[str, Any], job_id: str):
+    entry = index["entries"].pop(job_id, None)
+    if not entry:
+        return
+    persona_key, tags, _ = entry
+    buckets = index["buckets"]
+    for band, band_hash in enumerate(band_hashes(minhash_signature(tags))):
+        bucket = buckets.get((persona_key, band, band_hash))
+        if bucket is None:
+            continue
+        bucket.discard(job_id)
+        if not bucket:
+            del buckets[(persona_key, band, band_hash)]
+
+
+def find_similar_job_ids(prompt: str, persona_id: Optional[str], threshold: float) -> List[Tuple[str, float]]:
+    """Find indexed images of the same persona whose tag-set Jaccard >= threshold
+
+    Returns:
+        List of (job_id, similarity), best match first
+    """
+    persona_key = str(persona_id) if persona_id else None
+    tags = canonical_tag_set(prompt, _quality_tags())
+    if not tags:
+        return []
+
+    index = _INDEX  # A refresh may swap in a new index meanwhile
+    candidate_ids = set()
+    buckets = index["buckets"]
+    for band, band_hash in enumerate(band_hashes(minhash_signature(tags))):
+        candidate_ids.update(buckets.get((persona_key, band, band_hash), ()))
+    _STATS["candidates"] += len(candidate_ids)
+
+    scored = []
+    for job_id in candidate_ids:
+        entry = index["entries"].get(job_id)
+        if not entry:
+            continue
+        score = jaccard(tags, entry[1])
+        if score >= threshold:
+            scored.append((job_id, score))
+    scored.sort(key=lambda item: item[1], reverse=True)
+    return scored
+
+
+def refresh_index() -> Dict[str, int]:
+    """Incrementally load newly cacheable images from the DB and prune expired entries
+
+    Blocking (DB fetch and MinHash of every new prompt); run it in a thread.
+    Only one refresh may run at a time.
+    """
+    global _INDEX
+    from app.db.base import get_db
+    from app.db import crud
+
+    cfg = get_similarity_config()
+    now = datetime.utcnow()
+    horizon = now - timedelta(days=cfg["lookback_days"])
+    last = _INDEX["last_refreshed"]
+    since = max(horizon, last - REFRESH_OVERLAP) if last else horizon
+
+    with get_db() as db:
+        rows = crud.get_cacheable_image_prompts(db, since)
+
+    index = {
+        "buckets": {key: set(job_ids) for key, job_ids in _INDEX["buckets"].items()},
+        "entries": dict(_INDEX["entries"]),
+        "last_refreshed": now,
+    }
+    ignore = _quality_tags()
+    before = len(index["entries"])
+    for job_id, persona_id, prompt, finished_at in rows:
+        _add(index, job_id, persona_id, prompt, finished_at, ignore)
+    added = len(index["entries"]) - before
+
+    expired = [
+        job_id for job_id, (_, _, finished_at) in index["entries"].items()
+        if finished_at and finished_at < horizon
+    ]
+    for job_id in expired:
+        _remove(index, job_id)
+
+    _INDEX = index
+    log_verbose(f"[IMAGE-SIMILARITY] 🔄 Index refreshed: +{added}, -{len(expired)}, total {len(index['entries'])}")
+    return {"added": added, "expired": len(expired), "total": len(index["entries"])}
+
+
+async def find_similar_cached_image(db, prompt: str, persona_id, user_id: int):
+    """Find a servable, unseen cached image whose prompt is a near-duplicate of `prompt`
+
+    Returns:
+        ImageJob if found, None otherwise
+    """
+    from app.core import shown_images
+    from app.db import crud
+
+    cfg = get_similarity_config()
+    if not cfg["enabled"] or not _INDEX["entries"]:
+        return None
+
+    _STATS["lookups"] += 1
+    matches = find_similar_job_ids(prompt, persona_id, cfg["jaccard_threshold"])
+    if not matches:
+        return None
+
+    scores = dict(matches)
+    jobs = crud.get_cached_images_by_ids(db, [UUID(job_id) for job_id, _ in matches])
+    unseen = await shown_images.filter_unseen(user_id, jobs)
+    if not unseen:
+        return None
+
+    best = max(unseen, key=lambda job: scores.get(str(job.id), 0.0))
+    _STATS["hits"] += 1
+    log_always(f"[IMAGE-SIMILARITY] ✅ Near-duplicate cache hit {best.id} (jaccard={scores[str(best.id)]:.2f})")
+    return best
+
+
+def get_stats() -> Dict[str, Any]:
+    """Get near-duplicate matching statistics for this process"""
+    from app.core import shown_images
+
+    cfg = get_similarity_config()
+    exact_lookups = shown_images.get_stats()["lookups"]
+    return {
+        **_STATS,
+        "indexed_images": len(_INDEX["entries"]),
+        "last_refreshed": _INDEX["last_refreshed"].isoformat() if _INDEX["last_refreshed"] else None,
+        "jaccard_threshold": cfg["jaccard_threshold"],
+        "extra_hit_rate": round(_STATS["hits"] / exact_lookups, 4) if exact_lookups else 0.0,
+        "gpu_cost_saved_usd": round(_STATS["hits"] * cfg["cost_per_image_usd"], 4),
+    }
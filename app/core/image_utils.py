@@ -4,7 +4,10 @@ Handles color profile stripping, blurring, and image optimization for Telegram
 """
 from io import BytesIO
 from typing import Optional
-from PIL import Image, ImageFilter
+from app.core.lazy_imports import lazy_import
+
+Image = lazy_import("PIL.Image")
+ImageFilter = lazy_import("PIL.ImageFilter")
 
 
 def strip_color_profile(image_data: bytes) -> bytes:
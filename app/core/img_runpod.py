@@ -74,12 +74,52 @@ async def submit_image_job(
             )
             response.raise_for_status()
             
-            return response.json()
+            result = response.json()
     
     except httpx.HTTPStatusError as e:
         raise Exception(f"Runpod API error: {e.response.status_code} - {e.response.text}")
     except Exception as e:
         raise Exception(f"Runpod submission failed: {str(e)}")
+    
+    # Index the job by submit time so the reconciler can poll it if the webhook never arrives
+    from app.core import image_job_reconciler
+    await image_job_reconciler.track_submitted_job(job_id_str, result.get("id"))
+    
+    return result
+
+
+def get_status_url(runpod_job_id: str) -> str:
+    """Build the RunPod /status URL from the configured /run (or /runsync) endpoint"""
+    base = settings.RUNPOD_ENDPOINT.rstrip("/")
+    if base.endswith("/run") or base.endswith("/runsync"):
+        base = base.rsplit("/", 1)[0]
+    return f"{base}/status/{runpod_job_id}"
+
+
+async def get_job_statuses(runpod_job_ids: list[str], timeout_sec: int = 15) -> dict:
+    """
+    Poll RunPod for the status of several jobs concurrently over one connection pool
+    
+    Returns:
+        Dict of runpod_job_id -> status payload (or {"status": "POLL_ERROR", "error": ...})
+    """
+    import asyncio
+    
+    headers = {"Authorization": f"Bearer {settings.RUNPOD_API_KEY_POD}"}
+    
+    async def _poll(client: httpx.AsyncClient, runpod_job_id: str) -> dict:
+        try:
+            response = await client.get(get_status_url(runpod_job_id), headers=headers)
+            if response.status_code == 404:
+                return {"status": "NOT_FOUND"}
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            return {"status": "POLL_ERROR", "error": str(e)}
+    
+    async with httpx.AsyncClient(timeout=timeout_sec) as client:
+        results = await asyncio.gather(*[_poll(client, rid) for rid in runpod_job_ids])
+    return dict(zip(runpod_job_ids, results))
 
 
 async def dispatch_image_generation(
@@ -0,0 +1,55 @@
+"""
+Deferred imports for heavy optional dependencies
+
+boto3 (R2 uploads), pydub (TTS audio conversion) and Pillow (image
+post-processing) are only needed by a few code paths, but a module-level
+import loads them into every process that imports the helper module, e.g.
+for a constant or a stats counter. lazy_import returns a stand-in that
+imports the real module on first attribute access:
+
+    boto3 = lazy_import("boto3")
+    ...
+    boto3.client("s3")  # imported here, once
+
+The first access goes through importlib's import lock, so concurrent first
+use from worker threads is safe. scripts/import_profile.py shows what the
+app still imports eagerly.
+"""
+import importlib
+import time
+from types import ModuleType
+from typing import Dict, Optional
+
+_LOADED_MS: Dict[str, float] = {}  # Modules imported through a stand-in so far, with import time
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: Optional[ModuleType] = None
+
+    def _load(self) -> ModuleType:
+        if self._module is None:
+            started = time.perf_counter()
+            self._module = importlib.import_module(self._name)
+            _LOADED_MS.setdefault(self._name, round((time.perf_counter() - started) * 1000, 1))
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    """Module stand-in for name (see module docstring)"""
+    return LazyModule(name)
+
+
+def get_stats() -> Dict[str, float]:
+    """Deferred modules this process has actually imported, with their import time in ms"""
+    return dict(_LOADED_MS)
@@ -0,0 +1,208 @@
+"""
+Admission control for LLM calls
+
+Every generate_text attempt takes a slot here before it goes to OpenRouter.
+Calls are queued in priority lanes by brain:
+    interactive (dialogue) > state > image (decision + prompt)
+    > background (memory, summary) > followup
+A freed slot goes to the highest-priority lane that is under its own cap.
+Non-interactive lanes can't use the last reserved_interactive slots, so a
+burst of follow-ups or background jobs never makes a dialogue reply wait.
+Queue times are recorded per lane.
+
+RateLimiter is a token bucket for callers that also need a requests-per-second
+budget (scheduler follow-up batches).
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, List, Optional
+
+from app.core.logging_utils import log_verbose
+from app.settings import get_app_config
+
+
+LANE_INTERACTIVE = "interactive"
+LANE_STATE = "state"
+LANE_IMAGE = "image"
+LANE_BACKGROUND = "background"
+LANE_FOLLOWUP = "followup"
+
+LANE_PRIORITY = [LANE_INTERACTIVE, LANE_STATE, LANE_IMAGE, LANE_BACKGROUND, LANE_FOLLOWUP]
+
+BRAIN_LANES = {
+    "dialogue": LANE_INTERACTIVE,
+    "state": LANE_STATE,
+    "image_decision": LANE_IMAGE,
+    "image_prompt": LANE_IMAGE,
+    "memory": LANE_BACKGROUND,
+    "context_summary": LANE_BACKGROUND,
+    "followup": LANE_FOLLOWUP,
+}
+
+DEFAULT_LANE_CAPS = {
+    LANE_INTERACTIVE: 24,
+    LANE_STATE: 12,
+    LANE_IMAGE: 8,
+    LANE_BACKGROUND: 4,
+    LANE_FOLLOWUP: 4,
+}
+
+WAIT_WINDOW = 200  # Recent queue times kept per lane for the p95
+
+_LANES: Optional[Dict[str, Dict[str, Any]]] = None
+_CONFIG: Optional[Dict[str, Any]] = None
+_IN_FLIGHT = 0
+
+
+def get_governor_config() -> Dict[str, Any]:
+    """Get concurrency limits from app.yaml (llm.governor)"""
+    cfg = get_app_config().get("llm", {}).get("governor", {}) or {}
+    lane_caps = {**DEFAULT_LANE_CAPS, **(cfg.get("lanes", {}) or {})}
+    return {
+        "max_concurrent": int(cfg.get("max_concurrent", 24)),
+        "reserved_interactive": int(cfg.get("reserved_interactive", 6)),
+        "lanes": {lane: int(cap) for lane, cap in lane_caps.items()},
+    }
+
+
+def _get_lanes() -> Dict[str, Dict[str, Any]]:
+    global _LANES, _CONFIG
+    if _LANES is None:
+        _CONFIG = get_governor_config()
+        _LANES = {
+            lane: {
+                "cap": _CONFIG["lanes"].get(lane, 1),
+                "in_flight": 0,
+                "waiters": deque(),
+                "admitted": 0,
+                "queued": 0,
+                "waits_ms": deque(maxlen=WAIT_WINDOW),
+                "max_wait_ms": 0.0,
+            }
+            for lane in LANE_PRIORITY
+        }
+    return _LANES
+
+
+def lane_for_brain(brain: Optional[str]) -> str:
+    """Lane for a brain name; calls without a brain are treated as interactive"""
+    return BRAIN_LANES.get(brain, LANE_INTERACTIVE) if brain else LANE_INTERACTIVE
+
+
+def _can_admit(lane_name: str, lane: Dict[str, Any]) -> bool:
+    if lane["in_flight"] >= lane["cap"]:
+        return False
+    limit = _CONFIG["max_concurrent"]
+    if lane_name != LANE_INTERACTIVE:
+        limit -= _CONFIG["reserved_interactive"]
+    return _IN_FLIGHT < limit
+
+
+def _dispatch():
+    """Hand free slots to waiters, highest-priority lane first"""
+    global _IN_FLIGHT
+    lanes = _get_lanes()
+    for lane_name in LANE_PRIORITY:
+        lane = lanes[lane_name]
+        while lane["waiters"] and _can_admit(lane_name, lane):
+            waiter = lane["waiters"].popleft()
+            if waiter.done():
+                continue
+            lane["in_flight"] += 1
+            _IN_FLIGHT += 1
+            waiter.set_result(None)
+
+
+def _release(lane_name: str):
+    global _IN_FLIGHT
+    lane = _get_lanes()[lane_name]
+    lane["in_flight"] -= 1
+    _IN_FLIGHT -= 1
+    _dispatch()
+
+
+@asynccontextmanager
+async def llm_slot(brain: Optional[str] = None, lane_name: Optional[str] = None):
+    """Hold one LLM concurrency slot in the brain's lane (or lane_name) for the duration of the block"""
+    lane_name = lane_name or lane_for_brain(brain)
+    lane = _get_lanes()[lane_name]
+    waiter = asyncio.get_running_loop().create_future()
+    lane["waiters"].append(waiter)
+    queued_at = time.monotonic()
+    _dispatch()
+
+    if not waiter.done():
+        lane["queued"] += 1
+        log_verbose(f"[LLM-GOVERNOR] ⏳ Queued in '{lane_name}' lane ({len(lane['waiters'])} waiting)")
+    try:
+        await waiter
+    except asyncio.CancelledError:
+        if waiter.done() and not waiter.cancelled():
+            _release(lane_name)
+        else:
+            try:
+                lane["waiters"].remove(waiter)
+            except ValueError:
+                pass
+        raise
+
+    wait_ms = (time.monotonic() - queued_at) * 1000
+    lane["admitted"] += 1
+    lane["waits_ms"].append(wait_ms)
+    lane["max_wait_ms"] = max(lane["max_wait_ms"], wait_ms)
+    try:
+        yield
+    finally:
+        _release(lane_name)
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` acquisitions per second on average, in bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def _p95(values: Deque[float]) -> Optional[float]:
+    if not values:
+        return None
+    ordered: List[float] = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1)
+
+
+def get_stats() -> Dict[str, Any]:
+    """Get in-flight/queued counts and queue times per lane for this process"""
+    lanes = _get_lanes()
+    return {
+        "in_flight": _IN_FLIGHT,
+        "max_concurrent": _CONFIG["max_concurrent"],
+        "lanes": {
+            lane_name: {
+                "cap": lane["cap"],
+                "in_flight": lane["in_flight"],
+                "waiting": len(lane["waiters"]),
+                "admitted": lane["admitted"],
+                "queued": lane["queued"],
+                "p95_wait_ms": _p95(lane["waits_ms"]),
+                "max_wait_ms": round(lane["max_wait_ms"], 1),
+            }
+            for lane_name, lane in lanes.items()
+        },
+    }
@@ -0,0 +1,216 @@
+"""
+Per-model LLM latency, error and cost tracking, plus circuit breakers
+
+generate_text records every OpenRouter call here. The recorded data drives:
+- hedging: if a request hasn't returned by the model's observed p95 latency,
+  a backup request is sent to an alternate model and the first answer wins
+- routing: a model that failed failure_threshold times in a row is skipped
+  for cooldown_sec; after that, a single probe call is let through (half-open)
+  while other calls keep being routed elsewhere. A successful probe closes
+  the breaker, a failed one reopens it. Only model-side errors count: 5xx,
+  429 and transport errors, not a 4xx caused by the request itself
+- hedged requests that lose (or are cancelled) are recorded as censored
+  latency samples, so the p95 doesn't drift down to the winners only
+- model_router: per-brain model selection by SLO
+- cost tracking for models missing from MODEL_PRICING (learned USD per token)
+"""
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from app.settings import get_app_config
+
+
+EWMA_ALPHA = 0.2
+LATENCY_WINDOW = 50  # Recent latencies/outcomes kept per model for p95 and error rate
+MIN_SAMPLES_FOR_P95 = 5
+PROBE_STALE_SEC = 120  # A half-open probe that never reported back no longer blocks the next one
+
+_MODELS: Dict[str, Dict[str, Any]] = {}
+
+_HEDGE_STATS: Dict[str, int] = {
+    "hedged": 0,
+    "backup_wins": 0,
+}
+
+
+def get_health_config() -> Dict[str, Any]:
+    """Get hedging and circuit breaker settings from app.yaml (llm.hedging, llm.circuit_breaker)"""
+    llm_cfg = get_app_config().get("llm", {})
+    hedging = llm_cfg.get("hedging", {}) or {}
+    breaker = llm_cfg.get("circuit_breaker", {}) or {}
+    return {
+        "hedging_enabled": hedging.get("enabled", True),
+        "default_delay_ms": float(hedging.get("default_delay_ms", 6000)),
+        "min_delay_ms": float(hedging.get("min_delay_ms", 1500)),
+        "max_delay_ms": float(hedging.get("max_delay_ms", 15000)),
+        "failure_threshold": int(breaker.get("failure_threshold", 3)),
+        "cooldown_sec": float(breaker.get("cooldown_sec", 30)),
+    }
+
+
+def _entry(model: str) -> Dict[str, Any]:
+    entry = _MODELS.get(model)
+    if entry is None:
+        entry = {
+            "calls": 0,
+            "errors": 0,
+            "ewma_ms": None,
+            "latencies": deque(maxlen=LATENCY_WINDOW),
+            "outcomes": deque(maxlen=LATENCY_WINDOW),  # True = success
+            "cost_usd": 0.0,
+            "cost_tokens": 0,
+            "consecutive_failures": 0,
+            "open_until": 0.0,  # 0 = closed; in the past = half-open
+            "probe_started": None,  # Monotonic start of the in-flight half-open probe
+        }
+        _MODELS[model] = entry
+    return entry
+
+
+def record_success(model: str, latency_ms: float):
+    entry = _entry(model)
+    entry["calls"] += 1
+    entry["latencies"].append(latency_ms)
+    entry["outcomes"].append(True)
+    entry["ewma_ms"] = latency_ms if entry["ewma_ms"] is None else (
+        EWMA_ALPHA * latency_ms + (1 - EWMA_ALPHA) * entry["ewma_ms"]
+    )
+    entry["consecutive_failures"] = 0
+    entry["open_until"] = 0.0
+    entry["probe_started"] = None
+
+
+def record_failure(model: str):
+    """Record a model-side failure (5xx, 429, transport error, error body)"""
+    cfg = get_health_config()
+    entry = _entry(model)
+    entry["calls"] += 1
+    entry["errors"] += 1
+    entry["outcomes"].append(False)
+    entry["consecutive_failures"] += 1
+    entry["probe_started"] = None
+    if entry["consecutive_failures"] >= cfg["failure_threshold"]:
+        entry["open_until"] = time.monotonic() + cfg["cooldown_sec"]
+
+
+def record_cancelled(model: str, elapsed_ms: float):
+    """
+    Record a call cancelled before it answered (e.g. the losing side of a hedge).
+
+    It took at least elapsed_ms, so it is kept as a censored latency sample of
+    max(elapsed, current p95): leaving it out would keep only the fast calls in
+    the window, lowering the p95 and making hedges fire earlier and earlier.
+    """
+    entry = _entry(model)
+    p95 = p95_latency_ms(model)
+    entry["latencies"].append(max(elapsed_ms, p95) if p95 is not None else elapsed_ms)
+    record_inconclusive(model)
+
+
+def record_inconclusive(model: str):
+    """Record a call that says nothing about the model (cancelled, or rejected for its request)
+
+    A half-open probe that ends this way frees the slot, so the next call
+    probes again instead of waiting PROBE_STALE_SEC.
+    """
+    entry = _MODELS.get(model)
+    if entry:
+        entry["probe_started"] = None
+
+
+def _is_probing(entry: Dict[str, Any], now: float) -> bool:
+    return entry["probe_started"] is not None and now - entry["probe_started"] < PROBE_STALE_SEC
+
+
+def is_available(model: str) -> bool:
+    """False while the model's circuit breaker is open, or half-open with a probe in flight"""
+    entry = _MODELS.get(model)
+    if not entry or not entry["open_until"]:
+        return True
+    now = time.monotonic()
+    return entry["open_until"] <= now and not _is_probing(entry, now)
+
+
+def start_call(model: str):
+    """Note that a call to model is being sent (claims the probe if the breaker is half-open)"""
+    entry = _MODELS.get(model)
+    if entry and entry["open_until"]:
+        now = time.monotonic()
+        if entry["open_until"] <= now and not _is_probing(entry, now):
+            entry["probe_started"] = now
+
+
+def record_cost(model: str, cost_usd: float, tokens: int):
+    """Record the billed cost of a call (from OpenRouter usage.cost)"""
+    if tokens <= 0:
+        return
+    entry = _entry(model)
+    entry["cost_usd"] += cost_usd
+    entry["cost_tokens"] += tokens
+
+
+def usd_per_token(model: str) -> Optional[float]:
+    """Average billed USD per token for a model, or None if no cost was recorded yet"""
+    entry = _MODELS.get(model)
+    if not entry or not entry["cost_tokens"]:
+        return None
+    return entry["cost_usd"] / entry["cost_tokens"]
+
+
+def recent_error_rate(model: str) -> Optional[float]:
+    """Error rate over the last LATENCY_WINDOW calls, or None if there are none"""
+    entry = _MODELS.get(model)
+    if not entry or not entry["outcomes"]:
+        return None
+    outcomes = entry["outcomes"]
+    return outcomes.count(False) / len(outcomes)
+
+
+def sample_count(model: str) -> int:
+    entry = _MODELS.get(model)
+    return len(entry["outcomes"]) if entry else 0
+
+
+def p95_latency_ms(model: str) -> Optional[float]:
+    entry = _MODELS.get(model)
+    if not entry or len(entry["latencies"]) < MIN_SAMPLES_FOR_P95:
+        return None
+    latencies: Deque[float] = entry["latencies"]
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+def hedge_delay_sec(model: str) -> float:
+    """How long to wait for a model before sending a backup request"""
+    cfg = get_health_config()
+    p95 = p95_latency_ms(model)
+    delay_ms = cfg["default_delay_ms"] if p95 is None else min(max(p95, cfg["min_delay_ms"]), cfg["max_delay_ms"])
+    return delay_ms / 1000
+
+
+def record_hedge(backup_won: bool = False):
+    if backup_won:
+        _HEDGE_STATS["backup_wins"] += 1
+    else:
+        _HEDGE_STATS["hedged"] += 1
+
+
+def get_stats() -> Dict[str, Any]:
+    """Get per-model latency/error stats and hedging counters for this process"""
+    now = time.monotonic()
+    models = {}
+    for model, entry in _MODELS.items():
+        models[model] = {
+            "calls": entry["calls"],
+            "errors": entry["errors"],
+            "error_rate": round(entry["errors"] / entry["calls"], 4) if entry["calls"] else 0.0,
+            "recent_error_rate": recent_error_rate(model),
+            "ewma_ms": round(entry["ewma_ms"], 1) if entry["ewma_ms"] is not None else None,
+            "p95_ms": p95_latency_ms(model),
+            "circuit_open": entry["open_until"] > now,
+            "circuit_half_open": 0 < entry["open_until"] <= now,
+            "cost_usd": round(entry["cost_usd"], 6),
+            "usd_per_1k_tokens": round(usd_per_token(model) * 1000, 6) if entry["cost_tokens"] else None,
+        }
+    return {"models": models, **_HEDGE_STATS}
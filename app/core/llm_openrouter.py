@@ -3,9 +3,19 @@ OpenRouter LLM Client (Non-Streaming)
 """
 import httpx
 import asyncio
-from typing import List, Dict, Optional
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, List, Dict, Optional, Tuple
 from app.settings import settings, get_app_config
 from app.core import analytics_service_tg
+from app.core import llm_health, llm_governor, model_router
+from app.core.logging_utils import log_verbose, log_always, log_dev_request, log_dev_response
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+# Set by batch_session: {"client", "limiter", "lane"} shared by every call in the batch
+_BATCH_SESSION: ContextVar[Optional[Dict[str, Any]]] = ContextVar("llm_batch_session", default=None)
 
 # Model pricing (USD per 1M tokens) - (Input, Output)
 MODEL_PRICING = {
@@ -42,7 +52,9 @@ async def generate_text(
     presence_penalty: float = None,
     timeout_sec: int = None,
     user_id: Optional[int] = None,
-    reasoning: bool = False
+    reasoning: bool = False,
+    cost_meta: Optional[Dict] = None,
+    brain: Optional[str] = None
 ) -> str:
     """
     Generate text response from OpenRouter (non-streaming)
@@ -58,6 +70,11 @@ async def generate_text(
         timeout_sec: Override default timeout
         user_id: Optional Telegram user ID for cost tracking
         reasoning: Enable reasoning/thinking mode for supported models
+        cost_meta: Extra fields for the llm_cost event. If it contains
+            baseline_prompt_tokens, prompt_tokens_saved is reported as well
+        brain: Brain name in app.yaml model_routing. Without an explicit model,
+            the brain's model is picked by model_router; the brain's pool is
+            also used for hedging/failover
     
     Returns:
         Generated text response
@@ -65,7 +82,6 @@ async def generate_text(
     config = get_app_config()
     llm_config = config["llm"]
     
-    url = "https://openrouter.ai/api/v1/chat/completions"
     headers = {
         "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
         "Content-Type": "application/json",
@@ -73,12 +89,16 @@ async def generate_text(
         "X-Title": "Telegram Roleplay Bot"  # Optional, for OpenRouter analytics
     }
     
+    if model is None:
+        model = model_router.pick_model(brain, llm_config["model"]) if brain else llm_config["model"]
+    
     body = {
-        "model": model if model is not None else llm_config["model"],
+        "model": model,
         "messages": messages,
         "temperature": temperature if temperature is not None else llm_config["temperature"],
         "max_tokens": max_tokens if max_tokens is not None else llm_config["max_tokens"],
-        "transforms": ["middle-out"]  # Bypass OpenRouter's moderation for adult content
+        "transforms": ["middle-out"],  # Bypass OpenRouter's moderation for adult content
+        "usage": {"include": True}  # Return billed cost in usage.cost
     }
     fallback_model = llm_config.get("model")
     fallback_switched = False
@@ -95,9 +115,6 @@ async def generate_text(
     
     timeout = timeout_sec if timeout_sec is not None else llm_config["timeout_sec"]
     
-    from app.core.logging_utils import log_verbose, log_always, log_dev_request, log_dev_response
-    import time
-    
     # Verbose logging for development
     log_always(f"[LLM] 🤖 Calling {body['model']} (temp={body['temperature']}, max_tokens={body['max_tokens']})")
     log_verbose("[LLM] 📊 Full request details:")
@@ -135,76 +152,41 @@ async def generate_text(
     
     # Retry logic for transient errors. For deterministic 404 model-not-found,
     # auto-switch once to fallback model (llm.model) when possible.
+    # Each attempt is routed around open circuit breakers, hedged with a
+    # backup model (see _hedged_completion) and admitted by llm_governor in
+    # the brain's priority lane; backoff sleeps don't hold a slot.
     max_retries = 3
     request_start = time.time()
+    requested_model = body["model"]
     
     for attempt in range(max_retries):
         try:
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                response = await client.post(url, json=body, headers=headers)
-                response.raise_for_status()
-                
-                data = response.json()
-                
-                # Check for API error response
-                if "error" in data:
-                    error_msg = data["error"].get("message", str(data["error"]))
-                    raise Exception(f"OpenRouter API returned error: {error_msg}")
-                
-                if "choices" not in data or not data["choices"]:
-                    log_always(f"[LLM] ⚠️ Unexpected response structure: {data}")
-                    raise Exception(f"OpenRouter API returned invalid response (no choices). Response: {str(data)[:500]}")
-                
-                result = data["choices"][0]["message"]["content"]
-                
-                # Track token usage and cost if user_id is provided
-                if user_id and "usage" in data:
-                    usage = data["usage"]
-                    prompt_tokens = usage.get("prompt_tokens", 0)
-                    completion_tokens = usage.get("completion_tokens", 0)
-                    
-                    # Calculate cost
-                    used_model = data.get("model", body["model"])
-                    # Try to match model prefix if exact match not found
-                    pricing = MODEL_PRICING.get(used_model)
-                    if not pricing:
-                        # Fallback: try to find by partial match
-                        for key, val in MODEL_PRICING.items():
-                            if key in used_model:
-                                pricing = val
-                                break
-                    
-                    cost_usd = 0.0
-                    if pricing:
-                        input_price, output_price = pricing
-                        cost_usd = (prompt_tokens / 1_000_000 * input_price) + (completion_tokens / 1_000_000 * output_price)
-                    
-                    # Log analytics event
-                    analytics_service_tg.track_event_tg(
-                        client_id=user_id,
-                        event_name="llm_cost",
-                        meta={
-                            "model": used_model,
-                            "prompt_tokens": prompt_tokens,
-                            "completion_tokens": completion_tokens,
-                            "cost_usd": cost_usd
-                        }
-                    )
-                
-                request_duration_ms = (time.time() - request_start) * 1000
-                
-                log_always(f"[LLM] ✅ Response received ({len(result)} chars) in {request_duration_ms:.2f}ms")
-                log_verbose(f"[LLM] 📝 Response preview: {result[:200]}...")
-                
-                # Development-only: Log full response
-                log_dev_response(
-                    brain_name="LLM Client",
-                    model=body['model'],
-                    response=result,
-                    duration_ms=request_duration_ms
-                )
-                
-                return result
+            primary_model, backup_model = _route_models(requested_model, llm_config, brain)
+            body["model"] = primary_model
+            async with llm_governor.llm_slot(brain, lane_name=_batch_lane()):
+                data = await _hedged_completion(body, headers, timeout, backup_model)
+            
+            result = data["choices"][0]["message"]["content"]
+            used_model = data.get("model", body["model"])
+            
+            # Record cost per model; track the llm_cost event if user_id is provided
+            if "usage" in data:
+                _track_llm_cost(user_id, used_model, data["usage"], cost_meta, brain)
+            
+            request_duration_ms = (time.time() - request_start) * 1000
+            
+            log_always(f"[LLM] ✅ Response received ({len(result)} chars) in {request_duration_ms:.2f}ms")
+            log_verbose(f"[LLM] 📝 Response preview: {result[:200]}...")
+            
+            # Development-only: Log full response
+            log_dev_response(
+                brain_name="LLM Client",
+                model=used_model,
+                response=result,
+                duration_ms=request_duration_ms
+            )
+            
+            return result
                 
         except httpx.TimeoutException as e:
             if attempt == max_retries - 1:
@@ -221,7 +203,7 @@ async def generate_text(
             if status_code == 404:
                 if not fallback_switched and fallback_model and body["model"] != fallback_model:
                     previous_model = body["model"]
-                    body["model"] = fallback_model
+                    requested_model = fallback_model
                     fallback_switched = True
                     log_always(
                         f"[LLM] ⚠️ Model '{previous_model}' returned 404. "
@@ -235,7 +217,7 @@ async def generate_text(
                 except Exception:
                     detail = ""
                 raise NonRetryableOpenRouterError(
-                    f"OpenRouter 404 for model '{body['model']}' at '{url}'. "
+                    f"OpenRouter 404 for model '{body['model']}' at '{OPENROUTER_URL}'. "
                     f"{('Response: ' + detail) if detail else ''}".strip()
                 )
 
@@ -259,3 +241,247 @@ async def generate_text(
             await asyncio.sleep(wait_time)
     
     raise Exception("OpenRouter API failed unexpectedly")
+
+
+def _route_models(requested_model: str, llm_config: dict, brain: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """
+    Pick the model for an attempt and an optional hedge backup.
+    
+    Candidates are the requested model, the brain's model_routing pool, then
+    llm.fallback_models (default: llm.model). Models with an open circuit
+    breaker are skipped unless every candidate is open.
+    """
+    candidates = [requested_model]
+    fallbacks = llm_config.get("fallback_models") or [llm_config.get("model")]
+    for model in model_router.get_pool(brain, requested_model) + list(fallbacks):
+        if model and model not in candidates:
+            candidates.append(model)
+    
+    available = [m for m in candidates if llm_health.is_available(m)] or [requested_model]
+    primary = available[0]
+    backup = None
+    if llm_health.get_health_config()["hedging_enabled"]:
+        backup = next((m for m in available[1:] if m != primary), None)
+    if primary != requested_model:
+        log_always(f"[LLM] 🔌 Circuit open for '{requested_model}', routing to '{primary}'")
+    return primary, backup
+
+
+@asynccontextmanager
+async def batch_session(rps: float, lane: Optional[str] = None, max_connections: int = 20):
+    """
+    Share one pooled HTTP client between all generate_text calls made inside
+    the block (including tasks it spawns), and cap them at rps requests per
+    second. lane, if given, overrides the llm_governor lane of those calls.
+    
+    Requests started after the block exits (e.g. by background tasks that
+    outlive it) go back to their own client, without the rate budget.
+    Requests that already picked the shared client keep it: the block waits
+    for them (each is bounded by its own timeout) before closing it.
+    """
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    async with httpx.AsyncClient(timeout=None, limits=limits) as client:
+        session = {
+            "client": client,
+            "limiter": llm_governor.RateLimiter(rps),
+            "lane": lane,
+            "closing": False,
+            "in_flight": 0,
+            "idle": asyncio.Event(),
+        }
+        session["idle"].set()
+        token = _BATCH_SESSION.set(session)
+        try:
+            yield
+        finally:
+            _BATCH_SESSION.reset(token)
+            session["closing"] = True
+            if session["in_flight"]:
+                log_verbose(f"[LLM] ⏳ Batch session waiting for {session['in_flight']} in-flight request(s)")
+                await session["idle"].wait()
+
+
+def _active_batch_session() -> Optional[Dict[str, Any]]:
+    session = _BATCH_SESSION.get()
+    if session and not session["closing"] and not session["client"].is_closed:
+        return session
+    return None
+
+
+def _claim_batch_session() -> Optional[Dict[str, Any]]:
+    """Active batch session for one request, held open until _release_batch_session"""
+    session = _active_batch_session()
+    if session:
+        session["in_flight"] += 1
+        session["idle"].clear()
+    return session
+
+
+def _release_batch_session(session: Optional[Dict[str, Any]]):
+    if session:
+        session["in_flight"] -= 1
+        if not session["in_flight"]:
+            session["idle"].set()
+
+
+def _batch_lane() -> Optional[str]:
+    session = _active_batch_session()
+    return session["lane"] if session else None
+
+
+async def _send_request(body: dict, headers: dict, timeout: float, session: Optional[Dict[str, Any]]) -> httpx.Response:
+    if session:
+        return await session["client"].post(OPENROUTER_URL, json=body, headers=headers, timeout=timeout)
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        return await client.post(OPENROUTER_URL, json=body, headers=headers)
+
+
+def _is_model_side_status(status_code: int) -> bool:
+    """5xx and 429 count against a model's breaker; other 4xx are caused by the request"""
+    return status_code >= 500 or status_code == 429
+
+
+async def _post_completion(body: dict, headers: dict, timeout: float) -> dict:
+    """Send one chat completion request and record its latency/outcome for the model"""
+    model = body["model"]
+    llm_health.start_call(model)
+    session = _claim_batch_session()
+    start = time.monotonic()
+    try:
+        if session:
+            await session["limiter"].acquire()
+            start = time.monotonic()
+        response = await _send_request(body, headers, timeout, session)
+        response.raise_for_status()
+        data = response.json()
+        
+        # Check for API error response
+        if "error" in data:
+            error_msg = data["error"].get("message", str(data["error"]))
+            raise Exception(f"OpenRouter API returned error: {error_msg}")
+        
+        if "choices" not in data or not data["choices"]:
+            log_always(f"[LLM] ⚠️ Unexpected response structure: {data}")
+            raise Exception(f"OpenRouter API returned invalid response (no choices). Response: {str(data)[:500]}")
+    except asyncio.CancelledError:
+        llm_health.record_cancelled(model, (time.monotonic() - start) * 1000)
+        raise
+    except httpx.HTTPStatusError as e:
+        if _is_model_side_status(e.response.status_code):
+            llm_health.record_failure(model)
+        else:
+            llm_health.record_inconclusive(model)
+        raise
+    except Exception:
+        llm_health.record_failure(model)
+        raise
+    finally:
+        _release_batch_session(session)
+    
+    llm_health.record_success(model, (time.monotonic() - start) * 1000)
+    data.setdefault("model", model)
+    return data
+
+
+async def _hedged_completion(body: dict, headers: dict, timeout: float, backup_model: Optional[str]) -> dict:
+    """
+    Send the request; if it hasn't returned within the model's p95-derived
+    hedge delay, also send it to backup_model. The first successful response
+    wins and the other request is cancelled.
+    """
+    primary = asyncio.create_task(_post_completion(body, headers, timeout))
+    tasks = [primary]
+    try:
+        if backup_model:
+            done, _ = await asyncio.wait(tasks, timeout=llm_health.hedge_delay_sec(body["model"]))
+            if not done:
+                log_always(f"[LLM] 🐢 '{body['model']}' is slow, hedging with '{backup_model}'")
+                llm_health.record_hedge()
+                tasks.append(asyncio.create_task(
+                    _post_completion({**body, "model": backup_model}, headers, timeout)
+                ))
+        
+        pending = set(tasks)
+        last_error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not primary:
+                        llm_health.record_hedge(backup_won=True)
+                    return task.result()
+                last_error = task.exception()
+        raise last_error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+def _find_pricing(model: str) -> Optional[Tuple[float, float]]:
+    pricing = MODEL_PRICING.get(model)
+    if not pricing:
+        # Fallback: try to find by partial match
+        for key, val in MODEL_PRICING.items():
+            if key in model:
+                return val
+    return pricing
+
+
+def _track_llm_cost(
+    user_id: Optional[int],
+    used_model: str,
+    usage: dict,
+    cost_meta: Optional[Dict],
+    brain: Optional[str] = None
+):
+    """
+    Work out the cost of a call and record it for the model; track an
+    llm_cost event if user_id is set.
+    
+    Cost sources, in order: usage.cost billed by OpenRouter, MODEL_PRICING,
+    then the model's average USD per token learned from earlier billed calls.
+    """
+    prompt_tokens = usage.get("prompt_tokens", 0)
+    completion_tokens = usage.get("completion_tokens", 0)
+    total_tokens = prompt_tokens + completion_tokens
+    
+    cost_usd = 0.0
+    cost_source = "unknown"
+    pricing = _find_pricing(used_model)
+    learned = llm_health.usd_per_token(used_model)
+    if usage.get("cost") is not None:
+        cost_usd = float(usage["cost"])
+        cost_source = "billed"
+        llm_health.record_cost(used_model, cost_usd, total_tokens)
+    elif pricing:
+        input_price, output_price = pricing
+        cost_usd = (prompt_tokens / 1_000_000 * input_price) + (completion_tokens / 1_000_000 * output_price)
+        cost_source = "pricing_table"
+    elif learned is not None:
+        cost_usd = learned * total_tokens
+        cost_source = "learned"
+    
+    if not user_id:
+        return
+    
+    event_meta = {
+        "model": used_model,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost_usd": cost_usd,
+        "cost_source": cost_source
+    }
+    if brain:
+        event_meta["brain"] = brain
+    if cost_meta:
+        event_meta.update(cost_meta)
+        if "baseline_prompt_tokens" in cost_meta:
+            event_meta["prompt_tokens_saved"] = max(0, cost_meta["baseline_prompt_tokens"] - prompt_tokens)
+    
+    # Log analytics event
+    analytics_service_tg.track_event_tg(
+        client_id=user_id,
+        event_name="llm_cost",
+        meta=event_meta
+    )
@@ -8,6 +8,7 @@ from typing import List, Dict, Tuple
 from uuid import UUID
 from app.core.prompt_service import PromptService
 from app.core.llm_openrouter import generate_text
+from app.core import model_router, prefilters
 from app.settings import get_app_config
 from app.db.base import get_db
 from app.db import crud
@@ -163,7 +164,7 @@ async def update_memory(
         
         # Use a cheaper, faster model for memory extraction
         # You can use the same model as dialogue or a cheaper one
-        memory_model = config["llm"].get("memory_model", config["llm"]["model"])
+        memory_model = model_router.pick_model("memory", config["llm"].get("memory_model", config["llm"]["model"]))
         
         log_verbose(f"[MEMORY]    Current memory length: {len(current_memory or '')}")
         log_verbose(f"[MEMORY]    Chat history: {len(chat_history)} messages")
@@ -178,7 +179,8 @@ async def update_memory(
             messages=messages,
             model=memory_model,
             temperature=0.5,  # Slightly higher for better extraction quality
-            max_tokens=800  # Limit to stay under 1000 char hard limit
+            max_tokens=800,  # Limit to stay under 1000 char hard limit
+            brain="memory"
         )
         
         updated_memory = response.strip()
@@ -235,12 +237,18 @@ async def extract_user_name(
         if not chat_history or len(chat_history) < 2:
             return None
         
+        recent = chat_history[-6:]  # Last 6 messages max
+        
+        # No introduction cue in the window -> nothing for the LLM to find
+        verdict = prefilters.classify(prefilters.FILTER_USER_NAME, chat_history=recent)
+        if prefilters.try_skip(prefilters.FILTER_USER_NAME, verdict):
+            return None
+        
         log_verbose(f"[NAME] 🔍 Checking for user name in chat {chat_id}")
         
         prompt_template = PromptService.get("NAME_EXTRACTOR_GPT")
         
         # Format last few messages for context
-        recent = chat_history[-6:]  # Last 6 messages max
         conversation_text = "\n".join([
             f"{'USER' if m['role'] == 'user' else 'ASSISTANT'}: {m['content']}"
             for m in recent
@@ -249,13 +257,14 @@ async def extract_user_name(
         full_prompt = f"{prompt_template}\n\n<CONVERSATION>\n{conversation_text}\n</CONVERSATION>"
         
         config = get_app_config()
-        name_model = config["llm"].get("memory_model", config["llm"]["model"])
+        name_model = model_router.pick_model("memory", config["llm"].get("memory_model", config["llm"]["model"]))
         
         response = await generate_text(
             messages=[{"role": "user", "content": full_prompt}],
             model=name_model,
             temperature=0.1,
-            max_tokens=20
+            max_tokens=20,
+            brain="memory"
         )
         
         result = response.strip().strip('"').strip("'").strip()
@@ -263,9 +272,11 @@ async def extract_user_name(
         # Validate the result
         if not result or result.upper() == "NONE" or len(result) > 30 or " " in result.strip():
             log_verbose(f"[NAME] ℹ️  No name detected (response: {result})")
+            prefilters.record_shadow(prefilters.FILTER_USER_NAME, verdict, None)
             return None
         
         log_always(f"[NAME] ✅ Detected user name: {result}")
+        prefilters.record_shadow(prefilters.FILTER_USER_NAME, verdict, result)
         return result
         
     except Exception as e:
@@ -273,92 +284,49 @@ async def extract_user_name(
         return None
 
 
-async def trigger_name_extraction(chat_id: UUID):
+async def refresh_user_name(chat_id: UUID, chat_history: List[Dict[str, str]]):
     """
-    Fire-and-forget name extraction.
-    Checks if chat already has a name; if not, tries to extract one from recent messages.
+    Try to extract the user's name from recent messages and save it to chat.ext.
+    Called by chat_maintenance only while the chat has no discovered name.
     """
     try:
-        with get_db() as db:
-            chat = crud.get_chat_by_id(db, chat_id)
-            if not chat:
-                return
-            
-            # Skip if name already discovered for this chat
-            if chat.ext and chat.ext.get("user_display_name"):
-                return
-            
-            # Get recent messages
-            messages = crud.get_chat_messages(db, chat_id, limit=10)
-            chat_history = [
-                {"role": m.role, "content": m.text}
-                for m in messages
-                if m.text
-            ]
-        
-        # Try to extract name
         name = await extract_user_name(chat_id, chat_history)
+        if not name:
+            return
         
-        if name:
-            # Save to chat.ext
-            with get_db() as db:
-                chat = crud.get_chat_by_id(db, chat_id)
-                if chat:
-                    from sqlalchemy.orm.attributes import flag_modified
-                    if not chat.ext:
-                        chat.ext = {}
-                    chat.ext["user_display_name"] = name
-                    flag_modified(chat, "ext")
-                    db.commit()
-                    log_always(f"[NAME] ✅ Saved user name '{name}' to chat {chat_id}")
+        with get_db() as db:
+            chat = crud.get_chat_by_id(db, chat_id)
+            if chat:
+                from sqlalchemy.orm.attributes import flag_modified
+                if not chat.ext:
+                    chat.ext = {}
+                chat.ext["user_display_name"] = name
+                flag_modified(chat, "ext")
+                db.commit()
+                log_always(f"[NAME] ✅ Saved user name '{name}' to chat {chat_id}")
     
     except Exception as e:
         log_always(f"[NAME] ❌ Background name extraction failed: {e}")
 
 
-async def trigger_memory_update(
+async def refresh_memory(
     chat_id: UUID,
-    user_message: str,
-    ai_message: str
+    chat_history: List[Dict[str, str]],
+    current_memory: str = None
 ):
     """
-    Fire-and-forget memory update
-    Fetches current memory and recent chat history, updates it, and saves back to database
-    
-    This runs in the background and doesn't block the pipeline
+    Update memory from recent chat history and save it back to the database.
+    Called by chat_maintenance with history it already fetched.
     """
     try:
-        log_verbose(f"[MEMORY] 🚀 Background memory update triggered for chat {chat_id}")
+        log_verbose(f"[MEMORY] 🚀 Background memory update for chat {chat_id} ({len(chat_history)} messages)")
         
-        # Fetch current memory and recent messages from database
-        with get_db() as db:
-            chat = crud.get_chat_by_id(db, chat_id)
-            if not chat:
-                log_verbose(f"[MEMORY] ⚠️  Chat {chat_id} not found")
-                return
-            
-            current_memory = chat.memory
-            
-            # Get last 15 messages for context (more context = better extraction)
-            messages = crud.get_chat_messages(db, chat_id, limit=15)
-            
-            # Build chat history in the format expected by update_memory
-            chat_history = [
-                {"role": m.role, "content": m.text} 
-                for m in messages 
-                if m.text
-            ]
-        
-        log_verbose(f"[MEMORY]    Fetched {len(chat_history)} messages for context")
-        
-        # Update memory
         updated_memory = await update_memory(
             chat_id=chat_id,
             chat_history=chat_history,
             current_memory=current_memory
         )
         
-        # Save updated memory back to database
         with get_db() as db:
             crud.update_chat_memory(db, chat_id, updated_memory)
         
@@ -367,4 +335,3 @@ async def trigger_memory_update(
     except Exception as e:
         log_always(f"[MEMORY] ❌ Background memory update failed: {e}")
         # Silently fail - memory update is not critical to user experience
-
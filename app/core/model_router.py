@@ -0,0 +1,105 @@
+"""
+Per-brain model selection from live telemetry
+
+Each brain has a ranked model pool and an SLO in app.yaml (model_routing.brains).
+pick_model returns the first model in the pool that currently meets the SLO,
+judged on what llm_health records from live calls:
+- circuit breaker closed
+- p95 latency <= p95_ms
+- recent error rate <= max_error_rate
+- billed USD per 1k tokens <= max_usd_per_1k_tokens (optional)
+
+Models with fewer than min_samples recorded calls are assumed to meet the SLO,
+so a newly added model gets traffic. If no model meets the SLO, the available
+model with the lowest latency is used, so traffic shifts away from a degraded
+provider instead of failing. Brains without a pool keep their app.yaml model.
+"""
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from app.core import llm_health
+from app.core.logging_utils import log_verbose
+from app.settings import get_app_config
+
+
+_ROUTE_STATS: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))  # brain -> model -> picks
+
+
+def get_routing_config() -> Dict[str, Any]:
+    """Get per-brain pools and SLOs from app.yaml (model_routing)"""
+    cfg = get_app_config().get("model_routing", {}) or {}
+    return {
+        "enabled": cfg.get("enabled", True),
+        "min_samples": int(cfg.get("min_samples", 20)),
+        "brains": cfg.get("brains", {}) or {},
+    }
+
+
+def get_pool(brain: Optional[str], default_model: str) -> List[str]:
+    """Ranked model pool for a brain (just default_model if none is configured)"""
+    if not brain:
+        return [default_model]
+    pool = (get_routing_config()["brains"].get(brain) or {}).get("pool") or []
+    return list(pool) or [default_model]
+
+
+def _meets_slo(model: str, slo: Dict[str, Any], min_samples: int) -> bool:
+    if not llm_health.is_available(model):
+        return False
+    if llm_health.sample_count(model) < min_samples:
+        return True
+
+    p95 = llm_health.p95_latency_ms(model)
+    if slo.get("p95_ms") and p95 is not None and p95 > slo["p95_ms"]:
+        return False
+
+    error_rate = llm_health.recent_error_rate(model)
+    if error_rate is not None and error_rate > slo.get("max_error_rate", 0.2):
+        return False
+
+    usd_per_token = llm_health.usd_per_token(model)
+    if slo.get("max_usd_per_1k_tokens") and usd_per_token is not None \
+            and usd_per_token * 1000 > slo["max_usd_per_1k_tokens"]:
+        return False
+
+    return True
+
+
+def _latency_key(model: str) -> float:
+    p95 = llm_health.p95_latency_ms(model)
+    return p95 if p95 is not None else 0.0
+
+
+def pick_model(brain: str, default_model: str) -> str:
+    """
+    Pick the model a brain should call now.
+
+    Args:
+        brain: Brain name in app.yaml model_routing.brains
+        default_model: Model from the llm section, used when routing is off or
+            the brain has no pool
+
+    Returns:
+        Model id
+    """
+    cfg = get_routing_config()
+    brain_cfg = cfg["brains"].get(brain) or {}
+    pool = brain_cfg.get("pool") or []
+    if not cfg["enabled"] or not pool:
+        return default_model
+
+    model = next((m for m in pool if _meets_slo(m, brain_cfg, cfg["min_samples"])), None)
+    if model is None:
+        available = [m for m in pool if llm_health.is_available(m)] or list(pool)
+        model = min(available, key=_latency_key)
+        log_verbose(f"[MODEL-ROUTER] ⚠️ No model meets the {brain} SLO, using fastest: {model}")
+    elif model != pool[0]:
+        log_verbose(f"[MODEL-ROUTER] 🔀 {brain}: '{pool[0]}' outside SLO, routing to '{model}'")
+
+    _ROUTE_STATS[brain][model] += 1
+    return model
+
+
+def get_stats() -> Dict[str, Dict[str, int]]:
+    """Get model picks per brain for this process"""
+    return {brain: dict(models) for brain, models in _ROUTE_STATS.items()}
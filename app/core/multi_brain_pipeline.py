@@ -6,68 +6,127 @@ import asyncio
 import json
 import re
 from datetime import datetime
+from typing import Optional
 from uuid import UUID
 from app.core.brains.state_resolver import resolve_state
+from app.core.conversation_state import ConversationState
 from app.core.brains.dialogue_specialist import generate_dialogue
-from app.core.brains.image_prompt_engineer import generate_image_plan, assemble_final_prompt
+from app.core.brains.image_prompt_engineer import (
+    generate_image_plan,
+    assemble_final_prompt,
+    _detect_refusal_or_deflection,
+    _detect_scene_change_intent,
+    _extract_visual_actions,
+)
 from app.core.chat_actions import ChatActionManager
 from app.core.logging_utils import log_verbose, log_always, is_development, PipelineTimer, log_dev_section
 from app.core.telegram_utils import escape_markdown_v2
 from app.core import redis_queue
-from app.core.context_summarizer import generate_context_summary
+from app.core import chat_maintenance
 from app.db.base import get_db
 from app.db import crud
 from app.db.models import User
 from app.bot.loader import bot
 from app.core import analytics_service_tg
-from app.settings import get_ui_text
+from app.core import shown_images
+from app.core import background_tasks
+from app.settings import get_ui_text, get_app_config
 
 CONTROL_ORB_TOTAL_MESSAGES = 10
 
+# Visual state fields a speculative image plan is drafted from (see _speculative_plan_mismatch)
+SPECULATIVE_PLAN_STATE_FIELDS = ("location", "aiClothing")
+_ACTION_SEGMENT = re.compile(r'_([^_]+)_')  # Dialogue _italics_ = visual actions (see _extract_visual_actions)
+
+_SPECULATIVE_PLAN_STATS = {
+    "started": 0,
+    "used": 0,
+    "discarded": 0,
+    "failed": 0,
+}
+
+
+def _speculative_planning_enabled() -> bool:
+    return bool(get_app_config().get("image", {}).get("speculative_planning", False))
+
+
+def _speculative_plan_mismatch(
+    speculative_state: ConversationState | str,
+    final_state: ConversationState | str,
+    dialogue_response: str,
+) -> Optional[str]:
+    """
+    Check whether an image plan drafted from the previous state still fits the turn.
+    
+    The speculative plan saw the previous state and the user message, but not the
+    dialogue. It is discarded if the resolved state moved the scene or outfit, or
+    the dialogue refuses/deflects, describes a scene change, or describes any
+    _action_ (pose, gesture, interaction) the plan couldn't have drawn. In
+    practice only speech-only replies keep it.
+    
+    Returns:
+        Reason the plan is stale, or None if it can be used
+    """
+    before = ConversationState.coerce(speculative_state).to_dict()
+    after = ConversationState.coerce(final_state).to_dict()
+    for field in SPECULATIVE_PLAN_STATE_FIELDS:
+        if before[field].strip().lower() != after[field].strip().lower():
+            return f"{field} changed"
+
+    if _detect_refusal_or_deflection(dialogue_response):
+        return "dialogue refused or deflected"
+
+    scene_change = _detect_scene_change_intent("", _extract_visual_actions(dialogue_response))
+    if any(scene_change.values()):
+        return "dialogue changes the scene"
+
+    if _ACTION_SEGMENT.search(dialogue_response or ""):
+        return "dialogue describes actions"
+    return None
+
+
+def _drop_speculative_plan(task: Optional[asyncio.Task]):
+    """Cancel an unused speculative plan (or consume its error so it isn't logged as unretrieved)"""
+    if not task:
+        return
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        task.exception()
 
-def _parse_state_line(state: str) -> dict:
-    """Parse strict state line into dict, keeping defaults for missing fields."""
-    parsed = {
-        "relationshipStage": "friend",
-        "emotions": "",
-        "moodNotes": "",
-        "location": "",
-        "description": "",
-        "aiClothing": "",
-        "userClothing": "unknown",
-        "terminateDialog": False,
-        "terminateReason": "",
-    }
-    if not state:
-        return parsed
-
-    for key, value in re.findall(r'(\w+)="(.*?)"', state):
-        if key in parsed:
-            parsed[key] = value
-
-    for key, value in re.findall(r'(\w+)=(true|false)', state):
-        if key == "terminateDialog":
-            parsed[key] = value == "true"
-
-    return parsed
-
-
-def _escape_state_value(value: str) -> str:
-    return str(value or "").replace("\\", "\\\\").replace('"', '\\"')
-
-
-def _build_state_line(fields: dict) -> str:
-    return (
-        f'relationshipStage="{_escape_state_value(fields.get("relationshipStage", ""))}"'
-        f' | emotions="{_escape_state_value(fields.get("emotions", ""))}"'
-        f' | moodNotes="{_escape_state_value(fields.get("moodNotes", ""))}"'
-        f' | location="{_escape_state_value(fields.get("location", ""))}"'
-        f' | description="{_escape_state_value(fields.get("description", ""))}"'
-        f' | aiClothing="{_escape_state_value(fields.get("aiClothing", ""))}"'
-        f' | userClothing="{_escape_state_value(fields.get("userClothing", ""))}"'
-        f' | terminateDialog={"true" if bool(fields.get("terminateDialog")) else "false"}'
-        f' | terminateReason="{_escape_state_value(fields.get("terminateReason", ""))}"'
-    )
+
+async def _take_speculative_plan(
+    task: asyncio.Task,
+    speculative_state: ConversationState,
+    final_state: ConversationState,
+    dialogue_response: str,
+) -> Optional[str]:
+    """Await a speculative image plan if it is still valid, otherwise cancel it"""
+    reason = _speculative_plan_mismatch(speculative_state, final_state, dialogue_response)
+    if reason:
+        _drop_speculative_plan(task)
+        _SPECULATIVE_PLAN_STATS["discarded"] += 1
+        log_always(f"[IMAGE-BG] ♻️ Speculative image plan discarded ({reason})")
+        return None
+
+    try:
+        image_prompt = await task
+    except Exception as e:
+        _SPECULATIVE_PLAN_STATS["failed"] += 1
+        log_always(f"[IMAGE-BG] ⚠️ Speculative image plan failed: {e}")
+        return None
+
+    _SPECULATIVE_PLAN_STATS["used"] += 1
+    log_always(f"[IMAGE-BG] ⚡ Using speculative image plan")
+    return image_prompt
+
+
+def get_speculative_plan_stats() -> dict:
+    """Get process-local speculative image planning counters"""
+    stats = dict(_SPECULATIVE_PLAN_STATS)
+    started = stats["started"]
+    stats["hit_rate"] = round(stats["used"] / started, 4) if started else 0.0
+    return stats
 
 
 def _append_unique(existing: str, addition: str, sep: str = "; ") -> str:
@@ -82,17 +141,22 @@ def _append_unique(existing: str, addition: str, sep: str = "; ") -> str:
     return f"{current}{sep}{extra}"
 
 
-def _apply_gift_state_override(previous_state: str, item_key: str, item_name: str) -> str:
+def _apply_gift_state_override(
+    previous_state: Optional[ConversationState | str],
+    item_key: str,
+    item_name: str,
+) -> ConversationState:
     """
     Apply deterministic gift-driven state updates so wearable/effect gifts persist.
-    Produces a valid state line even if previous state was in legacy/freeform format.
+    Produces a structured state even if previous state was in legacy/freeform format.
     """
-    if previous_state and "relationshipStage=" in previous_state:
-        fields = _parse_state_line(previous_state)
+    previous = ConversationState.coerce(previous_state)
+    if previous.is_structured:
+        fields = previous.to_dict()
     else:
-        fields = _parse_state_line("")
-        if previous_state:
-            fields["moodNotes"] = _append_unique(fields.get("moodNotes", ""), f"Legacy state: {previous_state}")
+        fields = ConversationState().to_dict()
+        if str(previous):
+            fields["moodNotes"] = _append_unique(fields.get("moodNotes", ""), f"Legacy state: {previous}")
 
     key = (item_key or "").strip()
 
@@ -151,7 +215,7 @@ def _apply_gift_state_override(previous_state: str, item_key: str, item_name: st
                 sep=" ",
             )
 
-    return _build_state_line(fields)
+    return ConversationState(fields)
 
 
 def _control_orb_expired_text(language: str) -> str:
@@ -390,13 +454,8 @@ async def _send_gift_recommendation_message(
             flag_modified(chat, "ext")
             db.commit()
 
-    from app.core.memory_service import trigger_memory_update
-    asyncio.create_task(trigger_memory_update(
-        chat_id=chat_id,
-        user_message=f"[Gift suggestion opportunity: {item_key}]",
-        ai_message=suggestion_text,
-    ))
-    log_verbose("[BATCH] 🧠 Gift suggestion memory update triggered (background)")
+    chat_maintenance.schedule_maintenance(chat_id, [chat_maintenance.JOB_MEMORY])
+    log_verbose("[BATCH] 🧠 Gift suggestion memory update scheduled (background)")
 
 
 async def process_message_pipeline(
@@ -532,6 +591,7 @@ async def _process_single_batch(
     pipeline_timer: PipelineTimer
 ):
     """Process a single batch of messages"""
+    speculative_plan_task = None
     try:
         log_dev_section("BATCH PROCESSING")
         
@@ -574,13 +634,9 @@ async def _process_single_batch(
             else:
                 log_verbose(f"[BATCH] ℹ️  No previous image prompt found")
             
-            # Extract data before session closes
+            # Extract data before session closes (state is parsed once for all brains)
             previous_state_dict = chat.state_snapshot
-            if previous_state_dict and isinstance(previous_state_dict, dict):
-                # Extract state string from wrapper dict
-                previous_state = previous_state_dict.get("state")
-            else:
-                previous_state = None
+            previous_state = ConversationState.from_snapshot(previous_state_dict)
             
             # Extract memory
             memory = chat.memory
@@ -700,7 +756,7 @@ async def _process_single_batch(
             
             _log_brain_inputs(
                 "Brain 4 (Image Decision)",
-                previous_state=previous_state or "",
+                previous_state=previous_state,
                 user_message=batched_text,
                 chat_history=chat_history,
                 persona_name=persona_data["name"],
@@ -708,7 +764,7 @@ async def _process_single_batch(
             )
             
             should_generate_image_flag, decision_reason = await should_generate_image(
-                previous_state=previous_state or "",
+                previous_state=previous_state,
                 user_message=batched_text,
                 chat_history=chat_history,
                 persona_name=persona_data["name"],
@@ -734,6 +790,36 @@ async def _process_single_batch(
         control_orb_active = control_orb_messages_left > 0
         control_orb_turn_active = control_orb_active and not is_auto_followup and not is_resume
         
+        # Check specific image flags for each followup type
+        should_skip_image = False
+        if followup_type == "30min":
+            should_skip_image = not settings.ENABLE_IMAGES_IN_FOLLOWUP
+        elif followup_type == "24h":
+            should_skip_image = not settings.ENABLE_IMAGES_24HOURS
+        elif followup_type == "3day":
+            should_skip_image = not settings.ENABLE_IMAGES_3DAYS
+        
+        # 1.6 Speculative Brain 3: draft the image plan from the previous state while
+        # dialogue is generating; reconciled against the resolved state in _background_image_generation
+        if should_generate_image_flag and not should_skip_image and previous_state and _speculative_planning_enabled():
+            speculative_plan_task = asyncio.create_task(generate_image_plan(
+                state=previous_state,
+                dialogue_response="",
+                user_message=batched_text,
+                persona=persona_data,
+                chat_history=chat_history,
+                previous_image_prompt=previous_image_prompt,
+                previous_image_meta=previous_image_meta,
+                context_summary=context_summary,
+                mood=chat_mood,
+                purchases=chat_purchases,
+                force_gift_override=False,
+                control_orb_active=control_orb_turn_active,
+                control_orb_messages_left=control_orb_messages_left,
+            ))
+            _SPECULATIVE_PLAN_STATS["started"] += 1
+            log_always(f"[BATCH] ⚡ Brain 3: Speculative image plan started")
+        
         if is_resume:
             log_verbose(f"[BATCH]    Resume mode: AI initiating conversation")
             # Generate a welcome-back style message
@@ -812,7 +898,7 @@ async def _process_single_batch(
             dialogue_response=dialogue_response
         )
         log_always(f"[BATCH] ✅ Brain 2: State resolved")
-        log_verbose(f"[BATCH]    State preview: {new_state[:100]}...")
+        log_verbose(f"[BATCH]    State preview: {str(new_state)[:100]}...")
         
         pipeline_timer.end_stage()
         pipeline_timer.start_stage("Save to Database")
@@ -844,14 +930,14 @@ async def _process_single_batch(
                 chat_id, 
                 "assistant", 
                 dialogue_response,
-                state_snapshot={"state": new_state},
+                state_snapshot=new_state.to_snapshot(),
                 is_processed=True
             )
             assistant_message_id = assistant_message.id
             log_verbose(f"[BATCH]    Assistant message ID: {assistant_message_id}")
             
             # Update chat state and timestamps
-            crud.update_chat_state(db, chat_id, {"state": new_state})
+            crud.update_chat_state(db, chat_id, new_state.to_snapshot())
             crud.update_chat_timestamps(db, chat_id, assistant_at=datetime.utcnow())
             
             # Remove refresh button from last image (in same session to ensure we see current data)
@@ -950,15 +1036,6 @@ async def _process_single_batch(
         pipeline_timer.end_stage()
         
         # 6. Determine image generation logic
-        # Check specific flags for each followup type
-        should_skip_image = False
-        if followup_type == "30min":
-            should_skip_image = not settings.ENABLE_IMAGES_IN_FOLLOWUP
-        elif followup_type == "24h":
-            should_skip_image = not settings.ENABLE_IMAGES_24HOURS
-        elif followup_type == "3day":
-            should_skip_image = not settings.ENABLE_IMAGES_3DAYS
-        
         final_should_generate = should_generate_image_flag and not should_skip_image
         
         # If image will be generated, wait and send text as caption with the image
@@ -1040,33 +1117,17 @@ async def _process_single_batch(
         
         pipeline_timer.start_stage("Trigger Background Tasks")
         
-        # 5.5. Trigger background memory update (fire and forget) - PREMIUM ONLY
+        # 5.5. Schedule background maintenance (debounced per chat, one shared history fetch):
+        # memory (premium only), name extraction (until the name is known), context summary
+        maintenance_jobs = [chat_maintenance.JOB_SUMMARY]
         if is_premium:
-            from app.core.memory_service import trigger_memory_update
-            asyncio.create_task(trigger_memory_update(
-                chat_id=chat_id,
-                user_message=batched_text,
-                ai_message=dialogue_response
-            ))
-            log_verbose(f"[BATCH] 🧠 Memory update triggered (background) - premium user")
+            maintenance_jobs.append(chat_maintenance.JOB_MEMORY)
         else:
             log_verbose(f"[BATCH] ⏭️ Memory update skipped (free user - premium feature)")
-        
-        # 5.55. Trigger background name extraction (fire and forget) - only if name not yet known
         if not name_known:
-            from app.core.memory_service import trigger_name_extraction
-            asyncio.create_task(trigger_name_extraction(chat_id=chat_id))
-            log_verbose(f"[BATCH] 🏷️ Name extraction triggered (background)")
-        
-        # 5.6. Trigger background context summary update (fire and forget)
-        # Update summary with new messages for next round
-        asyncio.create_task(_update_context_summary(
-            chat_id=chat_id,
-            chat_history=chat_history,
-            user_message=batched_text,
-            ai_message=dialogue_response,
-            persona_name=persona_data["name"]
-        ))
+            maintenance_jobs.append(chat_maintenance.JOB_NAME)
+        chat_maintenance.schedule_maintenance(chat_id, maintenance_jobs, persona_name=persona_data["name"])
+        log_verbose(f"[BATCH] 🧹 Background maintenance scheduled: {', '.join(maintenance_jobs)}")
         
         pipeline_timer.end_stage()
         
@@ -1074,7 +1135,7 @@ async def _process_single_batch(
         
         if final_should_generate:
             log_always(f"[BATCH] 🎨 Starting background image generation (reason: {decision_reason})...")
-            asyncio.create_task(_background_image_generation(
+            background_tasks.spawn(_background_image_generation(
                 chat_id=chat_id,
                 user_id=user_id,
                 persona_id=persona_data["id"],
@@ -1095,7 +1156,10 @@ async def _process_single_batch(
                 purchases=chat_purchases,  # Recent purchases for image context
                 control_orb_active=control_orb_turn_active,
                 control_orb_messages_left=control_orb_messages_left,
+                speculative_plan_task=speculative_plan_task,
+                speculative_state=previous_state,
             ))
+            speculative_plan_task = None  # Owned by the background task now
             if should_wait_for_image:
                 log_always(f"[BATCH] ✅ Batch complete (text will be sent with image)")
             else:
@@ -1148,6 +1212,26 @@ async def _process_single_batch(
         
         await action_mgr.stop()
         raise
+    finally:
+        _drop_speculative_plan(speculative_plan_task)
+
+
+def _fail_image_job(user_id: int, job_id: Optional[UUID], energy_reserved: int, error: str):
+    """Give back the energy of an image that won't be generated
+
+    Once the job exists its reservation is refunded by marking it failed (so
+    the callback/reconciler can't settle it a second time); before that the
+    debit is refunded directly.
+    """
+    with get_db() as db:
+        if job_id:
+            crud.update_image_job_status(db, job_id, status="failed", error=error)
+        elif energy_reserved:
+            crud.refund_user_energy(db, user_id, energy_reserved)
+        else:
+            return
+    if energy_reserved:
+        log_always(f"[IMAGE-BG] ↩️ Refunded {energy_reserved} energy to user {user_id} ({error})")
 
 
 async def _background_image_generation(
@@ -1171,9 +1255,13 @@ async def _background_image_generation(
     purchases: list = None,  # Recent purchases for image context
     control_orb_active: bool = False,
     control_orb_messages_left: int = 0,
+    speculative_plan_task: asyncio.Task = None,  # Brain 3 started during dialogue from speculative_state
+    speculative_state: str = None,
 ):
     """Non-blocking image generation"""
     counter_incremented = False  # Track if we incremented counter for error handling
+    energy_reserved = 0  # Debited up front; refunded if no image comes of it
+    job_id = None
     try:
         from app.settings import settings
         
@@ -1204,6 +1292,7 @@ async def _background_image_generation(
                     log_always(f"[IMAGE-BG] ⚠️ Failed to deduct energy for user {user_id}")
                     await action_mgr.stop()
                     return
+                energy_reserved = 3
                 log_always(f"[IMAGE-BG] 🖼️ Generating image for free user {user_id} (3 energy deducted)")
             else:
                 log_always(f"[IMAGE-BG] 🖼️ Generating image for premium user {user_id} (no energy cost)")
@@ -1219,38 +1308,48 @@ async def _background_image_generation(
         register_action_manager(tg_chat_id, action_mgr)
         log_verbose(f"[IMAGE-BG] 📤 Started upload_photo action")
         
-        # Brain 3: Generate image plan
-        log_always(f"[IMAGE-BG] 🧠 Brain 3: Generating image plan...")
-        
-        _log_brain_inputs(
-            "Brain 3 (Image Plan)",
-            state=state,
-            dialogue_response=dialogue_response,
-            user_message=batched_text,
-            persona=persona,
-            chat_history=chat_history,
-            previous_image_prompt=previous_image_prompt,
-            previous_image_meta=previous_image_meta,
-            context_summary=context_summary,
-            control_orb_active=control_orb_active,
-            control_orb_messages_left=control_orb_messages_left,
-        )
+        # Brain 3: Generate image plan (reuse the speculative plan if the turn didn't invalidate it)
+        image_prompt = None
+        if speculative_plan_task:
+            image_prompt = await _take_speculative_plan(
+                speculative_plan_task,
+                speculative_state=speculative_state,
+                final_state=state,
+                dialogue_response=dialogue_response,
+            )
         
-        image_prompt = await generate_image_plan(
-            state=state,
-            dialogue_response=dialogue_response,
-            user_message=batched_text,
-            persona=persona,
-            chat_history=chat_history,
-            previous_image_prompt=previous_image_prompt,
-            previous_image_meta=previous_image_meta,
-            context_summary=context_summary,
-            mood=mood,
-            purchases=purchases,
-            force_gift_override=False,
-            control_orb_active=control_orb_active,
-            control_orb_messages_left=control_orb_messages_left,
-        )
+        if image_prompt is None:
+            log_always(f"[IMAGE-BG] 🧠 Brain 3: Generating image plan...")
+            
+            _log_brain_inputs(
+                "Brain 3 (Image Plan)",
+                state=state,
+                dialogue_response=dialogue_response,
+                user_message=batched_text,
+                persona=persona,
+                chat_history=chat_history,
+                previous_image_prompt=previous_image_prompt,
+                previous_image_meta=previous_image_meta,
+                context_summary=context_summary,
+                control_orb_active=control_orb_active,
+                control_orb_messages_left=control_orb_messages_left,
+            )
+            
+            image_prompt = await generate_image_plan(
+                state=state,
+                dialogue_response=dialogue_response,
+                user_message=batched_text,
+                persona=persona,
+                chat_history=chat_history,
+                previous_image_prompt=previous_image_prompt,
+                previous_image_meta=previous_image_meta,
+                context_summary=context_summary,
+                mood=mood,
+                purchases=purchases,
+                force_gift_override=False,
+                control_orb_active=control_orb_active,
+                control_orb_messages_left=control_orb_messages_left,
+            )
         log_always(f"[IMAGE-BG] ✅ Image plan generated")
         log_verbose(f"[IMAGE-BG]    Prompt preview: {image_prompt[:100]}...")
         
@@ -1270,7 +1369,9 @@ async def _background_image_generation(
         log_verbose(f"[IMAGE-BG] 🔍 Checking cache for hash: {prompt_hash[:16]}...")
         
         with get_db() as db:
-            cached_image = crud.find_cached_image(db, prompt_hash, user_id)
+            cached_image = await shown_images.find_unseen_cached_image(
+                db, prompt_hash, user_id, prompt=positive, persona_id=persona_id
+            )
             
             if cached_image and cached_image.result_url:
                 log_always(f"[IMAGE-BG] ✅ CACHE HIT! Found cached image {cached_image.id}")
@@ -1323,8 +1424,8 @@ async def _background_image_generation(
                         db.commit()
                     
                     # Mark image as shown to this user and increment cache serve count
-                    crud.mark_image_shown(db, user_id, cached_image.id)
-                    crud.increment_cache_serve_count(db, cached_image.id)
+                    await shown_images.mark_image_shown(user_id, cached_image.id)
+                    await shown_images.record_cache_serve(cached_image.id)
                     
                     # Track analytics
                     from app.core import analytics_service_tg
@@ -1366,7 +1467,8 @@ async def _background_image_generation(
         with get_db() as db:
             job = crud.create_image_job(
                 db, user_id, persona_id, positive, negative, chat_id,
-                ext=job_ext
+                ext=job_ext,
+                energy_reserved=energy_reserved
             )
             job_id = job.id
         log_verbose(f"[IMAGE-BG]    Job ID: {job_id}")
@@ -1406,6 +1508,7 @@ async def _background_image_generation(
             # Decrement counter since dispatch failed
             await redis_queue.decrement_user_image_count(user_id)
             print(f"[IMAGE-BG] 📊 Decremented user image count (dispatch failed)")
+            _fail_image_job(user_id, job_id, energy_reserved, "dispatch failed")
             # Stop action on dispatch failure
             from app.core.action_registry import stop_and_remove_action
             await stop_and_remove_action(tg_chat_id)
@@ -1423,63 +1526,17 @@ async def _background_image_generation(
             await redis_queue.decrement_user_image_count(user_id)
             print(f"[IMAGE-BG] 📊 Decremented user image count (error recovery)")
         
+        try:
+            _fail_image_job(user_id, job_id, energy_reserved, f"{type(e).__name__}: {e}")
+        except Exception as refund_error:
+            log_always(f"[IMAGE-BG] ⚠️ Failed to refund energy for user {user_id}: {refund_error}")
+        
         # Stop action on exception
         from app.core.action_registry import stop_and_remove_action
         await stop_and_remove_action(tg_chat_id)
-
-
-async def _update_context_summary(
-    chat_id: UUID,
-    chat_history: list[dict],
-    user_message: str,
-    ai_message: str,
-    persona_name: str
-):
-    """
-    Background task to update context summary after each message exchange.
-    Generates new summary and saves to chat.ext["context_summary"].
-    """
-    try:
-        # Build full history including the new messages
-        full_history = chat_history + [
-            {"role": "user", "content": user_message},
-            {"role": "assistant", "content": ai_message}
-        ]
-        
-        # Only generate summary if we have enough messages
-        if len(full_history) < 5:
-            log_verbose(f"[CONTEXT-SUMMARY] ⏭️ Skipping - only {len(full_history)} messages (need 5+)")
-            return
-        
-        log_verbose(f"[CONTEXT-SUMMARY] 🧠 Generating summary for {len(full_history)} messages...")
-        
-        # Generate new summary
-        new_summary = await generate_context_summary(
-            chat_history=full_history[-20:],  # Last 20 messages
-            persona_name=persona_name
-        )
-        
-        if not new_summary:
-            log_verbose(f"[CONTEXT-SUMMARY] ⚠️ Empty summary generated, skipping save")
-            return
-        
-        # Save to database
-        with get_db() as db:
-            from sqlalchemy.orm.attributes import flag_modified
-            chat = crud.get_chat_by_id(db, chat_id)
-            if chat:
-                if not chat.ext:
-                    chat.ext = {}
-                chat.ext["context_summary"] = new_summary
-                flag_modified(chat, "ext")
-                db.commit()
-                log_always(f"[CONTEXT-SUMMARY] ✅ Summary saved ({len(new_summary)} chars)")
-            else:
-                log_verbose(f"[CONTEXT-SUMMARY] ⚠️ Chat {chat_id} not found")
-                
-    except Exception as e:
-        log_always(f"[CONTEXT-SUMMARY] ❌ Error updating summary: {e}")
-        # Non-critical - don't raise, just log
+    finally:
+        # Skipped (limit/energy) or failed before the plan was taken
+        _drop_speculative_plan(speculative_plan_task)
 
 
 async def process_gift_purchase(
@@ -1558,8 +1615,8 @@ async def process_gift_purchase(
                 log_always(f"[GIFT-PURCHASE] Applied user image_prompt override for persona {persona.key}")
 
             # Get state
-            previous_state = chat.state_snapshot.get("state", "chatting") if chat.state_snapshot else "chatting"
-            gift_state = _apply_gift_state_override(previous_state, item_key=item_key, item_name=item_name) or previous_state
+            previous_state = ConversationState.from_snapshot(chat.state_snapshot) or ConversationState.parse("chatting")
+            gift_state = _apply_gift_state_override(previous_state, item_key=item_key, item_name=item_name)
             memory = chat.memory
             context_summary = chat.ext.get("context_summary") if chat.ext else None
 
@@ -1615,19 +1672,14 @@ async def process_gift_purchase(
         with get_db() as db:
             crud.create_message_with_state(
                 db, chat_id, "assistant", dialogue_response,
-                state_snapshot={"state": gift_state}
+                state_snapshot=gift_state.to_snapshot()
             )
-            crud.update_chat_state(db, chat_id, {"state": gift_state})
+            crud.update_chat_state(db, chat_id, gift_state.to_snapshot())
             crud.update_chat_timestamps(db, chat_id, assistant_at=datetime.utcnow())
         
         # Trigger memory update so the gift is remembered in future conversations
-        from app.core.memory_service import trigger_memory_update
-        asyncio.create_task(trigger_memory_update(
-            chat_id=chat_id,
-            user_message=f"[User bought a gift: {item_name}]",
-            ai_message=dialogue_response
-        ))
-        log_always(f"[GIFT-PURCHASE] 🧠 Memory update triggered (background)")
+        chat_maintenance.schedule_maintenance(chat_id, [chat_maintenance.JOB_MEMORY], persona_name=persona_name)
+        log_always(f"[GIFT-PURCHASE] 🧠 Memory update scheduled (background)")
         
         # Send the reaction message as caption with image (don't send text separately)
         # Generate image with gift context
@@ -1669,7 +1721,9 @@ async def process_gift_purchase(
         # Check cache
         prompt_hash = crud.compute_prompt_hash(positive)
         with get_db() as db:
-            cached_image = crud.find_cached_image(db, prompt_hash, user_id)
+            cached_image = await shown_images.find_unseen_cached_image(
+                db, prompt_hash, user_id, prompt=positive, persona_id=persona_data["id"]
+            )
             
             if cached_image and cached_image.result_url:
                 log_always(f"[GIFT-PURCHASE] ✅ CACHE HIT for gift image")
@@ -1692,8 +1746,8 @@ async def process_gift_purchase(
                         chat.ext["last_image_msg_id"] = sent_message.message_id
                         flag_modified(chat, "ext")
                         db.commit()
-                    crud.mark_image_shown(db, user_id, cached_image.id)
-                    crud.increment_cache_serve_count(db, cached_image.id)
+                    await shown_images.mark_image_shown(user_id, cached_image.id)
+                    await shown_images.record_cache_serve(cached_image.id)
                     await action_mgr.stop()
                     log_always(f"[GIFT-PURCHASE] ✅ Gift image + reaction sent (cached)")
                     return
@@ -2,16 +2,28 @@
 In-memory cache for preset personas and histories
 Loaded at startup, persists for application lifetime
 """
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
+import hashlib
 import random
 
+import orjson
+
 # Global cache storage
 _CACHE: Dict[str, Any] = {
     "presets": [],           # List of all preset personas (as dicts)
     "by_id": {},            # Dict: persona_id -> persona dict
-    "histories": {}         # Dict: persona_id -> list of history dicts
+    "histories": {},        # Dict: persona_id -> list of history dicts
+    "by_key": {},           # Dict: persona key -> persona dict
+    "history_index": {},    # Dict: history_id -> (persona dict, index in persona's histories, history dict)
+    "fields": {},           # Dict: language -> ((translation version, generation), {persona_id: fields}, {history_id: fields})
+    "gallery": {},          # Dict: language -> ((translation version, generation), payload bytes, etag)
+    "generation": 0,        # Bumped by every load_cache; tags the per-language tables above
 }
 
+# Translatable fields, resolved per language into _CACHE["fields"]
+PERSONA_FIELDS = ("name", "description", "small_description", "intro")
+HISTORY_FIELDS = ("name", "button_name", "small_description", "description", "text")
+
 
 def load_cache():
     """Load all preset personas and histories from DB into memory"""
@@ -22,10 +34,19 @@ def load_cache():
     print("[CACHE] 📦 Loading preset personas and histories into memory...")
     
     with get_db() as db:
-        # Load all preset personas
+        # Load all preset personas, and all their histories in one query
         preset_personas = crud.get_preset_personas(db)
+        history_rows: Dict[str, List[Any]] = {str(persona.id): [] for persona in preset_personas}
+        if preset_personas:
+            for history in db.query(PersonaHistoryStart).filter(
+                PersonaHistoryStart.persona_id.in_([persona.id for persona in preset_personas])
+            ):
+                history_rows[str(history.persona_id)].append(history)
         
+        # Build new snapshots, then swap them in at once (readers never see a partial cache)
         preset_list = []
+        by_id = {}
+        histories_by_persona = {}
         for persona in preset_personas:
             # Extract all data from ORM object
             # Translations are now handled by translation_service, not stored in persona dict
@@ -51,15 +72,10 @@ def load_cache():
             preset_list.append(persona_dict)
             
             # Store in by_id lookup
-            _CACHE["by_id"][str(persona.id)] = persona_dict
-            
-            # Load histories for this persona
-            histories = db.query(PersonaHistoryStart).filter(
-                PersonaHistoryStart.persona_id == persona.id
-            ).all()
+            by_id[str(persona.id)] = persona_dict
             
             history_list = []
-            for history in histories:
+            for history in history_rows[str(persona.id)]:
                 # Translations are now handled by translation_service, not stored in history dict
                 history_dict = {
                     "id": str(history.id),
@@ -76,11 +92,33 @@ def load_cache():
                 
                 history_list.append(history_dict)
             
-            _CACHE["histories"][str(persona.id)] = history_list
+            histories_by_persona[str(persona.id)] = history_list
         
         # Sort preset personas by order field (lower numbers appear first)
         preset_list.sort(key=lambda p: p.get("order", 999))
-        _CACHE["presets"] = preset_list
+        
+        # Lookup indexes (first persona in display order wins for a duplicate key)
+        by_key = {}
+        history_index = {}
+        for persona_dict in preset_list:
+            if persona_dict["key"]:
+                by_key.setdefault(persona_dict["key"], persona_dict)
+            for idx, history_dict in enumerate(histories_by_persona[persona_dict["id"]]):
+                history_index[history_dict["id"]] = (persona_dict, idx, history_dict)
+        
+        # The generation goes last: a reader that sees it sees the new snapshot.
+        # Tables a concurrent reader builds from the old one carry the old
+        # generation and are rebuilt on next use.
+        _CACHE.update({
+            "presets": preset_list,
+            "by_id": by_id,
+            "histories": histories_by_persona,
+            "by_key": by_key,
+            "history_index": history_index,
+            "fields": {},
+            "gallery": {},
+            "generation": _CACHE["generation"] + 1,
+        })
     
     print(f"[CACHE] ✅ Loaded {len(_CACHE['presets'])} personas with {sum(len(h) for h in _CACHE['histories'].values())} total histories")
     print(f"[CACHE] 🌐 Translations are now managed by TranslationService")
@@ -98,10 +136,7 @@ def get_persona_by_id(persona_id: str) -> Optional[Dict[str, Any]]:
 
 def get_persona_by_key(persona_key: str) -> Optional[Dict[str, Any]]:
     """Get cached persona by key"""
-    for persona in _CACHE["presets"]:
-        if persona.get("key") == persona_key:
-            return persona
-    return None
+    return _CACHE["by_key"].get(persona_key)
 
 
 def get_persona_histories(persona_id: str) -> List[Dict[str, Any]]:
@@ -141,6 +176,47 @@ def is_cache_loaded() -> bool:
     return len(_CACHE["presets"]) > 0
 
 
+def _translate(trans_key: str, language: str, default: Any) -> Any:
+    from app.core.translation_service import translation_service
+
+    translated = translation_service.get(trans_key, language, fallback=True)
+    # If translation key was returned unchanged (not found), use default value
+    return default if translated == trans_key else translated
+
+
+def _table_version() -> Tuple[int, int]:
+    """Version of the per-language tables: translations and persona snapshot"""
+    from app.core.translation_service import translation_service
+
+    # Generation first: the snapshot read after it is at least as new
+    generation = _CACHE["generation"]
+    return translation_service.version, generation
+
+
+def _field_tables(language: str) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """Translated persona/history fields for a language, rebuilt when translations or personas reload"""
+    version = _table_version()
+    cached = _CACHE["fields"].get(language)
+    if cached and cached[0] == version:
+        return cached[1], cached[2]
+
+    persona_fields = {}
+    history_fields = {}
+    for persona in _CACHE["presets"]:
+        key = persona.get("key")
+        persona_fields[persona["id"]] = {
+            field: _translate(f"{key}.{field}", language, persona.get(field)) if key else persona.get(field)
+            for field in PERSONA_FIELDS
+        }
+        for idx, history in enumerate(_CACHE["histories"].get(persona["id"], [])):
+            history_fields[history["id"]] = {
+                field: _translate(f"{key}.history.{field}-{idx}", language, history.get(field)) if key else history.get(field)
+                for field in HISTORY_FIELDS
+            }
+    _CACHE["fields"][language] = (version, persona_fields, history_fields)
+    return persona_fields, history_fields
+
+
 def get_persona_field(persona_dict: Dict[str, Any], field: str, language: str = 'en') -> Any:
     """Get a persona field with translation support
     
@@ -152,22 +228,18 @@ def get_persona_field(persona_dict: Dict[str, Any], field: str, language: str =
     Returns:
         Translated field value if available, otherwise fallback to default
     """
-    from app.core.translation_service import translation_service
+    persona_id = persona_dict.get('id')
+    if field in PERSONA_FIELDS and _CACHE["by_id"].get(persona_id) is persona_dict:
+        fields = _field_tables(language)[0].get(persona_id)
+        if fields is not None:
+            return fields[field]
     
+    # Not a cached persona (or an untranslated field): resolve directly
     persona_key = persona_dict.get('key')
     if not persona_key:
         # If persona doesn't have a key, return the default field value
         return persona_dict.get(field)
-    
-    # Try to get translation from translation service
-    trans_key = f"{persona_key}.{field}"
-    translated = translation_service.get(trans_key, language, fallback=True)
-    
-    # If translation key was returned unchanged (not found), use default value
-    if translated == trans_key:
-        return persona_dict.get(field)
-    
-    return translated
+    return _translate(f"{persona_key}.{field}", language, persona_dict.get(field))
 
 
 def get_history_field(history_dict: Dict[str, Any], field: str, language: str = 'en') -> Any:
@@ -181,42 +253,71 @@ def get_history_field(history_dict: Dict[str, Any], field: str, language: str =
     Returns:
         Translated field value if available, otherwise fallback to default
     """
-    from app.core.translation_service import translation_service
-    
-    # Find persona key and history index from the history dict
-    # We need to look up the persona this history belongs to
-    persona_id = history_dict.get('persona_id')
-    if not persona_id:
-        return history_dict.get(field)
-    
-    # Get persona to find its key
-    persona = get_persona_by_id(persona_id)
-    if not persona or not persona.get('key'):
+    indexed = _CACHE["history_index"].get(history_dict.get('id'))
+    if indexed is None:
+        # Not a cached history: no translation key to build
         return history_dict.get(field)
     
-    persona_key = persona['key']
+    if field in HISTORY_FIELDS and indexed[2] is history_dict:
+        fields = _field_tables(language)[1].get(history_dict['id'])
+        if fields is not None:
+            return fields[field]
     
-    # Find index of this history in the persona's histories
-    histories = get_persona_histories(persona_id)
-    history_index = None
-    for idx, h in enumerate(histories):
-        if h.get('id') == history_dict.get('id'):
-            history_index = idx
-            break
-    
-    if history_index is None:
+    # Copy of a cached history (or an untranslated field): build translation key: {persona_key}.history.{field}-{index}
+    persona, history_index, _ = indexed
+    if not persona.get('key'):
         return history_dict.get(field)
+    return _translate(f"{persona['key']}.history.{field}-{history_index}", language, history_dict.get(field))
+
+def payload_etag(payload: bytes) -> str:
+    """Strong ETag for a serialized response body"""
+    return '"' + hashlib.blake2b(payload, digest_size=16).hexdigest() + '"'
+
+
+def _build_gallery_entries(language: str) -> List[Dict[str, Any]]:
+    entries = []
+    for persona in _CACHE["presets"]:
+        persona_id = persona["id"]
+
+        # Use avatar_url as primary image, fallback to a history image (picked once per build)
+        avatar_url = persona["avatar_url"]
+        if not avatar_url:
+            history_start = get_random_history(persona_id)
+            avatar_url = history_start["image_url"] if history_start else None
+
+        entries.append({
+            "id": persona_id,
+            "name": get_persona_field(persona, 'name', language=language) or persona["name"],
+            "description": get_persona_field(persona, 'description', language=language) or "",
+            "smallDescription": get_persona_field(persona, 'small_description', language=language) or "",
+            "badges": persona["badges"] or [],
+            "avatar_url": avatar_url,
+            "is_custom": False,
+            "has_voice": persona.get("voice_id") is not None,
+        })
+    return entries
+
+
+def get_gallery_payload(language: str = 'en') -> Tuple[bytes, str]:
+    """Get the public persona gallery for the Mini App as JSON bytes plus its ETag
     
-    # Build translation key: {persona_key}.history.{field}-{index}
-    trans_key = f"{persona_key}.history.{field}-{history_index}"
-    translated = translation_service.get(trans_key, language, fallback=True)
-    
-    # If translation key was returned unchanged (not found), use default value
-    if translated == trans_key:
-        return history_dict.get(field)
+    Built once per language and rebuilt after reload_cache() or a translation reload.
     
-    return translated
-  
+    Returns:
+        Tuple of (JSON array bytes, ETag)
+    """
+    version = _table_version()
+    cached = _CACHE["gallery"].get(language)
+    if cached and cached[0] == version:
+        return cached[1], cached[2]
+
+    payload = orjson.dumps(_build_gallery_entries(language))
+    etag = payload_etag(payload)
+    _CACHE["gallery"][language] = (version, payload, etag)
+    print(f"[CACHE] 🖼️ Built '{language}' gallery payload ({len(payload)} bytes)")
+    return payload, etag
+
+
 def reload_cache():
     """Reload the persona cache from database"""
     load_cache()
@@ -6,6 +6,8 @@ import json
 import re
 from typing import Dict, List, Optional, Tuple, Union
 from app.db.models import Persona, Chat, Message
+from app.core.context_packer import pack_context
+from app.core.prompt_templates import apply_replacements
 
 
 # ========== MOOD/ENGAGEMENT DETECTION ==========
@@ -194,10 +196,7 @@ def build_template_replacements(persona: Union[Persona, dict], chat: Union[Chat,
 
 def apply_template_replacements(template: str, replacements: Dict[str, str]) -> str:
     """Apply template replacements (mirrors applyTemplateReplacements)"""
-    result = template
-    for key, value in replacements.items():
-        result = result.replace(key, value)
-    return result
+    return apply_replacements(template, replacements)
 
 
 # ========== LLM MESSAGE ASSEMBLY ==========
@@ -209,7 +208,7 @@ def build_llm_messages(
     messages: Union[List[Message], List[dict]],
     user_text: str,
     chat: Union[Chat, dict] = None,
-    max_history: int = 10
+    brain: str = "dialogue"
 ) -> List[Dict[str, str]]:
     """
     Build complete message array for LLM
@@ -260,10 +259,9 @@ def build_llm_messages(
     # Build message array
     llm_messages = [{"role": "system", "content": system_full}]
     
-    # Add recent conversation history (mirrors formatChatHistoryAsMessages)
-    recent_messages = messages[-max_history:] if len(messages) > max_history else messages
-    
-    for msg in recent_messages:
+    # Add recent conversation history that fits the brain's token budget
+    history = []
+    for msg in messages:
         # Handle both dict and ORM objects
         if isinstance(msg, dict):
             role = msg.get("role")
@@ -273,11 +271,13 @@ def build_llm_messages(
             text = msg.text or ""
         
         if role in ("user", "assistant"):
-            llm_messages.append({
+            history.append({
                 "role": role,
                 "content": text
             })
     
+    llm_messages.extend(pack_context(history, brain=brain)["messages"])
+    
     # Add current user message
     llm_messages.append({
         "role": "user",
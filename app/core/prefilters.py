@@ -0,0 +1,246 @@
+"""
+Local fast-path classifiers that run before LLM brains
+
+Some brain inputs can be decided without an LLM call: a bare "ok" or an
+emoji-only message usually needs no image (unless it answers a photo offer
+like "want a pic?"), and a conversation where the user never introduces
+themselves has no name to extract. Each filter is a list of
+classifiers (app.yaml prefilters.<filter>); the first one that returns a
+verdict decides. A classifier returns None when it isn't sure.
+
+Filters run in one of three modes:
+- enforce: a verdict skips the LLM call
+- shadow: the LLM is still called and agreement with the verdict is recorded,
+  to measure precision before enforcing
+- off: not run
+Filters default to shadow; switch one to enforce in app.yaml once
+/api/analytics/prefilter-stats shows its shadow_precision is high enough.
+
+gift_text is enforce-only: its verdict (use the template text) can't be
+compared with the free text the LLM writes, so shadow mode would measure
+nothing. It defaults to off, and shadow is treated as off.
+
+Besides regex/keyword features, image_decision can use a small scikit-learn
+style text model (anything with predict_proba, positive class last) loaded at
+startup from prefilters.model_path.
+"""
+import pickle
+import re
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core.logging_utils import log_always, log_verbose
+from app.settings import get_app_config
+
+
+FILTER_IMAGE_DECISION = "image_decision"
+FILTER_USER_NAME = "user_name"
+FILTER_GIFT_TEXT = "gift_text"
+
+MODE_OFF = "off"
+MODE_SHADOW = "shadow"
+MODE_ENFORCE = "enforce"
+
+# Filters whose verdict can't be compared with the LLM's answer (no shadow mode)
+ENFORCE_ONLY_FILTERS = {FILTER_GIFT_TEXT}
+
+Verdict = Tuple[Any, str]  # (value the brain would return, reason)
+
+ACK_WORDS = {
+    # EN
+    "ok", "okay", "k", "kk", "lol", "lmao", "haha", "hah", "hehe", "hmm", "hm", "mhm",
+    "thanks", "thx", "ty", "cool", "nice", "wow", "oh", "ah",
+    # RU
+    "ок", "окей", "хорошо", "ладно", "понятно", "ясно", "ага", "угу", "хм", "ммм",
+    "спасибо", "спс", "хаха", "ахах", "лол", "круто", "класс", "вау", "ой",
+}
+
+NAME_CUE_RE = re.compile(
+    r"\b(my name|name's|name is|call me)\b|меня зовут|мо[её] имя|зови меня|называй меня",
+    re.IGNORECASE,
+)
+# "I'm Alex" / "Я Лена": only with a capitalized word, "I'm tired" is not a cue
+CAPITALIZED_NAME_CUE_RE = re.compile(
+    r"\b(?:[Ii]'m|[Ii] am|[Ii]m|[Ii]t's|[Tt]his is)\s+[A-Z][a-z]+\b|(?:^|\s)(?:[Яя]|[Ээ]то)\s+[А-ЯЁ][а-яё]+"
+)
+NAME_QUESTION_RE = re.compile(
+    r"(your name|call you|как тебя зовут|как тебя называть|как к тебе обращаться|твоё имя|твое имя)",
+    re.IGNORECASE,
+)
+# Assistant turns offering a photo: a bare "ok"/"ага"/emoji after one is an acceptance
+PHOTO_OFFER_RE = re.compile(
+    r"\b(photos?|pics?|pictures?|selfies?|snaps?|show you)\b|фот|снимо?к|селфи|покаж|показать",
+    re.IGNORECASE,
+)
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+_MODEL: Any = None
+
+_STATS: Dict[str, Dict[str, int]] = defaultdict(lambda: {
+    "checked": 0,
+    "decided": 0,
+    "llm_calls_skipped": 0,
+    "shadow_compared": 0,
+    "shadow_agreed": 0,
+})
+
+
+def get_prefilter_config() -> Dict[str, Any]:
+    """Get filter modes and optional model settings from app.yaml (prefilters)"""
+    cfg = get_app_config().get("prefilters", {}) or {}
+    return {
+        "modes": {
+            FILTER_IMAGE_DECISION: cfg.get(FILTER_IMAGE_DECISION, MODE_SHADOW),
+            FILTER_USER_NAME: cfg.get(FILTER_USER_NAME, MODE_SHADOW),
+            FILTER_GIFT_TEXT: cfg.get(FILTER_GIFT_TEXT, MODE_OFF),
+        },
+        "model_path": cfg.get("model_path"),
+        "model_no_threshold": float(cfg.get("model_no_threshold", 0.1)),
+    }
+
+
+def get_mode(filter_name: str) -> str:
+    mode = get_prefilter_config()["modes"].get(filter_name, MODE_OFF)
+    if mode == MODE_SHADOW and filter_name in ENFORCE_ONLY_FILTERS:
+        return MODE_OFF
+    return mode
+
+
+def is_trivial_message(text: str) -> bool:
+    """True for acknowledgments, emoji/punctuation-only or empty messages"""
+    stripped = (text or "").strip().lower()
+    if not stripped:
+        return True
+    words = _WORD_RE.findall(stripped)
+    if not words:
+        return True  # Only emoji / punctuation
+    return len(words) <= 2 and all(word in ACK_WORDS for word in words)
+
+
+# ========== CLASSIFIERS ==========
+
+def _offered_photo(chat_history: List[Dict[str, str]]) -> bool:
+    """Whether the last assistant turn offers a photo"""
+    for message in reversed(chat_history or ()):
+        if message.get("role") == "assistant":
+            return bool(PHOTO_OFFER_RE.search(message.get("content") or ""))
+    return False
+
+
+def _trivial_image_request(user_message: str = "", chat_history: List[Dict[str, str]] = (), **_) -> Optional[Verdict]:
+    if is_trivial_message(user_message) and not _offered_photo(chat_history):
+        return False, "trivial message (local)"
+    return None
+
+
+def _model_image_request(user_message: str = "", **_) -> Optional[Verdict]:
+    if _MODEL is None or not user_message:
+        return None
+    try:
+        p_yes = float(_MODEL.predict_proba([user_message])[0][-1])
+    except Exception as e:
+        log_verbose(f"[PREFILTER] ⚠️ Model prediction failed: {e}")
+        return None
+    if p_yes < get_prefilter_config()["model_no_threshold"]:
+        return False, f"local model p_yes={p_yes:.2f}"
+    return None
+
+
+def _no_name_cue(chat_history: List[Dict[str, str]] = (), **_) -> Optional[Verdict]:
+    user_texts = [m.get("content") or "" for m in chat_history if m.get("role") == "user"]
+    other_texts = [m.get("content") or "" for m in chat_history if m.get("role") != "user"]
+    if any(NAME_CUE_RE.search(text) or CAPITALIZED_NAME_CUE_RE.search(text) for text in user_texts):
+        return None
+    if any(NAME_QUESTION_RE.search(text) for text in other_texts):
+        return None  # A bare one-word answer may be the name
+    return None, "no name cue (local)"
+
+
+def _trivial_gift_turn(user_message: str = "", **_) -> Optional[Verdict]:
+    if is_trivial_message(user_message):
+        return None, "trivial message, template text (local)"
+    return None
+
+
+_CLASSIFIERS: Dict[str, List[Callable[..., Optional[Verdict]]]] = {
+    FILTER_IMAGE_DECISION: [_trivial_image_request, _model_image_request],
+    FILTER_USER_NAME: [_no_name_cue],
+    FILTER_GIFT_TEXT: [_trivial_gift_turn],
+}
+
+
+def register_classifier(filter_name: str, classifier: Callable[..., Optional[Verdict]]):
+    """Add a classifier to a filter; it gets the filter's keyword features and returns a verdict or None"""
+    _CLASSIFIERS.setdefault(filter_name, []).append(classifier)
+
+
+def classify(filter_name: str, **features) -> Optional[Verdict]:
+    """
+    Run a filter's classifiers on the given features.
+
+    Returns:
+        (value, reason) verdict, or None if the LLM has to decide (or the filter is off)
+    """
+    if get_mode(filter_name) == MODE_OFF:
+        return None
+    stats = _STATS[filter_name]
+    stats["checked"] += 1
+    for classifier in _CLASSIFIERS.get(filter_name, []):
+        verdict = classifier(**features)
+        if verdict is not None:
+            stats["decided"] += 1
+            return verdict
+    return None
+
+
+def try_skip(filter_name: str, verdict: Optional[Verdict]) -> bool:
+    """True if the brain should return the verdict instead of calling the LLM (enforce mode)"""
+    if verdict is None or get_mode(filter_name) != MODE_ENFORCE:
+        return False
+    _STATS[filter_name]["llm_calls_skipped"] += 1
+    log_verbose(f"[PREFILTER] ⚡ {filter_name}: skipped LLM ({verdict[1]})")
+    return True
+
+
+def record_shadow(filter_name: str, verdict: Optional[Verdict], llm_value: Any):
+    """Compare a shadow-mode verdict with what the LLM returned"""
+    if verdict is None:
+        return
+    stats = _STATS[filter_name]
+    stats["shadow_compared"] += 1
+    if verdict[0] == llm_value:
+        stats["shadow_agreed"] += 1
+    else:
+        log_verbose(f"[PREFILTER] 🔍 {filter_name}: local {verdict[0]!r} ({verdict[1]}) vs LLM {llm_value!r}")
+
+
+def load_model():
+    """Load the optional image_decision text model (called at startup)"""
+    global _MODEL
+    path = get_prefilter_config()["model_path"]
+    if not path:
+        return
+    try:
+        try:
+            import joblib
+            _MODEL = joblib.load(path)
+        except ImportError:
+            with open(path, "rb") as f:
+                _MODEL = pickle.load(f)
+        log_always(f"[PREFILTER] ✅ Loaded image decision model from {path}")
+    except Exception as e:
+        _MODEL = None
+        log_always(f"[PREFILTER] ⚠️ Failed to load model {path}: {e}")
+
+
+def get_stats() -> Dict[str, Dict[str, Any]]:
+    """Get per-filter decisions, skipped LLM calls and shadow precision for this process"""
+    result = {}
+    for filter_name, stats in _STATS.items():
+        compared = stats["shadow_compared"]
+        result[filter_name] = {
+            **stats,
+            "mode": get_mode(filter_name),
+            "shadow_precision": round(stats["shadow_agreed"] / compared, 4) if compared else None,
+        }
+    return result
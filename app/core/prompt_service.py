@@ -11,6 +11,7 @@ from config.prompts import (
     IMAGE_DECISION_GPT,
     VOICE_PROCESSOR_GPT,
     CONTEXT_SUMMARY_GPT,
+    CONTEXT_SUMMARY_UPDATE_GPT,
     NAME_EXTRACTOR_GPT
 )
 
@@ -28,6 +29,7 @@ class PromptService:
         "IMAGE_DECISION_GPT": IMAGE_DECISION_GPT,
         "VOICE_PROCESSOR_GPT": VOICE_PROCESSOR_GPT,
         "CONTEXT_SUMMARY_GPT": CONTEXT_SUMMARY_GPT,
+        "CONTEXT_SUMMARY_UPDATE_GPT": CONTEXT_SUMMARY_UPDATE_GPT,
         "NAME_EXTRACTOR_GPT": NAME_EXTRACTOR_GPT,
     }
     
@@ -0,0 +1,104 @@
+"""
+Precompiled prompt templates
+
+Prompts in config/prompts.py are long strings with {{placeholder}} fields.
+Filling them with a str.replace pass per field rescans the whole prompt for
+every field on every request. Here a template is split once into literal and
+placeholder segments, so a render is a single join.
+
+Most fields of the dialogue prompt only depend on the persona (name, persona
+prompt, fixed defaults). render_partial caches the template with those fields
+filled in, per template and field values, and only substitutes the volatile
+per-request fields (user name, response length) on top.
+"""
+import re
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+PLACEHOLDER_RE = re.compile(r"\{\{[\w.]+\}\}")
+PARTIAL_CACHE_SIZE = 512
+
+_PARTIALS: "OrderedDict[tuple, CompiledTemplate]" = OrderedDict()
+_PARTIAL_STATS: Dict[str, int] = {"hits": 0, "misses": 0}
+
+
+class CompiledTemplate:
+    """A template split into literal strings and placeholder keys ("{{char.name}}")"""
+
+    __slots__ = ("segments",)
+
+    def __init__(self, template: str):
+        # Literals and placeholders alternate: even indices are literals
+        segments: List[str] = []
+        pos = 0
+        for match in PLACEHOLDER_RE.finditer(template):
+            segments.append(template[pos:match.start()])
+            segments.append(match.group(0))
+            pos = match.end()
+        segments.append(template[pos:])
+        self.segments: Tuple[str, ...] = tuple(segments)
+
+    @property
+    def placeholders(self) -> Tuple[str, ...]:
+        return self.segments[1::2]
+
+    def render(self, values: Dict[str, str]) -> str:
+        """Fill placeholders from values; unknown placeholders are left as they are"""
+        segments = self.segments
+        parts = list(segments)
+        for i in range(1, len(segments), 2):
+            value = values.get(segments[i])
+            if value is not None:
+                parts[i] = value
+        return "".join(parts)
+
+    def partial(self, values: Dict[str, str]) -> "CompiledTemplate":
+        """
+        Compile a new template with the given fields filled in. Placeholders
+        that appear inside the filled-in values can still be rendered later.
+        """
+        return CompiledTemplate(self.render(values))
+
+
+@lru_cache(maxsize=64)
+def compile_template(template: str) -> CompiledTemplate:
+    """Compile a template (cached; prompt strings are module constants)"""
+    return CompiledTemplate(template)
+
+
+def apply_replacements(template: str, replacements: Dict[str, str]) -> str:
+    """Drop-in for a str.replace loop over {{placeholder}} -> value pairs"""
+    return compile_template(template).render(replacements)
+
+
+def render_partial(template: str, stable: Dict[str, str], volatile: Dict[str, str]) -> str:
+    """
+    Render a template whose stable fields (e.g. persona) repeat across requests.
+
+    Args:
+        template: Template string
+        stable: Fields that are the same for many requests; the template with
+            these filled in is cached
+        volatile: Fields that change per request; substituted on every call
+
+    Returns:
+        Rendered prompt
+    """
+    key = (template, tuple(stable.items()))
+    partial = _PARTIALS.get(key)
+    if partial is None:
+        _PARTIAL_STATS["misses"] += 1
+        partial = compile_template(template).partial(stable)
+        _PARTIALS[key] = partial
+        if len(_PARTIALS) > PARTIAL_CACHE_SIZE:
+            _PARTIALS.popitem(last=False)
+    else:
+        _PARTIAL_STATS["hits"] += 1
+        _PARTIALS.move_to_end(key)
+    return partial.render(volatile)
+
+
+def get_stats() -> Dict[str, int]:
+    """Get partial render cache statistics for this process"""
+    return {**_PARTIAL_STATS, "cached": len(_PARTIALS)}
@@ -1,16 +1,43 @@
 """
 Cloudflare R2 storage helpers for uploads.
+
+boto3 is synchronous, so async callers go through upload_bytes_async /
+upload_stream_async, which run calls on the shared (thread-safe, pooled)
+client in worker threads. Objects larger than MULTIPART_CHUNK_SIZE are sent
+as multipart uploads, a few parts at a time, so streamed request bodies are
+never held in memory as a whole.
 """
 from __future__ import annotations
 
+import asyncio
+import time
 from functools import lru_cache
-from typing import Optional
-
-import boto3
-from botocore.config import Config
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
+from app.core.lazy_imports import lazy_import
 from app.settings import settings
 
+boto3 = lazy_import("boto3")
+botocore_config = lazy_import("botocore.config")
+
+
+MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024  # R2/S3 parts must be >= 5 MiB (except the last)
+MAX_CONCURRENT_PARTS = 4
+MAX_POOL_CONNECTIONS = 16
+
+_UPLOAD_STATS: Dict[str, float] = {
+    "uploads": 0,
+    "multipart_uploads": 0,
+    "parts": 0,
+    "failures": 0,
+    "bytes": 0,
+    "seconds": 0.0,
+}
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when a streamed upload exceeds its max_bytes limit"""
+
 
 def is_r2_configured() -> bool:
     return all(
@@ -43,7 +70,11 @@ def get_r2_client():
         aws_access_key_id=settings.R2_ACCESS_KEY_ID,
         aws_secret_access_key=settings.R2_SECRET_ACCESS_KEY,
         region_name="auto",
-        config=Config(signature_version="s3v4"),
+        config=botocore_config.Config(
+            signature_version="s3v4",
+            max_pool_connections=MAX_POOL_CONNECTIONS,
+            retries={"max_attempts": 3, "mode": "standard"},
+        ),
     )
 
 
@@ -55,6 +86,168 @@ def upload_bytes_to_r2(*, key: str, data: bytes, content_type: Optional[str]) ->
     client.put_object(**put_params)
 
 
+def _record_upload(size: int, started: float, parts: int = 0) -> None:
+    _UPLOAD_STATS["uploads"] += 1
+    _UPLOAD_STATS["bytes"] += size
+    _UPLOAD_STATS["seconds"] += time.monotonic() - started
+    if parts:
+        _UPLOAD_STATS["multipart_uploads"] += 1
+        _UPLOAD_STATS["parts"] += parts
+
+
+async def _upload_part(client, *, key: str, upload_id: str, part_number: int, data: bytes) -> Dict:
+    response = await asyncio.to_thread(
+        client.upload_part,
+        Bucket=settings.R2_BUCKET_NAME,
+        Key=key,
+        UploadId=upload_id,
+        PartNumber=part_number,
+        Body=data,
+    )
+    return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+
+async def _multipart_upload(
+    *,
+    key: str,
+    first_chunk: bytes,
+    chunks: AsyncIterator[bytes],
+    content_type: Optional[str],
+    max_bytes: Optional[int],
+) -> Tuple[int, int]:
+    """Upload first_chunk + the rest of chunks as a multipart object; returns (total size, part count)"""
+    client = get_r2_client()
+    create_params = {"Bucket": settings.R2_BUCKET_NAME, "Key": key}
+    if content_type:
+        create_params["ContentType"] = content_type
+    upload_id = (await asyncio.to_thread(client.create_multipart_upload, **create_params))["UploadId"]
+
+    in_flight: List[asyncio.Task] = []
+    parts: List[Dict] = []
+    total = len(first_chunk)
+    part_number = 1
+
+    async def _submit(data: bytes):
+        nonlocal part_number
+        in_flight.append(asyncio.create_task(
+            _upload_part(client, key=key, upload_id=upload_id, part_number=part_number, data=data)
+        ))
+        part_number += 1
+        if len(in_flight) >= MAX_CONCURRENT_PARTS:
+            parts.append(await in_flight.pop(0))
+
+    try:
+        await _submit(first_chunk)
+        async for chunk in chunks:
+            total += len(chunk)
+            if max_bytes is not None and total > max_bytes:
+                raise UploadTooLargeError(f"Upload exceeds {max_bytes} bytes")
+            await _submit(chunk)
+        parts.extend(await asyncio.gather(*in_flight))
+        in_flight.clear()
+
+        await asyncio.to_thread(
+            client.complete_multipart_upload,
+            Bucket=settings.R2_BUCKET_NAME,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": sorted(parts, key=lambda p: p["PartNumber"])},
+        )
+    except BaseException:
+        for task in in_flight:
+            task.cancel()
+        try:
+            await asyncio.to_thread(
+                client.abort_multipart_upload,
+                Bucket=settings.R2_BUCKET_NAME,
+                Key=key,
+                UploadId=upload_id,
+            )
+        except Exception as abort_error:
+            print(f"[R2] ⚠️ Failed to abort multipart upload {key}: {abort_error}")
+        raise
+    return total, part_number - 1
+
+
+async def _rechunk(chunks: AsyncIterator[bytes], size: int) -> AsyncIterator[bytes]:
+    """Regroup an arbitrary byte stream into size-byte chunks (last one may be shorter)"""
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer.extend(chunk)
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+    if buffer:
+        yield bytes(buffer)
+
+
+async def upload_stream_async(
+    *,
+    key: str,
+    chunks: AsyncIterator[bytes],
+    content_type: Optional[str],
+    max_bytes: Optional[int] = None,
+) -> int:
+    """
+    Upload an async byte stream to R2 without buffering it whole.
+
+    Streams that fit in one MULTIPART_CHUNK_SIZE part use a single PUT, larger
+    ones a multipart upload (aborted on any error).
+
+    Raises:
+        UploadTooLargeError: if the stream is longer than max_bytes
+
+    Returns:
+        Number of bytes uploaded
+    """
+    started = time.monotonic()
+    parts = _rechunk(chunks, MULTIPART_CHUNK_SIZE)
+    try:
+        first = await parts.__anext__()
+    except StopAsyncIteration:
+        first = b""
+
+    try:
+        if max_bytes is not None and len(first) > max_bytes:
+            raise UploadTooLargeError(f"Upload exceeds {max_bytes} bytes")
+        if len(first) < MULTIPART_CHUNK_SIZE:
+            await asyncio.to_thread(upload_bytes_to_r2, key=key, data=first, content_type=content_type)
+            _record_upload(len(first), started)
+            return len(first)
+
+        total, part_count = await _multipart_upload(
+            key=key,
+            first_chunk=first,
+            chunks=parts,
+            content_type=content_type,
+            max_bytes=max_bytes,
+        )
+    except Exception:
+        _UPLOAD_STATS["failures"] += 1
+        raise
+    _record_upload(total, started, parts=part_count)
+    return total
+
+
+async def upload_bytes_async(*, key: str, data: bytes, content_type: Optional[str]) -> int:
+    """Async upload of an in-memory object (multipart above MULTIPART_CHUNK_SIZE)"""
+    async def _chunks():
+        for offset in range(0, len(data), MULTIPART_CHUNK_SIZE):
+            yield data[offset:offset + MULTIPART_CHUNK_SIZE]
+
+    return await upload_stream_async(key=key, chunks=_chunks(), content_type=content_type)
+
+
+def get_upload_stats() -> Dict[str, float]:
+    """Get process-local upload counters and average throughput"""
+    stats = dict(_UPLOAD_STATS)
+    stats["seconds"] = round(stats["seconds"], 3)
+    stats["throughput_mb_per_sec"] = (
+        round(stats["bytes"] / (1024 * 1024) / _UPLOAD_STATS["seconds"], 3) if _UPLOAD_STATS["seconds"] else 0.0
+    )
+    return stats
+
+
 def build_r2_public_url(*, key: str) -> str:
     if not settings.R2_PUBLIC_BASE_URL:
         raise ValueError("R2_PUBLIC_BASE_URL is not set for public URLs")
@@ -3,12 +3,20 @@ Background scheduler for auto-messages and other periodic tasks
 """
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from datetime import datetime
+import asyncio
+import functools
 import logging
+import time
 from app.db.base import get_db
 from app.db import crud
 from app.core import redis_queue
 from app.core.multi_brain_pipeline import process_message_pipeline
 from app.core import system_message_service
+from app.core import shown_images
+from app.core import llm_governor
+from app.core import workers
+from app.core.llm_openrouter import batch_session
+from app.settings import get_app_config
 
 scheduler = AsyncIOScheduler()
 logger = logging.getLogger(__name__)
@@ -41,11 +49,7 @@ async def check_inactive_chats_3min():
         
         print(f"[SCHEDULER] Found {len(chat_data)} inactive chats (3min)")
         
-        for data in chat_data:
-            try:
-                await send_auto_message(data["chat_id"], data["tg_chat_id"], followup_type="3min")
-            except Exception as e:
-                print(f"[SCHEDULER] Auto-message error for chat {data['chat_id']}: {e}")
+        await send_followup_batch(chat_data, followup_type="3min")
                 
     except Exception as e:
         print(f"[SCHEDULER] Error checking inactive chats (3min): {e}")
@@ -79,11 +83,7 @@ async def check_inactive_chats():
         
         print(f"[SCHEDULER] Found {len(chat_data)} inactive chats (30min)")
         
-        for data in chat_data:
-            try:
-                await send_auto_message(data["chat_id"], data["tg_chat_id"], followup_type="30min")
-            except Exception as e:
-                print(f"[SCHEDULER] Auto-message error for chat {data['chat_id']}: {e}")
+        await send_followup_batch(chat_data, followup_type="30min")
                 
     except Exception as e:
         print(f"[SCHEDULER] Error checking inactive chats (30min): {e}")
@@ -136,11 +136,7 @@ async def check_inactive_chats_24h():
         if total_chats > max_per_run:
             print(f"[SCHEDULER] ⏱️  Rate limiting: Processing {max_per_run} of {total_chats} chats (remaining will be processed in next run)")
         
-        for data in chats_to_process:
-            try:
-                await send_auto_message(data["chat_id"], data["tg_chat_id"], followup_type="24h")
-            except Exception as e:
-                print(f"[SCHEDULER] Auto-message error for chat {data['chat_id']}: {e}")
+        await send_followup_batch(chats_to_process, followup_type="24h")
                 
     except Exception as e:
         print(f"[SCHEDULER] Error checking inactive chats (24h): {e}")
@@ -193,11 +189,7 @@ async def check_inactive_chats_3day():
         if total_chats > max_per_run:
             print(f"[SCHEDULER] ⏱️  Rate limiting: Processing {max_per_run} of {total_chats} chats (remaining will be processed in next run)")
         
-        for data in chats_to_process:
-            try:
-                await send_auto_message(data["chat_id"], data["tg_chat_id"], followup_type="3day")
-            except Exception as e:
-                print(f"[SCHEDULER] Auto-message error for chat {data['chat_id']}: {e}")
+        await send_followup_batch(chats_to_process, followup_type="3day")
                 
     except Exception as e:
         print(f"[SCHEDULER] Error checking inactive chats (3 day): {e}")
@@ -216,6 +208,54 @@ async def add_daily_tokens_by_tier():
         print(f"[SCHEDULER] ❌ Error adding daily tokens: {e}")
 
 
+def get_followup_batch_config() -> dict:
+    """Get follow-up batch settings from app.yaml (followup_batch)"""
+    cfg = get_app_config().get("followup_batch", {}) or {}
+    return {
+        "enabled": cfg.get("enabled", True),
+        "max_concurrent_chats": int(cfg.get("max_concurrent_chats", 8)),
+        "llm_rps": float(cfg.get("llm_rps", 4)),
+    }
+
+
+async def send_followup_batch(chat_data: list, followup_type: str):
+    """
+    Send follow-ups to all due chats of one scheduler run
+    
+    In batch mode the chats run concurrently (up to max_concurrent_chats),
+    and their LLM calls share one pooled HTTP client, the followup governor
+    lane and an llm_rps requests-per-second budget. Otherwise chats are
+    processed one by one.
+    """
+    cfg = get_followup_batch_config()
+    
+    async def _send_one(data):
+        try:
+            await send_auto_message(data["chat_id"], data["tg_chat_id"], followup_type=followup_type)
+        except Exception as e:
+            print(f"[SCHEDULER] Auto-message error for chat {data['chat_id']}: {e}")
+    
+    if not cfg["enabled"] or len(chat_data) <= 1:
+        for data in chat_data:
+            await _send_one(data)
+        return
+    
+    semaphore = asyncio.Semaphore(cfg["max_concurrent_chats"])
+    
+    async def _send_limited(data):
+        async with semaphore:
+            await _send_one(data)
+    
+    batch_start = time.monotonic()
+    async with batch_session(
+        rps=cfg["llm_rps"],
+        lane=llm_governor.LANE_FOLLOWUP,
+        max_connections=cfg["max_concurrent_chats"] * 2,
+    ):
+        await asyncio.gather(*(_send_limited(data) for data in chat_data))
+    print(f"[SCHEDULER] ✅ Follow-up batch ({followup_type}): {len(chat_data)} chats in {time.monotonic() - batch_start:.1f}s")
+
+
 async def send_auto_message(chat_id, tg_chat_id, followup_type: str = "30min"):
     """
     Generate and send contextual follow-up using the full multi-brain pipeline
@@ -358,6 +398,33 @@ async def daily_cleanup_old_chats():
         print(f"[SCHEDULER] ❌ Error in daily cleanup: {e}")
 
 
+async def flush_shown_images():
+    """Write batched shown-image rows and cache serve counts to the database"""
+    try:
+        await shown_images.flush_pending_writes()
+    except Exception as e:
+        print(f"[SCHEDULER] ❌ Error flushing shown images: {e}")
+
+
+async def reconcile_image_jobs():
+    """Finalize or retry image jobs whose RunPod webhook never arrived"""
+    try:
+        from app.core.image_job_reconciler import reconcile_pending_jobs
+        await reconcile_pending_jobs()
+    except Exception as e:
+        print(f"[SCHEDULER] ❌ Error reconciling image jobs: {e}")
+
+
+async def refresh_image_similarity_index():
+    """Load newly cached images into the near-duplicate prompt index"""
+    try:
+        from app.core.image_similarity import refresh_index
+        # Off the event loop: a cold index hashes weeks of cached prompts
+        await asyncio.to_thread(refresh_index)
+    except Exception as e:
+        print(f"[SCHEDULER] ❌ Error refreshing image similarity index: {e}")
+
+
 async def check_scheduled_messages():
     """
     Check for scheduled messages ready to send
@@ -428,27 +495,42 @@ async def retry_failed_deliveries_task():
         }, exc_info=True)
 
 
+def _leader_only(job):
+    """
+    Run a global job only in the scheduler leader (see workers), so it runs
+    once per interval however many workers there are. Every worker keeps
+    the job scheduled and can take over if the leader goes away.
+    """
+    @functools.wraps(job)
+    async def run():
+        if workers.is_leader():
+            await job()
+    return run
+
+
 def start_scheduler():
     """Start the background scheduler"""
     from app.settings import settings
     
     print("[SCHEDULER] Starting background scheduler...")
     
+    # Jobs wrapped in _leader_only run in one worker at a time (multi-worker mode)
+    
     # Only add followup jobs if enabled
     if settings.ENABLE_FOLLOWUPS:
         # Check for inactive chats every minute (3min threshold - first quick followup)
-        scheduler.add_job(check_inactive_chats_3min, 'interval', minutes=1)
+        scheduler.add_job(_leader_only(check_inactive_chats_3min), 'interval', minutes=1)
         
         # Check for inactive chats every minute (30min threshold - after 3min followup)
-        scheduler.add_job(check_inactive_chats, 'interval', minutes=1)
+        scheduler.add_job(_leader_only(check_inactive_chats), 'interval', minutes=1)
         
         # Check for inactive chats every 5 minutes (24h threshold)
         # Processes max 4 chats per run = 4 low-priority image requests every 5 minutes
-        scheduler.add_job(check_inactive_chats_24h, 'interval', minutes=5)
+        scheduler.add_job(_leader_only(check_inactive_chats_24h), 'interval', minutes=5)
         
         # Check for inactive chats every 10 minutes (3 day threshold)
         # Processes max 4 chats per run = 4 low-priority image requests every 10 minutes
-        scheduler.add_job(check_inactive_chats_3day, 'interval', minutes=10)
+        scheduler.add_job(_leader_only(check_inactive_chats_3day), 'interval', minutes=10)
         
         print("[SCHEDULER] ✅ Followup jobs enabled (3min, 30min checks every 1min, 24h every 5min, 3day every 10min)")
     else:
@@ -461,15 +543,29 @@ def start_scheduler():
     print("[SCHEDULER] ⚠️  Daily energy refill disabled (Premium = unlimited energy)")
     
     # Check for scheduled system messages every minute
-    scheduler.add_job(check_scheduled_messages, 'interval', minutes=1)
+    scheduler.add_job(_leader_only(check_scheduled_messages), 'interval', minutes=1)
     print("[SCHEDULER] ✅ Scheduled system messages check enabled (every 1 minute)")
     
     # Note: Auto-retry disabled - use manual retry button in UI instead
     # scheduler.add_job(retry_failed_deliveries_task, 'interval', minutes=5)
     # print("[SCHEDULER] ⚠️  Auto-retry disabled (use manual retry in UI)")
     
+    # Flush batched image cache bookkeeping (user_shown_images rows, serve counts)
+    # Runs in every worker: each one buffers its own writes
+    scheduler.add_job(flush_shown_images, 'interval', seconds=15)
+    print("[SCHEDULER] ✅ Shown-image flush enabled (every 15 seconds)")
+    
+    # Poll RunPod for overdue image jobs (missing webhooks)
+    scheduler.add_job(_leader_only(reconcile_image_jobs), 'interval', seconds=30)
+    print("[SCHEDULER] ✅ Image job reconciler enabled (every 30 seconds)")
+    
+    # Near-duplicate image cache index (first run immediately to warm the index)
+    # Runs in every worker: each one keeps its own in-memory index
+    scheduler.add_job(refresh_image_similarity_index, 'interval', minutes=5, next_run_time=datetime.now())
+    print("[SCHEDULER] ✅ Image similarity index refresh enabled (every 5 minutes)")
+    
     # Daily cleanup: delete chats inactive >30 days (runs at 4:00 AM UTC)
-    scheduler.add_job(daily_cleanup_old_chats, 'cron', hour=4, minute=0)
+    scheduler.add_job(_leader_only(daily_cleanup_old_chats), 'cron', hour=4, minute=0)
     print("[SCHEDULER] ✅ Daily old chat cleanup enabled (04:00 UTC)")
     
     scheduler.start()
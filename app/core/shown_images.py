@@ -0,0 +1,312 @@
+"""
+Per-user "seen images" filter for image cache deduplication
+
+A Redis bitset Bloom filter per user sits in front of user_shown_images:
+- Cache lookups fetch candidates with a single index probe and drop the ones
+  the user has (probably) seen, instead of running a NOT EXISTS anti-join
+- Marking an image as shown sets bits in Redis and queues the DB row; rows are
+  written in batches by the scheduler (flush_pending_writes)
+
+False positives only mean a cache candidate is skipped (an extra generation),
+never that a user sees the same image twice. If Redis is unavailable the
+original DB path (crud.find_cached_image / crud.mark_image_shown) is used.
+"""
+import hashlib
+from typing import List, Dict, Any
+
+from sqlalchemy.exc import IntegrityError
+
+from app.core import redis_queue
+from app.core.logging_utils import log_always, log_verbose
+from app.db.base import get_db
+from app.db import crud
+
+
+BLOOM_BITS = 1 << 16  # 64k bits = 8 KiB per user, ~0.3% false positives at 5k images
+BLOOM_HASHES = 5
+BLOOM_TTL_SECONDS = 14 * 86400  # Refreshed on every lookup/mark
+LOADED_BIT = BLOOM_BITS  # Sentinel bit past the filter range: set once the filter is rebuilt from DB
+
+CANDIDATE_LIMIT = 25  # Cached candidates fetched per lookup
+FLUSH_BATCH_SIZE = 1000
+
+PENDING_SHOWN_KEY = "shown_images:pending"
+PENDING_SERVES_KEY = "image_cache_serves:pending"
+
+# Process-local counters (exposed via get_stats)
+_STATS: Dict[str, int] = {
+    "lookups": 0,
+    "candidates_checked": 0,
+    "filtered_as_seen": 0,
+    "filter_rebuilds": 0,
+    "db_fallbacks": 0,
+    "rows_flushed": 0,
+    "rows_dropped": 0,
+    "serve_counts_flushed": 0,
+}
+
+
+def _bloom_key(user_id: int) -> str:
+    return f"seen_img_bloom:{user_id}"
+
+
+def bloom_positions(image_job_id) -> List[int]:
+    """Bit positions for an image job ID (double hashing over one SHA-256 digest)"""
+    digest = hashlib.sha256(str(image_job_id).encode()).digest()
+    h1 = int.from_bytes(digest[:8], "big")
+    h2 = int.from_bytes(digest[8:16], "big") | 1
+    return [(h1 + i * h2) % BLOOM_BITS for i in range(BLOOM_HASHES)]
+
+
+async def _ensure_filter_loaded(redis, user_id: int):
+    """Rebuild the user's filter from user_shown_images if it was never built or expired
+
+    Readiness is tracked with LOADED_BIT rather than key existence, because
+    mark_image_shown may create the key before the rebuild happens.
+    """
+    key = _bloom_key(user_id)
+    if await redis.getbit(key, LOADED_BIT):
+        return
+
+    with get_db() as db:
+        shown_ids = crud.get_user_shown_image_ids(db, user_id)
+
+    pipe = redis.pipeline(transaction=False)
+    for job_id in shown_ids:
+        for pos in bloom_positions(job_id):
+            pipe.setbit(key, pos, 1)
+    pipe.setbit(key, LOADED_BIT, 1)
+    pipe.expire(key, BLOOM_TTL_SECONDS)
+    await pipe.execute()
+
+    _STATS["filter_rebuilds"] += 1
+    log_verbose(f"[SEEN-IMAGES] 🔄 Rebuilt filter for user {user_id} from {len(shown_ids)} rows")
+
+
+async def _filter_seen(redis, user_id: int, image_job_ids: List) -> List[bool]:
+    """Return a seen flag per image job ID (True = probably seen)"""
+    key = _bloom_key(user_id)
+    pipe = redis.pipeline(transaction=False)
+    for job_id in image_job_ids:
+        for pos in bloom_positions(job_id):
+            pipe.getbit(key, pos)
+    pipe.expire(key, BLOOM_TTL_SECONDS)
+    bits = await pipe.execute()
+
+    return [
+        all(bits[i * BLOOM_HASHES:(i + 1) * BLOOM_HASHES])
+        for i in range(len(image_job_ids))
+    ]
+
+
+async def filter_unseen(user_id: int, jobs: List) -> List:
+    """Drop image jobs the user has (probably) been shown already
+
+    Returns an empty list if the filter is unavailable, so callers never
+    serve an image the user may have seen.
+    """
+    if not jobs:
+        return []
+    try:
+        redis = await redis_queue.get_redis()
+        await _ensure_filter_loaded(redis, user_id)
+        seen_flags = await _filter_seen(redis, user_id, [job.id for job in jobs])
+    except Exception as e:
+        log_always(f"[SEEN-IMAGES] ⚠️ Filter unavailable: {e}")
+        return []
+
+    _STATS["candidates_checked"] += len(jobs)
+    _STATS["filtered_as_seen"] += sum(seen_flags)
+    return [job for job, is_seen in zip(jobs, seen_flags) if not is_seen]
+
+
+async def find_unseen_cached_image(db, prompt_hash: str, user_id: int, prompt: str = None, persona_id=None):
+    """Find a cached image for prompt_hash that the user hasn't been shown yet
+
+    Async replacement for crud.find_cached_image. When `prompt` is given and
+    there is no exact match, near-duplicate prompts of the same persona are
+    tried as well (see app.core.image_similarity).
+
+    Args:
+        db: Database session
+        prompt_hash: SHA256 hash of normalized prompt
+        user_id: User ID to exclude images they've already seen
+        prompt: Full positive prompt (enables near-duplicate matching)
+        persona_id: Persona of the requested image (near-duplicates never cross personas)
+
+    Returns:
+        ImageJob if found, None otherwise
+    """
+    _STATS["lookups"] += 1
+    cached_image = await _find_exact_unseen(db, prompt_hash, user_id)
+    if cached_image or not prompt:
+        return cached_image
+
+    from app.core import image_similarity
+    try:
+        return await image_similarity.find_similar_cached_image(db, prompt, persona_id, user_id)
+    except Exception as e:
+        log_always(f"[SEEN-IMAGES] ⚠️ Near-duplicate lookup failed: {e}")
+        return None
+
+
+async def _find_exact_unseen(db, prompt_hash: str, user_id: int):
+    candidates = crud.get_cached_image_candidates(db, prompt_hash, limit=CANDIDATE_LIMIT)
+    if not candidates:
+        return None
+
+    try:
+        redis = await redis_queue.get_redis()
+        await _ensure_filter_loaded(redis, user_id)
+        seen_flags = await _filter_seen(redis, user_id, [c.id for c in candidates])
+    except Exception as e:
+        _STATS["db_fallbacks"] += 1
+        log_always(f"[SEEN-IMAGES] ⚠️ Filter unavailable, using DB anti-join: {e}")
+        return crud.find_cached_image(db, prompt_hash, user_id)
+
+    _STATS["candidates_checked"] += len(candidates)
+    for candidate, is_seen in zip(candidates, seen_flags):
+        if not is_seen:
+            return candidate
+        _STATS["filtered_as_seen"] += 1
+
+    # Every sampled candidate was seen; only a full pool can still hide unseen images
+    if len(candidates) >= CANDIDATE_LIMIT:
+        _STATS["db_fallbacks"] += 1
+        return crud.find_cached_image(db, prompt_hash, user_id)
+    return None
+
+
+async def mark_image_shown(user_id: int, image_job_id):
+    """Record that a user has been shown an image
+
+    Sets the user's filter bits immediately and queues the user_shown_images row
+    for the next batched flush. Falls back to a direct DB insert if Redis fails.
+    """
+    if not user_id or not image_job_id:
+        return
+
+    try:
+        redis = await redis_queue.get_redis()
+        key = _bloom_key(user_id)
+        pipe = redis.pipeline(transaction=False)
+        for pos in bloom_positions(image_job_id):
+            pipe.setbit(key, pos, 1)
+        pipe.expire(key, BLOOM_TTL_SECONDS)
+        pipe.rpush(PENDING_SHOWN_KEY, f"{int(user_id)}:{image_job_id}")
+        await pipe.execute()
+    except Exception as e:
+        log_always(f"[SEEN-IMAGES] ⚠️ Redis unavailable, writing shown image directly: {e}")
+        with get_db() as db:
+            crud.mark_image_shown(db, user_id, image_job_id)
+
+
+async def record_cache_serve(image_job_id):
+    """Count a cache serve for an image; aggregated and flushed to image_jobs in batches"""
+    try:
+        redis = await redis_queue.get_redis()
+        await redis.hincrby(PENDING_SERVES_KEY, str(image_job_id), 1)
+    except Exception as e:
+        log_always(f"[SEEN-IMAGES] ⚠️ Redis unavailable, incrementing serve count directly: {e}")
+        with get_db() as db:
+            crud.increment_cache_serve_count(db, image_job_id)
+
+
+async def _pop_pending_rows(redis) -> List[tuple]:
+    """Atomically take up to FLUSH_BATCH_SIZE queued (user_id, image_job_id) rows"""
+    pipe = redis.pipeline(transaction=True)
+    pipe.lrange(PENDING_SHOWN_KEY, 0, FLUSH_BATCH_SIZE - 1)
+    pipe.ltrim(PENDING_SHOWN_KEY, FLUSH_BATCH_SIZE, -1)
+    raw_rows, _ = await pipe.execute()
+
+    rows = []
+    for raw in raw_rows:
+        user_id, _, job_id = raw.partition(":")
+        if user_id and job_id:
+            rows.append((int(user_id), job_id))
+    return rows
+
+
+async def _flush_rows_one_by_one(redis, rows: List[tuple]) -> tuple:
+    """Write rows individually, dropping ones the DB rejects
+
+    Returns:
+        (rows written, whether the rest was put back because the DB itself failed)
+    """
+    written = 0
+    for i, row in enumerate(rows):
+        try:
+            with get_db() as db:
+                written += crud.bulk_mark_images_shown(db, [row])
+        except IntegrityError as e:
+            _STATS["rows_dropped"] += 1
+            log_always(f"[SEEN-IMAGES] 🗑️ Dropped shown row {row[0]}:{row[1]}: {e.orig}")
+        except Exception as e:
+            await redis.rpush(PENDING_SHOWN_KEY, *[f"{uid}:{jid}" for uid, jid in rows[i:]])
+            log_always(f"[SEEN-IMAGES] ❌ Failed to flush {len(rows) - i} shown rows: {e}")
+            return written, True
+    return written, False
+
+
+async def flush_pending_writes() -> Dict[str, int]:
+    """Write queued shown-image rows and cache serve counts to the database
+
+    Called periodically by the scheduler and once on shutdown.
+
+    Returns:
+        Dict with rows and serve counts written
+    """
+    result = {"rows": 0, "serve_counts": 0}
+    redis = await redis_queue.get_redis()
+
+    while True:
+        rows = await _pop_pending_rows(redis)
+        if not rows:
+            break
+        try:
+            with get_db() as db:
+                result["rows"] += crud.bulk_mark_images_shown(db, rows)
+        except IntegrityError as e:
+            # A bad row (e.g. its job was deleted by the daily cleanup) fails the whole
+            # statement; write the rows one by one so the good ones aren't held back with it
+            log_always(f"[SEEN-IMAGES] ⚠️ Batch of {len(rows)} shown rows rejected, retrying row by row: {e}")
+            written, requeued = await _flush_rows_one_by_one(redis, rows)
+            result["rows"] += written
+            if requeued:
+                break
+        except Exception as e:
+            # Put the batch back so it is retried on the next flush
+            await redis.rpush(PENDING_SHOWN_KEY, *[f"{uid}:{jid}" for uid, jid in rows])
+            log_always(f"[SEEN-IMAGES] ❌ Failed to flush {len(rows)} shown rows: {e}")
+            break
+        if len(rows) < FLUSH_BATCH_SIZE:
+            break
+
+    pipe = redis.pipeline(transaction=True)
+    pipe.hgetall(PENDING_SERVES_KEY)
+    pipe.delete(PENDING_SERVES_KEY)
+    serve_counts, _ = await pipe.execute()
+    if serve_counts:
+        try:
+            with get_db() as db:
+                result["serve_counts"] = crud.bulk_increment_cache_serve_counts(db, serve_counts)
+        except Exception as e:
+            pipe = redis.pipeline(transaction=False)
+            for job_id, delta in serve_counts.items():
+                pipe.hincrby(PENDING_SERVES_KEY, job_id, int(delta))
+            await pipe.execute()
+            log_always(f"[SEEN-IMAGES] ❌ Failed to flush {len(serve_counts)} serve counts: {e}")
+
+    _STATS["rows_flushed"] += result["rows"]
+    _STATS["serve_counts_flushed"] += result["serve_counts"]
+    if result["rows"] or result["serve_counts"]:
+        log_verbose(f"[SEEN-IMAGES] 💾 Flushed {result['rows']} shown rows, {result['serve_counts']} serve counts")
+    return result
+
+
+def get_stats() -> Dict[str, Any]:
+    """Get process-local filter statistics"""
+    stats = dict(_STATS)
+    checked = stats["candidates_checked"]
+    stats["seen_ratio"] = round(stats["filtered_as_seen"] / checked, 4) if checked else 0.0
+    return stats
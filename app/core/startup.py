@@ -0,0 +1,71 @@
+"""
+Startup phases with timing
+
+lifespan runs its loaders as named phases. Independent phases run
+concurrently (blocking loaders in worker threads), and each phase's
+duration is recorded so a slow boot shows which step to look at
+(/api/analytics/startup-stats, and one log line at the end of startup).
+"""
+import asyncio
+import inspect
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Union
+
+from app.core.logging_utils import log_always
+
+
+Phase = Callable[[], Union[None, Awaitable[None]]]
+
+_TIMINGS_MS: Dict[str, float] = {}
+_STARTED_AT: Optional[float] = None
+_READY_MS: Optional[float] = None
+_BACKGROUND: Set[asyncio.Task] = set()  # Keeps background phases referenced until done
+
+
+def begin():
+    """Mark the start of startup (call first thing in lifespan)"""
+    global _STARTED_AT, _READY_MS
+    _STARTED_AT = time.perf_counter()
+    _READY_MS = None
+    _TIMINGS_MS.clear()
+
+
+async def run_phase(name: str, phase: Phase, in_thread: bool = False):
+    """Run one phase and record its duration"""
+    started = time.perf_counter()
+    try:
+        if inspect.iscoroutinefunction(phase):
+            await phase()
+        elif in_thread:
+            await asyncio.to_thread(phase)
+        else:
+            phase()
+    finally:
+        _TIMINGS_MS[name] = round((time.perf_counter() - started) * 1000, 1)
+
+
+async def run_concurrently(phases: Dict[str, Phase]):
+    """Run independent phases at the same time (sync ones in worker threads); the first failure propagates"""
+    await asyncio.gather(*(run_phase(name, phase, in_thread=True) for name, phase in phases.items()))
+
+
+def run_in_background(name: str, phase: Phase):
+    """Run a phase that startup doesn't need to wait for (timed when it completes)"""
+    task = asyncio.create_task(run_phase(name, phase))
+    _BACKGROUND.add(task)
+    task.add_done_callback(_BACKGROUND.discard)
+
+
+def finish():
+    """Mark the app as ready to serve and log the breakdown"""
+    global _READY_MS
+    if _STARTED_AT is None:
+        return
+    _READY_MS = round((time.perf_counter() - _STARTED_AT) * 1000, 1)
+    breakdown = ", ".join(f"{name} {ms:.0f}ms" for name, ms in _TIMINGS_MS.items())
+    log_always(f"[STARTUP] ⏱️ Ready in {_READY_MS:.0f}ms ({breakdown})")
+
+
+def get_stats() -> Dict[str, Any]:
+    """Get the per-phase startup timings of this process (background phases included once done)"""
+    return {"ready_ms": _READY_MS, "phases_ms": dict(_TIMINGS_MS)}
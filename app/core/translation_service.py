@@ -1,74 +1,63 @@
 """
-Translation Service - Unified translation management with in-memory caching
+Translation Service - Unified translation management
 Provides a clean API for accessing all translations (UI texts, personas, histories)
+Languages are compiled to memory-mapped tables (see translation_store) and opened on first use
 """
+from pathlib import Path
 from typing import Dict, Optional
 from threading import Lock
 
+from app.core.translation_store import TranslationStore, ensure_compiled
+
 
 class TranslationService:
-    """Singleton service for managing translations with in-memory cache"""
+    """Singleton service for managing translations, backed by compiled mmap tables"""
     
     def __init__(self):
-        self._cache: Dict[str, Dict[str, str]] = {}  # {lang: {key: value}}
+        self._stores: Dict[str, TranslationStore] = {}  # {lang: store}, opened on first use
+        self._sources: Dict[str, Path] = {}  # {lang: JSON file}
         self._loaded = False
-        self._lock = Lock()  # Thread-safe cache updates
+        self._lock = Lock()  # Thread-safe store updates
+        self.version = 0  # Bumped on every (re)load so derived caches can tell they're stale
     
     def load(self):
-        """Load all translations from JSON files into memory cache"""
-        import json
-        from pathlib import Path
-        
+        """Find translation files; each language is compiled/opened on first use"""
         print("[TRANSLATION-SERVICE] 📦 Loading translations from JSON files...")
         
         with self._lock:
-            # Clear existing cache
-            self._cache = {}
-            
             # Get path to config/translations/
             # Assuming this file is at app/core/translation_service.py
             app_dir = Path(__file__).parent.parent  # app/
             config_dir = app_dir.parent / "config" / "translations"
             
-            # Load each language file
-            for lang in ['en', 'ru']:
-                json_file = config_dir / f"{lang}.json"
-                
-                if not json_file.exists():
-                    print(f"[TRANSLATION-SERVICE] ⚠️  Warning: {json_file} not found, skipping")
-                    continue
-                
-                try:
-                    with open(json_file, 'r', encoding='utf-8') as f:
-                        translations_nested = json.load(f)
-                    
-                    # Flatten nested structure to dot-notation keys
-                    translations_flat = self._flatten_dict(translations_nested)
-                    
-                    self._cache[lang] = translations_flat
-                    print(f"[TRANSLATION-SERVICE] ✓ Loaded {len(translations_flat)} translations for '{lang}' from {json_file.name}")
-                
-                except Exception as e:
-                    print(f"[TRANSLATION-SERVICE] ✗ Error loading {json_file}: {e}")
-                    continue
+            sources = {path.stem: path for path in sorted(config_dir.glob("*.json"))}
+            if not sources:
+                print(f"[TRANSLATION-SERVICE] ⚠️  Warning: no translation files in {config_dir}")
             
+            # Swap in the new file list; open stores are dropped (readers holding one keep it)
+            self._sources = sources
+            self._stores = {}
             self._loaded = True
+            self.version += 1
             
-            # Log statistics
-            total_translations = sum(len(keys) for keys in self._cache.values())
-            languages = list(self._cache.keys())
-            print(f"[TRANSLATION-SERVICE] ✅ Loaded {total_translations} translations across {len(languages)} languages: {languages}")
+            print(f"[TRANSLATION-SERVICE] ✅ Found translations for {len(sources)} languages: {list(sources)}")
     
-    def _flatten_dict(self, d, parent_key='', sep='.'):
-        """Flatten nested dict to dot-notation keys"""
-        items = []
-        for k, v in d.items():
-            new_key = f"{parent_key}{sep}{k}" if parent_key else k
-            if isinstance(v, dict):
-                items.extend(self._flatten_dict(v, new_key, sep=sep).items())
-            else:
-                items.append((new_key, v))
-        return dict(items)
+    def _store(self, lang: str) -> Optional[TranslationStore]:
+        """Compiled table for a language (compiled and mapped on first use)"""
+        store = self._stores.get(lang)
+        if store is not None or lang not in self._sources:
+            return store
+        with self._lock:
+            store = self._stores.get(lang)
+            if store is None and lang in self._sources:
+                try:
+                    store = TranslationStore(ensure_compiled(self._sources[lang]))
+                    self._stores[lang] = store
+                    print(f"[TRANSLATION-SERVICE] ✓ Mapped {len(store)} translations for '{lang}'")
+                except Exception as e:
+                    print(f"[TRANSLATION-SERVICE] ✗ Error loading {self._sources[lang]}: {e}")
+                    return None
+        return store
     
     def get(self, key: str, lang: str = 'en', fallback: bool = True) -> str:
         """Get single translation with optional fallback to English
@@ -86,12 +75,17 @@ class TranslationService:
             return key
         
         # Try requested language
-        if lang in self._cache and key in self._cache[lang]:
-            return self._cache[lang][key]
+        store = self._store(lang)
+        value = store.get(key) if store is not None else None
+        if value is not None:
+            return value
         
         # Fallback to English if enabled
-        if fallback and lang != 'en' and 'en' in self._cache and key in self._cache['en']:
-            return self._cache['en'][key]
+        if fallback and lang != 'en':
+            store = self._store('en')
+            value = store.get(key) if store is not None else None
+            if value is not None:
+                return value
         
         # Return key itself if not found (makes missing translations obvious)
         return key
@@ -108,7 +102,8 @@ class TranslationService:
         if not self._loaded:
             return {}
         
-        return self._cache.get(lang, {}).copy()
+        store = self._store(lang)
+        return dict(store.items()) if store is not None else {}
     
     def get_namespace(self, prefix: str, lang: str) -> Dict[str, str]:
         """Get all translations with keys starting with a prefix
@@ -123,17 +118,11 @@ class TranslationService:
         if not self._loaded:
             return {}
         
-        if lang not in self._cache:
-            return {}
-        
-        return {
-            key: value
-            for key, value in self._cache[lang].items()
-            if key.startswith(prefix)
-        }
+        store = self._store(lang)
+        return dict(store.prefix_items(prefix)) if store is not None else {}
     
     def reload(self):
-        """Refresh cache from database
+        """Refresh translation files (recompiled if they changed)
         
         This is called when translations are updated via the admin UI
         """
@@ -154,7 +143,7 @@ class TranslationService:
         Returns:
             List of language codes
         """
-        return ['en', 'ru']
+        return list(self._sources) if self._sources else ['en', 'ru']
 
 
 # Global singleton instance
@@ -0,0 +1,159 @@
+"""
+Compiled, memory-mapped translation tables
+
+config/translations/<lang>.json is compiled once into a binary file with the
+flattened keys sorted. Every worker process mmaps the same file read-only,
+so the table lives in the OS page cache once instead of as a dict per
+worker, and only the pages that are actually read get loaded.
+
+File layout (little-endian):
+    header   b"LTR1", entry count (uint32)
+    entries  per key, sorted by UTF-8 key bytes:
+             key offset, key length, value offset, value length (uint32 each)
+    blob     UTF-8 keys and values
+
+Lookups and prefix queries are binary searches, O(log n). A small
+per-process memo keeps the hottest keys from being searched every time.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+MAGIC = b"LTR1"
+HEADER = struct.Struct("<4sI")
+ENTRY = struct.Struct("<IIII")
+
+COMPILED_DIR = Path(tempfile.gettempdir()) / "translations-compiled"
+MEMO_SIZE = 2048  # Looked-up keys remembered per language and process
+
+
+def flatten(d: dict, parent_key: str = '', sep: str = '.') -> Dict[str, str]:
+    """Flatten nested dict to dot-notation keys"""
+    items: Dict[str, str] = {}
+    for k, v in d.items():
+        new_key = f"{parent_key}{sep}{k}" if parent_key else k
+        if isinstance(v, dict):
+            items.update(flatten(v, new_key, sep=sep))
+        else:
+            items[new_key] = v if isinstance(v, str) else json.dumps(v, ensure_ascii=False)
+    return items
+
+
+def compile_table(translations: Dict[str, str], target: Path):
+    """Write a flat {key: value} table to target in the compiled format (atomically)"""
+    pairs = sorted((key.encode("utf-8"), value.encode("utf-8")) for key, value in translations.items())
+    blob_start = HEADER.size + ENTRY.size * len(pairs)
+
+    entries = bytearray()
+    blob = bytearray()
+    for key, value in pairs:
+        key_off = blob_start + len(blob)
+        blob += key
+        value_off = blob_start + len(blob)
+        blob += value
+        entries += ENTRY.pack(key_off, len(key), value_off, len(value))
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=target.parent, prefix=target.name, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(pairs)))
+        f.write(entries)
+        f.write(blob)
+    # Workers compiling the same source at once each write their own temp file; the last rename wins
+    os.replace(tmp_path, target)
+
+
+def compiled_path(source: Path) -> Path:
+    """Artifact path for a source JSON file; a changed source gets a new artifact"""
+    stat = source.stat()
+    return COMPILED_DIR / f"{source.stem}-{stat.st_mtime_ns}-{stat.st_size}.ltr"
+
+
+def ensure_compiled(source: Path) -> Path:
+    """Compile source if it has no up-to-date artifact yet; returns the artifact path"""
+    target = compiled_path(source)
+    if not target.exists():
+        with open(source, 'r', encoding='utf-8') as f:
+            compile_table(flatten(json.load(f)), target)
+        for stale in COMPILED_DIR.glob(f"{source.stem}-*.ltr"):
+            if stale != target:
+                try:
+                    stale.unlink()
+                except OSError:
+                    pass
+    return target
+
+
+class TranslationStore:
+    """Read-only view of one compiled language table"""
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"Not a compiled translation table: {path}")
+        self._memo: Dict[str, Optional[str]] = {}
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _entry(self, i: int) -> Tuple[int, int, int, int]:
+        return ENTRY.unpack_from(self._mm, HEADER.size + i * ENTRY.size)
+
+    def _key(self, i: int) -> bytes:
+        key_off, key_len, _, _ = self._entry(i)
+        return self._mm[key_off:key_off + key_len]
+
+    def _item(self, i: int) -> Tuple[str, str]:
+        key_off, key_len, value_off, value_len = self._entry(i)
+        return (
+            self._mm[key_off:key_off + key_len].decode("utf-8"),
+            self._mm[value_off:value_off + value_len].decode("utf-8"),
+        )
+
+    def _bisect(self, key: bytes) -> int:
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def get(self, key: str) -> Optional[str]:
+        """Value for key, or None"""
+        try:
+            return self._memo[key]
+        except KeyError:
+            pass
+        encoded = key.encode("utf-8")
+        i = self._bisect(encoded)
+        value = None
+        if i < self.count and self._key(i) == encoded:
+            value = self._item(i)[1]
+        if len(self._memo) >= MEMO_SIZE:
+            self._memo.clear()
+        self._memo[key] = value
+        return value
+
+    def prefix_items(self, prefix: str) -> Iterator[Tuple[str, str]]:
+        """(key, value) pairs whose key starts with prefix, in key order"""
+        encoded = prefix.encode("utf-8")
+        i = self._bisect(encoded)
+        while i < self.count and self._key(i).startswith(encoded):
+            yield self._item(i)
+            i += 1
+
+    def items(self) -> List[Tuple[str, str]]:
+        return [self._item(i) for i in range(self.count)]
+
+    def close(self):
+        self._mm.close()
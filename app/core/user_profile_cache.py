@@ -0,0 +1,244 @@
+"""
+Hot per-user profile: locale, premium and energy
+
+check_user_premium, get_user_energy, check_user_energy and get_user_language
+run several times per message (chat handler, batch pipeline, image
+generation, image callbacks). They read a small profile from here instead
+of selecting the full users row each time.
+
+Two layers (app.yaml user_profile_cache):
+    local   per-process LRU with a short TTL (local_ttl_sec)
+    Redis   shared by all workers, key user_profile:<id> (redis_ttl_sec)
+
+Writes that change these fields go through crud, which either writes the new
+profile through (energy deductions) or invalidates it (payments, bonuses,
+locale changes, admin edits). Invalidation replaces the Redis entry with a
+short-lived tombstone, so other workers see the change once their local
+entry expires.
+
+Between invalidations the balance only goes down (every credit
+invalidates), so of two write-throughs the one with the lower balance is
+the newer. Deductions on different workers can finish out of order; a
+write-through never replaces an entry holding a lower balance, so an older
+one can't overwrite a newer one.
+
+The tombstone also guards against a racing read: a miss that selected the
+row just before a payment committed would otherwise store the pre-payment
+profile after the invalidation, for the whole redis_ttl_sec. Loads from the
+DB only fill an empty key (SET NX), and no store replaces a tombstone; for
+tombstone_sec after an invalidation the profile is read from the DB.
+
+The DB stays the source of truth for balances: deductions and purchases
+always debit the row, and a cached "not enough energy" is re-checked
+against the DB before the user is told so.
+
+The crud helpers are synchronous, so this uses a synchronous Redis client
+with short timeouts; when Redis is unreachable it is skipped for a while and
+only the local layer is used.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import orjson
+import redis
+
+from app.core.logging_utils import log_always
+from app.settings import settings, get_app_config
+
+
+REDIS_KEY = "user_profile:{}"
+TOMBSTONE = b"-"
+
+# Write-through: replace the entry unless it was just invalidated or holds a
+# lower (newer) balance
+_WRITE_THROUGH = """
+local current = redis.call('get', KEYS[1])
+if current == ARGV[2] then
+    return 0
+end
+if current then
+    local cached = cjson.decode(current)
+    if (cached.energy or 0) + (cached.temp_energy or 0) < tonumber(ARGV[4]) then
+        return 0
+    end
+end
+redis.call('set', KEYS[1], ARGV[1], 'EX', ARGV[3])
+return 1
+"""
+REDIS_TIMEOUT_SEC = 0.25
+REDIS_RETRY_SEC = 30  # How long to skip Redis after a connection error
+
+_LOCAL: "OrderedDict[int, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_INVALIDATED_AT: "OrderedDict[int, float]" = OrderedDict()  # Local tombstones, oldest first
+_REDIS: Optional[redis.Redis] = None
+_REDIS_DOWN_UNTIL = 0.0
+
+_STATS: Dict[str, int] = {
+    "local_hits": 0,
+    "redis_hits": 0,
+    "misses": 0,
+    "stores": 0,
+    "stores_skipped": 0,
+    "invalidations": 0,
+    "redis_errors": 0,
+}
+
+
+def get_profile_config() -> Dict[str, Any]:
+    """Get profile cache settings from app.yaml (user_profile_cache)"""
+    cfg = get_app_config().get("user_profile_cache", {}) or {}
+    return {
+        "enabled": cfg.get("enabled", True),
+        "local_ttl_sec": float(cfg.get("local_ttl_sec", 5)),
+        "redis_ttl_sec": int(cfg.get("redis_ttl_sec", 300)),
+        "max_entries": int(cfg.get("max_entries", 10000)),
+        "tombstone_sec": int(cfg.get("tombstone_sec", 10)),
+    }
+
+
+def profile_from_user(user) -> Dict[str, Any]:
+    """Profile fields of a User row (read them before commit to avoid a refresh query)"""
+    return {
+        "locale": user.locale or "en",
+        "is_premium": bool(user.is_premium),
+        "premium_tier": user.premium_tier or "free",
+        "premium_until": user.premium_until.isoformat() if user.premium_until else None,
+        "energy": user.energy or 0,
+        "temp_energy": user.temp_energy or 0,
+    }
+
+
+def _redis() -> Optional[redis.Redis]:
+    global _REDIS
+    if time.monotonic() < _REDIS_DOWN_UNTIL:
+        return None
+    if _REDIS is None:
+        _REDIS = redis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_connect_timeout=REDIS_TIMEOUT_SEC,
+            socket_timeout=REDIS_TIMEOUT_SEC,
+        )
+    return _REDIS
+
+
+def _redis_failed(e: Exception):
+    global _REDIS_DOWN_UNTIL
+    _STATS["redis_errors"] += 1
+    _REDIS_DOWN_UNTIL = time.monotonic() + REDIS_RETRY_SEC
+    log_always(f"[USER-PROFILE] ⚠️ Redis unavailable, using local cache only for {REDIS_RETRY_SEC}s: {e}")
+
+
+def _put_local(user_id: int, profile: Dict[str, Any], max_entries: int):
+    _LOCAL[user_id] = (time.monotonic(), profile)
+    _LOCAL.move_to_end(user_id)
+    while len(_LOCAL) > max_entries:
+        _LOCAL.popitem(last=False)
+
+
+def get(user_id: int) -> Optional[Dict[str, Any]]:
+    """Cached profile of a user, or None (load it from the DB and store() it)"""
+    config = get_profile_config()
+    if not config["enabled"]:
+        return None
+
+    entry = _LOCAL.get(user_id)
+    if entry is not None:
+        if time.monotonic() - entry[0] <= config["local_ttl_sec"]:
+            _LOCAL.move_to_end(user_id)
+            _STATS["local_hits"] += 1
+            return entry[1]
+        del _LOCAL[user_id]
+
+    client = _redis()
+    if client is not None:
+        try:
+            data = client.get(REDIS_KEY.format(user_id))
+        except redis.RedisError as e:
+            _redis_failed(e)
+            data = None
+        if data is not None and data != TOMBSTONE:
+            profile = orjson.loads(data)
+            _put_local(user_id, profile, config["max_entries"])
+            _STATS["redis_hits"] += 1
+            return profile
+
+    _STATS["misses"] += 1
+    return None
+
+
+def _recently_invalidated(user_id: int, tombstone_sec: int) -> bool:
+    now = time.monotonic()
+    while _INVALIDATED_AT and next(iter(_INVALIDATED_AT.values())) < now - tombstone_sec:
+        _INVALIDATED_AT.popitem(last=False)
+    return user_id in _INVALIDATED_AT
+
+
+def _balance(profile: Dict[str, Any]) -> int:
+    return (profile.get("energy") or 0) + (profile.get("temp_energy") or 0)
+
+
+def store(user_id: int, profile: Dict[str, Any], fill: bool = False):
+    """
+    Write a user's profile to both layers (skipped right after an invalidation).
+
+    Args:
+        fill: The profile was just loaded from the DB on a miss; only stored
+            if the key is still empty (another writer's newer entry wins).
+            Otherwise it's a write-through after a deduction and doesn't
+            replace an entry with a lower balance.
+    """
+    config = get_profile_config()
+    if not config["enabled"]:
+        return
+    if _recently_invalidated(user_id, config["tombstone_sec"]):
+        _STATS["stores_skipped"] += 1
+        return
+    local = _LOCAL.get(user_id)
+    if fill or local is None or _balance(local[1]) >= _balance(profile):
+        _put_local(user_id, profile, config["max_entries"])
+    _STATS["stores"] += 1
+    client = _redis()
+    if client is not None:
+        key, data = REDIS_KEY.format(user_id), orjson.dumps(profile)
+        try:
+            if fill:
+                client.set(key, data, ex=config["redis_ttl_sec"], nx=True)
+            else:
+                client.eval(_WRITE_THROUGH, 1, key, data, TOMBSTONE, config["redis_ttl_sec"], _balance(profile))
+        except redis.RedisError as e:
+            _redis_failed(e)
+
+
+def invalidate(*user_ids: int):
+    """Drop cached profiles after a write that changes locale, premium or energy"""
+    if not user_ids:
+        return
+    tombstone_sec = get_profile_config()["tombstone_sec"]
+    now = time.monotonic()
+    for user_id in user_ids:
+        _LOCAL.pop(user_id, None)
+        _INVALIDATED_AT.pop(user_id, None)
+        _INVALIDATED_AT[user_id] = now
+    _STATS["invalidations"] += len(user_ids)
+    client = _redis()
+    if client is not None:
+        try:
+            pipe = client.pipeline(transaction=False)
+            for user_id in user_ids:
+                pipe.set(REDIS_KEY.format(user_id), TOMBSTONE, ex=tombstone_sec)
+            pipe.execute()
+        except redis.RedisError as e:
+            _redis_failed(e)
+
+
+def get_stats() -> Dict[str, Any]:
+    """Get profile cache hit rates for this process"""
+    lookups = _STATS["local_hits"] + _STATS["redis_hits"] + _STATS["misses"]
+    hits = _STATS["local_hits"] + _STATS["redis_hits"]
+    return {
+        **_STATS,
+        "local_entries": len(_LOCAL),
+        "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        "redis_available": time.monotonic() >= _REDIS_DOWN_UNTIL,
+    }
@@ -0,0 +1,173 @@
+"""
+Mini App init data: validate once, parse once, resolve the user once
+
+The Mini App sends the same Telegram initData string with every request of a
+session. parse_init_data checks its HMAC and parses the user JSON once, then
+keeps the result in an LRU keyed by a hash of the string (with a TTL, so a
+stolen string isn't trusted forever).
+
+Endpoints take the result as a FastAPI dependency:
+    init_data: InitData = Depends(miniapp_init_data)      # 403 if unauthorized
+    user: Optional[UserContext] = Depends(miniapp_user)   # + language/premium/energy
+
+UserContext comes from a short-lived per-user cache (one DB session per
+user every USER_CONTEXT_TTL_SEC at most). Its energy is for display and
+gating hints only; anything that spends energy reads the DB. Endpoints that
+change the cached fields call invalidate_user_context.
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from fastapi import Depends, Header, HTTPException
+
+from app.core.security import validate_telegram_webapp_data
+from app.settings import settings
+
+
+INIT_DATA_CACHE_SIZE = 4096
+INIT_DATA_TTL_SEC = 300
+USER_CONTEXT_CACHE_SIZE = 4096
+USER_CONTEXT_TTL_SEC = 10
+
+
+@dataclass(frozen=True)
+class InitData:
+    """Parsed Telegram initData"""
+    raw: str
+    is_valid: bool
+    user: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def user_id(self) -> Optional[int]:
+        return self.user.get("id")
+
+    @property
+    def language_code(self) -> str:
+        return self.user.get("language_code", "en")
+
+
+@dataclass(frozen=True)
+class UserContext:
+    """User fields most Mini App endpoints need"""
+    user_id: int
+    language: str = "en"
+    is_premium: bool = False
+    premium_tier: str = "free"
+    energy: int = 0  # energy + temp_energy when loaded
+
+
+_INIT_DATA: "OrderedDict[bytes, Tuple[float, InitData]]" = OrderedDict()
+_USER_CONTEXTS: "OrderedDict[int, Tuple[float, UserContext]]" = OrderedDict()
+
+_STATS: Dict[str, int] = {
+    "init_data_hits": 0,
+    "init_data_misses": 0,
+    "user_context_hits": 0,
+    "user_context_misses": 0,
+}
+
+
+def _lru_get(cache: OrderedDict, key, ttl: float):
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    if time.monotonic() - entry[0] > ttl:
+        del cache[key]
+        return None
+    cache.move_to_end(key)
+    return entry[1]
+
+
+def _lru_put(cache: OrderedDict, key, value, max_size: int):
+    cache[key] = (time.monotonic(), value)
+    cache.move_to_end(key)
+    if len(cache) > max_size:
+        cache.popitem(last=False)
+
+
+def parse_init_data(raw: Optional[str]) -> InitData:
+    """Validate and parse an initData string (cached by its hash)"""
+    raw = raw or ""
+    if not raw:
+        return InitData(raw="", is_valid=False)
+
+    key = hashlib.blake2b(raw.encode(), digest_size=16).digest()
+    cached = _lru_get(_INIT_DATA, key, INIT_DATA_TTL_SEC)
+    if cached is not None:
+        _STATS["init_data_hits"] += 1
+        return cached
+    _STATS["init_data_misses"] += 1
+
+    try:
+        user = json.loads(dict(parse_qsl(raw)).get("user", "{}"))
+        if not isinstance(user, dict):
+            user = {}
+    except Exception:
+        user = {}
+    init_data = InitData(raw=raw, is_valid=validate_telegram_webapp_data(raw), user=user)
+    _lru_put(_INIT_DATA, key, init_data, INIT_DATA_CACHE_SIZE)
+    return init_data
+
+
+def is_authorized(init_data: InitData) -> bool:
+    """Signature check is enforced in production unless SKIP_MINIAPP_AUTH is set (dev/testing only)"""
+    return settings.SKIP_MINIAPP_AUTH or settings.ENV != "production" or init_data.is_valid
+
+
+async def miniapp_init_data(x_telegram_init_data: Optional[str] = Header(None)) -> InitData:
+    """FastAPI dependency: parsed init data, 403 if it doesn't authenticate"""
+    init_data = parse_init_data(x_telegram_init_data)
+    if not is_authorized(init_data):
+        raise HTTPException(status_code=403, detail="Invalid Telegram authentication")
+    return init_data
+
+
+def load_user_context(user_id: int) -> UserContext:
+    """User context from the per-user cache, loaded in one DB session on a miss"""
+    cached = _lru_get(_USER_CONTEXTS, user_id, USER_CONTEXT_TTL_SEC)
+    if cached is not None:
+        _STATS["user_context_hits"] += 1
+        return cached
+    _STATS["user_context_misses"] += 1
+
+    from app.db.base import get_db
+    from app.db import crud
+
+    with get_db() as db:
+        profile = crud.get_user_profile(db, user_id)
+        if profile is None:
+            context = UserContext(user_id=user_id)
+        else:
+            premium_info = crud.check_user_premium(db, user_id)
+            context = UserContext(
+                user_id=user_id,
+                language=profile["locale"],
+                is_premium=premium_info["is_premium"],
+                premium_tier=premium_info["tier"],
+                energy=profile["temp_energy"] + profile["energy"],
+            )
+    _lru_put(_USER_CONTEXTS, user_id, context, USER_CONTEXT_CACHE_SIZE)
+    return context
+
+
+def invalidate_user_context(user_id: Optional[int]):
+    """Drop a user's cached context (after changing language, premium or energy)"""
+    if user_id is not None:
+        _USER_CONTEXTS.pop(user_id, None)
+
+
+async def miniapp_user(init_data: InitData = Depends(miniapp_init_data)) -> Optional[UserContext]:
+    """FastAPI dependency: context of the authenticated user, None if init data has no user"""
+    if not init_data.user_id:
+        return None
+    return load_user_context(init_data.user_id)
+
+
+def get_stats() -> Dict[str, Any]:
+    """Get init-data and user-context cache statistics for this process"""
+    return {**_STATS, "init_data_cached": len(_INIT_DATA), "user_contexts_cached": len(_USER_CONTEXTS)}
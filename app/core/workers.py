@@ -0,0 +1,171 @@
+"""
+Multi-worker mode (uvicorn --workers)
+
+Several worker processes on one host share nothing in memory; they
+coordinate through Redis and Postgres:
+
+    Shared through Redis/Postgres (correct with any number of workers)
+        chat message queues and processing locks (redis_queue), the user
+        profile cache, image jobs and energy reservations, cache generations,
+        chat maintenance runs (a per-chat lock, see chat_maintenance)
+    Per worker, kept consistent through Redis
+        persona/translation/start-code snapshots (cache_bus reloads every
+        worker), chat action indicators (a stop requested on another worker
+        is forwarded, see action_registry)
+    Per worker, by design
+        background tasks (background_tasks), LLM governor slots (so caps
+        are per process), the shown-image write buffer and the image
+        similarity index (each worker flushes/refreshes its own)
+    One worker at a time
+        global scheduler jobs (follow-ups, system messages, image job
+        reconciler, cleanup), which would otherwise run once per worker.
+        Workers elect a leader with a Redis key (scheduler:leader, SET NX
+        with a TTL) that the leader keeps renewing; if it dies, another
+        worker takes over within leader_ttl_sec.
+
+app.yaml workers.multi_worker: auto turns this on when WEB_CONCURRENCY
+(the worker count uvicorn uses) is above 1; set it to true when running
+several single-worker replicas against the same Redis.
+"""
+import asyncio
+import os
+from typing import Any, Dict, Optional
+
+from app.core import cache_bus, redis_queue
+from app.core.logging_utils import log_always, log_verbose
+from app.settings import get_app_config
+
+
+LEADER_KEY = "scheduler:leader"
+
+# Renew/release only while the key still holds our id (it may have expired and been taken over)
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_IS_LEADER = False
+_ELECTION: Optional[asyncio.Task] = None
+
+_STATS: Dict[str, int] = {
+    "elected": 0,
+    "renewals": 0,
+    "lost": 0,
+    "errors": 0,
+}
+
+
+def get_workers_config() -> Dict[str, Any]:
+    """Get multi-worker settings from app.yaml (workers)"""
+    cfg = get_app_config().get("workers", {}) or {}
+    return {
+        "multi_worker": cfg.get("multi_worker", "auto"),
+        "leader_ttl_sec": int(cfg.get("leader_ttl_sec", 30)),
+        "shutdown_drain_sec": float(cfg.get("shutdown_drain_sec", 20)),
+        "action_stop_channel": cfg.get("action_stop_channel", "chat_actions:stop"),
+    }
+
+
+def worker_count() -> int:
+    """Worker processes on this host (WEB_CONCURRENCY, which uvicorn --workers also defaults to)"""
+    try:
+        return max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+    except ValueError:
+        return 1
+
+
+def is_multi_worker() -> bool:
+    """Whether other processes share this Redis and need coordinating with"""
+    mode = get_workers_config()["multi_worker"]
+    if mode == "auto":
+        return worker_count() > 1
+    return bool(mode)
+
+
+def is_leader() -> bool:
+    """Whether this process runs the global scheduler jobs (always true in single-worker mode)"""
+    return _IS_LEADER or not is_multi_worker()
+
+
+async def _campaign(redis, ttl_sec: int) -> bool:
+    """Renew our leadership, or take it if nobody holds it; returns whether we lead"""
+    if _IS_LEADER and await redis.eval(_RENEW_SCRIPT, 1, LEADER_KEY, cache_bus.INSTANCE_ID, ttl_sec):
+        _STATS["renewals"] += 1
+        return True
+    return bool(await redis.set(LEADER_KEY, cache_bus.INSTANCE_ID, nx=True, ex=ttl_sec))
+
+
+async def elect_once():
+    """Run one election round and update this process's leadership"""
+    global _IS_LEADER
+    ttl_sec = get_workers_config()["leader_ttl_sec"]
+    try:
+        redis = await redis_queue.get_redis()
+        leader = await _campaign(redis, ttl_sec)
+    except Exception as e:
+        # Without Redis we can't tell whether our key expired, so step down rather than risk two leaders
+        _STATS["errors"] += 1
+        log_always(f"[WORKERS] ⚠️ Leader election failed: {e}")
+        leader = False
+
+    if leader and not _IS_LEADER:
+        _STATS["elected"] += 1
+        log_always(f"[WORKERS] 👑 Worker {os.getpid()} is now the scheduler leader")
+    elif _IS_LEADER and not leader:
+        _STATS["lost"] += 1
+        log_always(f"[WORKERS] ⚠️ Worker {os.getpid()} lost scheduler leadership")
+    _IS_LEADER = leader
+
+
+async def _run_elections():
+    interval = max(1.0, get_workers_config()["leader_ttl_sec"] / 3)
+    while True:
+        await asyncio.sleep(interval)
+        await elect_once()
+        log_verbose(f"[WORKERS] Leader: {_IS_LEADER}")
+
+
+async def start():
+    """Join the scheduler leader election (call at startup, before the scheduler starts)"""
+    global _ELECTION
+    if not is_multi_worker() or _ELECTION is not None:
+        return
+    await elect_once()
+    _ELECTION = asyncio.create_task(_run_elections())
+    log_always(f"[WORKERS] ✅ Multi-worker mode ({worker_count()} workers), leader: {_IS_LEADER}")
+
+
+async def stop():
+    """Leave the election and hand leadership over right away (call on shutdown)"""
+    global _ELECTION, _IS_LEADER
+    if _ELECTION is not None:
+        _ELECTION.cancel()
+        await asyncio.gather(_ELECTION, return_exceptions=True)
+        _ELECTION = None
+    if _IS_LEADER:
+        try:
+            redis = await redis_queue.get_redis()
+            await redis.eval(_RELEASE_SCRIPT, 1, LEADER_KEY, cache_bus.INSTANCE_ID)
+        except Exception as e:
+            log_always(f"[WORKERS] ⚠️ Failed to release scheduler leadership (expires on its own): {e}")
+        _IS_LEADER = False
+
+
+def get_stats() -> Dict[str, Any]:
+    """Get this worker's role and election counters"""
+    return {
+        **_STATS,
+        "pid": os.getpid(),
+        "instance_id": cache_bus.INSTANCE_ID,
+        "worker_count": worker_count(),
+        "multi_worker": is_multi_worker(),
+        "is_leader": is_leader(),
+    }
@@ -4,12 +4,13 @@ CRUD operations for database models
 from typing import List, Optional, Dict, Any
 from uuid import UUID
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
+from sqlalchemy import case, desc, func, update
 from app.db.models import (
     User, Persona, Chat, Message, ImageJob, TgAnalyticsEvent, StartCode,
     PersonaTranslation, PersonaHistoryTranslation, SystemMessage, SystemMessageTemplate, SystemMessageDelivery
 )
 from datetime import datetime, date
+from app.core import user_profile_cache
 from app.core.catalog.gifts import get_shop_items_map
 
 
@@ -123,6 +124,7 @@ def get_or_create_user(
             user.locale = normalized_locale
             db.commit()
             db.refresh(user)
+            user_profile_cache.invalidate(telegram_id)
         
         # Only set acquisition source if not already set (first-touch attribution)
         if acquisition_source and not user.acquisition_source:
@@ -178,6 +180,7 @@ def set_user_locale(db: Session, telegram_id: int, locale: str) -> User:
         user.locale_manually_set = True
         db.commit()
         db.refresh(user)
+        user_profile_cache.invalidate(telegram_id)
     return user
 
 
@@ -248,10 +251,29 @@ def get_user_language(db: Session, telegram_id: int) -> str:
     Returns:
         Language code (e.g., 'en', 'ru', 'fr', 'de', 'es'), defaults to 'en'
     """
-    user = db.query(User).filter(User.id == telegram_id).first()
-    if user and user.locale:
-        return user.locale
-    return 'en'
+    profile = get_user_profile(db, telegram_id)
+    return profile["locale"] if profile else 'en'
+
+
+def get_user_profile(db: Session, telegram_id: int) -> Optional[Dict[str, Any]]:
+    """Get the cached locale/premium/energy profile of a user
+    
+    Served from user_profile_cache, loaded from the users row on a miss.
+    
+    Args:
+        telegram_id: Telegram user ID
+    
+    Returns:
+        Profile dict (see user_profile_cache.profile_from_user) or None if the user doesn't exist
+    """
+    profile = user_profile_cache.get(telegram_id)
+    if profile is None:
+        user = db.query(User).filter(User.id == telegram_id).first()
+        if not user:
+            return None
+        profile = user_profile_cache.profile_from_user(user)
+        user_profile_cache.store(telegram_id, profile, fill=True)
+    return profile
 
 
 # ========== PERSONA OPERATIONS ==========
@@ -1178,6 +1200,97 @@ def find_cached_image(db: Session, prompt_hash: str, user_id: int) -> Optional[I
     ).order_by(func.random()).first()  # Random from available
 
 
+def get_cached_image_candidates(db: Session, prompt_hash: str, limit: int = 25) -> List[ImageJob]:
+    """Get servable cached images for a prompt hash without the per-user anti-join
+    
+    Single probe of the ix_image_jobs_cache_lookup partial index. Per-user
+    deduplication is done by the caller (see app.core.shown_images).
+    """
+    return db.query(ImageJob).filter(
+        ImageJob.prompt_hash == prompt_hash,
+        ImageJob.status == "completed",
+        ImageJob.result_url.like("https://imagedelivery.net/%"),  # Only cloudflare URLs
+        ImageJob.is_blacklisted == False
+    ).order_by(func.random()).limit(limit).all()
+
+
+def get_cached_images_by_ids(db: Session, job_ids: List[UUID]) -> List[ImageJob]:
+    """Get servable cached images (completed, Cloudflare URL, not blacklisted) by ID"""
+    if not job_ids:
+        return []
+    return db.query(ImageJob).filter(
+        ImageJob.id.in_(job_ids),
+        ImageJob.status == "completed",
+        ImageJob.result_url.like("https://imagedelivery.net/%"),
+        ImageJob.is_blacklisted == False
+    ).all()
+
+
+def get_cacheable_image_prompts(db: Session, since: datetime) -> List[tuple]:
+    """Get (id, persona_id, prompt, finished_at) of servable cached images finished after `since`
+    
+    Used to build the near-duplicate prompt index (app.core.image_similarity).
+    """
+    return db.query(
+        ImageJob.id, ImageJob.persona_id, ImageJob.prompt, ImageJob.finished_at
+    ).filter(
+        ImageJob.status == "completed",
+        ImageJob.result_url.like("https://imagedelivery.net/%"),
+        ImageJob.is_blacklisted == False,
+        ImageJob.finished_at >= since
+    ).all()
+
+
+def get_user_shown_image_ids(db: Session, user_id: int) -> List[UUID]:
+    """Get IDs of all images a user has been shown (used to rebuild the Redis seen-filter)"""
+    from app.db.models import UserShownImage
+    
+    rows = db.query(UserShownImage.image_job_id).filter(
+        UserShownImage.user_id == user_id
+    ).all()
+    return [row[0] for row in rows]
+
+
+def bulk_mark_images_shown(db: Session, rows: List[tuple]) -> int:
+    """Insert many (user_id, image_job_id) pairs into user_shown_images in one statement
+    
+    Uses INSERT ... ON CONFLICT DO NOTHING, single commit for the whole batch.
+    
+    Returns:
+        Number of pairs submitted
+    """
+    from sqlalchemy.dialects.postgresql import insert
+    from app.db.models import UserShownImage
+    
+    if not rows:
+        return 0
+    
+    # Deduplicate within the batch (ON CONFLICT can't resolve duplicates in one VALUES list)
+    unique_rows = list(dict.fromkeys((int(uid), str(jid)) for uid, jid in rows))
+    stmt = insert(UserShownImage).values([
+        {"user_id": uid, "image_job_id": UUID(jid)} for uid, jid in unique_rows
+    ]).on_conflict_do_nothing(
+        index_elements=['user_id', 'image_job_id']
+    )
+    db.execute(stmt)
+    db.commit()
+    return len(unique_rows)
+
+
+def bulk_increment_cache_serve_counts(db: Session, counts: Dict[str, int]) -> int:
+    """Apply aggregated cache serve count increments (job_id -> delta) in one commit"""
+    if not counts:
+        return 0
+    
+    for job_id, delta in counts.items():
+        db.query(ImageJob).filter(ImageJob.id == UUID(str(job_id))).update(
+            {ImageJob.cache_serve_count: ImageJob.cache_serve_count + int(delta)},
+            synchronize_session=False
+        )
+    db.commit()
+    return len(counts)
+
+
 def mark_image_shown(db: Session, user_id: int, image_job_id: UUID):
     """Mark that a user has been shown an image (for cache deduplication)
     
@@ -1220,13 +1333,22 @@ def create_image_job(
     negative_prompt: str,
     chat_id: UUID = None,
     ext: dict = None,
-    prompt_hash: str = None
+    prompt_hash: str = None,
+    energy_reserved: int = 0
 ) -> ImageJob:
-    """Create a new image generation job"""
+    """Create a new image generation job
+    
+    energy_reserved: energy already debited for this job; refunded if the job
+    fails (see update_image_job_status)
+    """
     # Auto-compute hash if not provided
     if prompt_hash is None:
         prompt_hash = compute_prompt_hash(prompt)
     
+    ext = dict(ext or {})
+    if energy_reserved:
+        ext[ENERGY_RESERVATION_KEY] = {"amount": energy_reserved, "state": "held"}
+    
     job = ImageJob(
         user_id=user_id,
         persona_id=persona_id,
@@ -1276,6 +1398,16 @@ def get_image_job(db: Session, job_id: UUID) -> Optional[ImageJob]:
     return db.query(ImageJob).filter(ImageJob.id == job_id).first()
 
 
+def get_image_job_statuses(db: Session, job_ids: List[str]) -> Dict[str, str]:
+    """Get status for several image jobs at once (job_id -> status)"""
+    if not job_ids:
+        return {}
+    rows = db.query(ImageJob.id, ImageJob.status).filter(
+        ImageJob.id.in_([UUID(str(job_id)) for job_id in job_ids])
+    ).all()
+    return {str(job_id): status for job_id, status in rows}
+
+
 def get_last_completed_image_job(db: Session, chat_id: UUID) -> Optional[ImageJob]:
     """Get the last completed image job for a chat (to get previous image prompt)"""
     return db.query(ImageJob).filter(
@@ -1292,10 +1424,21 @@ def update_image_job_status(
     result_file_id: str = None,
     error: str = None
 ):
-    """Update image job status"""
-    job = db.query(ImageJob).filter(ImageJob.id == job_id).first()
+    """Update image job status
+    
+    Finishing a job settles its energy reservation: kept on completion,
+    refunded on failure. The row is locked and re-read (the caller's session
+    may already hold a stale copy) so a reservation is settled once even if
+    the callback and the reconciler finish the job concurrently.
+    """
+    finishing = status in ("completed", "failed")
+    query = db.query(ImageJob).filter(ImageJob.id == job_id)
+    if finishing:
+        query = query.with_for_update().populate_existing()
+    job = query.first()
     if not job:
         return
+    already_finished = job.status in ("completed", "failed")
     
     job.status = status
     if result_url:
@@ -1304,10 +1447,25 @@ def update_image_job_status(
         job.result_file_id = result_file_id
     if error:
         job.error = error
-    if status in ("completed", "failed"):
+    refunded = False
+    if finishing and not already_finished:
         job.finished_at = datetime.utcnow()
+        refunded = _settle_energy_reservation(db, job, refund=status == "failed")
     
     db.commit()
+    if refunded:
+        user_profile_cache.invalidate(job.user_id)
+
+
+def _settle_energy_reservation(db: Session, job: ImageJob, refund: bool) -> bool:
+    """Commit or refund a held reservation (caller commits); True if energy was credited back"""
+    reservation = (job.ext or {}).get(ENERGY_RESERVATION_KEY)
+    if not reservation or reservation.get("state") != "held":
+        return False
+    if refund:
+        _credit_user_energy(db, job.user_id, reservation["amount"])
+    job.ext = {**job.ext, ENERGY_RESERVATION_KEY: {**reservation, "state": "refunded" if refund else "committed"}}
+    return refund
 
 
 # ========== PERSONA HISTORY OPERATIONS ==========
@@ -1403,13 +1561,15 @@ def delete_persona_history(db: Session, history_id: UUID) -> bool:
 
 # ========== USER ENERGY OPERATIONS ==========
 
+ENERGY_RESERVATION_KEY = "energy_reservation"  # ImageJob.ext entry: {"amount": int, "state": "held" | "committed" | "refunded"}
+
 def get_user_energy(db: Session, user_id: int) -> dict:
     """Get user's current token balance (combined temp_energy + regular energy)"""
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+    profile = get_user_profile(db, user_id)
+    if not profile:
         return {"tokens": 0, "premium_tier": "free"}
-    total_tokens = (user.temp_energy or 0) + user.energy
-    return {"tokens": total_tokens, "premium_tier": user.premium_tier}
+    total_tokens = profile["temp_energy"] + profile["energy"]
+    return {"tokens": total_tokens, "premium_tier": profile["premium_tier"]}
 
 
 def deduct_user_energy(db: Session, user_id: int, amount: int = 5) -> bool:
@@ -1417,30 +1577,56 @@ def deduct_user_energy(db: Session, user_id: int, amount: int = 5) -> bool:
     Deduct tokens from user (all users including premium tiers consume tokens)
     Deducts from temp_energy first, then regular energy
     Returns True if successful, False if insufficient tokens
-    """
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        return False
     
-    # Check if user has enough total energy
-    total_energy = (user.temp_energy or 0) + user.energy
-    if total_energy < amount:
+    A single conditional UPDATE ... RETURNING: the balance check and the debit
+    happen in the database, so concurrent deductions can't both spend the
+    same tokens.
+    """
+    temp_energy = func.coalesce(User.temp_energy, 0)
+    covered_by_temp = temp_energy >= amount
+    row = db.execute(
+        update(User)
+        .where(User.id == user_id, temp_energy + User.energy >= amount)
+        .values(
+            # Both expressions see the row as it was before the update
+            temp_energy=case((covered_by_temp, temp_energy - amount), else_=0),
+            energy=case((covered_by_temp, User.energy), else_=User.energy - (amount - temp_energy)),
+        )
+        .returning(User.locale, User.is_premium, User.premium_tier, User.premium_until, User.energy, User.temp_energy)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if row is None:
         return False
     
-    # Deduct from temp_energy first
-    if user.temp_energy >= amount:
-        # Sufficient temp energy to cover the cost
-        user.temp_energy -= amount
-    else:
-        # Use all temp energy and deduct the rest from regular energy
-        remaining = amount - user.temp_energy
-        user.temp_energy = 0
-        user.energy -= remaining
-    
     db.commit()
+    user_profile_cache.store(user_id, user_profile_cache.profile_from_user(row))
     return True
 
 
+def _credit_user_energy(db: Session, user_id: int, amount: int):
+    """Add tokens to regular energy in one UPDATE (caller commits)"""
+    db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(energy=User.energy + amount)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def refund_user_energy(db: Session, user_id: int, amount: int):
+    """
+    Give back tokens deducted for work that didn't happen (e.g. an image that was never generated)
+    
+    Refunds go to regular energy: temp_energy is reset daily, so a refund
+    there could be wiped before it's used.
+    """
+    if amount <= 0:
+        return
+    _credit_user_energy(db, user_id, amount)
+    db.commit()
+    user_profile_cache.invalidate(user_id)
+
+
 def add_user_energy(db: Session, user_id: int, amount: int) -> bool:
     """
     Add tokens to user (no cap - tokens are purchased)
@@ -1453,16 +1639,21 @@ def add_user_energy(db: Session, user_id: int, amount: int) -> bool:
     # Simply add tokens - no max_energy cap for purchased tokens
     user.energy += amount
     db.commit()
+    user_profile_cache.invalidate(user_id)
     return True
 
 
 def check_user_energy(db: Session, user_id: int, required: int = 5) -> bool:
     """Check if user has enough energy (checks temp_energy + regular energy combined)"""
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+    profile = get_user_profile(db, user_id)
+    if not profile:
         return False
-    total_energy = (user.temp_energy or 0) + user.energy
-    return total_energy >= required
+    if profile["temp_energy"] + profile["energy"] >= required:
+        return True
+    # Energy may have been added by another worker since it was cached; confirm before refusing
+    user_profile_cache.invalidate(user_id)
+    profile = get_user_profile(db, user_id)
+    return profile["temp_energy"] + profile["energy"] >= required
 
 
 def save_energy_upsell_message(db: Session, user_id: int, message_id: int, chat_id: int):
@@ -1501,7 +1692,17 @@ def check_user_premium(db: Session, user_id: int) -> dict:
     Check if user has active premium subscription and return tier information
     Returns: {"is_premium": bool, "tier": str}
     """
-    
+    profile = get_user_profile(db, user_id)
+    if not profile:
+        return {"is_premium": False, "tier": "free"}
+    if not profile["is_premium"]:
+        return {"is_premium": False, "tier": profile["premium_tier"]}
+    premium_until = profile["premium_until"]
+    if (premium_until is None or datetime.fromisoformat(premium_until) > datetime.utcnow()) and profile["premium_tier"] != "free":
+        return {"is_premium": True, "tier": profile["premium_tier"]}
+    
+    # Expired or tier missing - fix up the row below
+    user_profile_cache.invalidate(user_id)
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         return {"is_premium": False, "tier": "free"}
@@ -1556,6 +1757,7 @@ def activate_premium(db: Session, user_id: int, duration_days: int, tier: str =
     # Premium = unlimited energy for messages, photos, blur removal
     
     db.commit()
+    user_profile_cache.invalidate(user_id)
     return True
 
 
@@ -1583,6 +1785,7 @@ def add_daily_tokens_by_tier(db: Session) -> int:
     
     count = 0
     now = datetime.utcnow()
+    refilled = []
     
     for user in users:
         # Check if 24 hours have passed since last refill
@@ -1596,9 +1799,11 @@ def add_daily_tokens_by_tier(db: Session) -> int:
         if temp_energy_amount > 0:
             user.temp_energy = temp_energy_amount  # Reset, not add
             user.last_temp_energy_refill = now
+            refilled.append(user.id)
             count += 1
     
     db.commit()
+    user_profile_cache.invalidate(*refilled)
     return count
 
 
@@ -1716,6 +1921,7 @@ def claim_daily_bonus(db: Session, user_id: int) -> dict:
     
     db.commit()
     db.refresh(user)
+    user_profile_cache.invalidate(user_id)
     
     # Build response message
     if is_day_30:
@@ -1777,6 +1983,7 @@ def award_referral_tokens(db: Session, referrer_id: int, new_user_id: int) -> bo
     new_user.referral_tokens_awarded = True
     
     db.commit()
+    user_profile_cache.invalidate(referrer_id)
     return True
 
 
@@ -4618,6 +4825,7 @@ def purchase_shop_item(db: Session, user_id: int, chat_id: UUID, item_key: str)
     db.commit()
     db.refresh(user)
     db.refresh(chat)
+    user_profile_cache.invalidate(user_id)
     
     new_tokens = (user.temp_energy or 0) + user.energy
     
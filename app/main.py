@@ -38,6 +38,9 @@ from app.core.rate import close_redis
 from app.db.base import get_db
 from app.db import crud
 from app.core import analytics_service_tg
+from app.core import shown_images
+from app.core import image_job_reconciler
+from app.core import background_tasks
 print("✅ Core modules loaded")
 
 print("🌐 Loading Mini App API...")
@@ -55,42 +58,57 @@ async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
     # Startup
     print("🚀 Starting application...")
-    load_configs()
+    from app.core import startup
+    startup.begin()
+    await startup.run_phase("configs", load_configs)
     
-    # Load translation service FIRST (before persona cache, as it depends on it)
+    # Independent loaders run at the same time (DB and file loaders in worker threads).
+    # Persona fields are translated lazily, so the persona cache no longer waits for translations.
     from app.core.translation_service import translation_service
-    translation_service.load()
-    print("✅ Translation service loaded")
-    
-    # Load persona cache (depends on translation_service)
     from app.core.persona_cache import load_cache
-    load_cache()
-    print("✅ Persona cache loaded")
-    
-    # Load start code cache
     from app.core.start_code_cache import load_cache as load_start_code_cache
-    load_start_code_cache()
-    print("✅ Start code cache loaded")
+    from app.core.prefilters import load_model as load_prefilter_model
+    await startup.run_concurrently({
+        "translations": translation_service.load,
+        "persona_cache": load_cache,
+        "start_code_cache": load_start_code_cache,
+        "prefilter_model": load_prefilter_model,  # Optional local pre-filter model (LLM fast paths)
+    })
+    print("✅ Translations, persona cache and start code cache loaded")
+    
+    # Reload the caches above when another worker/replica publishes an admin change;
+    # in multi-worker mode the same subscription carries chat action stops
+    from app.core import action_registry, cache_bus, workers
+    action_registry.listen_for_remote_stops()
+    await startup.run_phase("cache_bus", cache_bus.start)
     
-    # Set Mini App menu button (only if bot is enabled)
+    # Multi-worker mode: elect the worker that runs the global scheduler jobs
+    await startup.run_phase("leader_election", workers.start)
+    
+    # Set Mini App menu button (only if bot is enabled); a Telegram API call that
+    # doesn't need to hold up serving webhooks
     if settings.ENABLE_BOT and bot:
-        try:
-            from aiogram.types import MenuButtonWebApp, WebAppInfo
-            from app.settings import get_app_config
-            app_config = get_app_config()
-            miniapp_config = app_config.get('miniapp', {})
-            button_name = miniapp_config.get('menu_button_name', 'App')
-            miniapp_url = settings.miniapp_url
-            menu_button = MenuButtonWebApp(text=button_name, web_app=WebAppInfo(url=miniapp_url))
-            await bot.set_chat_menu_button(menu_button=menu_button)
-            print(f"✅ Mini App menu button set: {miniapp_url}")
-        except Exception as e:
-            print(f"⚠️  Failed to set Mini App menu button: {e}")
+        async def set_menu_button():
+            try:
+                from aiogram.types import MenuButtonWebApp, WebAppInfo
+                from app.settings import get_app_config
+                app_config = get_app_config()
+                miniapp_config = app_config.get('miniapp', {})
+                button_name = miniapp_config.get('menu_button_name', 'App')
+                miniapp_url = settings.miniapp_url
+                menu_button = MenuButtonWebApp(text=button_name, web_app=WebAppInfo(url=miniapp_url))
+                await bot.set_chat_menu_button(menu_button=menu_button)
+                print(f"✅ Mini App menu button set: {miniapp_url}")
+            except Exception as e:
+                print(f"⚠️  Failed to set Mini App menu button: {e}")
+        
+        startup.run_in_background("menu_button", set_menu_button)
     
     # Start background scheduler
     from app.core.scheduler import start_scheduler
-    start_scheduler()
+    await startup.run_phase("scheduler", start_scheduler)
     
+    startup.finish()
     if settings.ENABLE_BOT:
         print("✅ Bot started successfully")
     else:
@@ -101,9 +119,32 @@ async def lifespan(app: FastAPI):
     # Shutdown
     print("🛑 Shutting down application...")
     
-    # Stop scheduler
+    # Stop scheduler and hand scheduler leadership to another worker
     from app.core.scheduler import stop_scheduler
     stop_scheduler()
+    from app.core import workers
+    await workers.stop()
+    
+    # Let in-flight background work (replies, uploads) finish while Redis, DB and bot are still up
+    from app.core import background_tasks
+    await background_tasks.drain(workers.get_workers_config()["shutdown_drain_sec"])
+    
+    # Stop listening for cache invalidations
+    from app.core import cache_bus
+    await cache_bus.stop()
+    
+    # Run debounced chat maintenance (memory/name/summary) that is still waiting
+    try:
+        from app.core.chat_maintenance import run_pending_now
+        await run_pending_now()
+    except Exception as e:
+        print(f"⚠️  Failed to run pending chat maintenance: {e}")
+    
+    # Persist any batched shown-image rows before Redis goes away
+    try:
+        await shown_images.flush_pending_writes()
+    except Exception as e:
+        print(f"⚠️  Failed to flush shown images: {e}")
     
     await close_redis()
     
@@ -392,7 +433,7 @@ async def _update_persona_avatar_with_fallback(persona_id: UUID, image_data: byt
                 # Mark image as shown to this user for cache deduplication
                 if job_id and user_id:
                     try:
-                        crud.mark_image_shown(db, user_id, job_id)
+                        await shown_images.mark_image_shown(user_id, job_id)
                         print(f"[CHARACTER-AVATAR] ✅ Marked image as shown to user {user_id}")
                     except Exception as e:
                         print(f"[CHARACTER-AVATAR] ⚠️  Failed to mark image as shown: {e}")
@@ -425,6 +466,7 @@ async def image_callback(request: Request):
     image_url = None
     status = None
     error = None
+    output = {}
     
     # Check Content-Type header to determine how to parse
     content_type = request.headers.get("content-type", "").lower()
@@ -437,28 +479,7 @@ async def image_callback(request: Request):
             body = await request.body()
             payload = json.loads(body)
             print(f"[IMAGE-CALLBACK] JSON payload keys: {list(payload.keys())}")
-            
-            status = payload.get("status", "").upper()
-            output = payload.get("output", {})
-            error = payload.get("error")
-            
-            # Check for images in output
-            images = output.get("images", [])
-            if images:
-                first_image = images[0]
-                
-                # Handle base64 format from ComfyUI handler: {"filename": "...", "type": "base64", "data": "..."}
-                if isinstance(first_image, dict) and first_image.get("type") == "base64":
-                    import base64 as b64
-                    image_data = b64.b64decode(first_image.get("data", ""))
-                    print(f"[IMAGE-CALLBACK] Decoded base64 image: {len(image_data)} bytes")
-                    status = "COMPLETED"
-                elif isinstance(first_image, str):
-                    # URL format
-                    image_url = first_image
-                    print(f"[IMAGE-CALLBACK] Got image URL from JSON: {image_url}")
-                else:
-                    print(f"[IMAGE-CALLBACK] Unknown image format: {type(first_image)}")
+            status, output, error, image_data, image_url = parse_image_payload(payload)
         except Exception as e:
             print(f"[IMAGE-CALLBACK] Failed to parse JSON: {e}")
             import traceback
@@ -507,6 +528,57 @@ async def image_callback(request: Request):
     
     print(f"[IMAGE-CALLBACK] Job {job_id_str}: status={status}")
     
+    return await handle_image_result(job_id_str, status, output, error, image_data, image_url)
+
+
+def parse_image_payload(payload: dict) -> tuple:
+    """
+    Parse a RunPod JSON job payload (webhook body or /status response)
+    
+    Returns:
+        Tuple of (status, output, error, image_data, image_url)
+    """
+    image_data = None
+    image_url = None
+    status = (payload.get("status") or "").upper()
+    output = payload.get("output") or {}
+    error = payload.get("error")
+    
+    # Check for images in output
+    images = output.get("images", []) if isinstance(output, dict) else []
+    if images:
+        first_image = images[0]
+        
+        # Handle base64 format from ComfyUI handler: {"filename": "...", "type": "base64", "data": "..."}
+        if isinstance(first_image, dict) and first_image.get("type") == "base64":
+            import base64 as b64
+            image_data = b64.b64decode(first_image.get("data", ""))
+            print(f"[IMAGE-CALLBACK] Decoded base64 image: {len(image_data)} bytes")
+            status = "COMPLETED"
+        elif isinstance(first_image, str):
+            # URL format
+            image_url = first_image
+            print(f"[IMAGE-CALLBACK] Got image URL from JSON: {image_url}")
+        else:
+            print(f"[IMAGE-CALLBACK] Unknown image format: {type(first_image)}")
+    
+    return status, output if isinstance(output, dict) else {}, error, image_data, image_url
+
+
+async def handle_image_result(
+    job_id_str: str,
+    status: str,
+    output: dict,
+    error: str = None,
+    image_data: bytes = None,
+    image_url: str = None
+) -> dict:
+    """
+    Finalize an image job from a RunPod result and deliver it to the user
+    
+    Shared by the webhook (image_callback) and the pending job reconciler
+    (app.core.image_job_reconciler) for jobs whose webhook never arrived.
+    """
     # Initialize tg_chat_id
     tg_chat_id = None
     
@@ -520,6 +592,7 @@ async def image_callback(request: Request):
         # Check idempotency - if already completed/failed, ignore
         if job.status in ("completed", "failed"):
             print(f"[IMAGE-CALLBACK] Job {job_id_str} already {job.status}, ignoring duplicate callback")
+            await image_job_reconciler.untrack_job(job_id_str)
             return {"ok": True, "message": "Already processed"}
         
         # Update job status
@@ -577,7 +650,7 @@ async def image_callback(request: Request):
                     
                     # If we have image_data, upload to Cloudflare
                     if image_data:
-                        asyncio.create_task(_update_persona_avatar_with_fallback(
+                        background_tasks.spawn(_update_persona_avatar_with_fallback(
                             persona_id=job_persona_id,
                             image_data=image_data,
                             file_id=None,  # We don't have file_id yet since not sent to Telegram
@@ -605,7 +678,7 @@ async def image_callback(request: Request):
                 tg_chat_id = job.user_id
         
         elif status == "FAILED":
-            error_msg = error or (output.get("error") if 'output' in locals() else "Unknown error")
+            error_msg = error or output.get("error") or "Unknown error"
             print(f"[IMAGE-CALLBACK] ❌ Job failed with error: {error_msg}")
             crud.update_image_job_status(
                 db,
@@ -617,7 +690,15 @@ async def image_callback(request: Request):
             # Decrement concurrent image counter
             user_id_for_decrement = job.user_id
             
-            tg_chat_id = None
+            # Resolve the chat so the upload_photo action is stopped and the user is notified
+            job_ext_data = job.ext if job.ext else {}
+            if job_ext_data.get("skip_chat_send"):
+                tg_chat_id = None
+            elif job.chat_id:
+                chat = crud.get_chat_by_id(db, job.chat_id)
+                tg_chat_id = chat.tg_chat_id if chat else None
+            else:
+                tg_chat_id = job_ext_data.get("tg_chat_id")
         
         else:
             # IN_PROGRESS, IN_QUEUE - update status but don't send anything
@@ -630,6 +711,7 @@ async def image_callback(request: Request):
         from app.core import redis_queue
         await redis_queue.decrement_user_image_count(user_id_for_decrement)
         print(f"[IMAGE-CALLBACK] 📊 Decremented user image count for user {user_id_for_decrement}")
+        await image_job_reconciler.untrack_job(job_id_str)
     
     # Send photo to user if completed
     if status == "COMPLETED" and tg_chat_id and (image_url or image_data):
@@ -804,7 +886,7 @@ async def image_callback(request: Request):
                             print(f"[IMAGE-CALLBACK] ⚠️  Blurred CF upload error: {e}")
                     
                     # Fire and forget - don't wait
-                    asyncio.create_task(_upload_blurred_original_async(actual_image_data, job_id_str, pending_caption))
+                    background_tasks.spawn(_upload_blurred_original_async(actual_image_data, job_id_str, pending_caption))
                 else:
                     print(f"[IMAGE-CALLBACK] ⚠️  Failed to blur image, sending original")
                     should_blur = False  # Fallback to original
@@ -846,7 +928,7 @@ async def image_callback(request: Request):
                             print(f"[IMAGE-CALLBACK] ⚠️  Async CF upload error: {e}")
                     
                     # Fire and forget - don't block
-                    asyncio.create_task(_upload_image_async(image_data, job_id_str))
+                    background_tasks.spawn(_upload_image_async(image_data, job_id_str))
                 else:
                     # Send via URL (already a URL, no need to re-upload)
                     sent_message = await bot.send_photo(
@@ -891,7 +973,7 @@ async def image_callback(request: Request):
                     
                     # Try Cloudflare upload, but fallback to Telegram file_id if it fails
                     if image_data:
-                        asyncio.create_task(_update_persona_avatar_with_fallback(
+                        background_tasks.spawn(_update_persona_avatar_with_fallback(
                             persona_id=job_persona_id,
                             image_data=image_data,
                             file_id=file_id,
@@ -907,9 +989,8 @@ async def image_callback(request: Request):
             print(f"[IMAGE-CALLBACK] ✅ Image sent to chat {tg_chat_id}")
             
             # Mark image as shown to this user (for cache deduplication)
-            with get_db() as db:
-                crud.mark_image_shown(db, job_user_id, job_id_str)
-                print(f"[IMAGE-CALLBACK] 📝 Marked image as shown to user {job_user_id}")
+            await shown_images.mark_image_shown(job_user_id, job_id_str)
+            print(f"[IMAGE-CALLBACK] 📝 Marked image as shown to user {job_user_id}")
             
             # Track image generation for analytics
             # NOTE: We upload to Cloudflare async above, so just pass image_url here
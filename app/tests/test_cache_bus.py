@@ -0,0 +1,79 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from app.core import cache_bus
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.published = []
+
+    async def incr(self, key):
+        self.values[key] = self.values.get(key, 0) + 1
+        return self.values[key]
+
+    async def publish(self, channel, data):
+        self.published.append((channel, json.loads(data)))
+
+    async def mget(self, keys):
+        return [self.values.get(key) for key in keys]
+
+
+class TestCacheBus(unittest.TestCase):
+    def setUp(self):
+        self.reloads = []
+        config = {"enabled": True, "channel": "cache:invalidate", "reload_jitter_ms": 0}
+        reloaders = {name: (lambda name=name: self.reloads.append(name)) for name in cache_bus.CACHE_NAMES}
+        for patcher in (
+            patch.object(cache_bus, "get_bus_config", return_value=config),
+            patch.object(cache_bus, "_reloaders", return_value=reloaders),
+            patch.dict(cache_bus._GENERATIONS, {name: 0 for name in cache_bus.CACHE_NAMES}),
+            patch.dict(cache_bus._TARGETS, clear=True),
+            patch.dict(cache_bus._PENDING, clear=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _message(self, cache_name, generation, origin="other-process"):
+        return json.dumps({"cache": cache_name, "generation": generation, "origin": origin})
+
+    def test_invalidate_reloads_locally_and_publishes_generation(self):
+        redis = _FakeRedis()
+        with patch.object(cache_bus.redis_queue, "get_redis", AsyncMock(return_value=redis)):
+            asyncio.run(cache_bus.invalidate(cache_bus.CACHE_PERSONAS))
+
+        self.assertEqual(self.reloads, [cache_bus.CACHE_PERSONAS])
+        channel, message = redis.published[0]
+        self.assertEqual(channel, "cache:invalidate")
+        self.assertEqual(message["generation"], 1)
+        self.assertEqual(message["origin"], cache_bus.INSTANCE_ID)
+        self.assertEqual(cache_bus._GENERATIONS[cache_bus.CACHE_PERSONAS], 1)
+
+    def test_burst_of_messages_collapses_into_one_reload(self):
+        async def _scenario():
+            for generation in (1, 2, 3):
+                cache_bus.handle_message(self._message(cache_bus.CACHE_START_CODES, generation))
+            await asyncio.gather(*cache_bus._PENDING.values())
+
+        asyncio.run(_scenario())
+        self.assertEqual(self.reloads, [cache_bus.CACHE_START_CODES])
+        self.assertEqual(cache_bus._GENERATIONS[cache_bus.CACHE_START_CODES], 3)
+
+    def test_own_and_stale_messages_are_ignored(self):
+        cache_bus._GENERATIONS[cache_bus.CACHE_TRANSLATIONS] = 5
+
+        async def _scenario():
+            cache_bus.handle_message(self._message(cache_bus.CACHE_TRANSLATIONS, 6, origin=cache_bus.INSTANCE_ID))
+            cache_bus.handle_message(self._message(cache_bus.CACHE_TRANSLATIONS, 4))
+            cache_bus.handle_message("not json")
+
+        asyncio.run(_scenario())
+        self.assertEqual(cache_bus._PENDING, {})
+        self.assertEqual(self.reloads, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, patch
+from uuid import uuid4
+
+from app.core import chat_maintenance
+
+
+class TestChatMaintenanceDebounce(unittest.TestCase):
+    def setUp(self):
+        self.runs = []
+
+        async def _fake_run(chat_id, jobs, persona_name=None):
+            self.runs.append((chat_id, set(jobs), persona_name))
+
+        for patcher in (
+            patch.object(chat_maintenance, "run_maintenance", _fake_run),
+            patch.object(chat_maintenance.workers, "is_multi_worker", return_value=False),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(chat_maintenance._PENDING.clear)
+
+    def _config(self, quiet_sec, max_pending_messages):
+        return patch.object(
+            chat_maintenance,
+            "get_maintenance_config",
+            return_value={
+                "quiet_sec": quiet_sec,
+                "max_pending_messages": max_pending_messages,
+                "lock_ttl_sec": 60,
+                "lock_retry_sec": 0.01,
+            },
+        )
+
+    def test_requests_within_quiet_period_run_once_with_merged_jobs(self):
+        chat_id = uuid4()
+
+        async def _scenario():
+            chat_maintenance.schedule_maintenance(chat_id, [chat_maintenance.JOB_SUMMARY], persona_name="Mia")
+            chat_maintenance.schedule_maintenance(chat_id, [chat_maintenance.JOB_MEMORY])
+            await asyncio.sleep(0.05)
+
+        with self._config(quiet_sec=0.01, max_pending_messages=10):
+            asyncio.run(_scenario())
+
+        self.assertEqual(
+            self.runs,
+            [(chat_id, {chat_maintenance.JOB_SUMMARY, chat_maintenance.JOB_MEMORY}, "Mia")],
+        )
+
+    def test_message_threshold_runs_without_waiting_for_quiet(self):
+        chat_id = uuid4()
+
+        async def _scenario():
+            chat_maintenance.schedule_maintenance(chat_id, [chat_maintenance.JOB_SUMMARY])
+            chat_maintenance.schedule_maintenance(chat_id, [chat_maintenance.JOB_NAME])
+            await asyncio.sleep(0.01)
+            return list(self.runs)
+
+        with self._config(quiet_sec=60, max_pending_messages=2):
+            runs = asyncio.run(_scenario())
+
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(runs[0][1], {chat_maintenance.JOB_SUMMARY, chat_maintenance.JOB_NAME})
+
+    def test_chat_locked_by_another_worker_runs_after_it_is_released(self):
+        chat_id = uuid4()
+        redis = _FakeRedis()
+        lock_key = chat_maintenance.LOCK_KEY.format(chat_id=chat_id)
+        redis.values[lock_key] = "1"  # Another worker is running maintenance for this chat
+
+        async def _scenario():
+            chat_maintenance.schedule_maintenance(chat_id, [chat_maintenance.JOB_SUMMARY])
+            await asyncio.sleep(0.05)
+            runs_while_locked = list(self.runs)
+            await redis.delete(lock_key)
+            await asyncio.sleep(0.05)
+            return runs_while_locked
+
+        with self._config(quiet_sec=0.01, max_pending_messages=10), \
+                patch.object(chat_maintenance.workers, "is_multi_worker", return_value=True), \
+                patch.object(chat_maintenance.redis_queue, "get_redis", AsyncMock(return_value=redis)):
+            runs_while_locked = asyncio.run(_scenario())
+
+        self.assertEqual(runs_while_locked, [])
+        self.assertEqual(self.runs, [(chat_id, {chat_maintenance.JOB_SUMMARY}, None)])
+        self.assertNotIn(lock_key, redis.values)
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from unittest.mock import patch
+
+from app.core import context_packer
+
+
+def _msg(role, words):
+    return {"role": role, "content": " ".join(["word"] * words)}
+
+
+class TestContextPacker(unittest.TestCase):
+    def _pack(self, history, tokens, **kwargs):
+        budget = {"tokens": tokens, "min_recent_messages": 2, "memory_reserve": kwargs.pop("memory_reserve", 200)}
+        with patch.object(context_packer, "get_context_budget", return_value=budget):
+            return context_packer.pack_context(history, brain="dialogue", **kwargs)
+
+    def test_fills_budget_with_most_recent_turns(self):
+        history = [_msg("user", 10) for _ in range(10)]  # 14 tokens each
+        packed = self._pack(history, tokens=60)
+        self.assertEqual(len(packed["messages"]), 4)
+        self.assertEqual(packed["messages"], history[-4:])
+        self.assertLessEqual(packed["tokens"], 60)
+
+    def test_long_old_message_stops_packing(self):
+        history = [_msg("user", 5), _msg("assistant", 500), _msg("user", 5), _msg("assistant", 5)]
+        packed = self._pack(history, tokens=100)
+        self.assertEqual(packed["messages"], history[-2:])
+
+    def test_summary_and_memory_take_priority_over_older_turns(self):
+        history = [_msg("user", 10) for _ in range(6)]
+        summary = " ".join(["fact"] * 20)
+        packed = self._pack(history, tokens=60, summary=summary, memory="user likes tea")
+        self.assertEqual(packed["summary"], summary)
+        self.assertEqual(packed["memory"], "user likes tea")
+        self.assertEqual(packed["messages"], history[-2:])
+
+    def test_recent_turns_are_kept_even_over_budget(self):
+        history = [_msg("user", 100), _msg("assistant", 100)]
+        packed = self._pack(history, tokens=10, summary="summary")
+        self.assertEqual(packed["messages"], history)
+        self.assertIsNone(packed["summary"])
+
+    def test_memory_keeps_its_reserve_when_summary_would_fill_the_budget(self):
+        history = [_msg("user", 10), _msg("assistant", 10)]  # 28 tokens
+        summary = " ".join(["fact"] * 40)
+        memory = "\n".join(f"user fact number {i}" for i in range(10))  # 5 tokens per line
+        packed = self._pack(history, tokens=70, summary=summary, memory=memory, memory_reserve=20)
+        self.assertIsNone(packed["summary"])
+        self.assertTrue(memory.startswith(packed["memory"]))
+        self.assertGreaterEqual(len(packed["memory"].splitlines()), 4)
+        self.assertLessEqual(packed["tokens"], 70)
+
+    def test_long_memory_is_truncated_not_dropped(self):
+        history = [_msg("user", 10), _msg("assistant", 10)]
+        memory = "\n".join(f"user fact number {i}" for i in range(20))
+        packed = self._pack(history, tokens=50, memory=memory)
+        self.assertTrue(packed["memory"])
+        self.assertTrue(memory.startswith(packed["memory"]))
+        self.assertLessEqual(packed["tokens"], 50)
+
+    def test_token_estimate_counts_non_ascii_denser(self):
+        self.assertGreater(context_packer._estimate_tokens("привет"), context_packer._estimate_tokens("hello"))
+
+
+if __name__ == "__main__":
+    unittest.main()
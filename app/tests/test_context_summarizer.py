@@ -0,0 +1,71 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+from uuid import uuid4
+
+from app.core import context_summarizer
+
+
+START = datetime(2026, 1, 1, 12, 0, 0)
+
+
+def _history(count: int):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}", "created_at": START + timedelta(minutes=i)}
+        for i in range(count)
+    ]
+
+
+class TestIncrementalContextSummary(unittest.TestCase):
+    def _run(self, chat_ext, history):
+        chat = SimpleNamespace(ext=dict(chat_ext))
+        fold = AsyncMock(return_value="folded summary")
+        full = AsyncMock(return_value="full summary")
+        with patch("app.db.base.get_db") as get_db, \
+                patch("app.db.crud.get_chat_by_id", return_value=chat), \
+                patch.object(context_summarizer, "fold_into_summary", fold), \
+                patch.object(context_summarizer, "generate_context_summary", full), \
+                patch.object(context_summarizer, "get_summary_config",
+                             return_value={"incremental": True, "window_messages": 20, "compact_every": 3}):
+            get_db.return_value.__enter__.return_value = SimpleNamespace(commit=lambda: None)
+            asyncio.run(context_summarizer.update_context_summary(uuid4(), history, "Mia", user_id=1))
+        return chat, fold, full
+
+    def test_only_new_messages_are_folded_into_existing_summary(self):
+        history = _history(10)
+        chat, fold, full = self._run(
+            {"context_summary": "old", "context_summary_upto": history[7]["created_at"].isoformat(), "context_summary_folds": 1},
+            history,
+        )
+        full.assert_not_called()
+        self.assertEqual(fold.call_args.args[1], history[8:])
+        self.assertEqual(chat.ext["context_summary"], "folded summary")
+        self.assertEqual(chat.ext["context_summary_folds"], 2)
+        self.assertEqual(chat.ext["context_summary_upto"], history[-1]["created_at"].isoformat())
+
+    def test_full_compaction_after_compact_every_folds(self):
+        history = _history(10)
+        chat, fold, full = self._run(
+            {"context_summary": "old", "context_summary_upto": history[7]["created_at"].isoformat(), "context_summary_folds": 3},
+            history,
+        )
+        fold.assert_not_called()
+        full.assert_awaited_once()
+        self.assertEqual(chat.ext["context_summary"], "full summary")
+        self.assertEqual(chat.ext["context_summary_folds"], 0)
+
+    def test_cutoff_outside_window_resummarizes(self):
+        history = _history(10)
+        stale_cutoff = (START - timedelta(days=1)).isoformat()
+        chat, fold, full = self._run(
+            {"context_summary": "old", "context_summary_upto": stale_cutoff, "context_summary_folds": 0},
+            history,
+        )
+        fold.assert_not_called()
+        full.assert_awaited_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+
+from app.core.conversation_state import ConversationState
+from app.core import multi_brain_pipeline as pipeline
+from app.core.brains.gift_recommendation_brain import classify_scene_mode
+from app.core.brains.image_decision_specialist import _extract_location_from_state
+
+
+STATE_LINE = (
+    'relationshipStage="lover" | emotions="playful" | moodNotes="" | location="beach" '
+    '| description="she says \\"hi\\"" | aiClothing="red bikini" | userClothing="unknown" '
+    '| terminateDialog=false | terminateReason=""'
+)
+
+
+class TestConversationState(unittest.TestCase):
+    def test_parse_reads_fields_and_keeps_line(self):
+        state = ConversationState.parse(STATE_LINE)
+        self.assertEqual(state.relationship_stage, "lover")
+        self.assertEqual(state.location, "beach")
+        self.assertEqual(state.description, 'she says "hi"')
+        self.assertIs(state.terminate_dialog, False)
+        self.assertEqual(str(state), STATE_LINE)
+
+    def test_snapshot_round_trip(self):
+        state = ConversationState.parse(STATE_LINE)
+        snapshot = state.to_snapshot()
+        self.assertEqual(snapshot["v"], 2)
+        restored = ConversationState.from_snapshot(snapshot)
+        self.assertEqual(restored.to_dict(), state.to_dict())
+        self.assertEqual(ConversationState.parse(str(restored)).to_dict(), state.to_dict())
+
+    def test_legacy_snapshots_are_read(self):
+        legacy = ConversationState.from_snapshot({"state": STATE_LINE})
+        self.assertEqual(legacy.ai_clothing, "red bikini")
+
+        structured = ConversationState.from_snapshot({
+            "rel": {"relationshipStage": "friend", "emotions": "shy"},
+            "scene": {"location": "cafe", "aiClothing": "hoodie"},
+        })
+        self.assertEqual((structured.emotions, structured.location), ("shy", "cafe"))
+
+        self.assertIsNone(ConversationState.from_snapshot({}))
+        self.assertIsNone(ConversationState.from_snapshot(None))
+
+    def test_freeform_state_survives_snapshot(self):
+        state = ConversationState.parse("Relationship: stranger\nLocation: online chat room")
+        self.assertFalse(state.is_structured)
+        restored = ConversationState.from_snapshot(state.to_snapshot())
+        self.assertEqual(str(restored), str(state))
+
+    def test_brains_accept_object_or_line(self):
+        state = ConversationState.parse(STATE_LINE)
+        self.assertEqual(_extract_location_from_state(state), "beach")
+        self.assertEqual(_extract_location_from_state(STATE_LINE), "beach")
+        self.assertEqual(_extract_location_from_state('emotions="calm"'), "unknown")
+        self.assertEqual(classify_scene_mode(state, "", ""), classify_scene_mode(STATE_LINE, "", ""))
+
+    def test_gift_override_from_legacy_state(self):
+        state = pipeline._apply_gift_state_override("chatting", item_key="cute_pajamas", item_name="Pajamas")
+        self.assertEqual(state.ai_clothing, "cute pink pajamas")
+        self.assertIn("Legacy state: chatting", state.mood_notes)
+        self.assertEqual(ConversationState.parse(str(state)).to_dict(), state.to_dict())
+
+
+if __name__ == "__main__":
+    unittest.main()
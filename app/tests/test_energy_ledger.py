@@ -0,0 +1,169 @@
+import asyncio
+import os
+import tempfile
+import unittest
+import uuid
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app.core import multi_brain_pipeline as pipeline
+from app.core import user_profile_cache
+from app.db import crud
+from app.db.models import ImageJob
+
+
+class TestEnergyLedger(unittest.TestCase):
+    def setUp(self):
+        # Only the columns the ledger statements touch
+        engine = create_engine("sqlite://")
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE users (id INTEGER PRIMARY KEY, energy INTEGER, temp_energy INTEGER, "
+                "locale TEXT, is_premium BOOLEAN, premium_tier TEXT, premium_until DATETIME, updated_at DATETIME)"
+            ))
+            conn.execute(text("INSERT INTO users VALUES (42, 10, 3, 'en', 0, 'free', NULL, NULL)"))
+        self.db = Session(engine)
+        self.addCleanup(self.db.close)
+
+        for patcher in (
+            patch.object(user_profile_cache, "store"),
+            patch.object(user_profile_cache, "invalidate"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _balance(self):
+        return tuple(self.db.execute(text("SELECT temp_energy, energy FROM users WHERE id = 42")).one())
+
+    def test_deducts_temp_energy_first(self):
+        self.assertTrue(crud.deduct_user_energy(self.db, 42, amount=2))
+        self.assertEqual(self._balance(), (1, 10))
+
+        self.assertTrue(crud.deduct_user_energy(self.db, 42, amount=5))
+        self.assertEqual(self._balance(), (0, 6))
+
+    def test_insufficient_balance_changes_nothing(self):
+        self.assertFalse(crud.deduct_user_energy(self.db, 42, amount=14))
+        self.assertFalse(crud.deduct_user_energy(self.db, 7, amount=1))
+        self.assertEqual(self._balance(), (3, 10))
+
+    def test_failed_job_refunds_its_reservation_once(self):
+        crud.deduct_user_energy(self.db, 42, amount=3)
+        job = SimpleNamespace(user_id=42, ext={crud.ENERGY_RESERVATION_KEY: {"amount": 3, "state": "held"}})
+
+        self.assertTrue(crud._settle_energy_reservation(self.db, job, refund=True))
+        self.assertFalse(crud._settle_energy_reservation(self.db, job, refund=True))
+        self.db.commit()
+
+        self.assertEqual(job.ext[crud.ENERGY_RESERVATION_KEY]["state"], "refunded")
+        self.assertEqual(self._balance(), (0, 13))
+
+    def test_completed_job_keeps_its_reservation(self):
+        job = SimpleNamespace(user_id=42, ext={crud.ENERGY_RESERVATION_KEY: {"amount": 3, "state": "held"}})
+        self.assertFalse(crud._settle_energy_reservation(self.db, job, refund=False))
+        self.assertEqual(job.ext[crud.ENERGY_RESERVATION_KEY]["state"], "committed")
+        self.assertEqual(self._balance(), (3, 10))
+
+
+class TestConcurrentJobFailure(unittest.TestCase):
+    """The webhook and the reconciler failing the same job refund its energy once"""
+
+    def setUp(self):
+        # A file database so each session gets its own connection, as with Postgres
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        self.engine = create_engine(f"sqlite:///{path}")
+        self.addCleanup(self.engine.dispose)
+        self.job_id = uuid.uuid4()
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE users (id INTEGER PRIMARY KEY, energy INTEGER, temp_energy INTEGER, updated_at DATETIME)"
+            ))
+            conn.execute(text("INSERT INTO users VALUES (42, 10, 0, NULL)"))
+            conn.execute(text(
+                "CREATE TABLE image_jobs (id CHAR(32) PRIMARY KEY, chat_id CHAR(32), persona_id CHAR(32), "
+                "user_id INTEGER, prompt TEXT, negative_prompt TEXT, prompt_hash TEXT, status TEXT, "
+                "result_url TEXT, result_file_id TEXT, error TEXT, refresh_count INTEGER, "
+                "cache_serve_count INTEGER, is_blacklisted BOOLEAN, ext TEXT, created_at DATETIME, "
+                "finished_at DATETIME)"
+            ))
+        with Session(self.engine) as db:
+            db.add(ImageJob(
+                id=self.job_id, persona_id=uuid.uuid4(), user_id=42, prompt="p", status="queued",
+                ext={crud.ENERGY_RESERVATION_KEY: {"amount": 3, "state": "held"}},
+            ))
+            db.commit()
+
+        patcher = patch.object(user_profile_cache, "invalidate")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_job_already_loaded_in_the_session_is_not_refunded_twice(self):
+        webhook_db = Session(self.engine)
+        self.addCleanup(webhook_db.close)
+        job = crud.get_image_job(webhook_db, self.job_id)  # The webhook's idempotency check
+        self.assertEqual(job.status, "queued")
+
+        with Session(self.engine) as reconciler_db:
+            crud.update_image_job_status(reconciler_db, self.job_id, status="failed", error="timed out")
+        crud.update_image_job_status(webhook_db, self.job_id, status="failed", error="runpod error")
+
+        with self.engine.connect() as conn:
+            energy = conn.execute(text("SELECT energy FROM users WHERE id = 42")).scalar()
+        self.assertEqual(energy, 13)
+
+
+class TestBackgroundImageRefund(unittest.TestCase):
+    """A free user's image energy comes back if the pipeline never produces the image"""
+
+    def setUp(self):
+        db = MagicMock()
+        db.query.return_value.filter.return_value.first.return_value = SimpleNamespace(global_message_count=10)
+        self.crud = MagicMock()
+        self.crud.check_user_premium.return_value = {"is_premium": False}
+        self.crud.create_image_job.return_value = SimpleNamespace(id="job-1")
+        for patcher in (
+            patch.object(pipeline, "crud", self.crud),
+            patch.object(pipeline, "assemble_final_prompt", return_value=("pos", "neg")),
+            patch.object(pipeline, "generate_image_plan", AsyncMock(return_value="tags")),
+            patch.object(pipeline.shown_images, "find_unseen_cached_image", AsyncMock(return_value=None)),
+            patch.object(pipeline.redis_queue, "increment_user_image_count", AsyncMock(return_value=1)),
+            patch.object(pipeline.redis_queue, "decrement_user_image_count", AsyncMock()),
+            patch("app.settings.settings.CONCURRENT_IMAGE_LIMIT_ENABLED", False),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        get_db = patch.object(pipeline, "get_db").start()
+        self.addCleanup(patch.stopall)
+        get_db.return_value.__enter__.return_value = db
+
+    def _generate(self):
+        asyncio.run(pipeline._background_image_generation(
+            chat_id="chat-1", user_id=42, persona_id="persona-1", state="", dialogue_response="hi",
+            batched_text="hi", persona={}, tg_chat_id=777, action_mgr=AsyncMock(), chat_history=[],
+        ))
+
+    def test_failed_dispatch_fails_the_job_and_its_reservation(self):
+        with patch("app.core.img_runpod.dispatch_image_generation", AsyncMock(return_value=False)):
+            self._generate()
+
+        self.assertEqual(self.crud.create_image_job.call_args.kwargs["energy_reserved"], 3)
+        self.crud.update_image_job_status.assert_called_once()
+        self.assertEqual(self.crud.update_image_job_status.call_args.kwargs["status"], "failed")
+        self.crud.refund_user_energy.assert_not_called()
+
+    def test_error_before_the_job_exists_refunds_directly(self):
+        with patch.object(pipeline, "generate_image_plan", AsyncMock(side_effect=RuntimeError("llm down"))):
+            self._generate()
+
+        self.crud.create_image_job.assert_not_called()
+        self.crud.refund_user_energy.assert_called_once()
+        self.assertEqual(self.crud.refund_user_energy.call_args.args[1:], (42, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.core import image_job_reconciler as reconciler
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.zset = {}
+        self.meta = {}
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    async def zrangebyscore(self, key, low, high, start=0, num=None):
+        ids = [jid for jid, score in sorted(self.zset.items(), key=lambda item: item[1]) if low <= score <= high]
+        return ids[start:start + num] if num is not None else ids[start:]
+
+    async def zadd(self, key, mapping, xx=False):
+        for jid, score in mapping.items():
+            if not xx or jid in self.zset:
+                self.zset[jid] = score
+
+    async def hmget(self, key, ids):
+        return [self.meta.get(jid) for jid in ids]
+
+
+class TestReconcilerPaging(unittest.TestCase):
+    def test_still_running_jobs_make_way_for_other_overdue_jobs(self):
+        redis = _FakeRedis()
+        for i, job_id in enumerate(("job-a", "job-b")):
+            redis.zset[job_id] = 1000 + i
+            redis.meta[job_id] = json.dumps({"runpod_id": f"rp-{job_id}", "submitted_at": 1000 + i, "retries": 0})
+        config = {"overdue_sec": 90, "hard_timeout_sec": 10 ** 9, "max_retries": 1, "batch_size": 1}
+        polled = []
+
+        async def _statuses(runpod_ids):
+            polled.extend(runpod_ids)
+            return {runpod_id: {"status": "IN_PROGRESS"} for runpod_id in runpod_ids}
+
+        db = MagicMock()
+        with patch.object(reconciler.redis_queue, "get_redis", AsyncMock(return_value=redis)), \
+                patch.object(reconciler, "get_reconciler_config", return_value=config), \
+                patch("app.core.img_runpod.get_job_statuses", _statuses), \
+                patch("app.db.crud.get_image_job_statuses", return_value={"job-a": "queued", "job-b": "queued"}), \
+                patch("app.db.base.get_db") as get_db, \
+                patch.object(reconciler.time, "time", side_effect=[5000, 5001]):
+            get_db.return_value.__enter__.return_value = db
+            asyncio.run(reconciler.reconcile_pending_jobs())
+            asyncio.run(reconciler.reconcile_pending_jobs())
+
+        self.assertEqual(polled, ["rp-job-a", "rp-job-b"])
+        self.assertEqual(redis.zset, {"job-a": 5000, "job-b": 5001})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from uuid import uuid4
+
+from app.core import image_similarity
+
+
+_CONFIG = {"image": {"quality_prompt": "masterpiece, best quality", "similar_cache": {"jaccard_threshold": 0.8}}}
+_BASE = "1girl, solo, pov, close-up, smile, blush, bedroom, night, dim_lighting, long_hair, red_dress, sitting_on_bed"
+
+
+class TestImageSimilarity(unittest.TestCase):
+    def setUp(self):
+        for patcher in (
+            patch.object(image_similarity, "get_app_config", return_value=_CONFIG),
+            patch.object(image_similarity, "_INDEX", {"buckets": {}, "entries": {}, "last_refreshed": None}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_weights_and_quality_tags_do_not_affect_tag_set(self):
+        quality = image_similarity._quality_tags()
+        a = image_similarity.canonical_tag_set("(smile:1.2), Blush, masterpiece", quality)
+        b = image_similarity.canonical_tag_set("smile, blush, best quality", quality)
+        self.assertEqual(a, b)
+        self.assertEqual(a, frozenset({"smile", "blush"}))
+
+    def test_finds_near_duplicate_of_same_persona_only(self):
+        persona_id, other_persona_id = uuid4(), uuid4()
+        job_id = str(uuid4())
+        image_similarity.add_to_index(job_id, persona_id, _BASE + ", masterpiece")
+
+        near_duplicate = _BASE.replace("smile", "(smile:1.3)") + ", light_smile"
+        matches = image_similarity.find_similar_job_ids(near_duplicate, persona_id, 0.8)
+        self.assertEqual([m[0] for m in matches], [job_id])
+        self.assertGreaterEqual(matches[0][1], 0.9)
+
+        self.assertEqual(image_similarity.find_similar_job_ids(near_duplicate, other_persona_id, 0.8), [])
+
+    def test_unrelated_prompt_is_not_matched(self):
+        persona_id = uuid4()
+        image_similarity.add_to_index(str(uuid4()), persona_id, _BASE)
+        unrelated = "1girl, solo, beach, bikini, sunlight, ocean, standing, wet_hair, laughing, cowboy_shot"
+        self.assertEqual(image_similarity.find_similar_job_ids(unrelated, persona_id, 0.8), [])
+
+    def test_remove_from_index_clears_buckets(self):
+        job_id = str(uuid4())
+        image_similarity.add_to_index(job_id, None, _BASE)
+        image_similarity._remove_from_index(job_id)
+        self.assertEqual(image_similarity._INDEX["entries"], {})
+        self.assertEqual(image_similarity._INDEX["buckets"], {})
+
+    def test_refresh_swaps_in_a_new_index(self):
+        persona_id = uuid4()
+        stale_id, new_id = str(uuid4()), str(uuid4())
+        image_similarity.add_to_index(stale_id, persona_id, _BASE, datetime.utcnow() - timedelta(days=90))
+        previous = image_similarity._INDEX
+
+        rows = [(new_id, persona_id, _BASE + ", masterpiece", datetime.utcnow())]
+        with patch("app.db.base.get_db"), patch("app.db.crud.get_cacheable_image_prompts", return_value=rows):
+            result = image_similarity.refresh_index()
+
+        self.assertEqual(result, {"added": 1, "expired": 1, "total": 1})
+        self.assertEqual([m[0] for m in image_similarity.find_similar_job_ids(_BASE, persona_id, 0.8)], [new_id])
+        # Lookups already holding the old index keep a consistent view
+        self.assertEqual(list(previous["entries"]), [stale_id])
+
+
+if __name__ == "__main__":
+    unittest.main()
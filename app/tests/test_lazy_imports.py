@@ -0,0 +1,31 @@
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+from app.core import lazy_imports
+
+
+ROOT = Path(__file__).parent.parent.parent
+
+
+class TestLazyImports(unittest.TestCase):
+    def test_module_is_imported_on_first_attribute_access(self):
+        module = lazy_imports.lazy_import("json.tool")
+        self.assertIn("not loaded", repr(module))
+        self.assertTrue(callable(module.main))
+        self.assertIn("json.tool", lazy_imports.get_stats())
+
+    def test_optional_subsystems_do_not_import_heavy_packages(self):
+        code = (
+            "import sys\n"
+            "import app.core.r2_storage, app.core.image_utils, app.core.elevenlabs_service\n"
+            "print(sorted(m for m in ('boto3', 'pydub', 'PIL.Image') if m in sys.modules))\n"
+        )
+        result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip().splitlines()[-1], "[]")
+
+
+if __name__ == "__main__":
+    unittest.main()
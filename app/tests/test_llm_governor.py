@@ -0,0 +1,94 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import patch
+
+from app.core import llm_governor
+
+
+def _config(max_concurrent, reserved_interactive=0, **lanes):
+    return {
+        "max_concurrent": max_concurrent,
+        "reserved_interactive": reserved_interactive,
+        "lanes": {**llm_governor.DEFAULT_LANE_CAPS, **lanes},
+    }
+
+
+class TestLlmGovernor(unittest.IsolatedAsyncioTestCase):
+    def _configure(self, config):
+        llm_governor._LANES = None
+        llm_governor._IN_FLIGHT = 0
+        patcher = patch.object(llm_governor, "get_governor_config", return_value=config)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def _hold(self, brain, order, release):
+        async with llm_governor.llm_slot(brain):
+            order.append(brain)
+            await release.wait()
+
+    async def test_higher_priority_lane_is_admitted_first(self):
+        self._configure(_config(max_concurrent=1))
+        order, release = [], asyncio.Event()
+        first = asyncio.create_task(self._hold("memory", order, release))
+        await asyncio.sleep(0)
+        followup = asyncio.create_task(self._hold("followup", order, release))
+        dialogue = asyncio.create_task(self._hold("dialogue", order, release))
+        await asyncio.sleep(0)
+        self.assertEqual(order, ["memory"])
+
+        release.set()
+        await asyncio.gather(first, followup, dialogue)
+        self.assertEqual(order, ["memory", "dialogue", "followup"])
+
+    async def test_reserved_slots_are_kept_for_dialogue(self):
+        self._configure(_config(max_concurrent=2, reserved_interactive=1))
+        order, release = [], asyncio.Event()
+        tasks = [asyncio.create_task(self._hold(brain, order, release)) for brain in ("followup", "memory", "dialogue")]
+        await asyncio.sleep(0)
+        self.assertEqual(order, ["followup", "dialogue"])
+        self.assertEqual(llm_governor.get_stats()["lanes"]["background"]["waiting"], 1)
+
+        release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(llm_governor.get_stats()["in_flight"], 0)
+
+    async def test_lane_cap_limits_concurrency(self):
+        self._configure(_config(max_concurrent=10, followup=1))
+        order, release = [], asyncio.Event()
+        tasks = [asyncio.create_task(self._hold("followup", order, release)) for _ in range(3)]
+        await asyncio.sleep(0)
+        self.assertEqual(len(order), 1)
+
+        release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(llm_governor.get_stats()["lanes"]["followup"]["queued"], 2)
+
+    async def test_cancelled_waiter_leaves_the_queue(self):
+        self._configure(_config(max_concurrent=1))
+        order, release = [], asyncio.Event()
+        holder = asyncio.create_task(self._hold("dialogue", order, release))
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(self._hold("state", order, release))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+
+        self.assertEqual(llm_governor.get_stats()["lanes"]["state"]["waiting"], 0)
+        release.set()
+        await holder
+        self.assertEqual(llm_governor.get_stats()["in_flight"], 0)
+
+
+class TestRateLimiter(unittest.IsolatedAsyncioTestCase):
+    async def test_acquisitions_are_spread_over_the_rate(self):
+        limiter = llm_governor.RateLimiter(rate=50, burst=1)
+        start = time.monotonic()
+        for _ in range(6):
+            await limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,12 @@
+import asyncio
+import time
 import unittest
 from unittest.mock import patch
 
 import httpx
 
-from app.core.llm_openrouter import generate_text
+from app.core import llm_governor, llm_health
+from app.core.llm_openrouter import _is_model_side_status, _post_completion, batch_session, generate_text
 
 
 class _FakeResponse:
@@ -50,12 +53,25 @@ class _FakeAsyncClient:
         )
 
 
+def _reset_governor(test):
+    llm_governor._LANES = None
+    patcher = patch.object(llm_governor, "get_governor_config", return_value={
+        "max_concurrent": 8, "reserved_interactive": 0, "lanes": dict(llm_governor.DEFAULT_LANE_CAPS),
+    })
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
 class TestOpenRouterFallback(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        _reset_governor(self)
+
     @patch("app.core.llm_openrouter.httpx.AsyncClient", new=_FakeAsyncClient)
+    @patch("app.core.llm_health.get_app_config")
     @patch("app.core.llm_openrouter.get_app_config")
-    async def test_404_model_falls_back_to_default_model(self, mock_get_app_config):
+    async def test_404_model_falls_back_to_default_model(self, mock_get_app_config, mock_health_config):
         _FakeAsyncClient.posted_models = []
-        mock_get_app_config.return_value = {
+        mock_get_app_config.return_value = mock_health_config.return_value = {
             "llm": {
                 "model": "fallback/model",
                 "temperature": 0.7,
@@ -74,5 +90,210 @@ class TestOpenRouterFallback(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(_FakeAsyncClient.posted_models, ["invalid/model", "fallback/model"])
 
 
+class _SlowPrimaryAsyncClient(_FakeAsyncClient):
+    async def post(self, url, json, headers):
+        model = json.get("model")
+        self.__class__.posted_models.append(model)
+        if model == "slow/model":
+            await asyncio.sleep(5)
+        return _FakeResponse(
+            status_code=200,
+            data={"model": model, "choices": [{"message": {"content": f"from {model}"}}]},
+        )
+
+
+class TestOpenRouterHedging(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        llm_health._MODELS.clear()
+        _reset_governor(self)
+
+    @patch("app.core.llm_openrouter.httpx.AsyncClient", new=_SlowPrimaryAsyncClient)
+    @patch("app.core.llm_health.get_app_config")
+    @patch("app.core.llm_openrouter.get_app_config")
+    async def test_slow_model_is_hedged_with_backup(self, mock_get_app_config, mock_health_config):
+        _SlowPrimaryAsyncClient.posted_models = []
+        mock_get_app_config.return_value = mock_health_config.return_value = {
+            "llm": {
+                "model": "backup/model",
+                "temperature": 0.7,
+                "max_tokens": 300,
+                "timeout_sec": 10,
+                "hedging": {"enabled": True, "default_delay_ms": 50},
+            }
+        }
+
+        result = await generate_text(messages=[{"role": "user", "content": "hi"}], model="slow/model")
+
+        self.assertEqual(result, "from backup/model")
+        self.assertEqual(_SlowPrimaryAsyncClient.posted_models, ["slow/model", "backup/model"])
+        # The cancelled loser still leaves a (censored) latency sample
+        await asyncio.sleep(0)
+        self.assertEqual(len(llm_health._MODELS["slow/model"]["latencies"]), 1)
+
+    @patch("app.core.llm_openrouter.httpx.AsyncClient", new=_SlowPrimaryAsyncClient)
+    @patch("app.core.llm_health.get_app_config")
+    @patch("app.core.llm_openrouter.get_app_config")
+    async def test_open_circuit_routes_to_fallback(self, mock_get_app_config, mock_health_config):
+        _SlowPrimaryAsyncClient.posted_models = []
+        mock_get_app_config.return_value = mock_health_config.return_value = {
+            "llm": {
+                "model": "backup/model",
+                "temperature": 0.7,
+                "max_tokens": 300,
+                "timeout_sec": 10,
+                "hedging": {"enabled": False},
+                "circuit_breaker": {"failure_threshold": 2, "cooldown_sec": 60},
+            }
+        }
+        llm_health.record_failure("broken/model")
+        llm_health.record_failure("broken/model")
+
+        result = await generate_text(messages=[{"role": "user", "content": "hi"}], model="broken/model")
+
+        self.assertEqual(result, "from backup/model")
+        self.assertEqual(_SlowPrimaryAsyncClient.posted_models, ["backup/model"])
+
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        llm_health._MODELS.clear()
+        patcher = patch.object(llm_health, "get_health_config", return_value={
+            "hedging_enabled": True, "default_delay_ms": 6000, "min_delay_ms": 1500, "max_delay_ms": 15000,
+            "failure_threshold": 2, "cooldown_sec": 30,
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_half_open_breaker_lets_one_probe_through(self):
+        llm_health.record_failure("m")
+        llm_health.record_failure("m")
+        self.assertFalse(llm_health.is_available("m"))
+
+        llm_health._MODELS["m"]["open_until"] = time.monotonic() - 1  # Cooldown over
+        self.assertTrue(llm_health.is_available("m"))
+        llm_health.start_call("m")
+        self.assertFalse(llm_health.is_available("m"))  # Probe in flight
+
+        llm_health.record_success("m", 100)
+        self.assertTrue(llm_health.is_available("m"))
+        self.assertFalse(llm_health.get_stats()["models"]["m"]["circuit_half_open"])
+
+    def test_failed_probe_reopens_the_breaker(self):
+        llm_health.record_failure("m")
+        llm_health.record_failure("m")
+        llm_health._MODELS["m"]["open_until"] = time.monotonic() - 1
+        llm_health.start_call("m")
+        llm_health.record_failure("m")
+        self.assertFalse(llm_health.is_available("m"))
+        self.assertTrue(llm_health.get_stats()["models"]["m"]["circuit_open"])
+
+    def test_cancelled_calls_do_not_pull_p95_down(self):
+        for _ in range(10):
+            llm_health.record_success("m", 1000)
+        for _ in range(10):
+            llm_health.record_cancelled("m", 50)
+        self.assertEqual(llm_health.p95_latency_ms("m"), 1000)
+
+    def test_probe_rejected_for_its_request_frees_the_half_open_slot(self):
+        llm_health.record_failure("m")
+        llm_health.record_failure("m")
+        llm_health._MODELS["m"]["open_until"] = time.monotonic() - 1
+
+        async def _bad_request(*args):
+            return _FakeResponse(status_code=400, text='{"error":{"message":"context too long"}}')
+
+        with patch("app.core.llm_openrouter._send_request", _bad_request):
+            with self.assertRaises(httpx.HTTPStatusError):
+                asyncio.run(_post_completion({"model": "m"}, {}, 10))
+        self.assertTrue(llm_health.is_available("m"))
+
+    def test_request_errors_do_not_count_against_the_model(self):
+        self.assertFalse(_is_model_side_status(400))
+        self.assertFalse(_is_model_side_status(413))
+        self.assertTrue(_is_model_side_status(429))
+        self.assertTrue(_is_model_side_status(503))
+
+
+class _PooledAsyncClient(_FakeAsyncClient):
+    created = 0
+
+    def __init__(self, timeout=None, limits=None):
+        super().__init__(timeout)
+        self.__class__.created += 1
+        self.is_closed = False
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.is_closed = True
+        return False
+
+    async def post(self, url, json, headers, timeout=None):
+        return await super().post(url, json, headers)
+
+
+class TestOpenRouterBatchSession(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        _reset_governor(self)
+
+    @patch("app.core.llm_openrouter.httpx.AsyncClient", new=_PooledAsyncClient)
+    @patch("app.core.model_router.get_app_config")
+    @patch("app.core.llm_health.get_app_config")
+    @patch("app.core.llm_openrouter.get_app_config")
+    async def test_calls_in_batch_share_one_client_and_lane(self, mock_get_app_config, mock_health_config, mock_router_config):
+        _PooledAsyncClient.created = 0
+        _PooledAsyncClient.posted_models = []
+        mock_get_app_config.return_value = mock_health_config.return_value = mock_router_config.return_value = {
+            "llm": {"model": "some/model", "temperature": 0.7, "max_tokens": 300, "timeout_sec": 10,
+                    "hedging": {"enabled": False}}
+        }
+        messages = [{"role": "user", "content": "hi"}]
+
+        async with batch_session(rps=100, lane=llm_governor.LANE_FOLLOWUP):
+            results = await asyncio.gather(*(generate_text(messages=messages, brain="state") for _ in range(3)))
+
+        self.assertEqual(results, ["ok"] * 3)
+        self.assertEqual(_PooledAsyncClient.created, 1)
+        self.assertEqual(llm_governor.get_stats()["lanes"]["followup"]["admitted"], 3)
+        self.assertEqual(llm_governor.get_stats()["lanes"]["state"]["admitted"], 0)
+
+        # Outside the batch, calls use their own client again
+        await generate_text(messages=messages)
+        self.assertEqual(_PooledAsyncClient.created, 2)
+
+
+class _SlowPooledAsyncClient(_PooledAsyncClient):
+    async def post(self, url, json, headers, timeout=None):
+        await asyncio.sleep(0.05)
+        if self.is_closed:
+            raise httpx.ReadError("client closed mid-request")
+        return await super().post(url, json, headers)
+
+
+class TestOpenRouterBatchSessionShutdown(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        llm_health._MODELS.clear()
+        _reset_governor(self)
+
+    @patch("app.core.llm_openrouter.httpx.AsyncClient", new=_SlowPooledAsyncClient)
+    @patch("app.core.model_router.get_app_config")
+    @patch("app.core.llm_health.get_app_config")
+    @patch("app.core.llm_openrouter.get_app_config")
+    async def test_block_exit_waits_for_requests_spawned_inside_it(self, mock_get_app_config, mock_health_config, mock_router_config):
+        _SlowPooledAsyncClient.created = 0
+        mock_get_app_config.return_value = mock_health_config.return_value = mock_router_config.return_value = {
+            "llm": {"model": "some/model", "temperature": 0.7, "max_tokens": 300, "timeout_sec": 10,
+                    "hedging": {"enabled": False}}
+        }
+        messages = [{"role": "user", "content": "hi"}]
+
+        async with batch_session(rps=100):
+            background = asyncio.create_task(generate_text(messages=messages))
+            await asyncio.sleep(0.01)  # Request in flight when the block exits
+
+        self.assertEqual(await background, "ok")
+        self.assertEqual(_SlowPooledAsyncClient.created, 1)
+        self.assertEqual(llm_health._MODELS["some/model"]["errors"], 0)
+
+
 if __name__ == "__main__":
     unittest.main()
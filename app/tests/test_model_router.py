@@ -0,0 +1,77 @@
+import unittest
+from unittest.mock import patch
+
+from app.core import llm_health, model_router
+from app.core.llm_openrouter import _track_llm_cost
+
+
+ROUTING = {
+    "enabled": True,
+    "min_samples": 3,
+    "brains": {
+        "state": {
+            "pool": ["fast/model", "backup/model"],
+            "p95_ms": 1000,
+            "max_error_rate": 0.2,
+            "max_usd_per_1k_tokens": 0.01,
+        }
+    },
+}
+
+
+class TestModelRouter(unittest.TestCase):
+    def setUp(self):
+        llm_health._MODELS.clear()
+        patcher = patch.object(model_router, "get_routing_config", return_value=ROUTING)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_uses_first_model_in_pool_until_it_has_samples(self):
+        self.assertEqual(model_router.pick_model("state", "default/model"), "fast/model")
+
+    def test_brain_without_pool_keeps_default_model(self):
+        self.assertEqual(model_router.pick_model("memory", "default/model"), "default/model")
+
+    def test_slow_model_shifts_traffic_to_next_in_pool(self):
+        for _ in range(5):
+            llm_health.record_success("fast/model", 3000)
+        self.assertEqual(model_router.pick_model("state", "default/model"), "backup/model")
+
+    def test_erroring_model_shifts_traffic(self):
+        with patch.object(llm_health, "get_health_config", return_value={"failure_threshold": 100, "cooldown_sec": 30}):
+            for _ in range(2):
+                llm_health.record_success("fast/model", 100)
+                llm_health.record_failure("fast/model")
+        self.assertEqual(model_router.pick_model("state", "default/model"), "backup/model")
+
+    def test_expensive_model_shifts_traffic(self):
+        for _ in range(3):
+            llm_health.record_success("fast/model", 100)
+        llm_health.record_cost("fast/model", 0.5, 1000)
+        self.assertEqual(model_router.pick_model("state", "default/model"), "backup/model")
+
+    def test_falls_back_to_fastest_when_nothing_meets_slo(self):
+        for _ in range(5):
+            llm_health.record_success("fast/model", 3000)
+            llm_health.record_success("backup/model", 2000)
+        self.assertEqual(model_router.pick_model("state", "default/model"), "backup/model")
+
+
+class TestLearnedPricing(unittest.TestCase):
+    def setUp(self):
+        llm_health._MODELS.clear()
+
+    @patch("app.core.llm_openrouter.analytics_service_tg.track_event_tg")
+    def test_billed_cost_is_learned_for_unpriced_model(self, track_event):
+        _track_llm_cost(1, "new/model", {"prompt_tokens": 800, "completion_tokens": 200, "cost": 0.002}, None, "state")
+        _track_llm_cost(1, "new/model", {"prompt_tokens": 400, "completion_tokens": 100}, None, "state")
+
+        first, second = [c.kwargs["meta"] for c in track_event.call_args_list]
+        self.assertEqual(first["cost_source"], "billed")
+        self.assertEqual(first["brain"], "state")
+        self.assertEqual(second["cost_source"], "learned")
+        self.assertAlmostEqual(second["cost_usd"], 0.001)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+import orjson
+
+from app.api import miniapp
+from app.core import persona_cache
+from app.core.translation_service import translation_service
+
+
+PERSONA = {
+    "id": "p1",
+    "name": "Kiki",
+    "key": "kiki",
+    "description": "desc",
+    "small_description": "small",
+    "badges": ["new"],
+    "avatar_url": "https://example.com/kiki.png",
+    "voice_id": None,
+}
+
+
+class TestPersonaGallery(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.dict(persona_cache._CACHE, {
+            "presets": [PERSONA],
+            "by_id": {"p1": PERSONA},
+            "histories": {},
+            "by_key": {"kiki": PERSONA},
+            "history_index": {},
+            "fields": {},
+            "gallery": {},
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_payload_is_built_once_per_translation_version(self):
+        with patch.object(persona_cache, "_build_gallery_entries", wraps=persona_cache._build_gallery_entries) as build:
+            first, etag = persona_cache.get_gallery_payload("en")
+            second, same_etag = persona_cache.get_gallery_payload("en")
+            self.assertIs(first, second)
+            self.assertEqual(etag, same_etag)
+            self.assertEqual(build.call_count, 1)
+
+            with patch.object(translation_service, "version", translation_service.version + 1):
+                persona_cache.get_gallery_payload("en")
+            self.assertEqual(build.call_count, 2)
+
+        self.assertEqual(orjson.loads(first)[0]["name"], "Kiki")
+
+    def test_endpoint_returns_304_for_matching_etag(self):
+        async def _scenario():
+            response = await miniapp.get_personas(user=None, if_none_match=None)
+            etag = response.headers["etag"]
+            revalidated = await miniapp.get_personas(user=None, if_none_match=etag)
+            return response, revalidated
+
+        response, revalidated = asyncio.run(_scenario())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(orjson.loads(response.body)[0]["id"], "p1")
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.body, b"")
+
+
+class TestPersonaCacheIndexes(unittest.TestCase):
+    def setUp(self):
+        history = {"id": "h1", "persona_id": "p1", "name": "Beach", "text": "Hi"}
+        self.history = history
+        patcher = patch.dict(persona_cache._CACHE, {
+            "presets": [PERSONA],
+            "by_id": {"p1": PERSONA},
+            "histories": {"p1": [history]},
+            "by_key": {"kiki": PERSONA},
+            "history_index": {"h1": (PERSONA, 0, history)},
+            "fields": {},
+            "gallery": {},
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        translations = {("kiki.name", "ru"): "Кики", ("kiki.history.name-0", "ru"): "Пляж"}
+        get = lambda key, lang="en", fallback=True: translations.get((key, lang), key)
+        patcher = patch.object(translation_service, "get", side_effect=get)
+        self.translate = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_lookups_use_indexes(self):
+        self.assertIs(persona_cache.get_persona_by_key("kiki"), PERSONA)
+        persona, history = persona_cache.get_persona_with_history_by_index("kiki", 0)
+        self.assertIs(history, self.history)
+
+    def test_fields_are_resolved_once_per_language(self):
+        self.assertEqual(persona_cache.get_persona_field(PERSONA, "name", "ru"), "Кики")
+        self.assertEqual(persona_cache.get_history_field(self.history, "name", "ru"), "Пляж")
+        self.assertEqual(persona_cache.get_history_field(self.history, "text", "ru"), "Hi")
+        calls = self.translate.call_count
+
+        persona_cache.get_persona_field(PERSONA, "description", "ru")
+        persona_cache.get_history_field(self.history, "name", "ru")
+        self.assertEqual(self.translate.call_count, calls)
+
+        # A copy of a cached history still resolves by its index
+        self.assertEqual(persona_cache.get_history_field(dict(self.history), "name", "ru"), "Пляж")
+
+    def test_tables_built_during_a_reload_are_not_reused_for_the_new_snapshot(self):
+        stale_tables = (persona_cache._table_version(),) + persona_cache._field_tables("ru")[:2]
+
+        # reload_cache swaps in a persona added meanwhile; a racing reader then
+        # stores tables built from the old presets into the new snapshot
+        added = {**PERSONA, "id": "p2", "key": "mia", "name": "Mia"}
+        persona_cache._CACHE.update({
+            "presets": [PERSONA, added],
+            "by_id": {"p1": PERSONA, "p2": added},
+            "fields": {"ru": stale_tables},
+            "generation": persona_cache._CACHE["generation"] + 1,
+        })
+
+        self.assertEqual(persona_cache.get_persona_field(added, "name", "ru"), "Mia")
+        self.assertIn("p2", persona_cache._CACHE["fields"]["ru"][1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from app.core import prefilters
+from app.core.brains import image_decision_specialist
+
+
+def _config(mode):
+    return {
+        "modes": {name: mode for name in (prefilters.FILTER_IMAGE_DECISION, prefilters.FILTER_USER_NAME, prefilters.FILTER_GIFT_TEXT)},
+        "model_path": None,
+        "model_no_threshold": 0.1,
+    }
+
+
+class TestPrefilterClassifiers(unittest.TestCase):
+    def setUp(self):
+        prefilters._STATS.clear()
+        patcher = patch.object(prefilters, "get_prefilter_config", return_value=_config(prefilters.MODE_ENFORCE))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_trivial_messages(self):
+        for text in ("ok", "Ок!", "😘😘", "haha lol", "...", ""):
+            self.assertTrue(prefilters.is_trivial_message(text), text)
+        for text in ("yes", "take off your dress", "ok, let's go to the beach"):
+            self.assertFalse(prefilters.is_trivial_message(text), text)
+
+    def test_image_decision_only_decides_trivial_messages(self):
+        self.assertEqual(prefilters.classify(prefilters.FILTER_IMAGE_DECISION, user_message="ok")[0], False)
+        self.assertIsNone(prefilters.classify(prefilters.FILTER_IMAGE_DECISION, user_message="lie down on the bed"))
+
+    def test_acks_after_a_photo_offer_go_to_the_llm(self):
+        for offer in ("Want me to send you a pic? 😏", "Хочешь, покажу фото?"):
+            history = [{"role": "assistant", "content": offer}, {"role": "user", "content": "ага"}]
+            for reply in ("ok", "ага", "😍"):
+                verdict = prefilters.classify(prefilters.FILTER_IMAGE_DECISION, user_message=reply, chat_history=history)
+                self.assertIsNone(verdict, (offer, reply))
+
+    def test_name_filter_skips_only_without_introduction(self):
+        no_intro = [{"role": "user", "content": "I'm tired today"}, {"role": "assistant", "content": "Poor you"}]
+        intro_en = [{"role": "user", "content": "hi, I'm Alex"}, {"role": "assistant", "content": "Hi!"}]
+        intro_ru = [{"role": "user", "content": "меня зовут лена"}, {"role": "assistant", "content": "Привет!"}]
+        asked = [{"role": "assistant", "content": "What's your name?"}, {"role": "user", "content": "Alex"}]
+
+        self.assertIsNotNone(prefilters.classify(prefilters.FILTER_USER_NAME, chat_history=no_intro))
+        for history in (intro_en, intro_ru, asked):
+            self.assertIsNone(prefilters.classify(prefilters.FILTER_USER_NAME, chat_history=history))
+
+    def test_optional_model_decides_low_probability(self):
+        model = type("Model", (), {"predict_proba": lambda self, texts: [[0.97, 0.03]]})()
+        with patch.object(prefilters, "_MODEL", model):
+            verdict = prefilters.classify(prefilters.FILTER_IMAGE_DECISION, user_message="tell me about your day")
+        self.assertEqual(verdict[0], False)
+
+
+class TestPrefilterDefaults(unittest.TestCase):
+    def test_measurable_filters_default_to_shadow(self):
+        with patch.object(prefilters, "get_app_config", return_value={}):
+            modes = prefilters.get_prefilter_config()["modes"]
+        self.assertEqual(modes[prefilters.FILTER_IMAGE_DECISION], prefilters.MODE_SHADOW)
+        self.assertEqual(modes[prefilters.FILTER_USER_NAME], prefilters.MODE_SHADOW)
+        self.assertEqual(modes[prefilters.FILTER_GIFT_TEXT], prefilters.MODE_OFF)
+
+    def test_enforce_only_filter_does_not_run_in_shadow(self):
+        with patch.object(prefilters, "get_prefilter_config", return_value=_config(prefilters.MODE_SHADOW)):
+            self.assertEqual(prefilters.get_mode(prefilters.FILTER_GIFT_TEXT), prefilters.MODE_OFF)
+            self.assertIsNone(prefilters.classify(prefilters.FILTER_GIFT_TEXT, user_message="ok"))
+
+
+class TestImageDecisionFastPath(unittest.TestCase):
+    def setUp(self):
+        prefilters._STATS.clear()
+
+    def _decide(self, mode, user_message):
+        llm = AsyncMock(return_value=(True, "physical action"))
+        with patch.object(prefilters, "get_prefilter_config", return_value=_config(mode)), \
+                patch.object(image_decision_specialist, "_decide_with_llm", llm):
+            result = asyncio.run(image_decision_specialist.should_generate_image("", user_message, [], "Mia"))
+            stats = prefilters.get_stats()["image_decision"]
+        return result, llm, stats
+
+    def test_enforce_skips_llm(self):
+        result, llm, stats = self._decide(prefilters.MODE_ENFORCE, "ok")
+        self.assertFalse(result[0])
+        llm.assert_not_awaited()
+        self.assertEqual(stats["llm_calls_skipped"], 1)
+
+    def test_shadow_calls_llm_and_measures_agreement(self):
+        result, llm, stats = self._decide(prefilters.MODE_SHADOW, "ok")
+        self.assertEqual(result, (True, "physical action"))
+        llm.assert_awaited_once()
+        self.assertEqual(stats["shadow_compared"], 1)
+        self.assertEqual(stats["shadow_precision"], 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
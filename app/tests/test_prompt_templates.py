@@ -0,0 +1,44 @@
+import unittest
+
+from config.prompts import CHAT_GPT_EN, CHAT_GPT_RU
+from app.core import prompt_templates
+from app.core.brains.dialogue_specialist import _apply_template_replacements
+
+
+def _replace_loop(template, replacements):
+    for key, value in replacements.items():
+        template = template.replace(key, value)
+    return template
+
+
+class TestPromptTemplates(unittest.TestCase):
+    def test_render_matches_replace_loop(self):
+        replacements = {"{{char.name}}": "Mia", "{{user.name}}": "Alex", "{{response.length_task}}": "Be short."}
+        for template in (CHAT_GPT_EN, CHAT_GPT_RU):
+            self.assertEqual(prompt_templates.apply_replacements(template, replacements), _replace_loop(template, replacements))
+
+    def test_unknown_placeholders_are_kept(self):
+        self.assertEqual(prompt_templates.apply_replacements("Hi {{a}} and {{b}}", {"{{a}}": "x"}), "Hi x and {{b}}")
+
+    def test_partial_is_cached_and_volatile_fields_still_change(self):
+        template = "{{char.name}} talks to {{user.name}}. {{custom.prompt}}"
+        stable = {"{{char.name}}": "Mia", "{{custom.prompt}}": "Call {{user.name}} darling."}
+        before = prompt_templates.get_stats()["hits"]
+
+        first = prompt_templates.render_partial(template, stable, {"{{user.name}}": "Alex"})
+        second = prompt_templates.render_partial(template, stable, {"{{user.name}}": "Sam"})
+
+        self.assertEqual(first, "Mia talks to Alex. Call Alex darling.")
+        self.assertEqual(second, "Mia talks to Sam. Call Sam darling.")
+        self.assertEqual(prompt_templates.get_stats()["hits"], before + 1)
+
+    def test_dialogue_prompt_has_no_known_placeholders_left(self):
+        persona = {"name": "Mia", "prompt": "sweet girlfriend"}
+        for template in (CHAT_GPT_EN, CHAT_GPT_RU):
+            rendered = _apply_template_replacements(template, persona, state="", message_count=3, user_name=None)
+            self.assertNotIn("{{", rendered)
+            self.assertIn("Mia", rendered)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from app.core import r2_storage
+
+
+class _FakeS3Client:
+    def __init__(self):
+        self.objects = {}
+        self.parts = {}
+        self.aborted = []
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.objects[Key] = Body
+
+    def create_multipart_upload(self, Bucket, Key, ContentType=None):
+        self.parts[Key] = {}
+        return {"UploadId": f"upload-{Key}"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.parts[Key][PartNumber] = Body
+        return {"ETag": f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        numbers = [p["PartNumber"] for p in MultipartUpload["Parts"]]
+        self.objects[Key] = b"".join(self.parts[Key][n] for n in numbers)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append(Key)
+
+
+async def _stream(data: bytes, piece: int):
+    for offset in range(0, len(data), piece):
+        yield data[offset:offset + piece]
+
+
+class TestR2StreamingUpload(unittest.TestCase):
+    def setUp(self):
+        self.client = _FakeS3Client()
+        patcher = patch.object(r2_storage, "get_r2_client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        chunk_patcher = patch.object(r2_storage, "MULTIPART_CHUNK_SIZE", 10)
+        chunk_patcher.start()
+        self.addCleanup(chunk_patcher.stop)
+
+    def test_small_stream_uses_single_put(self):
+        size = asyncio.run(r2_storage.upload_stream_async(
+            key="small", chunks=_stream(b"abc", 2), content_type="image/png"
+        ))
+        self.assertEqual(size, 3)
+        self.assertEqual(self.client.objects["small"], b"abc")
+        self.assertNotIn("small", self.client.parts)
+
+    def test_large_stream_is_uploaded_in_parts(self):
+        data = bytes(range(95))
+        size = asyncio.run(r2_storage.upload_stream_async(
+            key="large", chunks=_stream(data, 7), content_type="image/png"
+        ))
+        self.assertEqual(size, len(data))
+        self.assertEqual(self.client.objects["large"], data)
+        self.assertEqual(len(self.client.parts["large"]), 10)
+
+    def test_oversized_stream_aborts_multipart_upload(self):
+        with self.assertRaises(r2_storage.UploadTooLargeError):
+            asyncio.run(r2_storage.upload_stream_async(
+                key="huge", chunks=_stream(bytes(50), 10), content_type=None, max_bytes=25
+            ))
+        self.assertEqual(self.client.aborted, ["huge"])
+        self.assertNotIn("huge", self.client.objects)
+
+
+if __name__ == "__main__":
+    unittest.main()
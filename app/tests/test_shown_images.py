@@ -0,0 +1,142 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+from uuid import uuid4
+
+from sqlalchemy.exc import IntegrityError
+
+from app.core import shown_images
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._calls = []
+
+    def __getattr__(self, name):
+        def _queue(*args):
+            self._calls.append((name, args))
+            return self
+        return _queue
+
+    async def execute(self):
+        results = []
+        for name, args in self._calls:
+            results.append(await getattr(self._redis, name)(*args))
+        self._calls = []
+        return results
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.bits = {}
+        self.lists = {}
+
+    def pipeline(self, transaction=False):
+        return _FakePipeline(self)
+
+    async def getbit(self, key, pos):
+        return 1 if pos in self.bits.get(key, set()) else 0
+
+    async def setbit(self, key, pos, value):
+        self.bits.setdefault(key, set()).add(pos)
+        return 0
+
+    async def expire(self, key, seconds):
+        return True
+
+    async def rpush(self, key, *values):
+        self.lists.setdefault(key, []).extend(values)
+        return len(self.lists[key])
+
+    async def lrange(self, key, start, end):
+        return list(self.lists.get(key, [])[start:end + 1])
+
+    async def ltrim(self, key, start, end):
+        self.lists[key] = self.lists.get(key, [])[start:]
+        return True
+
+    async def hgetall(self, key):
+        return {}
+
+    async def delete(self, *keys):
+        return 0
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+class TestShownImagesFilter(unittest.TestCase):
+    def test_bloom_positions_are_deterministic_and_in_range(self):
+        job_id = uuid4()
+        positions = shown_images.bloom_positions(job_id)
+        self.assertEqual(positions, shown_images.bloom_positions(str(job_id)))
+        self.assertEqual(len(positions), shown_images.BLOOM_HASHES)
+        self.assertTrue(all(0 <= p < shown_images.BLOOM_BITS for p in positions))
+
+    def test_lookup_skips_images_marked_as_shown(self):
+        redis = _FakeRedis()
+        seen, fresh = SimpleNamespace(id=uuid4()), SimpleNamespace(id=uuid4())
+
+        async def _get_redis():
+            return redis
+
+        with patch.object(shown_images.redis_queue, "get_redis", _get_redis), \
+                patch.object(shown_images.crud, "get_user_shown_image_ids", return_value=[]), \
+                patch.object(shown_images.crud, "get_cached_image_candidates", return_value=[seen, fresh]), \
+                patch.object(shown_images, "get_db") as get_db:
+            get_db.return_value.__enter__.return_value = None
+            _run(shown_images.mark_image_shown(42, seen.id))
+            result = _run(shown_images.find_unseen_cached_image(None, "hash", 42))
+
+        self.assertIs(result, fresh)
+        self.assertEqual(redis.lists[shown_images.PENDING_SHOWN_KEY], [f"42:{seen.id}"])
+
+    def test_filter_is_rebuilt_from_db_before_first_lookup(self):
+        redis = _FakeRedis()
+        seen = SimpleNamespace(id=uuid4())
+
+        async def _get_redis():
+            return redis
+
+        with patch.object(shown_images.redis_queue, "get_redis", _get_redis), \
+                patch.object(shown_images.crud, "get_user_shown_image_ids", return_value=[seen.id]), \
+                patch.object(shown_images.crud, "get_cached_image_candidates", return_value=[seen]), \
+                patch.object(shown_images, "get_db") as get_db:
+            get_db.return_value.__enter__.return_value = None
+            result = _run(shown_images.find_unseen_cached_image(None, "hash", 7))
+
+        self.assertIsNone(result)
+        self.assertIn(shown_images.LOADED_BIT, redis.bits[shown_images._bloom_key(7)])
+
+
+    def test_rejected_row_is_dropped_without_holding_back_the_batch(self):
+        redis = _FakeRedis()
+        good, bad = str(uuid4()), str(uuid4())
+        redis.lists[shown_images.PENDING_SHOWN_KEY] = [f"1:{good}", f"2:{bad}"]
+        written = []
+
+        async def _get_redis():
+            return redis
+
+        def _bulk_mark(db, rows):
+            if any(job_id == bad for _, job_id in rows):
+                raise IntegrityError("INSERT", {}, Exception("violates foreign key constraint"))
+            written.extend(rows)
+            return len(rows)
+
+        with patch.object(shown_images.redis_queue, "get_redis", _get_redis), \
+                patch.object(shown_images.crud, "bulk_mark_images_shown", side_effect=_bulk_mark), \
+                patch.object(shown_images, "get_db") as get_db:
+            get_db.return_value.__enter__.return_value = None
+            result = _run(shown_images.flush_pending_writes())
+
+        self.assertEqual(result["rows"], 1)
+        self.assertEqual(written, [(1, good)])
+        self.assertEqual(redis.lists[shown_images.PENDING_SHOWN_KEY], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import asyncio
+import unittest
+
+from app.core import multi_brain_pipeline as pipeline
+
+
+PREVIOUS_STATE = (
+    'relationshipStage="friend" | emotions="calm" | moodNotes="" | location="cafe" '
+    '| description="sipping coffee" | aiClothing="red dress" | userClothing="unknown" '
+    '| terminateDialog=false | terminateReason=""'
+)
+
+
+class TestSpeculativeImagePlan(unittest.TestCase):
+    def test_plan_is_kept_when_only_mood_changes(self):
+        final_state = PREVIOUS_STATE.replace('emotions="calm"', 'emotions="playful"')
+        reason = pipeline._speculative_plan_mismatch(PREVIOUS_STATE, final_state, "*Hey you.*")
+        self.assertIsNone(reason)
+
+    def test_plan_is_discarded_when_dialogue_describes_a_pose(self):
+        reason = pipeline._speculative_plan_mismatch(
+            PREVIOUS_STATE, PREVIOUS_STATE, "_smiles and leans closer_ *Hey you.*"
+        )
+        self.assertEqual(reason, "dialogue describes actions")
+
+    def test_plan_is_discarded_when_scene_moves(self):
+        final_state = PREVIOUS_STATE.replace('location="cafe"', 'location="park"')
+        reason = pipeline._speculative_plan_mismatch(PREVIOUS_STATE, final_state, "_smiles_")
+        self.assertEqual(reason, "location changed")
+
+    def test_plan_is_discarded_when_dialogue_changes_outfit(self):
+        reason = pipeline._speculative_plan_mismatch(
+            PREVIOUS_STATE, PREVIOUS_STATE, "_starts to undress_ *Better.*"
+        )
+        self.assertEqual(reason, "dialogue changes the scene")
+
+    def test_discarded_plan_task_is_cancelled(self):
+        async def _scenario():
+            task = asyncio.create_task(asyncio.sleep(10, result="tags"))
+            final_state = PREVIOUS_STATE.replace('aiClothing="red dress"', 'aiClothing="bikini"')
+            result = await pipeline._take_speculative_plan(task, PREVIOUS_STATE, final_state, "_smiles_")
+            await asyncio.sleep(0)
+            return result, task.cancelled()
+
+        result, cancelled = asyncio.run(_scenario())
+        self.assertIsNone(result)
+        self.assertTrue(cancelled)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from app.core import startup
+
+
+class TestStartup(unittest.TestCase):
+    def test_independent_phases_overlap_and_are_timed(self):
+        barrier = threading.Barrier(2, timeout=2)  # Deadlocks unless both loaders run at once
+
+        async def _scenario():
+            startup.begin()
+            await startup.run_concurrently({"a": barrier.wait, "b": barrier.wait})
+            await startup.run_phase("inline", lambda: time.sleep(0.01))
+            startup.finish()
+
+        asyncio.run(_scenario())
+        stats = startup.get_stats()
+        self.assertEqual(set(stats["phases_ms"]), {"a", "b", "inline"})
+        self.assertGreaterEqual(stats["phases_ms"]["inline"], 10)
+        self.assertIsNotNone(stats["ready_ms"])
+
+    def test_failing_phase_fails_startup(self):
+        def broken():
+            raise RuntimeError("db down")
+
+        async def _scenario():
+            startup.begin()
+            await startup.run_concurrently({"ok": lambda: None, "broken": broken})
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(_scenario())
+        self.assertIn("broken", startup.get_stats()["phases_ms"])
+
+
+if __name__ == "__main__":
+    unittest.main()
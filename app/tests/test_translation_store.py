@@ -0,0 +1,68 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from app.core import translation_store
+from app.core.translation_service import TranslationService
+
+
+class TestTranslationStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = patch.object(translation_store, "COMPILED_DIR", Path(self.tmp.name) / "compiled")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _store(self, translations):
+        path = Path(self.tmp.name) / "table.ltr"
+        translation_store.compile_table(translations, path)
+        return translation_store.TranslationStore(path)
+
+    def test_lookup_and_prefix_queries(self):
+        store = self._store({
+            "welcome.title": "Привет",
+            "welcome.body": "Тело",
+            "welcomeback": "x",
+            "airi.name": "Айри",
+        })
+        self.assertEqual(store.get("welcome.title"), "Привет")
+        self.assertIsNone(store.get("welcome"))
+        self.assertEqual(dict(store.prefix_items("welcome.")), {"welcome.title": "Привет", "welcome.body": "Тело"})
+        self.assertEqual(len(store), 4)
+
+    def test_artifact_is_reused_until_source_changes(self):
+        source = Path(self.tmp.name) / "en.json"
+        source.write_text(json.dumps({"a": {"b": "c"}}), encoding="utf-8")
+        first = translation_store.ensure_compiled(source)
+        self.assertEqual(translation_store.ensure_compiled(source), first)
+
+        source.write_text(json.dumps({"a": {"b": "changed!"}}), encoding="utf-8")
+        second = translation_store.ensure_compiled(source)
+        self.assertNotEqual(second, first)
+        self.assertFalse(first.exists())
+        self.assertEqual(translation_store.TranslationStore(second).get("a.b"), "changed!")
+
+    def test_service_matches_source_files(self):
+        service = TranslationService()
+        service.load()
+        config_dir = Path(__file__).resolve().parents[2] / "config" / "translations"
+        ru = translation_store.flatten(json.loads((config_dir / "ru.json").read_text(encoding="utf-8")))
+        en = translation_store.flatten(json.loads((config_dir / "en.json").read_text(encoding="utf-8")))
+
+        for key in list(ru)[:50]:
+            self.assertEqual(service.get(key, "ru"), ru[key])
+        only_en = next((key for key in en if key not in ru), None)
+        if only_en:
+            self.assertEqual(service.get(only_en, "ru"), en[only_en])
+        self.assertEqual(service.get("missing.key", "ru"), "missing.key")
+        self.assertEqual(service.get_all("en"), en)
+
+        namespace = next(iter(ru)).split(".")[0] + "."
+        self.assertEqual(service.get_namespace(namespace, "ru"), {k: v for k, v in ru.items() if k.startswith(namespace)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import orjson
+import redis
+
+from app.core import user_profile_cache
+from app.db import crud
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    def eval(self, script, numkeys, key, value, tombstone, ex, balance):
+        current = self.values.get(key)
+        if current == tombstone:
+            return 0
+        if current is not None:
+            cached = orjson.loads(current)
+            if cached["energy"] + cached["temp_energy"] < balance:
+                return 0
+        self.values[key] = value
+        return 1
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        return []
+
+
+def _user(**fields):
+    values = {
+        "id": 42, "locale": "ru", "is_premium": False, "premium_tier": "free",
+        "premium_until": None, "energy": 10, "temp_energy": 3,
+    }
+    values.update(fields)
+    return SimpleNamespace(**values)
+
+
+def _db(user):
+    db = MagicMock()
+    db.query.return_value.filter.return_value.first.return_value = user
+    return db
+
+
+class TestUserProfileCache(unittest.TestCase):
+    def setUp(self):
+        self.redis = _FakeRedis()
+        config = {"enabled": True, "local_ttl_sec": 5, "redis_ttl_sec": 300, "max_entries": 100, "tombstone_sec": 10}
+        for patcher in (
+            patch.object(user_profile_cache, "get_profile_config", return_value=config),
+            patch.object(user_profile_cache, "_redis", return_value=self.redis),
+            patch.dict(user_profile_cache._LOCAL, clear=True),
+            patch.dict(user_profile_cache._INVALIDATED_AT, clear=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_hot_checks_select_the_row_once(self):
+        db = _db(_user())
+        self.assertEqual(crud.get_user_language(db, 42), "ru")
+        self.assertEqual(crud.get_user_energy(db, 42)["tokens"], 13)
+        self.assertTrue(crud.check_user_energy(db, 42, required=5))
+        self.assertEqual(crud.check_user_premium(db, 42), {"is_premium": False, "tier": "free"})
+        self.assertEqual(db.query.call_count, 1)
+
+    def test_other_workers_read_the_shared_layer(self):
+        crud.get_user_language(_db(_user()), 42)
+        user_profile_cache._LOCAL.clear()
+
+        db = _db(None)
+        self.assertEqual(crud.get_user_language(db, 42), "ru")
+        db.query.assert_not_called()
+
+    def test_deduction_writes_through(self):
+        db = _db(None)
+        db.execute.return_value.first.return_value = _user(energy=8, temp_energy=0)  # UPDATE ... RETURNING
+        self.assertTrue(crud.deduct_user_energy(db, 42, amount=5))
+
+        db = _db(None)
+        self.assertEqual(crud.get_user_energy(db, 42)["tokens"], 8)
+        db.query.assert_not_called()
+
+    def test_deductions_finishing_out_of_order_keep_the_newer_balance(self):
+        older = user_profile_cache.profile_from_user(_user(energy=8, temp_energy=0))
+        newer = user_profile_cache.profile_from_user(_user(energy=3, temp_energy=0))
+        user_profile_cache.store(42, newer)  # Worker B's later debit writes first
+        user_profile_cache.store(42, older)
+
+        self.assertEqual(user_profile_cache.get(42)["energy"], 3)
+        user_profile_cache._LOCAL.clear()  # As seen from another worker
+        self.assertEqual(user_profile_cache.get(42)["energy"], 3)
+
+    def test_stale_insufficient_balance_is_rechecked(self):
+        user = _user(energy=0, temp_energy=0)
+        db = _db(user)
+        self.assertFalse(crud.check_user_energy(db, 42, required=5))
+
+        user.energy = 50  # e.g. a payment processed by another worker
+        self.assertTrue(crud.check_user_energy(db, 42, required=5))
+
+    def test_expired_premium_is_downgraded_from_the_row(self):
+        user = _user(is_premium=True, premium_tier="premium", premium_until=datetime.utcnow() - timedelta(days=1))
+        db = _db(user)
+        self.assertEqual(crud.check_user_premium(db, 42), {"is_premium": False, "tier": "free"})
+        self.assertFalse(user.is_premium)
+        db.commit.assert_called_once()
+
+    def test_read_racing_a_payment_does_not_cache_the_old_profile(self):
+        stale = user_profile_cache.profile_from_user(_user())  # Selected before the payment committed
+        user_profile_cache.invalidate(42)  # Payment commits and invalidates
+        user_profile_cache.store(42, stale, fill=True)  # The racing read stores afterwards
+
+        user_profile_cache._INVALIDATED_AT.clear()  # As seen from another worker
+        self.assertIsNone(user_profile_cache.get(42))
+
+        paid = _user(is_premium=True, premium_tier="premium", premium_until=datetime.utcnow() + timedelta(days=30))
+        self.assertTrue(crud.check_user_premium(_db(paid), 42)["is_premium"])
+
+    def test_redis_errors_fall_back_to_local_layer(self):
+        self.redis.get = MagicMock(side_effect=redis.ConnectionError("down"))
+        with patch.object(user_profile_cache, "_redis_failed") as failed:
+            self.assertIsNone(user_profile_cache.get(42))
+        failed.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+from urllib.parse import urlencode
+
+from fastapi import HTTPException
+
+from app.core import webapp_auth
+
+
+INIT_DATA = urlencode({"user": json.dumps({"id": 42, "language_code": "ru"}), "hash": "x"})
+
+
+class TestWebappAuth(unittest.TestCase):
+    def setUp(self):
+        for patcher in (
+            patch.dict(webapp_auth._INIT_DATA, clear=True),
+            patch.dict(webapp_auth._USER_CONTEXTS, clear=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_init_data_is_validated_once(self):
+        with patch.object(webapp_auth, "validate_telegram_webapp_data", return_value=True) as validate:
+            first = webapp_auth.parse_init_data(INIT_DATA)
+            second = webapp_auth.parse_init_data(INIT_DATA)
+        self.assertIs(first, second)
+        self.assertEqual(validate.call_count, 1)
+        self.assertEqual(first.user_id, 42)
+        self.assertEqual(first.language_code, "ru")
+
+    def test_invalid_init_data_is_rejected_in_production(self):
+        with patch.object(webapp_auth, "validate_telegram_webapp_data", return_value=False), \
+             patch.object(webapp_auth.settings, "ENV", "production"), \
+             patch.object(webapp_auth.settings, "SKIP_MINIAPP_AUTH", False):
+            with self.assertRaises(HTTPException) as ctx:
+                asyncio.run(webapp_auth.miniapp_init_data(INIT_DATA))
+        self.assertEqual(ctx.exception.status_code, 403)
+
+    def test_user_context_is_cached_until_invalidated(self):
+        profile = {"locale": "ru", "energy": 5, "temp_energy": 2}
+        db = MagicMock()
+        db.__enter__.return_value = db
+        with patch("app.db.base.get_db", return_value=db), \
+             patch("app.db.crud.get_user_profile", return_value=profile) as get_user, \
+             patch("app.db.crud.check_user_premium", return_value={"is_premium": True, "tier": "plus"}):
+            context = webapp_auth.load_user_context(42)
+            self.assertIs(webapp_auth.load_user_context(42), context)
+            self.assertEqual(get_user.call_count, 1)
+
+            webapp_auth.invalidate_user_context(42)
+            webapp_auth.load_user_context(42)
+            self.assertEqual(get_user.call_count, 2)
+
+        self.assertEqual(context.language, "ru")
+        self.assertEqual(context.energy, 7)
+        self.assertEqual(context.premium_tier, "plus")
+
+
+if __name__ == "__main__":
+    unittest.main()
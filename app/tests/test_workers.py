@@ -0,0 +1,155 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from app.core import action_registry, background_tasks, workers
+from app.core.scheduler import _leader_only
+
+
+class _FakeRedis:
+    """Shared Redis for several simulated workers (SET NX EX and the renew/release scripts)"""
+
+    def __init__(self):
+        self.values = {}
+        self.published = []
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    async def eval(self, script, numkeys, key, owner, *args):
+        if self.values.get(key) != owner:
+            return 0
+        if script == workers._RELEASE_SCRIPT:
+            del self.values[key]
+        return 1
+
+    async def publish(self, channel, data):
+        self.published.append((channel, data))
+
+
+class _Manager:
+    def __init__(self):
+        self.stopped = False
+
+    async def stop(self):
+        self.stopped = True
+
+
+class TestLeaderElection(unittest.TestCase):
+    def setUp(self):
+        self.redis = _FakeRedis()
+        config = {"multi_worker": True, "leader_ttl_sec": 30, "shutdown_drain_sec": 1, "action_stop_channel": "stops"}
+        for patcher in (
+            patch.object(workers, "get_workers_config", return_value=config),
+            patch.object(workers.redis_queue, "get_redis", AsyncMock(return_value=self.redis)),
+            patch.object(workers, "_IS_LEADER", False),
+            patch.dict(workers._STATS, {key: 0 for key in workers._STATS}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _as_worker(self, instance_id, coro_fn):
+        with patch.object(workers.cache_bus, "INSTANCE_ID", instance_id):
+            asyncio.run(coro_fn())
+        return workers._IS_LEADER
+
+    def test_only_one_worker_leads(self):
+        self.assertTrue(self._as_worker("worker-a", workers.elect_once))
+        workers._IS_LEADER = False  # Switch to another process's view
+        self.assertFalse(self._as_worker("worker-b", workers.elect_once))
+
+    def test_leader_renews_and_hands_over_on_stop(self):
+        self.assertTrue(self._as_worker("worker-a", workers.elect_once))
+        self.assertTrue(self._as_worker("worker-a", workers.elect_once))
+        self.assertEqual(workers._STATS["renewals"], 1)
+
+        self._as_worker("worker-a", workers.stop)
+        self.assertNotIn(workers.LEADER_KEY, self.redis.values)
+        self.assertTrue(self._as_worker("worker-b", workers.elect_once))
+
+    def test_redis_errors_step_down(self):
+        self._as_worker("worker-a", workers.elect_once)
+        with patch.object(workers.redis_queue, "get_redis", AsyncMock(side_effect=ConnectionError("down"))):
+            self.assertFalse(self._as_worker("worker-a", workers.elect_once))
+        self.assertEqual(workers._STATS["lost"], 1)
+
+    def test_global_jobs_run_only_in_the_leader(self):
+        runs = []
+
+        async def job():
+            runs.append(1)
+
+        asyncio.run(_leader_only(job)())
+        self.assertEqual(runs, [])
+        workers._IS_LEADER = True
+        asyncio.run(_leader_only(job)())
+        self.assertEqual(runs, [1])
+
+    def test_single_worker_always_leads(self):
+        with patch.object(workers, "get_workers_config", return_value={"multi_worker": "auto"}), \
+                patch.dict("os.environ", {"WEB_CONCURRENCY": "1"}):
+            self.assertTrue(workers.is_leader())
+
+
+class TestRemoteActionStop(unittest.TestCase):
+    def setUp(self):
+        self.redis = _FakeRedis()
+        config = {"multi_worker": True, "leader_ttl_sec": 30, "shutdown_drain_sec": 1, "action_stop_channel": "stops"}
+        for patcher in (
+            patch.object(workers, "get_workers_config", return_value=config),
+            patch.object(action_registry.redis_queue, "get_redis", AsyncMock(return_value=self.redis)),
+            patch.dict(action_registry._action_managers, clear=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_stop_for_another_workers_manager_is_forwarded(self):
+        asyncio.run(action_registry.stop_and_remove_action(777))
+        self.assertEqual(self.redis.published, [("stops", "777")])
+
+    def test_owning_worker_stops_its_manager(self):
+        manager = _Manager()
+        action_registry.register_action_manager(777, manager)
+
+        async def _scenario():
+            action_registry.handle_stop_message("777")
+            await asyncio.sleep(0)
+
+        asyncio.run(_scenario())
+        self.assertTrue(manager.stopped)
+        self.assertFalse(action_registry.has_active_action(777))
+
+
+class TestBackgroundTasks(unittest.TestCase):
+    def test_drain_waits_for_tasks_and_their_children(self):
+        done = []
+
+        async def child():
+            await asyncio.sleep(0.01)
+            done.append("child")
+
+        async def parent():
+            background_tasks.spawn(child())
+            done.append("parent")
+
+        async def _scenario():
+            background_tasks.spawn(parent())
+            return await background_tasks.drain(timeout=1)
+
+        self.assertEqual(asyncio.run(_scenario()), 0)
+        self.assertEqual(done, ["parent", "child"])
+
+    def test_drain_cancels_tasks_past_the_timeout(self):
+        async def _scenario():
+            background_tasks.spawn(asyncio.sleep(10))
+            return await background_tasks.drain(timeout=0.01)
+
+        self.assertEqual(asyncio.run(_scenario()), 1)
+        self.assertEqual(background_tasks.get_stats()["running"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
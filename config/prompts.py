@@ -716,6 +716,31 @@ DON'T MAKE THINGS UP
 </EXAMPLES>
 """
 
+CONTEXT_SUMMARY_UPDATE_GPT = """
+<TASK>
+Update an existing conversation summary with the NEW messages only (max 400 chars).
+The previous summary already covers everything before the new messages.
+</TASK>
+
+<OUTPUT_FORMAT>
+Output EXACTLY in this format (no other text):
+
+FACTS: [key facts about user: name, preferences, boundaries, relationship details]
+SCENE: [current location, clothing state, physical situation]
+RECENT: [what happened in last 2-3 exchanges - be specific]
+</OUTPUT_FORMAT>
+
+DON'T MAKE THINGS UP
+
+<RULES>
+- Keep FACTS from the previous summary unless the new messages contradict them
+- Update SCENE if the new messages change location, clothing or physical situation
+- Rewrite RECENT from the new messages
+- Be extremely concise - every word must add value
+- Max 400 characters total
+</RULES>
+"""
+
 NAME_EXTRACTOR_GPT = """
 <TASK>
 You analyze a short conversation between a USER (human) and an ASSISTANT (AI character).
@@ -0,0 +1,76 @@
+"""
+Microbenchmark: dialogue system prompt rendering
+
+Compares the old str.replace pass per placeholder with the precompiled
+template + cached persona partial used by dialogue_specialist.
+
+Usage:
+    python scripts/bench_prompt_render.py [iterations]
+"""
+import sys
+import timeit
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.prompts import CHAT_GPT_EN, CHAT_GPT_RU
+from app.core import prompt_templates
+from app.core.brains.dialogue_specialist import _apply_template_replacements
+
+
+PERSONA = {
+    "name": "Mia",
+    "prompt": "warm, sweet girlfriend, long blonde hair, blue eyes, slim athletic build, casual cute style " * 20,
+}
+
+
+def _replace_loop(template: str, message_count: int, user_name: str) -> str:
+    """Previous implementation: one str.replace pass per placeholder"""
+    replacements = {
+        "{{char.name}}": PERSONA["name"],
+        "{{char.physical_description}}": PERSONA["prompt"],
+        "{{scene.location}}": "[see state below]",
+        "{{scene.description}}": "[see state below]",
+        "{{scene.aiClothing}}": "[see state below]",
+        "{{scene.userClothing}}": "[see state below]",
+        "{{rel.relationshipStage}}": "[see state below]",
+        "{{rel.emotions}}": "[see state below]",
+        "{{rel.moodNotes}}": "[see state below]",
+        "{{custom.prompt}}": PERSONA["prompt"],
+        "{{custom.negative_prompt}}": "",
+        "{{core.personalities}}": "Natural, Authentic",
+        "{{core.personality.prompts}}": "",
+        "{{sexual.archetypes}}": "Balanced",
+        "{{sexual.archetype.prompts}}": "",
+        "{{user.name}}": user_name,
+        "{{user.lang}}": "[detect from conversation]",
+        "{{response.length_guidance}}": "1-2 sentences MAXIMUM" if message_count < 10 else "Max 3 sentences",
+        "{{response.length_task}}": "Keep output VERY SHORT" if message_count < 10 else "Keep output concise",
+    }
+    result = template
+    for key, value in replacements.items():
+        result = result.replace(key, value)
+    return result
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    for label, template in (("EN", CHAT_GPT_EN), ("RU", CHAT_GPT_RU)):
+        old = timeit.timeit(lambda: _replace_loop(template, 12, "Alex"), number=iterations)
+        new = timeit.timeit(
+            lambda: _apply_template_replacements(template, PERSONA, state="", message_count=12, user_name="Alex"),
+            number=iterations,
+        )
+        print(
+            f"{label} ({len(template)} chars): "
+            f"str.replace {old / iterations * 1e6:.1f} µs/render, "
+            f"compiled {new / iterations * 1e6:.1f} µs/render "
+            f"({old / new:.1f}x)"
+        )
+    print(f"Partial cache: {prompt_templates.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
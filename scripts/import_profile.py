@@ -0,0 +1,141 @@
+"""
+Import-time report: which modules make startup (and every worker) slow
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter,
+parses the timings into the import tree and prints:
+  - the slowest top-level imports of the app (cumulative time)
+  - the slowest third-party packages pulled in, and which app module imported them
+  - the tree down to --min-ms
+
+Usage:
+    python scripts/import_profile.py [module] [--min-ms 20] [--top 25] [--depth 4]
+
+    python scripts/import_profile.py                      # app.main
+    python scripts/import_profile.py app.core.multi_brain_pipeline --min-ms 5
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).parent.parent
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+@dataclass
+class ImportNode:
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+    children: List["ImportNode"] = field(default_factory=list)
+    parent: Optional["ImportNode"] = None
+
+    @property
+    def cumulative_ms(self) -> float:
+        return self.cumulative_us / 1000
+
+
+def run_importtime(module: str) -> str:
+    """Import module in a fresh interpreter and return its -X importtime output"""
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        tail = "\n".join(result.stderr.splitlines()[-15:])
+        raise SystemExit(f"Importing {module} failed:\n{tail}")
+    return result.stderr
+
+
+def parse_tree(output: str) -> List[ImportNode]:
+    """
+    Build the import tree from -X importtime lines.
+
+    A module is printed after everything it imported, one indent level
+    (2 spaces) deeper than its importer, so children are collected on a
+    stack until their parent's line shows up.
+    """
+    pending: Dict[int, List[ImportNode]] = {}
+    roots: List[ImportNode] = []
+    for line in output.splitlines():
+        match = LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        depth = (len(indent) - 1) // 2
+        node = ImportNode(name, int(self_us), int(cumulative_us), depth)
+        node.children = pending.pop(depth + 1, [])
+        for child in node.children:
+            child.parent = node
+        if depth == 0:
+            roots.append(node)
+        else:
+            pending.setdefault(depth, []).append(node)
+    return roots
+
+
+def walk(nodes: List[ImportNode]):
+    for node in nodes:
+        yield node
+        yield from walk(node.children)
+
+
+def app_importer(node: ImportNode) -> Optional[str]:
+    """Closest app.* module that (transitively) imported node"""
+    parent = node.parent
+    while parent is not None:
+        if parent.name.startswith("app.") or parent.name == "config.prompts":
+            return parent.name
+        parent = parent.parent
+    return None
+
+
+def print_tree(node: ImportNode, min_ms: float, max_depth: int, level: int = 0):
+    if node.cumulative_ms < min_ms or level > max_depth:
+        return
+    print(f"{node.cumulative_ms:9.1f} ms  {'  ' * level}{node.name}")
+    for child in sorted(node.children, key=lambda n: n.cumulative_us, reverse=True):
+        print_tree(child, min_ms, max_depth, level + 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("module", nargs="?", default="app.main")
+    parser.add_argument("--min-ms", type=float, default=20.0, help="hide subtrees cheaper than this")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--depth", type=int, default=4, help="tree depth to print")
+    args = parser.parse_args()
+
+    roots = parse_tree(run_importtime(args.module))
+    nodes = list(walk(roots))
+    total_ms = sum(root.cumulative_us for root in roots) / 1000
+    print(f"Importing {args.module}: {total_ms:.0f} ms total, {len(nodes)} modules\n")
+
+    app_modules = [node for node in nodes if node.name.startswith("app.") or node.name == "config.prompts"]
+    print(f"Slowest app modules (cumulative, includes what they import):")
+    for node in sorted(app_modules, key=lambda n: n.cumulative_us, reverse=True)[:args.top]:
+        print(f"{node.cumulative_ms:9.1f} ms  {node.name}")
+
+    # Top-level third-party packages: first dotted component, not under another third-party package
+    third_party = [
+        node for node in nodes
+        if "." not in node.name and not node.name.startswith(("app", "config", "_"))
+        and node.name not in sys.stdlib_module_names
+    ]
+    print(f"\nSlowest third-party packages (and the app module that pulled them in):")
+    for node in sorted(third_party, key=lambda n: n.cumulative_us, reverse=True)[:args.top]:
+        print(f"{node.cumulative_ms:9.1f} ms  {node.name:<24} <- {app_importer(node) or '-'}")
+
+    print(f"\nImport tree (>= {args.min_ms:g} ms, depth <= {args.depth}):")
+    for root in sorted(roots, key=lambda n: n.cumulative_us, reverse=True):
+        print_tree(root, args.min_ms, args.depth)
+
+
+if __name__ == "__main__":
+    main()